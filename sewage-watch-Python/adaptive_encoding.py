@@ -0,0 +1,155 @@
+import logging
+import threading
+import cv2
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 编码档位：(最大宽度, JPEG质量)，从高到低排列，宽度None表示原始分辨率
+DEFAULT_TIERS = (
+    (None, 80),
+    (1280, 75),
+    (960, 70),
+    (640, 60),
+    (480, 50),
+    (320, 40)
+)
+
+# 原始分辨率、默认质量的档位
+FULL_TIER = DEFAULT_TIERS[0]
+
+def encode_tier(frame, width=None, quality=80):
+    """
+    按档位缩放并编码为JPEG
+
+    Args:
+        frame: BGR帧
+        width: 最大宽度，None或不小于帧宽度时不缩放
+        quality: JPEG质量
+
+    Returns:
+        bytes: JPEG字节
+    """
+    if width is not None and frame.shape[1] > width:
+        height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+        frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+    if not ok:
+        raise ValueError("JPEG编码失败")
+    return buffer.tobytes()
+
+class AdaptiveEncoder:
+    """
+    单个观看者的自适应编码档位：按发送耗时和发送期间被覆盖的帧数判断连接是否拥塞，
+    拥塞时降低分辨率和质量，持续空闲时逐级恢复
+    """
+    def __init__(self, tiers=DEFAULT_TIERS, max_width=None, enabled=True, degrade_ratio=0.5, upgrade_ratio=0.2,
+                 upgrade_after=30, hold_frames=10, smoothing=0.2):
+        """
+        初始化自适应编码
+
+        Args:
+            tiers: 编码档位，(最大宽度, JPEG质量)从高到低排列
+            max_width: 观看者请求的最大宽度，None表示不限制
+            enabled: False时固定使用第一档(仍受max_width限制)
+            degrade_ratio: 平滑后的发送耗时超过帧间隔的该比例时降一档
+            upgrade_ratio: 发送耗时低于帧间隔的该比例时视为空闲
+            upgrade_after: 连续空闲该帧数后升一档
+            hold_frames: 切换档位后至少发送该帧数再判断是否降档，等待平滑值反映新档位
+            smoothing: 发送耗时和积压帧数的指数平滑系数
+        """
+        self.tiers = tuple(tiers)
+        self.max_width = max_width if max_width and max_width > 0 else None
+        self.enabled = enabled
+        self.degrade_ratio = degrade_ratio
+        self.upgrade_ratio = upgrade_ratio
+        self.upgrade_after = upgrade_after
+        self.hold_frames = hold_frames
+        self.smoothing = smoothing
+        self.level = 0
+        self._idle_frames = 0
+        self._since_change = 0
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.send_time = None
+        self.backlog = 0.0
+        self.frames = 0
+        self.bytes_sent = 0
+        self.downgrades = 0
+        self.upgrades = 0
+
+    def key(self, frame_width):
+        """
+        当前档位对应的编码参数，同一帧上参数相同的观看者共用一次编码
+
+        Args:
+            frame_width: 原始帧宽度
+
+        Returns:
+            tuple: (宽度, 质量)，宽度不小于帧宽度时为None
+        """
+        width, quality = self.tiers[self.level]
+        if self.max_width is not None:
+            width = self.max_width if width is None else min(width, self.max_width)
+        if width is not None and width >= frame_width:
+            width = None
+        return width, quality
+
+    def record_send(self, seconds, interval, size=0, backlog=0):
+        """
+        记录一次发送并调整档位
+
+        Args:
+            seconds: 发送耗时(秒)
+            interval: 该观看者的帧间隔(秒)
+            size: 发送的JPEG字节数
+            backlog: 发送期间被新帧覆盖而丢弃的帧数
+        """
+        with self._lock:
+            self.frames += 1
+            self.bytes_sent += size
+            self.send_time = seconds if self.send_time is None else self.send_time + self.smoothing * (seconds - self.send_time)
+            self.backlog += self.smoothing * (backlog - self.backlog)
+            self._since_change += 1
+            if not self.enabled:
+                return
+
+            # 平均每次发送都有新帧被覆盖时，说明连接跟不上流水线
+            congested = self.send_time > self.degrade_ratio * interval or self.backlog >= 0.5
+            if congested:
+                self._idle_frames = 0
+                if self._since_change >= self.hold_frames and self.level < len(self.tiers) - 1:
+                    self._change(self.level + 1)
+                    self.downgrades += 1
+            elif self.send_time < self.upgrade_ratio * interval:
+                self._idle_frames += 1
+                if self._idle_frames >= self.upgrade_after and self.level > 0:
+                    self._change(self.level - 1)
+                    self.upgrades += 1
+            else:
+                self._idle_frames = 0
+
+    def _change(self, level):
+        """切换档位，重置平滑值以便尽快反映新档位的发送耗时"""
+        self.level = level
+        self._idle_frames = 0
+        self._since_change = 0
+        self.backlog = 0.0
+
+    def stats(self):
+        """返回当前档位、发送耗时和升降档次数"""
+        with self._lock:
+            width, quality = self.tiers[self.level]
+            return {
+                "level": self.level,
+                "width": width,
+                "quality": quality,
+                "max_width": self.max_width,
+                "send_ms": round(self.send_time * 1000, 2) if self.send_time is not None else 0.0,
+                "backlog": round(self.backlog, 2),
+                "avg_frame_kb": round(self.bytes_sent / self.frames / 1024, 1) if self.frames else 0.0,
+                "downgrades": self.downgrades,
+                "upgrades": self.upgrades
+            }
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+import cv2
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adaptive_encoding import DEFAULT_TIERS, encode_tier, AdaptiveEncoder
+
+def _benchmark(video_path="public/sample.mp4", max_frames=150, bandwidth_kbps=4000, fps=30.0):
+    """
+    统计各档位每帧的编码耗时和大小，并模拟带宽为bandwidth_kbps的连接，
+    对比固定原始档位和自适应档位的发送耗时
+    """
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        print(f"无法读取视频: {video_path}")
+        return
+
+    sizes = {}
+    for width, quality in DEFAULT_TIERS:
+        start = time.perf_counter()
+        total = sum(len(encode_tier(frame, width, quality)) for frame in frames)
+        elapsed = time.perf_counter() - start
+        sizes[(width, quality)] = total / len(frames)
+        print(f"档位 宽度={width or frames[0].shape[1]} 质量={quality}: {total / len(frames) / 1024:.1f} KB/帧, "
+              f"编码 {elapsed / len(frames) * 1000:.2f} 毫秒/帧")
+
+    interval = 1.0 / fps
+    bytes_per_second = bandwidth_kbps * 1000 / 8
+    for enabled in (False, True):
+        encoder = AdaptiveEncoder(enabled=enabled)
+        send_total = 0.0
+        for _ in range(3):
+            for frame in frames:
+                key = encoder.key(frame.shape[1])
+                size = sizes[encoder.tiers[encoder.level]]
+                seconds = size / bytes_per_second
+                send_total += seconds
+                # 发送超过一个帧间隔时，期间流水线产出的帧被覆盖
+                encoder.record_send(seconds, interval, int(size), backlog=int(seconds // interval))
+        stats = encoder.stats()
+        frames_sent = encoder.frames
+        print(f"{'自适应' if enabled else '固定原始档位'}({bandwidth_kbps} kbps): 平均发送 {send_total / frames_sent * 1000:.1f} 毫秒/帧, "
+              f"可达 {min(fps, frames_sent / send_total):.1f} fps, 最终档位 {key}, 降档 {stats['downgrades']} 次")
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import shutil
+import subprocess
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from detection import DetectionProcessor, RECORD_COPY, RECORD_OPENCV, RTMPRecorder
+
+def _benchmark(video_path="public/sample.mp4", frame_interval=30, worker_counts=(1, 2, 4, 8)):
+    """比较不同进程数下的视频分析耗时，并检查合并结果与顺序分析一致"""
+    import tempfile
+
+    def comparable(result):
+        # 文件名包含时间和uuid，比较时去掉路径字段；轨迹在合并后统一计算，轨迹字段也参与比较
+        frames = [{k: v for k, v in frame.items() if k not in ("path", "relative_path")}
+                  for frame in result["saved_frames"]]
+        return result["video_info"], result["detected_objects"], frames, result["tracks"]
+
+    with tempfile.TemporaryDirectory() as history_path:
+        processor = DetectionProcessor(history_path=history_path)
+        baseline = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            result = processor.process_video(video_path, frame_interval=frame_interval, workers=workers)
+            elapsed = time.perf_counter() - start
+            if not result.get("success"):
+                print(f"分析失败: {result.get('error')}")
+                return
+            if baseline is None:
+                baseline = (comparable(result), elapsed)
+            identical = comparable(result) == baseline[0]
+            print(f"{workers}进程: {elapsed:.2f}秒, 加速比 {baseline[1] / elapsed:.2f}x, "
+                  f"保存{result['total_saved_frames']}帧, 结果与顺序分析一致: {identical}, "
+                  f"唯一物体: {result['total_tracks']}")
+
+def _benchmark_recording(video_path="public/sample.mp4", rtmp_url="rtmp://localhost:1935/live/recording_bench",
+                         seconds=30, ffmpeg_path="ffmpeg"):
+    """
+    比较两种录制方式每路流的CPU占用和文件大小
+
+    需要先启动仓库中的node-media-server(node ../Node.js/server.js)，本函数用ffmpeg把样例视频循环推送到rtmp_url作为测试流。
+    OpenCV方式统计本进程的CPU时间，复制码流方式统计ffmpeg子进程的CPU时间
+    """
+    import resource
+    import tempfile
+
+    ffmpeg = shutil.which(ffmpeg_path)
+    if ffmpeg is None:
+        print(f"找不到ffmpeg: {ffmpeg_path}")
+        return
+    publisher = subprocess.Popen([ffmpeg, "-hide_banner", "-loglevel", "error", "-re", "-stream_loop", "-1",
+                                  "-i", video_path, "-c", "copy", "-f", "flv", rtmp_url],
+                                 stdin=subprocess.DEVNULL)
+    try:
+        time.sleep(3)
+        if publisher.poll() is not None:
+            print(f"推流失败，请确认node-media-server已在 {rtmp_url} 对应的端口运行")
+            return
+        with tempfile.TemporaryDirectory() as output_dir:
+            for backend in (RECORD_OPENCV, RECORD_COPY):
+                recorder = RTMPRecorder(rtmp_url, output_dir=output_dir, backend=backend, ffmpeg_path=ffmpeg_path)
+                children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+                cpu_before = time.process_time()
+                if recorder.start_recording() is None:
+                    print(f"{backend}: 启动录制失败")
+                    continue
+                time.sleep(seconds)
+                output_file = recorder.stop_recording()
+                if backend == RECORD_COPY:
+                    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+                    cpu = (children_after.ru_utime + children_after.ru_stime -
+                           children_before.ru_utime - children_before.ru_stime)
+                else:
+                    cpu = time.process_time() - cpu_before
+                size = os.path.getsize(output_file) if output_file and os.path.exists(output_file) else 0
+                print(f"{backend}: CPU {cpu / seconds * 100:.1f}% 单核/路, 文件 {size / 1024 / 1024:.1f} MB ({seconds}秒)")
+    finally:
+        publisher.terminate()
+        publisher.wait()
+
+if __name__ == "__main__":
+    if "--recording" in sys.argv:
+        _benchmark_recording()
+    else:
+        _benchmark()
@@ -0,0 +1,59 @@
+import os
+import sys
+import time
+import cv2
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_clips import EventClipRecorder, ClipWriter
+
+def _benchmark(video_path="public/sample.mp4", fps=15.0, stream_seconds=120.0, event_times=(20.0, 26.0, 80.0),
+               width=960, quality=70):
+    """
+    用样例视频按fps模拟stream_seconds秒的直播流，在event_times触发检测事件，
+    统计每帧加入缓冲的开销、单路缓冲占用，以及事件片段与全程录制的磁盘占用
+    """
+    import tempfile
+    from adaptive_encoding import encode_tier
+
+    cap = cv2.VideoCapture(video_path)
+    encoded = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        encoded.append(encode_tier(frame, width, quality))
+    cap.release()
+    if not encoded:
+        print(f"无法读取视频: {video_path}")
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        writer = ClipWriter(output_dir=directory)
+        recorder = EventClipRecorder("benchmark", writer, pre_roll=10.0, post_roll=10.0)
+        base = time.time() - stream_seconds
+        pending_events = list(event_times)
+        add_time = 0.0
+        peak_bytes = 0
+        total_frames = int(stream_seconds * fps)
+        for index in range(total_frames):
+            timestamp = base + index / fps
+            while pending_events and timestamp - base >= pending_events[0]:
+                recorder.trigger("bottle", f"/history/event_{pending_events.pop(0):.0f}.jpg", timestamp)
+            start = time.perf_counter()
+            recorder.add_frame(encoded[index % len(encoded)], timestamp)
+            add_time += time.perf_counter() - start
+            peak_bytes = max(peak_bytes, recorder.ring.bytes)
+        recorder.close()
+        writer.shutdown()
+        stats = writer.stats()
+        print(f"加入缓冲: {add_time / total_frames * 1e6:.1f} 微秒/帧, 单路缓冲峰值 {peak_bytes / 1024 / 1024:.1f} MB "
+              f"({recorder.pre_roll:.0f}秒 {width}宽 质量{quality})")
+        print(f"{len(event_times)}个事件写出 {stats['clips_written']} 个片段, 共 {stats['seconds_written']}秒 "
+              f"{stats['bytes_written'] / 1024 / 1024:.1f} MB, 平均写入 {stats['avg_write_ms']} 毫秒/片段")
+        print(f"全程录制{stream_seconds:.0f}秒估算 {stats['estimated_continuous_bytes'] / 1024 / 1024:.1f} MB, "
+              f"节省 {stats['bytes_saved'] / 1024 / 1024:.1f} MB")
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,44 @@
+import os
+import sys
+import time
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from event_dedup import EventDeduplicator
+
+def _benchmark(video_path="public/sample.mp4", model_path="public/yolov8n_7_11.pt", detect_types=("*",)):
+    """在样例视频上统计逐帧保存与事件去重后的保存次数，时间按视频帧率推进"""
+    import cv2
+    from model_registry import model_registry
+    from postprocess import FrameDetections
+    from tracker import ObjectTracker
+
+    model = model_registry.get(model_path)
+    mask = model.class_map.type_mask(list(detect_types))
+    tracker = ObjectTracker()
+    deduplicator = EventDeduplicator()
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frame_index = 0
+    start = time.perf_counter()
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        result = model(frame, conf=0.4, iou=0.5)[0]
+        detections = FrameDetections(result.boxes, model.class_map)
+        selected = mask[detections.cls]
+        track_ids = tracker.update(detections.types, detections.conf, detections.xyxy, timestamp=frame_index / fps)
+        deduplicator.update(track_ids[selected], detections.conf[selected], lambda index=frame_index: index,
+                            now=frame_index / fps)
+        frame_index += 1
+    cap.release()
+    deduplicator.flush()
+    stats = deduplicator.stats()
+    print(f"{frame_index}帧, 用时 {time.perf_counter() - start:.1f}秒")
+    print(f"逐帧保存: {stats['candidate_frames']} 张图片和记录")
+    print(f"事件去重: {stats['events']} 个事件, 保存 {stats['saved']} 张, 减少 {stats['suppressed']} 次写入")
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,43 @@
+import os
+import sys
+import json
+import time
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_protocol import PROTOCOL_JSON, PROTOCOL_BINARY, build_payload
+
+def _benchmark(video_path="public/sample.mp4", max_frames=300):
+    """比较两种协议每帧的字节数和CPU耗时"""
+    import cv2
+
+    cap = cv2.VideoCapture(video_path)
+    jpegs = []
+    while len(jpegs) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
+        jpegs.append(buffer.tobytes())
+    cap.release()
+    if not jpegs:
+        print(f"无法读取视频: {video_path}")
+        return
+
+    fps = 30.0
+    for protocol in (PROTOCOL_JSON, PROTOCOL_BINARY):
+        total_bytes = 0
+        cpu_start = time.process_time()
+        for seq, jpeg in enumerate(jpegs):
+            payload = build_payload(jpeg, protocol, seq, time.time(), fps, 3)
+            # send_json在发送前同样要做JSON序列化
+            data = payload if isinstance(payload, bytes) else json.dumps(payload).encode('utf-8')
+            total_bytes += len(data)
+        cpu_per_frame = (time.process_time() - cpu_start) / len(jpegs)
+        print(f"{protocol:>6}: {total_bytes / len(jpegs) / 1024:.1f} KB/帧, "
+              f"{total_bytes / len(jpegs) * fps / 1024 / 1024:.2f} MB/s@{fps:.0f}fps, "
+              f"CPU {cpu_per_frame * 1e6:.1f} us/帧")
+
+if __name__ == "__main__":
+    _benchmark()
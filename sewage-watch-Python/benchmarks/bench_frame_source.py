@@ -0,0 +1,119 @@
+import os
+import sys
+import threading
+import time
+import cv2
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from frame_source import POLICY_LATEST, POLICY_BUFFER, FrameSource
+
+def _benchmark(video_path="public/sample.mp4", frame_interval=30, jpeg_quality=80):
+    """
+    以文件按源帧率模拟直播流，统计同时观看、录制和分析时整个进程的CPU时间：
+    改进前观看和录制各自解码，录制结束后分析再读取一次MP4；改进后共用一个采集源，
+    观看编码JPEG、录制写入mp4v、分析取采样帧(不加载模型，推理耗时两种方式相同，不计入)
+    """
+    import os
+    import tempfile
+    from video_sampling import FrameSampler, SAMPLE_AUTO
+
+    encode_args = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
+
+    def watch(read):
+        frames = 0
+        while True:
+            frame = read()
+            if frame is None:
+                return frames
+            cv2.imencode('.jpg', frame, encode_args)
+            frames += 1
+
+    def record(read, path, fps, size):
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+        while True:
+            frame = read()
+            if frame is None:
+                break
+            writer.write(frame)
+        writer.release()
+
+    def paced_reader(cap, fps):
+        # 按源帧率读取，模拟直播流的到达节奏
+        next_due = [time.monotonic()]
+
+        def read():
+            ret, frame = cap.read()
+            if not ret:
+                return None
+            next_due[0] += 1.0 / fps
+            time.sleep(max(0.0, next_due[0] - time.monotonic()))
+            return frame
+        return read
+
+    def consumer_reader(consumer):
+        def read():
+            item = consumer.get()
+            return item[0] if item is not None else None
+        return read
+
+    probe = cv2.VideoCapture(video_path)
+    if not probe.isOpened():
+        print(f"无法读取视频: {video_path}")
+        return
+    fps = probe.get(cv2.CAP_PROP_FPS) or 30.0
+    size = (int(probe.get(cv2.CAP_PROP_FRAME_WIDTH)), int(probe.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    probe.release()
+
+    with tempfile.TemporaryDirectory() as directory:
+        # 改进前：观看和录制各打开一次视频源，录制结束后按采样间隔重新读取MP4
+        record_path = os.path.join(directory, "before.mp4")
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        watch_cap = cv2.VideoCapture(video_path)
+        record_cap = cv2.VideoCapture(video_path)
+        threads = [
+            threading.Thread(target=watch, args=(paced_reader(watch_cap, fps),)),
+            threading.Thread(target=record, args=(paced_reader(record_cap, fps), record_path, fps, size))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        watch_cap.release()
+        record_cap.release()
+        cap = cv2.VideoCapture(record_path)
+        sampled_before = sum(1 for _ in FrameSampler(cap, frame_interval=frame_interval, mode=SAMPLE_AUTO))
+        cap.release()
+        before_cpu, before_wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+        # 改进后：一个采集源分发给观看(只保留最新帧)、录制(有界缓冲)和分析(采样)三个消费者
+        record_path = os.path.join(directory, "after.mp4")
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        source = FrameSource(video_path, realtime=True)
+        viewer = source.add_consumer("viewer", POLICY_LATEST)
+        recorder = source.add_consumer("recorder", POLICY_BUFFER, max_size=int(fps * 3))
+        analyzer = source.add_consumer("analysis", POLICY_BUFFER, max_size=16, sample_interval=frame_interval)
+        threads = [
+            threading.Thread(target=watch, args=(consumer_reader(viewer),)),
+            threading.Thread(target=record, args=(consumer_reader(recorder), record_path, fps, size))
+        ]
+        for thread in threads:
+            thread.start()
+        source.start()
+        sampled_after = 0
+        while analyzer.get() is not None:
+            sampled_after += 1
+        for thread in threads:
+            thread.join()
+        source.stop()
+        after_cpu, after_wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    print(f"改进前(观看+录制各解码一次，录制后重新读取分析): CPU {before_cpu:.2f}秒, 耗时 {before_wall:.2f}秒, "
+          f"分析采样 {sampled_before} 帧")
+    print(f"改进后(共享采集源): CPU {after_cpu:.2f}秒, 耗时 {after_wall:.2f}秒, 解码 {source.frames_decoded} 帧, "
+          f"分析采样 {sampled_after} 帧, 录制丢帧 {recorder.frames_dropped}, 观看丢帧 {viewer.frames_dropped}")
+    print(f"CPU时间减少 {(1 - after_cpu / before_cpu) * 100:.1f}%")
+
+if __name__ == "__main__":
+    _benchmark()
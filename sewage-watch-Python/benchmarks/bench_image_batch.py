@@ -0,0 +1,56 @@
+import os
+import sys
+import asyncio
+import time
+import cv2
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_batch import run_image_batches
+
+def _benchmark(video_path="public/sample.mp4", num_images=64, batch_size=16):
+    """对比逐张处理和分批处理的吞吐量，图片取自样例视频并编码为JPEG"""
+    import tempfile
+    from detection import DetectionProcessor
+
+    cap = cv2.VideoCapture(video_path)
+    encoded = []
+    while len(encoded) < num_images:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        encoded.append(cv2.imencode(".jpg", frame)[1].tobytes())
+    cap.release()
+    if not encoded:
+        print(f"无法读取视频: {video_path}")
+        return
+
+    async def run(func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(None, lambda: func(*args, **kwargs))
+
+    with tempfile.TemporaryDirectory() as history_path:
+        processor = DetectionProcessor(history_path=history_path, detect_types=["*"])
+        processor.process_image_bytes(encoded[0])
+
+        # 逐张处理：与循环调用/detect/image相同，每张图片单独解码和推理
+        start = time.perf_counter()
+        for data in encoded:
+            processor.process_image_bytes(data)
+        single_elapsed = time.perf_counter() - start
+        print(f"逐张处理: {len(encoded) / single_elapsed:.2f} 张/秒")
+
+        async def batched():
+            async def constant(data):
+                return data
+            sources = [(f"{i}.jpg", lambda data=data: constant(data)) for i, data in enumerate(encoded)]
+            async for item in run_image_batches(sources, processor, run, batch_size=batch_size):
+                if "summary" in item:
+                    return item["summary"]
+
+        summary = asyncio.run(batched())
+        print(f"分批处理(batch_size={batch_size}): {summary['images_per_second']:.2f} 张/秒, "
+              f"解码 {summary['decode_time']:.2f}秒, 推理 {summary['inference_time']:.2f}秒")
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,43 @@
+import os
+import sys
+import time
+import cv2
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_writer import ImageWriter
+
+def _benchmark(num_images=200, width=1920, height=1080, max_workers=4):
+    """对比同步cv2.imwrite和后台写入时调用方线程的耗时，图片为随机噪声加渐变"""
+    import tempfile
+    import numpy as np
+
+    rng = np.random.default_rng(0)
+    gradient = np.tile(np.linspace(0, 255, width, dtype=np.uint8), (height, 1))
+    frame = np.dstack([gradient] * 3)
+    frame = cv2.add(frame, rng.integers(0, 32, frame.shape, dtype=np.uint8))
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        for i in range(num_images):
+            cv2.imwrite(os.path.join(directory, f"sync_{i}.jpg"), frame)
+        sync_elapsed = time.perf_counter() - start
+        print(f"同步写入: 调用方耗时 {sync_elapsed / num_images * 1000:.2f} 毫秒/张")
+
+        writer = ImageWriter(max_workers=max_workers, max_queue_size=num_images)
+        start = time.perf_counter()
+        futures = [writer.submit(frame, os.path.join(directory, f"async_{i}.jpg")) for i in range(num_images)]
+        caller_elapsed = time.perf_counter() - start
+        for future in futures:
+            future.result()
+        total_elapsed = time.perf_counter() - start
+        writer.shutdown()
+        stats = writer.stats()
+        print(f"后台写入(workers={max_workers}): 调用方耗时 {caller_elapsed / num_images * 1000:.2f} 毫秒/张, "
+              f"全部落盘 {total_elapsed:.2f}秒, 平均写入 {stats['avg_write_ms']}毫秒, 最大写入 {stats['max_write_ms']}毫秒")
+        leftovers = [name for name in os.listdir(directory) if name.endswith(".tmp")]
+        print(f"残留临时文件: {len(leftovers)}")
+
+if __name__ == "__main__":
+    _benchmark()
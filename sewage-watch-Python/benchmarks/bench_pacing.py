@@ -0,0 +1,50 @@
+import os
+import sys
+import time
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pacing import FramePacer
+
+def _benchmark(video_path="public/sample.mp4", process_ms=150, seconds=8.0):
+    """
+    模拟每帧处理耗时process_ms的文件源推流，对比逐帧解码和按墙上时钟跳帧时视频播放进度与真实时间的偏差
+    """
+    import cv2
+
+    for skip in (False, True):
+        cap = cv2.VideoCapture(video_path)
+        source_fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        pacer = FramePacer(target_fps=30.0, source_fps=source_fps)
+        position = 0
+        played = 0  # 循环播放时累计经过的源帧数
+        start = time.monotonic()
+        while time.monotonic() - start < seconds:
+            if skip:
+                behind = pacer.frames_behind(position)
+                for _ in range(behind):
+                    cap.grab()
+                position += behind
+                played += behind
+                pacer.record_skipped(behind)
+            ret, frame = cap.read()
+            if not ret:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                position = 0
+                pacer.restart(0)
+                continue
+            position += 1
+            played += 1
+            time.sleep(process_ms / 1000)  # 模拟推理
+            time.sleep(pacer.wait_time())
+            pacer.frame_sent(time.time())
+        elapsed = time.monotonic() - start
+        stats = pacer.stats()
+        print(f"{'跳帧' if skip else '逐帧'}: 实际 {stats['achieved_fps']} fps, 播放进度 {played / source_fps:.2f}秒 "
+              f"(真实时间 {elapsed:.2f}秒, 落后 {elapsed - played / source_fps:.2f}秒), "
+              f"跳过 {stats['source_frames_skipped']} 帧")
+        cap.release()
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,39 @@
+import os
+import sys
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from recording_segments import SEGMENT_ANALYZING, SEGMENT_ANALYZED, summarize_segment_result, SegmentIndex
+
+def _benchmark(num_segments=60, detections_per_segment=50):
+    """模拟一小时录制按60秒分段，统计每个分段写入索引、更新统计和按保留数量清理的耗时"""
+    import tempfile
+    import time
+
+    with tempfile.TemporaryDirectory() as directory:
+        index = SegmentIndex(directory, task_id="benchmark", retention=10)
+        start = time.perf_counter()
+        for i in range(num_segments):
+            path = os.path.join(directory, f"segment_{i:05d}.mp4")
+            with open(path, "wb") as f:
+                f.write(b"\0" * 1024)
+            segment = index.add(path, i * 60.0, (i + 1) * 60.0)
+            index.update(segment["index"], status=SEGMENT_ANALYZING, job_id=i)
+            summary = summarize_segment_result({
+                "video_info": {"processed_frames": 60},
+                "total_saved_frames": detections_per_segment,
+                "total_tracks": 3,
+                "detected_objects": {"bottle": {"count": detections_per_segment, "unique_count": 3,
+                                                "avg_confidence": 0.8}}
+            })
+            index.update(segment["index"], status=SEGMENT_ANALYZED, summary=summary)
+            index.prune()
+        elapsed = time.perf_counter() - start
+        data = index.to_dict()
+        remaining = len([name for name in os.listdir(directory) if name.endswith(".mp4")])
+        print(f"{num_segments}个分段: 每个分段索引开销 {elapsed / num_segments * 1000:.2f} 毫秒, "
+              f"保留文件 {remaining} 个, 合计检测 {data['totals']['detected_objects']['bottle']['count']} 次")
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,147 @@
+import os
+import sys
+import functools
+import multiprocessing
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from shm_frame_bus import WORKER_RUNNING, InferenceWorkerPool
+
+def _busy_infer_factory(work_ms):
+    """基准测试用的推理函数：每帧做work_ms毫秒持有GIL的纯Python计算，模拟推理前后处理"""
+    def infer(frames):
+        results = []
+        for frame in frames:
+            deadline = time.perf_counter() + work_ms / 1000
+            total = 0
+            while time.perf_counter() < deadline:
+                total += 1
+            results.append(np.array([[0, 0, frame.shape[1], frame.shape[0], 0.9, 0]], dtype=np.float32))
+        return results
+    return infer
+
+def _crash_infer_factory():
+    """基准测试用的推理函数：处理第3批时退出进程，模拟推理进程崩溃"""
+    calls = [0]
+
+    def infer(frames):
+        calls[0] += 1
+        if calls[0] == 3:
+            import os
+            os._exit(1)
+        return [np.zeros((0, 6), dtype=np.float32) for _ in frames]
+    return infer
+
+def _failing_infer_factory():
+    """基准测试用的推理函数：加载模型时失败，模拟模型路径错误"""
+    raise FileNotFoundError("model.pt")
+
+def _benchmark(video_path="public/sample.mp4", num_frames=300, work_ms=10.0, workers=2):
+    """
+    对比每帧work_ms毫秒持有GIL的推理负载下，当前的queue.Queue+线程与共享内存+推理进程的吞吐量(帧/秒)，
+    模拟推理进程崩溃，检查槽位回收和请求重新分派，并检查加载模型失败时的退避重启和停用
+    """
+    import queue
+
+    cap = cv2.VideoCapture(video_path)
+    ret, frame = cap.read()
+    cap.release()
+    if not ret:
+        print(f"无法读取视频: {video_path}")
+        return
+    infer = _busy_infer_factory(work_ms)
+
+    # 当前方式：帧对象通过queue.Queue传给同一进程中的推理线程
+    frames_queue = queue.Queue(maxsize=16)
+    done = []
+
+    def consume():
+        while True:
+            item = frames_queue.get()
+            if item is None:
+                return
+            done.append(infer([item])[0])
+
+    threads = [threading.Thread(target=consume) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for _ in range(num_frames):
+        frames_queue.put(frame)
+    for _ in threads:
+        frames_queue.put(None)
+    for thread in threads:
+        thread.join()
+    queue_fps = num_frames / (time.perf_counter() - start)
+
+    # 共享内存：帧写入槽位，推理进程直接读取
+    pool = InferenceWorkerPool(functools.partial(_busy_infer_factory, work_ms), workers=workers, slots=16,
+                               max_width=frame.shape[1], max_height=frame.shape[0])
+    pool.start()
+    while not all(worker.state == WORKER_RUNNING for worker in pool._workers):
+        time.sleep(0.05)
+    write_time = 0.0
+    futures = deque()
+    start = time.perf_counter()
+    for _ in range(num_frames):
+        # 槽位有限，等最早的请求完成后再提交，避免丢帧
+        while len(futures) >= pool.bus.slots:
+            futures.popleft().result()
+        write_start = time.perf_counter()
+        futures.append(pool.submit(frame))
+        write_time += time.perf_counter() - write_start
+    for future in futures:
+        future.result()
+    shm_fps = num_frames / (time.perf_counter() - start)
+    stats = pool.stats()
+    pool.stop()
+
+    print(f"{frame.shape[1]}x{frame.shape[0]}, 每帧负载 {work_ms}毫秒, {workers}个线程/进程, CPU核数 {multiprocessing.cpu_count()}")
+    print(f"queue.Queue + 线程: {queue_fps:.1f} 帧/秒")
+    print(f"共享内存 + 推理进程: {shm_fps:.1f} 帧/秒, 写入槽位 {write_time / num_frames * 1000:.3f} 毫秒/帧, "
+          f"延迟p50 {stats['latency_p50_ms']} 毫秒")
+
+    # 推理进程崩溃后回收槽位、重新分派并重启
+    pool = InferenceWorkerPool(_crash_infer_factory, workers=1, slots=8, max_width=frame.shape[1],
+                               max_height=frame.shape[0], max_batch_size=1, restart_delay=0.1)
+    pool.start()
+    results = [pool.submit(frame) for _ in range(8)]
+    completed = 0
+    for future in results:
+        try:
+            future.result(timeout=60)
+            completed += 1
+        except Exception:
+            pass
+    stats = pool.stats()
+    pool.stop()
+    print(f"崩溃恢复: 完成 {completed}/8, 重新分派 {stats['requeued']}, 进程重启 {stats['worker_restarts']}, "
+          f"空闲槽位 {stats['slots_free']}/8")
+
+    # 加载模型失败时按退避时间重启，超过次数后停用，之后的请求立即失败
+    pool = InferenceWorkerPool(_failing_infer_factory, workers=1, slots=4, max_width=frame.shape[1],
+                               max_height=frame.shape[0], restart_delay=0.2, max_restarts=3)
+    start = time.perf_counter()
+    pool.start()
+    while pool.failed is None and time.perf_counter() - start < 30:
+        time.sleep(0.05)
+    failed_after = time.perf_counter() - start
+    submit_start = time.perf_counter()
+    try:
+        pool.submit(frame).result()
+    except RuntimeError:
+        pass
+    submit_ms = (time.perf_counter() - submit_start) * 1000
+    stats = pool.stats()
+    pool.stop()
+    print(f"加载失败: 重启 {stats['worker_restarts']} 次后 {failed_after:.1f}秒停用, 原因 {stats['failed']}, "
+          f"之后的请求 {submit_ms:.2f} 毫秒内失败")
+
+if __name__ == "__main__":
+    _benchmark()
@@ -0,0 +1,72 @@
+import os
+import sys
+import asyncio
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upload_ingest import DEFAULT_CHUNK_SIZE, UploadIngestor
+
+def _ingest_worker(mode, paths, chunk_size, result_queue):
+    """在独立进程中并发读取上传文件并返回峰值RSS，避免不同模式的峰值互相影响"""
+    import resource
+    import tempfile
+    from starlette.datastructures import UploadFile
+
+    async def whole_file(upload, dest_path):
+        # 原有方式：一次性读入内存再写盘
+        with open(dest_path, "wb") as buffer:
+            content = await upload.read()
+            buffer.write(content)
+
+    async def run():
+        ingestor = UploadIngestor(chunk_size=chunk_size, hash_algorithm="sha256")
+        with tempfile.TemporaryDirectory() as temp_dir:
+            uploads = [UploadFile(file=open(path, "rb"), filename=os.path.basename(path)) for path in paths]
+            tasks = []
+            for index, upload in enumerate(uploads):
+                dest_path = os.path.join(temp_dir, f"{index}.bin")
+                if mode == "read":
+                    tasks.append(whole_file(upload, dest_path))
+                else:
+                    tasks.append(ingestor.save_to_disk(upload, dest_path))
+            await asyncio.gather(*tasks)
+            for upload in uploads:
+                await upload.close()
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    asyncio.run(run())
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result_queue.put((baseline, peak))
+
+def _benchmark(concurrency=4, file_mb=256, chunk_size=DEFAULT_CHUNK_SIZE):
+    """并发上传大文件，比较一次性读取和分块读取的峰值RSS"""
+    import multiprocessing
+    import tempfile
+    import time
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as source_dir:
+        paths = []
+        block = os.urandom(1024 * 1024)
+        for index in range(concurrency):
+            path = os.path.join(source_dir, f"upload_{index}.bin")
+            with open(path, "wb") as f:
+                for _ in range(file_mb):
+                    f.write(block)
+            paths.append(path)
+
+        print(f"{concurrency}个并发上传，每个{file_mb} MB，分块大小{chunk_size // 1024} KB")
+        for mode in ("read", "stream"):
+            result_queue = context.Queue()
+            start = time.perf_counter()
+            process = context.Process(target=_ingest_worker, args=(mode, paths, chunk_size, result_queue))
+            process.start()
+            baseline, peak = result_queue.get()
+            process.join()
+            elapsed = time.perf_counter() - start
+            # Linux下ru_maxrss单位为KB
+            print(f"{mode:>6}: 峰值RSS {peak / 1024:.1f} MB (启动后 {baseline / 1024:.1f} MB), 耗时 {elapsed:.2f}秒")
+
+if __name__ == "__main__":
+    _benchmark()
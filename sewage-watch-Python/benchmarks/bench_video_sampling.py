@@ -0,0 +1,36 @@
+import os
+import sys
+import cv2
+
+# 从项目根目录导入被测模块
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_sampling import SAMPLE_READ, SAMPLE_GRAB, SAMPLE_SEEK, FrameSampler
+
+def _benchmark(frame_interval=30, sample_seconds=2.0):
+    """比较各采样模式在样例视频和录制文件上的耗时"""
+    import glob
+    import os
+    import time
+
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    videos = [os.path.join(base_dir, "public", "sample.mp4")]
+    videos += sorted(glob.glob(os.path.join(base_dir, "temp_uploads", "*.mp4")))
+
+    for video_path in videos:
+        if not os.path.exists(video_path):
+            continue
+        print(f"\n{os.path.relpath(video_path, base_dir)}")
+        for label, kwargs in ((f"每{frame_interval}帧", {"frame_interval": frame_interval}),
+                              (f"每{sample_seconds}秒", {"sample_seconds": sample_seconds})):
+            for mode in (SAMPLE_READ, SAMPLE_GRAB, SAMPLE_SEEK):
+                cap = cv2.VideoCapture(video_path)
+                start = time.perf_counter()
+                sampler = FrameSampler(cap, mode=mode, **kwargs)
+                indices = [index for index, _ in sampler]
+                elapsed = time.perf_counter() - start
+                cap.release()
+                print(f"  {label:<8} {mode:<5}: {elapsed:.3f}秒, 采样{len(indices)}帧, 前几帧 {indices[:4]}")
+
+if __name__ == "__main__":
+    _benchmark()
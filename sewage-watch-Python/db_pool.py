@@ -0,0 +1,326 @@
+import gc
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class PoolTimeout(Exception):
+    """连接池已满且在超时时间内没有连接归还"""
+
+def default_ping(connection):
+    """检查连接是否可用，pymysql使用ping，其他DB-API连接执行SELECT 1"""
+    if hasattr(connection, "ping"):
+        connection.ping(reconnect=False)
+    else:
+        cursor = connection.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        finally:
+            cursor.close()
+
+class PooledConnection:
+    """
+    从连接池借出的连接，close()时归还到连接池而不是断开，其余属性和方法透传给底层连接
+
+    未调用close()就被回收时，底层连接交给连接池在下次借出时关闭并释放名额
+    """
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+        self._closed = False
+        self._finalizer = weakref.finalize(self, pool._abandon, connection)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 出错时连接状态未知，关闭而不归还
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def close(self):
+        """归还连接，重复调用无效"""
+        if not self._closed:
+            self._closed = True
+            self._finalizer.detach()
+            self._pool.release(self._connection)
+
+    def discard(self):
+        """连接已损坏时调用，关闭底层连接而不归还"""
+        if not self._closed:
+            self._closed = True
+            self._finalizer.detach()
+            self._pool.release(self._connection, broken=True)
+
+class _PoolEntry:
+    """连接及其创建时间和最近一次使用时间"""
+    __slots__ = ("connection", "created_at", "last_used")
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+
+class _Waiter:
+    """排队等待连接的线程，归还的连接通过entry直接交付"""
+    __slots__ = ("entry", "ready")
+
+    def __init__(self):
+        self.entry = None
+        self.ready = False
+
+class ConnectionPool:
+    """
+    有界数据库连接池，连接在空闲过久时检查可用性，超过最大存活时间时重建，连接用尽时阻塞等待
+    """
+    def __init__(self, factory, max_size=10, timeout=5.0, recycle=3600, health_check_interval=30,
+                 reset_on_return=True, ping=default_ping):
+        """
+        初始化连接池
+
+        Args:
+            factory: 创建新连接的函数
+            max_size: 最大连接数
+            timeout: 连接用尽时等待归还的最长时间(秒)
+            recycle: 连接最大存活时间(秒)，超过后关闭重建，0表示不限制
+            health_check_interval: 连接空闲超过该时间(秒)后，借出前先检查可用性
+            reset_on_return: 归还时回滚未提交的事务，避免下一个使用者看到残留状态
+            ping: 检查连接可用性的函数，连接不可用时抛出异常
+        """
+        self.factory = factory
+        self.max_size = max(1, int(max_size))
+        self.timeout = timeout
+        self.recycle = recycle
+        self.health_check_interval = health_check_interval
+        self.reset_on_return = reset_on_return
+        self.ping = ping
+        self._idle = deque()
+        self._waiters = deque()
+        self._abandoned = deque()  # 未归还就被回收的连接，由借出连接的线程关闭
+        self._entries = {}
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+        # 统计信息
+        self.acquisitions = 0
+        self.waits = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+        self.timeouts = 0
+        self.created = 0
+        self.recycled = 0
+        self.health_check_failures = 0
+        self.reclaimed = 0
+
+    def _abandon(self, connection):
+        """PooledConnection未调用close()就被回收时调用，可能在任意线程的垃圾回收中执行，只入队不加锁"""
+        self._abandoned.append(connection)
+
+    def _reclaim_abandoned(self):
+        """
+        关闭被遗弃的连接并释放其名额，事务状态未知，不放回空闲连接
+
+        Returns:
+            int: 回收的连接数
+        """
+        reclaimed = 0
+        while True:
+            try:
+                connection = self._abandoned.popleft()
+            except IndexError:
+                break
+            logger.warning("回收未归还的数据库连接，调用方应在finally中调用close()")
+            with self._condition:
+                self.reclaimed += 1
+            self.release(connection, broken=True)
+            reclaimed += 1
+        return reclaimed
+
+    def acquire(self, timeout=None):
+        """
+        借出一个连接，连接用尽时阻塞等待
+
+        Args:
+            timeout: 等待超时时间(秒)，默认使用连接池配置
+
+        Returns:
+            PooledConnection: 使用完毕后调用close()归还
+
+        Raises:
+            PoolTimeout: 超时仍没有可用连接
+        """
+        timeout = self.timeout if timeout is None else timeout
+        self._reclaim_abandoned()
+        try:
+            return self._acquire(timeout)
+        except PoolTimeout:
+            # 借出的连接可能已不可达但尚未被回收(如处于引用环中)，强制回收后再试一次
+            gc.collect()
+            if not self._reclaim_abandoned():
+                raise
+            return self._acquire(timeout)
+
+    def _acquire(self, timeout):
+        """借出连接，不处理被遗弃的连接"""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("连接池已关闭")
+            if self._idle and not self._waiters:
+                entry = self._idle.pop()
+            elif self._size < self.max_size and not self._waiters:
+                self._size += 1
+                entry = None
+            else:
+                # 按先来先到排队，归还的连接直接交给最早等待的线程，避免被刚归还连接的线程反复抢占
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+                wait_start = time.monotonic()
+                deadline = wait_start + timeout
+                while not waiter.ready:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        self._waiters.remove(waiter)
+                        if self._closed:
+                            raise RuntimeError("连接池已关闭")
+                        self.timeouts += 1
+                        raise PoolTimeout(f"等待数据库连接超时({timeout}秒)，连接数: {self.max_size}")
+                    self._condition.wait(min(remaining, 0.5))
+                    if self._abandoned:
+                        # 等待期间有连接被遗弃，回收后交给排队的线程(条件变量可重入)
+                        self._reclaim_abandoned()
+                entry = waiter.entry
+                wait_time = time.monotonic() - wait_start
+                self.waits += 1
+                self.total_wait_time += wait_time
+                self.max_wait_time = max(self.max_wait_time, wait_time)
+            self.acquisitions += 1
+
+        try:
+            entry = self._prepare(entry)
+        except Exception:
+            # 创建连接失败，把名额交给等待的线程或释放
+            with self._condition:
+                if self._waiters and not self._closed:
+                    waiter = self._waiters.popleft()
+                    waiter.entry = None
+                    waiter.ready = True
+                else:
+                    self._size -= 1
+                self._condition.notify_all()
+            raise
+        entry.last_used = time.monotonic()
+        with self._condition:
+            self._entries[id(entry.connection)] = entry
+        return PooledConnection(self, entry.connection)
+
+    def _prepare(self, entry):
+        """确保借出的连接可用：新建、按存活时间重建或在空闲过久后检查"""
+        if entry is not None:
+            now = time.monotonic()
+            if self.recycle and now - entry.created_at > self.recycle:
+                with self._condition:
+                    self.recycled += 1
+                self._close_quietly(entry.connection)
+                entry = None
+            elif self.health_check_interval is not None and now - entry.last_used > self.health_check_interval:
+                try:
+                    self.ping(entry.connection)
+                except Exception as e:
+                    with self._condition:
+                        self.health_check_failures += 1
+                    logger.warning(f"数据库连接检查失败，重新建立连接: {e}")
+                    self._close_quietly(entry.connection)
+                    entry = None
+        if entry is None:
+            entry = _PoolEntry(self.factory())
+            with self._condition:
+                self.created += 1
+        return entry
+
+    def release(self, connection, broken=False):
+        """
+        归还连接
+
+        Args:
+            connection: 底层连接
+            broken: 连接已损坏时为True，直接关闭
+        """
+        with self._condition:
+            entry = self._entries.pop(id(connection), None)
+        if entry is None:
+            return
+        if not broken and not self._closed and self.reset_on_return:
+            try:
+                connection.rollback()
+            except Exception:
+                broken = True
+        with self._condition:
+            close = broken or self._closed
+            if close:
+                entry = None
+            else:
+                entry.last_used = time.monotonic()
+            if self._waiters and not self._closed:
+                # 交给最早等待的线程，连接已关闭时让其新建连接
+                waiter = self._waiters.popleft()
+                waiter.entry = entry
+                waiter.ready = True
+                self._condition.notify_all()
+            elif close:
+                self._size -= 1
+                self._condition.notify_all()
+            else:
+                self._idle.append(entry)
+        if close:
+            self._close_quietly(connection)
+
+    def close_all(self):
+        """关闭所有空闲连接，借出的连接归还时关闭"""
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for entry in idle:
+            self._close_quietly(entry.connection)
+
+    def _close_quietly(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        """返回连接池使用情况和等待统计"""
+        with self._condition:
+            idle = len(self._idle)
+            size = self._size
+            return {
+                "max_size": self.max_size,
+                "size": size,
+                "idle": idle,
+                "in_use": size - idle,
+                "acquisitions": self.acquisitions,
+                "waits": self.waits,
+                "total_wait_ms": round(self.total_wait_time * 1000, 2),
+                "avg_wait_ms": round(self.total_wait_time / self.waits * 1000, 2) if self.waits else 0.0,
+                "max_wait_ms": round(self.max_wait_time * 1000, 2),
+                "timeouts": self.timeouts,
+                "created": self.created,
+                "recycled": self.recycled,
+                "health_check_failures": self.health_check_failures,
+                "reclaimed": self.reclaimed
+            }
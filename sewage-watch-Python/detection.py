@@ -6,9 +6,22 @@ import logging
 import numpy as np
 import threading
 import time
-from ultralytics import YOLO
 from pathlib import Path
 import json
+import multiprocessing
+import shutil
+import subprocess
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from model_registry import model_registry
+from postprocess import FrameDetections
+from video_sampling import FrameSampler, SAMPLE_AUTO
+from frame_store import delete_frame_range, insert_frames_bulk, insert_frames_row_by_row, offset_frames
+from job_queue import JOB_COMPLETED, JOB_RUNNING
+from image_writer import image_writer
+from tracker import ObjectTracker, summarize_tracks
+from motion_gate import GatedDetector, MotionGate, merge_gate_stats
+from frame_source import POLICY_BUFFER, frame_sources
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -27,154 +40,79 @@ class DetectionProcessor:
             history_path: 历史记录保存路径
             detect_types: 需要检测的物体类型列表，如果为None或包含'*'则检测所有类型
         """
+        self.model_path = model_path
         self.history_path = history_path
         self.detect_types = detect_types or ["bottle", "plastic", "trash", "bird"]
         
         # 确保历史记录目录存在
         os.makedirs(self.history_path, exist_ok=True)
         
-        # 初始化YOLO模型
+        # 从共享注册表获取YOLO模型
         try:
-            self.model = YOLO(model_path)
+            self.model = model_registry.get(model_path)
             logger.info(f"YOLO模型初始化成功: {model_path}")
         except Exception as e:
             logger.error(f"YOLO模型初始化失败: {e}")
             self.model = None
-
-class RTMPRecorder:
-    """
-    RTMP流录制器，负责将RTMP流录制为MP4文件
-    """
-    def __init__(self, rtmp_url, output_dir="temp_uploads", max_duration=3600):
-        """
-        初始化RTMP录制器
-        
-        Args:
-            rtmp_url: RTMP流地址
-            output_dir: 输出文件保存目录
-            max_duration: 最大录制时长(秒)
-        """
-        self.rtmp_url = rtmp_url
-        self.output_dir = output_dir
-        self.max_duration = max_duration
-        self.is_recording = False
-        self.cap = None
-        self.writer = None
-        self.output_file = None
-        self.start_time = None
-        
-        # 确保输出目录存在
-        os.makedirs(self.output_dir, exist_ok=True)
-        
-        # 配置日志
-        self.logger = logging.getLogger("RTMPRecorder")
     
-    def start_recording(self):
+    def process_image(self, image_path, save_result=True):
         """
-        开始录制RTMP流
+        处理单张图片
         
+        Args:
+            image_path: 图片路径
+            save_result: 是否保存检测结果
+            
         Returns:
-            str: 录制文件的路径
+            dict: 包含检测结果的字典
         """
         try:
-            if self.is_recording:
-                self.logger.warning("录制已经在进行中")
-                return self.output_file
-            
-            # 初始化视频捕获
-            self.cap = cv2.VideoCapture(self.rtmp_url, cv2.CAP_FFMPEG)
-            if not self.cap.isOpened():
-                raise ValueError(f"无法打开RTMP流: {self.rtmp_url}")
-            
-            # 获取视频属性
-            fps = self.cap.get(cv2.CAP_PROP_FPS)
-            width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            
-            # 生成输出文件名
-            now = datetime.datetime.now()
-            timestamp = now.strftime("%Y%m%d_%H%M%S")
-            unique_id = str(uuid.uuid4()).replace("-", "")[:8]
-            self.output_file = os.path.join(self.output_dir, f"rtmp_recording_{timestamp}_{unique_id}.mp4")
-            
-            # 定义编码器和创建VideoWriter对象
-            fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-            self.writer = cv2.VideoWriter(self.output_file, fourcc, fps, (width, height))
+            if self.model is None:
+                return {"success": False, "error": "模型未初始化"}
             
-            # 开始录制
-            self.is_recording = True
-            self.start_time = time.time()
-            self.logger.info(f"开始录制RTMP流到文件: {self.output_file}")
+            # 读取图片
+            image = cv2.imread(image_path)
+            if image is None:
+                return {"success": False, "error": f"无法读取图片: {image_path}"}
             
-            # 开始录制线程
-            self.recording_thread = threading.Thread(target=self._record_loop, daemon=True)
-            self.recording_thread.start()
+            return self.process_image_array(image, save_result)
             
-            return self.output_file
-        except Exception as e:
-            self.logger.error(f"启动录制失败: {str(e)}")
-            self.release()
-            return None
-    
-    def _record_loop(self):
-        """
-        录制循环，在单独线程中运行
-        """
-        try:
-            while self.is_recording and self.cap.isOpened():
-                # 检查是否超过最大录制时长
-                if time.time() - self.start_time > self.max_duration:
-                    self.logger.info(f"达到最大录制时长({self.max_duration}秒)，停止录制")
-                    self.stop_recording()
-                    break
-                
-                ret, frame = self.cap.read()
-                if not ret or frame is None:
-                    self.logger.warning("无法读取帧，可能是连接问题")
-                    # 短暂暂停避免CPU占用过高
-                    time.sleep(0.01)
-                    continue
-                
-                # 写入帧到文件
-                self.writer.write(frame)
-                
         except Exception as e:
-            self.logger.error(f"录制过程中出错: {str(e)}")
-        finally:
-            self.release()
+            logger.error(f"处理图片时出错: {e}")
+            return {"success": False, "error": str(e)}
     
-    def stop_recording(self):
+    def process_image_bytes(self, data, save_result=True):
         """
-        停止录制RTMP流
+        直接从内存中的编码数据处理图片，不经过临时文件
         
+        Args:
+            data: 图片文件的字节数据
+            save_result: 是否保存检测结果
+            
         Returns:
-            str: 录制文件的路径
-        """
-        self.is_recording = False
-        if hasattr(self, 'recording_thread') and self.recording_thread.is_alive():
-            self.recording_thread.join(timeout=2)
-        self.release()
-        self.logger.info(f"录制已停止，文件保存为: {self.output_file}")
-        return self.output_file
-    
-    def release(self):
-        """
-        释放资源
+            dict: 包含检测结果的字典
         """
-        if self.writer is not None:
-            self.writer.release()
-            self.writer = None
-        
-        if self.cap is not None:
-            self.cap.release()
-            self.cap = None
+        try:
+            if self.model is None:
+                return {"success": False, "error": "模型未初始化"}
+            
+            # 从缓冲区解码图片
+            image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                return {"success": False, "error": "无法解码图片数据"}
+            
+            return self.process_image_array(image, save_result)
+            
+        except Exception as e:
+            logger.error(f"处理图片时出错: {e}")
+            return {"success": False, "error": str(e)}
     
-    def process_image(self, image_path, save_result=True):
+    def process_image_array(self, image, save_result=True):
         """
-        处理单张图片
+        处理已解码的图片
         
         Args:
-            image_path: 图片路径
+            image: BGR格式的图片数组
             save_result: 是否保存检测结果
             
         Returns:
@@ -184,104 +122,118 @@ class RTMPRecorder:
             if self.model is None:
                 return {"success": False, "error": "模型未初始化"}
             
-            # 读取图片
-            image = cv2.imread(image_path)
-            if image is None:
-                return {"success": False, "error": f"无法读取图片: {image_path}"}
-            
             # 模型推理
             results = self.model(image, conf=0.4, iou=0.5)
-            result = results[0]  # 单帧结果
-            
-            # 修改检测结果中的bird标签为bottle
-            for box in result.boxes:
-                cls = int(box.cls)
-                if result.names[cls] == 'bird':
-                    result.names[cls] = 'bottle'
-            
-            # 检查是否需要记录所有类型
-            record_all_types = '*' in self.detect_types
-            
-            # 收集所有检测到的物体类型
-            all_detected_types = {}
-            for box in result.boxes:
-                cls = int(box.cls)
-                type_name = result.names[cls]
-                conf = float(box.conf)
-                
-                if type_name not in all_detected_types:
-                    all_detected_types[type_name] = {
-                        "count": 1,
-                        "confidence": [conf]
-                    }
-                else:
-                    all_detected_types[type_name]["count"] += 1
-                    all_detected_types[type_name]["confidence"].append(conf)
-            
-            # 确定需要记录的类型
-            detected_types_to_record = {}
-            if record_all_types and all_detected_types:
-                # 如果配置中有*且检测到物体，记录所有类型
-                detected_types_to_record = all_detected_types
-            else:
-                # 否则只记录配置中指定的类型
-                for box in result.boxes:
-                    cls = int(box.cls)
-                    type_name = result.names[cls]
-                    conf = float(box.conf)
-                    
-                    if type_name in self.detect_types:
-                        if type_name not in detected_types_to_record:
-                            detected_types_to_record[type_name] = {
-                                "count": 1,
-                                "confidence": [conf]
-                            }
-                        else:
-                            detected_types_to_record[type_name]["count"] += 1
-                            detected_types_to_record[type_name]["confidence"].append(conf)
-            
-            # 在原图上绘制边界框和标签
-            annotated_image = result.plot(
-                conf=True,  # 显示置信度
-                line_width=2,  # 边界框线条宽度
-                font_size=12  # 标签字体大小
-            )
-            
-            # 保存结果图片
-            result_path = None
-            if save_result and detected_types_to_record:
-                # 生成唯一文件名
-                now = datetime.datetime.now()
-                date_str = now.strftime("%Y%m%d_%H%M%S")
-                unique_id = str(uuid.uuid4()).replace("-", "")
-                filename = f"{date_str}_{unique_id}.jpg"
-                result_path = os.path.join(self.history_path, filename)
-                
-                # 保存图片
-                cv2.imwrite(result_path, annotated_image)
-                logger.info(f"已保存检测结果图片: {result_path}")
-            
-            # 计算每种类型的平均置信度
-            for type_name, data in all_detected_types.items():
-                data["avg_confidence"] = sum(data["confidence"]) / len(data["confidence"])
-                data["confidence"] = [round(c, 2) for c in data["confidence"]]
-            
-            # 准备返回结果
-            detection_result = {
-                "success": True,
-                "detected_objects": all_detected_types,
-                "total_detections": len(result.boxes),
-                "result_path": result_path,
-                "relative_path": f"/history/{Path(result_path).name}" if result_path else None
-            }
-            
-            return detection_result
+            return self._image_result(results[0], save_result)  # 单帧结果
             
         except Exception as e:
             logger.error(f"处理图片时出错: {e}")
             return {"success": False, "error": str(e)}
     
-    def process_video(self, video_path, save_frames=True, frame_interval=30):
+    def process_image_batch(self, images, save_result=True):
+        """
+        批量处理已解码的图片，所有图片在一次模型调用中完成推理
+        
+        Args:
+            images: BGR格式的图片数组列表
+            save_result: 是否保存检测结果
+            
+        Returns:
+            list: 与输入顺序一致的检测结果列表
+        """
+        if self.model is None:
+            return [{"success": False, "error": "模型未初始化"} for _ in images]
+        if not images:
+            return []
+        try:
+            results = self.model(list(images), conf=0.4, iou=0.5)
+        except Exception as e:
+            logger.error(f"批量推理图片时出错: {e}")
+            return [{"success": False, "error": str(e)} for _ in images]
+        
+        batch_results = []
+        pending_writes = []
+        for result in results:
+            try:
+                batch_results.append(self._image_result(result, save_result, pending_writes))
+            except Exception as e:
+                logger.error(f"处理图片时出错: {e}")
+                batch_results.append({"success": False, "error": str(e)})
+        # 整批图片并行写入，全部落盘后再返回
+        self._wait_for_writes(pending_writes)
+        return batch_results
+    
+    def _image_result(self, result, save_result=True, pending_writes=None):
+        """
+        根据单张图片的推理结果统计类型、保存标注图片并构建返回结果
+
+        传入pending_writes时图片写入的Future追加到该列表，由调用方统一等待，否则等待写入完成后返回
+        """
+        # 使用加载时构建的类别表，一次性完成标签重映射和类型统计
+        result.names = self.model.names
+        detections = FrameDetections(result.boxes, self.model.class_map)
+        
+        # 收集所有检测到的物体类型及置信度
+        all_detected_types = detections.type_stats()
+        
+        # 确定需要记录的类型（配置中包含*时记录所有类型）
+        detected_types_to_record = detections.counts(self.model.class_map.type_mask(self.detect_types))
+        
+        # 在原图上绘制边界框和标签
+        annotated_image = result.plot(
+            conf=True,  # 显示置信度
+            line_width=2,  # 边界框线条宽度
+            font_size=12  # 标签字体大小
+        )
+        
+        # 保存结果图片
+        result_path = None
+        write_future = None
+        if save_result and detected_types_to_record:
+            # 生成唯一文件名
+            now = datetime.datetime.now()
+            date_str = now.strftime("%Y%m%d_%H%M%S")
+            unique_id = str(uuid.uuid4()).replace("-", "")
+            filename = f"{date_str}_{unique_id}{image_writer.extension}"
+            result_path = os.path.join(self.history_path, filename)
+            
+            # 保存图片，队列满时等待，保证每张结果图片都会写入
+            write_future = image_writer.submit(annotated_image, result_path, block=True)
+        
+        # 计算每种类型的平均置信度
+        for type_name, data in all_detected_types.items():
+            data["avg_confidence"] = sum(data["confidence"]) / len(data["confidence"])
+            data["confidence"] = [round(c, 2) for c in data["confidence"]]
+        
+        # 准备返回结果
+        detection_result = {
+            "success": True,
+            "detected_objects": all_detected_types,
+            "total_detections": len(detections),
+            "result_path": result_path,
+            "relative_path": f"/history/{Path(result_path).name}" if result_path else None
+        }
+        
+        if write_future is not None:
+            if pending_writes is not None:
+                pending_writes.append((detection_result, write_future))
+            else:
+                self._wait_for_writes([(detection_result, write_future)])
+        return detection_result
+    
+    def _wait_for_writes(self, pending_writes):
+        """等待图片写入完成，写入失败的结果不再指向图片，避免数据库记录引用不存在的文件"""
+        for detection_result, future in pending_writes:
+            try:
+                future.result()
+                logger.info(f"已保存检测结果图片: {detection_result['result_path']}")
+            except Exception as e:
+                logger.error(f"保存检测结果图片失败: {e}")
+                detection_result["result_path"] = None
+                detection_result["relative_path"] = None
+    
+    def process_video(self, video_path, save_frames=True, frame_interval=30, sample_mode=SAMPLE_AUTO, sample_seconds=None,
+                      workers=1, progress_callback=None, cancel_event=None, motion_gate=None):
         """
         处理视频文件
         
@@ -289,6 +241,12 @@ class RTMPRecorder:
             video_path: 视频路径
             save_frames: 是否保存检测到物体的帧
             frame_interval: 处理帧的间隔（每隔多少帧处理一次）
+            sample_mode: 采样模式，read逐帧解码，grab跳过的帧不解码，seek直接定位，auto按间隔自动选择
+            sample_seconds: 按时间采样的间隔(秒)，如2表示每2秒一帧，设置后忽略frame_interval
+            workers: 并行分析的进程数，大于1时把视频按帧范围切分，每个进程使用独立的解码器和模型；启用motion_gate时忽略
+            progress_callback: 进度回调，参数为(已处理帧数, 总帧数)
+            cancel_event: 取消事件，设置后尽快停止分析并返回cancelled结果
+            motion_gate: MotionGate的参数字典，设置后画面变化不大的采样帧复用上一采样帧的检测结果
             
         Returns:
             dict: 包含检测结果的字典
@@ -306,130 +264,79 @@ class RTMPRecorder:
             fps = cap.get(cv2.CAP_PROP_FPS)
             frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
             duration = frame_count / fps if fps > 0 else 0
+            cap.release()
+            
+            # 分段分析，并行模式下各段在独立进程中执行
+            sample_options = {
+                "save_frames": save_frames,
+                "frame_interval": frame_interval,
+                "sample_mode": sample_mode,
+                "sample_seconds": sample_seconds,
+                "motion_gate": motion_gate
+            }
+            if workers > 1 and motion_gate:
+                # 门控的参考帧和刷新计时依赖之前所有的采样帧，分段后每段的第一帧都会强制推理，
+                # 结果与顺序分析不一致，启用门控时按顺序分析
+                logger.info(f"启用运动门控时按顺序分析视频，忽略进程数: {workers}")
+                workers = 1
+            if workers > 1 and frame_count > 0:
+                ranges = split_frame_ranges(frame_count, workers, frame_interval)
+                logger.info(f"并行分析视频: {video_path}, 进程数: {workers}, 分段: {ranges}")
+                partials = self._analyze_ranges_parallel(video_path, ranges, workers, sample_options, frame_count,
+                                                         progress_callback, cancel_event)
+            else:
+                range_progress = None
+                if progress_callback is not None:
+                    range_progress = lambda frames_scanned: progress_callback(frames_scanned, frame_count)
+                partials = [self.analyze_range(video_path, 0, None, progress_callback=range_progress,
+                                               cancel_event=cancel_event, **sample_options)]
             
-            # 初始化结果
+            if cancel_event is not None and cancel_event.is_set():
+                logger.info(f"视频分析已取消: {video_path}")
+                return {"success": False, "cancelled": True, "error": "分析已取消"}
+            
+            # 按帧顺序合并各段结果，与顺序分析的统计过程完全一致
             all_detected_types = {}
             saved_frames = []
             frame_index = 0
-            
-            # 处理视频帧
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-                
-                # 每隔frame_interval帧处理一次
-                if frame_index % frame_interval == 0:
-                    # 模型推理
-                    results = self.model(frame, conf=0.4, iou=0.5)
-                    result = results[0]  # 单帧结果
-                    
-                    # 修改检测结果中的bird标签为bottle
-                    for box in result.boxes:
-                        cls = int(box.cls)
-                        if result.names[cls] == 'bird':
-                            result.names[cls] = 'bottle'
-                    
-                    # 如果检测到物体
-                    if len(result.boxes) > 0:
-                        # 收集检测到的物体类型和位置信息
-                        frame_detected_types = {}
-                        frame_objects = []
-                        
-                        for box in result.boxes:
-                            cls = int(box.cls)
-                            type_name = result.names[cls]
-                            conf = float(box.conf)
-                            
-                            # 获取边界框坐标
-                            x1, y1, x2, y2 = box.xyxy[0].tolist()
-                            
-                            # 计算中心点坐标和尺寸
-                            center_x = (x1 + x2) / 2
-                            center_y = (y1 + y2) / 2
-                            width = x2 - x1
-                            height = y2 - y1
-                            
-                            # 记录物体详细信息
-                            object_info = {
-                                "type": type_name,
-                                "confidence": conf,
-                                "position": {
-                                    "x1": x1,
-                                    "y1": y1,
-                                    "x2": x2,
-                                    "y2": y2,
-                                    "center_x": center_x,
-                                    "center_y": center_y,
-                                    "width": width,
-                                    "height": height
-                                }
+            for partial in partials:
+                frame_index += partial["frames_scanned"]
+                saved_frames.extend(partial["saved_frames"])
+                for frame_type_stats in partial["frame_type_stats"]:
+                    for type_name, data in frame_type_stats.items():
+                        if type_name not in all_detected_types:
+                            all_detected_types[type_name] = {
+                                "count": data["count"],
+                                "confidence": list(data["confidence"]),
+                                "total_frames": 1
                             }
-                            frame_objects.append(object_info)
-                            
-                            # 更新全局统计
-                            if type_name not in all_detected_types:
-                                all_detected_types[type_name] = {
-                                    "count": 1,
-                                    "confidence": [conf],
-                                    "total_frames": 1
-                                }
-                            else:
-                                all_detected_types[type_name]["count"] += 1
-                                all_detected_types[type_name]["confidence"].append(conf)
-                                
-                            # 更新当前帧统计
-                            if type_name not in frame_detected_types:
-                                frame_detected_types[type_name] = 1
-                            else:
-                                frame_detected_types[type_name] += 1
-                        
-                        # 在原图上绘制边界框和标签
-                        annotated_frame = result.plot(
-                            conf=True,  # 显示置信度
-                            line_width=2,  # 边界框线条宽度
-                            font_size=12  # 标签字体大小
-                        )
-                        
-                        # 保存检测到物体的帧
-                        if save_frames:
-                            # 生成唯一文件名
-                            now = datetime.datetime.now()
-                            date_str = now.strftime("%Y%m%d_%H%M%S")
-                            unique_id = str(uuid.uuid4()).replace("-", "")
-                            frame_time = frame_index / fps if fps > 0 else 0
-                            filename = f"{date_str}_{unique_id}_frame{frame_index}_time{frame_time:.2f}.jpg"
-                            frame_path = os.path.join(self.history_path, filename)
-                            
-                            # 保存图片
-                            cv2.imwrite(frame_path, annotated_frame)
-                            
-                            # 记录保存的帧信息
-                            saved_frames.append({
-                                "frame_index": frame_index,
-                                "time": frame_time,
-                                "path": frame_path,
-                                "relative_path": f"/history/{Path(frame_path).name}",
-                                "detected_types": frame_detected_types,
-                                "objects": frame_objects,
-                                "total_objects": len(frame_objects)
-                            })
-                
-                frame_index += 1
-                
-                # 显示处理进度
-                if frame_index % 100 == 0:
-                    progress = frame_index / frame_count * 100 if frame_count > 0 else 0
-                    logger.info(f"视频处理进度: {progress:.2f}%")
-            
-            # 释放资源
-            cap.release()
+                        else:
+                            all_detected_types[type_name]["count"] += data["count"]
+                            all_detected_types[type_name]["confidence"].extend(data["confidence"])
             
             # 计算每种类型的平均置信度
             for type_name, data in all_detected_types.items():
                 data["avg_confidence"] = sum(data["confidence"]) / len(data["confidence"])
                 data["confidence"] = [round(c, 2) for c in data["confidence"]]
             
+            # 各段只记录采样帧的检测框，在这里按帧顺序用一个跟踪器统一跟踪，
+            # 轨迹、轨迹ID和唯一物体数与顺序分析完全一致，不依赖分段边界处的轨迹拼接
+            tracker = ObjectTracker(max_age=track_max_age(fps, frame_interval, sample_seconds))
+            frames_by_index = {frame["frame_index"]: frame for frame in saved_frames}
+            for partial in partials:
+                for sample_index, types, confidences, boxes, timestamp in partial["detections"]:
+                    track_ids = tracker.update(types, confidences, boxes, timestamp)
+                    frame = frames_by_index.get(sample_index)
+                    if frame is not None:
+                        for obj, track_id in zip(frame["objects"], track_ids.tolist()):
+                            obj["track_id"] = track_id if track_id >= 0 else None
+            tracks = tracker.tracks()
+            
+            # count为检测框次数，unique_count为跟踪得到的唯一物体数
+            for type_name, data in summarize_tracks(tracks).items():
+                if type_name in all_detected_types:
+                    all_detected_types[type_name].update(data)
+            
             # 生成结构化数据文件路径
             structured_data_path = None
             if saved_frames:
@@ -449,14 +356,15 @@ class RTMPRecorder:
                         "total_frames_with_detections": len(saved_frames),
                         "detection_summary": all_detected_types
                     },
-                    "frames": saved_frames
+                    "frames": saved_frames,
+                    "tracks": tracks
                 }
                 
                 # 保存结构化数据到JSON文件
                 with open(structured_data_path, 'w', encoding='utf-8') as f:
                     json.dump(structured_data, f, ensure_ascii=False, indent=2)
                 
-                self.logger.info(f"已保存结构化数据到: {structured_data_path}")
+                logger.info(f"已保存结构化数据到: {structured_data_path}")
             
             # 准备返回结果
             detection_result = {
@@ -470,6 +378,9 @@ class RTMPRecorder:
                 "detected_objects": all_detected_types,
                 "saved_frames": saved_frames,
                 "total_saved_frames": len(saved_frames),
+                "tracks": tracks,
+                "total_tracks": len(tracks),
+                "motion_gate": merge_gate_stats([partial["motion_gate"] for partial in partials]),
                 "structured_data_path": structured_data_path
             }
             
@@ -479,7 +390,241 @@ class RTMPRecorder:
             logger.error(f"处理视频时出错: {e}")
             return {"success": False, "error": str(e)}
     
-    def save_to_database(self, db_connector, detection_result, task_id=None):
+    def analyze_range(self, video_path, start_frame=0, end_frame=None, save_frames=True, frame_interval=30,
+                      sample_mode=SAMPLE_AUTO, sample_seconds=None, progress_callback=None, cancel_event=None,
+                      motion_gate=None):
+        """
+        分析视频的一个帧范围
+        
+        Args:
+            video_path: 视频路径
+            start_frame: 起始帧索引(包含)
+            end_frame: 结束帧索引(不包含)，None表示到视频结尾
+            save_frames: 是否保存检测到物体的帧
+            frame_interval: 处理帧的间隔，采样位置按整段视频对齐
+            sample_mode: 采样模式
+            sample_seconds: 按时间采样的间隔(秒)
+            progress_callback: 进度回调，参数为本范围内已遍历的帧数
+            cancel_event: 取消事件，每个采样帧检查一次
+            motion_gate: MotionGate的参数字典，为None时每个采样帧都推理
+            
+        Returns:
+            dict: 已遍历帧数、按帧顺序排列的各帧类型统计、保存的帧信息、各采样帧的检测框和门控统计，
+                  保存的帧中物体的track_id为None，由process_video按帧顺序统一跟踪后填入
+        """
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            raise ValueError(f"无法打开视频: {video_path}")
+        
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        range_end = end_frame if end_frame is not None else frame_count
+        range_frames = range_end - start_frame
+        
+        frame_type_stats_list = []
+        saved_frames = []
+        pending_writes = []
+        
+        # 只记录各采样帧的检测框，跟踪需要按整段视频的帧顺序进行，由process_video在合并时完成
+        detection_log = _DetectionLog()
+        
+        # 画面与上次推理的采样帧相比变化不大时复用其检测结果
+        detect = GatedDetector(lambda image: self.model(image, conf=0.4, iou=0.5)[0],
+                               MotionGate(**motion_gate) if motion_gate else None)
+        
+        try:
+            # 按采样模式遍历视频帧，跳过的帧不做完整解码
+            sampler = FrameSampler(cap, frame_interval=frame_interval, sample_seconds=sample_seconds, mode=sample_mode,
+                                   start_frame=start_frame, end_frame=end_frame)
+        except Exception:
+            cap.release()
+            raise
+        
+        try:
+            next_progress_frame = 100
+            for frame_index, frame in sampler:
+                if cancel_event is not None and cancel_event.is_set():
+                    break
+                
+                frame_type_stats, frame_info, future = self._analyze_frame(frame, frame_index, fps, detect,
+                                                                           detection_log, save_frames)
+                detection_log.frame_indexes.append(frame_index)
+                if frame_type_stats is not None:
+                    frame_type_stats_list.append(frame_type_stats)
+                if frame_info is not None:
+                    saved_frames.append(frame_info)
+                    pending_writes.append(future)
+                
+                # 显示处理进度
+                if sampler.frames_scanned >= next_progress_frame:
+                    next_progress_frame = (sampler.frames_scanned // 100 + 1) * 100
+                    progress = sampler.frames_scanned / range_frames * 100 if range_frames > 0 else 0
+                    logger.info(f"视频处理进度: {progress:.2f}% (帧 {start_frame}-{range_end})")
+                if progress_callback is not None:
+                    progress_callback(sampler.frames_scanned)
+        finally:
+            # 释放资源
+            cap.release()
+            # 等待本段所有帧写入完成，只返回已落盘的帧
+            written_frames = []
+            for frame_info, future in zip(saved_frames, pending_writes):
+                try:
+                    future.result()
+                    written_frames.append(frame_info)
+                except Exception as e:
+                    logger.error(f"保存视频帧失败: {frame_info['path']}, 错误: {e}")
+            saved_frames = written_frames
+        
+        return {
+            "start_frame": start_frame,
+            "frames_scanned": sampler.frames_scanned,
+            "frame_type_stats": frame_type_stats_list,
+            "saved_frames": saved_frames,
+            "detections": detection_log.samples(),
+            "motion_gate": detect.stats()
+        }
+    
+    def _analyze_frame(self, frame, frame_index, fps, detect, tracker, save_frames=True):
+        """
+        对一个采样帧推理、跟踪，检测到物体时绘制标注并提交后台写入
+        
+        Args:
+            frame: BGR帧，只读取，标注画在副本上
+            frame_index: 帧索引
+            fps: 视频帧率，用于计算帧时间
+            detect: GatedDetector实例
+            tracker: ObjectTracker实例，或只记录检测框的_DetectionLog
+            save_frames: 是否保存检测到物体的帧
+            
+        Returns:
+            tuple: (本帧的类型统计, 保存的帧信息, 写入的Future)，未检测到物体时均为None，不保存帧时后两项为None
+        """
+        # 模型推理，门控跳过时复用上次的单帧结果
+        result, _ = detect(frame, frame_index / fps if fps > 0 else frame_index)
+        
+        # 使用加载时构建的类别表，一次性完成标签重映射
+        result.names = self.model.names
+        detections = FrameDetections(result.boxes, self.model.class_map)
+        
+        # 没有检测到物体的帧也要更新，使离开画面的轨迹按时结束
+        track_ids = tracker.update(detections.types, detections.conf, detections.xyxy,
+                                   frame_index / fps if fps > 0 else frame_index)
+        
+        if len(detections) == 0:
+            return None, None, None
+        
+        # 批量计算检测到的物体类型和位置信息
+        frame_type_stats = detections.type_stats()
+        if not save_frames:
+            return frame_type_stats, None, None
+        frame_detected_types = {type_name: data["count"] for type_name, data in frame_type_stats.items()}
+        frame_objects = detections.objects()
+        for obj, track_id in zip(frame_objects, track_ids.tolist()):
+            obj["track_id"] = track_id if track_id >= 0 else None
+        
+        # 在原图的副本上绘制边界框和标签
+        annotated_frame = result.plot(
+            conf=True,  # 显示置信度
+            line_width=2,  # 边界框线条宽度
+            font_size=12,  # 标签字体大小
+            img=frame  # 复用的结果也画在当前帧上
+        )
+        
+        # 生成唯一文件名
+        now = datetime.datetime.now()
+        date_str = now.strftime("%Y%m%d_%H%M%S")
+        unique_id = str(uuid.uuid4()).replace("-", "")
+        frame_time = frame_index / fps if fps > 0 else 0
+        filename = f"{date_str}_{unique_id}_frame{frame_index}_time{frame_time:.2f}{image_writer.extension}"
+        frame_path = os.path.join(self.history_path, filename)
+        
+        # 提交后台写入，与后续帧的解码和推理重叠进行
+        future = image_writer.submit(annotated_frame, frame_path, block=True)
+        
+        # 记录保存的帧信息
+        frame_info = {
+            "frame_index": frame_index,
+            "time": frame_time,
+            "path": frame_path,
+            "relative_path": f"/history/{Path(frame_path).name}",
+            "detected_types": frame_detected_types,
+            "objects": frame_objects,
+            "total_objects": len(frame_objects)
+        }
+        return frame_type_stats, frame_info, future
+    
+    def _analyze_ranges_parallel(self, video_path, ranges, workers, sample_options, frame_count,
+                                 progress_callback=None, cancel_event=None):
+        """在进程池中分析各帧范围，按范围顺序返回结果，每完成一段汇报一次进度"""
+        # 使用spawn启动工作进程，避免fork继承主进程中已初始化的推理线程
+        context = multiprocessing.get_context("spawn")
+        # 线程事件不能跨进程，取消时转发给工作进程共享的进程事件
+        worker_cancel = context.Event()
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_range_worker,
+                                 initargs=(self.model_path, self.history_path, self.detect_types,
+                                           worker_cancel, image_writer.image_format, image_writer.quality)) as pool:
+            futures = [pool.submit(_analyze_range_in_worker, (video_path, start, end, sample_options))
+                       for start, end in ranges]
+            pending = set(futures)
+            frames_done = 0
+            while pending:
+                done, pending = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    frames_done += future.result()["frames_scanned"]
+                if done and progress_callback is not None:
+                    progress_callback(frames_done, frame_count)
+                if cancel_event is not None and cancel_event.is_set():
+                    worker_cancel.set()
+                    for future in pending:
+                        future.cancel()
+                    break
+            return [future.result() for future in futures if not future.cancelled()]
+    
+    def save_image_results(self, db_connector, detection_results, task_id=None):
+        """
+        在一个事务中保存多张图片的历史记录
+        
+        Args:
+            db_connector: 数据库连接器函数
+            detection_results: process_image_batch返回的检测结果列表
+            task_id: 关联的任务ID
+            
+        Returns:
+            int: 保存的记录数
+        """
+        now = datetime.datetime.now()
+        rows = [
+            (task_id, ",".join(result["detected_objects"].keys()), result["relative_path"], now)
+            for result in detection_results
+            if result.get("success", False) and result.get("relative_path") and result.get("detected_objects")
+        ]
+        if not rows:
+            logger.warning("没有检测到任何物体，不保存到数据库")
+            return 0
+        
+        connection = db_connector()
+        if not connection:
+            logger.error("无法保存历史记录，数据库连接失败")
+            return 0
+        try:
+            with connection.cursor() as cursor:
+                sql = """
+                INSERT INTO history (taskId, type, src, createdTime)
+                VALUES (%s, %s, %s, %s)
+                """
+                cursor.executemany(sql, rows)
+            connection.commit()
+            logger.info(f"已在一个事务中保存 {len(rows)} 条历史记录")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"批量保存历史记录时出错: {e}")
+            connection.rollback()
+            return 0
+        finally:
+            connection.close()
+    
+    def save_to_database(self, db_connector, detection_result, task_id=None, bulk=True, chunk_size=500,
+                         frame_offset=0, time_offset=0.0, frame_span=None):
         """
         将检测结果保存到数据库
         
@@ -487,6 +632,12 @@ class RTMPRecorder:
             db_connector: 数据库连接器函数
             detection_result: 检测结果
             task_id: 关联的任务ID
+            bulk: 视频帧和物体是否使用分块批量写入，False时逐行写入
+            chunk_size: 批量写入时每次提交的帧数
+            frame_offset: 视频帧索引的偏移，分段录制时各分段的帧写入同一任务
+            time_offset: 视频帧时间的偏移(秒)，分段录制时为分段的起始时间
+            frame_span: 设置时先删除任务中帧索引在[frame_offset, frame_offset + frame_span)内的旧帧，
+                重新分析同一分段时覆盖旧结果；分段的帧数不能超过该值
             
         Returns:
             bool: 是否成功保存
@@ -514,7 +665,8 @@ class RTMPRecorder:
                 # 保存到数据库
                 connection = db_connector()
                 if connection:
-                    with connection.cursor() as cursor:
+                    # 离开with时归还连接，出错时关闭连接
+                    with connection, connection.cursor() as cursor:
                         # 插入历史记录
                         sql = """
                         INSERT INTO history (taskId, type, src, createdTime)
@@ -524,7 +676,6 @@ class RTMPRecorder:
                         cursor.execute(sql, (task_id, types_str, image_path, now))
                         connection.commit()
                         logger.info(f"历史记录已保存: {types_str}, {image_path}")
-                    connection.close()
                     return True
                 else:
                     logger.error("无法保存历史记录，数据库连接失败")
@@ -537,6 +688,10 @@ class RTMPRecorder:
                 if not saved_frames:
                     logger.warning("没有保存任何视频帧，不保存到数据库")
                     return False
+                if frame_span is not None and max(frame["frame_index"] for frame in saved_frames) >= frame_span:
+                    logger.error(f"分段帧数超过帧索引范围 {frame_span}，不保存到数据库")
+                    return False
+                saved_frames = offset_frames(saved_frames, frame_offset, time_offset)
                 
                 # 保存到数据库
                 connection = db_connector()
@@ -558,55 +713,15 @@ class RTMPRecorder:
                                 task_id_value = cursor.lastrowid
                                 connection.commit()
                         
-                        # 批量插入帧记录
-                        frame_sql = """
-                        INSERT INTO video_frames (task_id, frame_index, time_seconds, image_path, detected_types, total_objects)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        """
+                        if frame_span is not None:
+                            delete_frame_range(connection, task_id_value, frame_offset, frame_offset + frame_span)
                         
-                        # 批量插入对象记录
-                        object_sql = """
-                        INSERT INTO detected_objects (frame_id, type, confidence, x1, y1, x2, y2, center_x, center_y, width, height)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """
-                        
-                        with connection.cursor() as cursor:
-                            for frame in saved_frames:
-                                # 插入帧记录
-                                detected_types = list(frame["detected_types"].keys())
-                                types_str = ",".join(detected_types)
-                                
-                                cursor.execute(frame_sql, (
-                                    task_id_value,
-                                    frame["frame_index"],
-                                    frame["time"],
-                                    frame["relative_path"],
-                                    types_str,
-                                    frame["total_objects"]
-                                ))
-                                
-                                frame_id = cursor.lastrowid
-                                
-                                # 插入对象记录
-                                for obj in frame["objects"]:
-                                    cursor.execute(object_sql, (
-                                        frame_id,
-                                        obj["type"],
-                                        obj["confidence"],
-                                        obj["position"]["x1"],
-                                        obj["position"]["y1"],
-                                        obj["position"]["x2"],
-                                        obj["position"]["y2"],
-                                        obj["position"]["center_x"],
-                                        obj["position"]["center_y"],
-                                        obj["position"]["width"],
-                                        obj["position"]["height"]
-                                    ))
-                                
-                                success_count += 1
-                            
-                            connection.commit()
-                            logger.info(f"成功保存 {success_count}/{len(saved_frames)} 个视频帧及其对象信息到数据库")
+                        # 写入帧和物体记录，批量模式分块提交
+                        if bulk:
+                            success_count = insert_frames_bulk(connection, task_id_value, saved_frames, chunk_size)
+                        else:
+                            success_count = insert_frames_row_by_row(connection, task_id_value, saved_frames)
+                        logger.info(f"成功保存 {success_count}/{len(saved_frames)} 个视频帧及其对象信息到数据库")
                         
                         # 如果有结构化数据文件，也记录下来
                         if detection_result.get("structured_data_path"):
@@ -637,4 +752,719 @@ class RTMPRecorder:
                 
         except Exception as e:
             logger.error(f"保存检测结果到数据库时出错: {e}")
-            return False
\ No newline at end of file
+            return False
+
+
+def split_frame_ranges(frame_count, parts, frame_interval=1):
+    """
+    把视频切分为若干连续帧范围，边界对齐到帧间隔
+    
+    Args:
+        frame_count: 视频总帧数
+        parts: 切分段数
+        frame_interval: 采样帧间隔，边界取其整数倍
+        
+    Returns:
+        list: [(起始帧, 结束帧)]，最后一段的结束帧为None表示到视频结尾
+    """
+    step = max(1, frame_interval)
+    boundaries = [0]
+    for i in range(1, parts):
+        boundary = (frame_count * i // parts) // step * step
+        if boundary > boundaries[-1]:
+            boundaries.append(boundary)
+    ranges = [(boundaries[i], boundaries[i + 1]) for i in range(len(boundaries) - 1)]
+    ranges.append((boundaries[-1], None))
+    return ranges
+
+class _DetectionLog:
+    """
+    与ObjectTracker.update接口相同，只按顺序记录各采样帧的检测框，不分配轨迹ID
+
+    分段分析在各自的进程中执行，轨迹需要按整段视频的帧顺序计算，各段先记录检测框，合并时再统一跟踪
+    """
+    def __init__(self):
+        self.frame_indexes = []
+        self._updates = []
+
+    def update(self, types, confidences, boxes, timestamp=None):
+        """记录一帧的检测框，返回全为-1的轨迹ID"""
+        self._updates.append((np.asarray(types, dtype=object), np.asarray(confidences, dtype=np.float64),
+                              np.asarray(boxes, dtype=np.float64).reshape(-1, 4), timestamp))
+        return np.full(len(self._updates[-1][0]), -1, dtype=np.int64)
+
+    def samples(self):
+        """返回[(帧索引, 类型, 置信度, 检测框, 时间)]"""
+        return [(frame_index,) + update for frame_index, update in zip(self.frame_indexes, self._updates)]
+
+def track_max_age(fps, frame_interval, sample_seconds=None):
+    """视频分析中轨迹的最长未匹配时间(秒)：至少1秒，且能容忍连续两个采样帧漏检"""
+    if sample_seconds:
+        interval = sample_seconds
+    else:
+        interval = frame_interval / fps if fps > 0 else frame_interval
+    return max(1.0, 3 * interval)
+
+# 并行分析工作进程中的检测处理器，每个进程初始化一次
+_worker_processor = None
+
+_worker_cancel_event = None
+
+def _init_range_worker(model_path, history_path, detect_types, cancel_event=None, image_format=None, image_quality=None):
+    """工作进程初始化：加载该进程独立的模型，图片格式与主进程一致"""
+    global _worker_processor, _worker_cancel_event
+    _worker_processor = DetectionProcessor(model_path=model_path, history_path=history_path, detect_types=detect_types)
+    _worker_cancel_event = cancel_event
+    image_writer.configure(image_format=image_format, quality=image_quality)
+
+def _analyze_range_in_worker(task):
+    """在工作进程中分析一个帧范围"""
+    video_path, start_frame, end_frame, sample_options = task
+    return _worker_processor.analyze_range(video_path, start_frame, end_frame, cancel_event=_worker_cancel_event,
+                                           **sample_options)
+
+# 录制方式：ffmpeg直接复制码流、OpenCV解码后重新编码，auto优先复制码流，不可用时回退
+RECORD_COPY = "copy"
+RECORD_OPENCV = "opencv"
+RECORD_AUTO = "auto"
+
+class RTMPRecorder:
+    """
+    RTMP流录制器，负责将RTMP流录制为MP4文件
+
+    默认通过ffmpeg子进程以-c copy把收到的H.264/AAC数据包直接封装进MP4，不解码也不重新编码；
+    找不到ffmpeg或ffmpeg启动失败时回退到OpenCV逐帧解码并用mp4v重新编码，
+    设置shared_capture后OpenCV方式从共享采集源取帧，与观看者和实时分析共用一次解码。
+    设置segment_seconds后按固定时长写入分段文件，每个分段关闭时调用on_segment
+    """
+    def __init__(self, rtmp_url, output_dir="temp_uploads", max_duration=3600, backend=RECORD_AUTO,
+                 ffmpeg_path="ffmpeg", startup_timeout=10, segment_seconds=0, on_segment=None,
+                 shared_capture=False, buffer_frames=90):
+        """
+        初始化RTMP录制器
+        
+        Args:
+            rtmp_url: RTMP流地址
+            output_dir: 输出文件保存目录
+            max_duration: 最大录制时长(秒)
+            backend: 录制方式，auto/copy/opencv
+            ffmpeg_path: ffmpeg可执行文件路径
+            startup_timeout: 等待ffmpeg连上流并开始写文件的最长时间(秒)
+            segment_seconds: 分段时长(秒)，0表示录制为单个文件；复制码流时只能在关键帧处分段，实际时长略有偏差
+            on_segment: 分段关闭时在录制线程中调用的函数，参数为{"index", "path", "start", "end"}
+            shared_capture: OpenCV方式是否从frame_sources的共享采集源取帧，而不是自己再解码一次
+            buffer_frames: 共享采集时录制队列最多缓冲的帧数，写入跟不上时丢弃新帧
+        """
+        if backend not in (RECORD_AUTO, RECORD_COPY, RECORD_OPENCV):
+            raise ValueError(f"不支持的录制方式: {backend}")
+        self.rtmp_url = rtmp_url
+        self.output_dir = output_dir
+        self.max_duration = max_duration
+        self.backend = backend
+        self.ffmpeg_path = ffmpeg_path
+        self.startup_timeout = startup_timeout
+        self.active_backend = None  # 实际使用的录制方式
+        self.is_recording = False
+        self.cap = None
+        self.shared_capture = shared_capture
+        self.buffer_frames = buffer_frames
+        self.source = None  # 共享采集源
+        self.consumer = None
+        self.writer = None
+        self.process = None
+        self.output_file = None  # 分段录制时为分段所在的目录
+        self.start_time = None
+        self.segment_seconds = segment_seconds if segment_seconds and segment_seconds > 0 else 0
+        self.on_segment = on_segment
+        self.segments = []
+        self._segment_lock = threading.RLock()
+        self._segment_list_offset = 0
+        self._segment_start = None
+        self._stderr_tail = []
+        
+        # 确保输出目录存在
+        os.makedirs(self.output_dir, exist_ok=True)
+        
+        # 配置日志
+        self.logger = logging.getLogger("RTMPRecorder")
+    
+    def start_recording(self):
+        """
+        开始录制RTMP流
+        
+        Returns:
+            str: 录制文件的路径
+        """
+        if self.is_recording:
+            self.logger.warning("录制已经在进行中")
+            return self.output_file
+        
+        # 生成输出文件名
+        now = datetime.datetime.now()
+        timestamp = now.strftime("%Y%m%d_%H%M%S")
+        unique_id = str(uuid.uuid4()).replace("-", "")[:8]
+        if self.segment_seconds:
+            self.output_file = os.path.join(self.output_dir, f"rtmp_recording_{timestamp}_{unique_id}")
+        else:
+            self.output_file = os.path.join(self.output_dir, f"rtmp_recording_{timestamp}_{unique_id}.mp4")
+        
+        if self.backend != RECORD_OPENCV:
+            if self._start_copy():
+                return self.output_file
+            if self.backend == RECORD_COPY:
+                return None
+            self.logger.warning("ffmpeg复制码流不可用，回退到OpenCV重新编码")
+        return self._start_opencv()
+    
+    def _start_copy(self):
+        """
+        启动ffmpeg子进程，把RTMP数据包直接复制到MP4
+        
+        Returns:
+            bool: ffmpeg是否已开始录制
+        """
+        ffmpeg = shutil.which(self.ffmpeg_path)
+        if ffmpeg is None:
+            self.logger.warning(f"找不到ffmpeg: {self.ffmpeg_path}")
+            return False
+        
+        command = [
+            ffmpeg, "-hide_banner", "-nostats", "-loglevel", "error",
+            "-i", self.rtmp_url,
+            # 只复制视频和(存在时)音频，不解码不重新编码
+            "-map", "0:v", "-map", "0:a?", "-c", "copy",
+            "-t", str(self.max_duration)
+        ]
+        if self.segment_seconds:
+            # 分段关闭时ffmpeg向列表追加一行"文件名,起始时间,结束时间"
+            os.makedirs(self.output_file, exist_ok=True)
+            self._segment_list_offset = 0
+            first_output = self._segment_path(0)
+            command += [
+                "-f", "segment", "-segment_time", str(self.segment_seconds), "-reset_timestamps", "1",
+                "-segment_format", "mp4", "-segment_format_options", "movflags=+faststart",
+                "-segment_list", self._segment_list_path, "-segment_list_type", "csv",
+                "-y", os.path.join(self.output_file, "segment_%05d.mp4")
+            ]
+        else:
+            first_output = self.output_file
+            command += ["-movflags", "+faststart", "-y", self.output_file]
+        try:
+            self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                            stderr=subprocess.PIPE)
+        except OSError as e:
+            self.logger.error(f"启动ffmpeg失败: {e}")
+            self.process = None
+            return False
+        
+        self._stderr_tail = []
+        self.is_recording = True
+        self.start_time = time.time()
+        self.active_backend = RECORD_COPY
+        self.recording_thread = threading.Thread(target=self._watch_process, daemon=True)
+        self.recording_thread.start()
+        
+        # 等待ffmpeg连上流并创建输出文件，期间退出说明流无法打开，超时仍未创建文件也视为启动失败
+        deadline = time.time() + self.startup_timeout
+        while not os.path.exists(first_output):
+            if self.process.poll() is not None:
+                self.recording_thread.join(timeout=1)
+                self.logger.error(f"ffmpeg录制启动失败，退出码 {self.process.returncode}: "
+                                  f"{' '.join(self._stderr_tail[-3:])}")
+                self._abort_copy()
+                return False
+            if time.time() >= deadline:
+                self.logger.error(f"ffmpeg在{self.startup_timeout}秒内未开始写入文件，停止复制码流录制: "
+                                  f"{' '.join(self._stderr_tail[-3:])}")
+                self._abort_copy()
+                return False
+            time.sleep(0.1)
+        
+        if self.segment_seconds:
+            self.segment_thread = threading.Thread(target=self._poll_segment_list, daemon=True)
+            self.segment_thread.start()
+        self.logger.info(f"开始录制RTMP流到文件(复制码流): {self.output_file}")
+        return True
+    
+    def _abort_copy(self):
+        """ffmpeg启动失败时停止进程并删除已创建的输出，以便回退到OpenCV"""
+        self.is_recording = False
+        self.active_backend = None
+        # 尚未开始写文件，不需要等ffmpeg写完MP4索引，直接结束进程
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.release()
+        self.recording_thread.join(timeout=1)
+        if os.path.isdir(self.output_file):
+            shutil.rmtree(self.output_file, ignore_errors=True)
+        elif os.path.exists(self.output_file):
+            os.unlink(self.output_file)
+    
+    @property
+    def _segment_list_path(self):
+        """ffmpeg写入的分段列表"""
+        return os.path.join(self.output_file, "segment_list.csv")
+    
+    def _segment_path(self, number):
+        """第number个分段的文件路径"""
+        return os.path.join(self.output_file, f"segment_{number:05d}.mp4")
+    
+    def _poll_segment_list(self):
+        """ffmpeg运行期间定期读取分段列表，进程退出后再读取一次最后的分段"""
+        process = self.process
+        while process is not None and process.poll() is None:
+            self._read_segment_list()
+            time.sleep(0.5)
+        self._read_segment_list()
+    
+    def _read_segment_list(self):
+        """读取分段列表中新增的完整行，逐个通知分段关闭"""
+        with self._segment_lock:
+            if not os.path.exists(self._segment_list_path):
+                return
+            with open(self._segment_list_path, "rb") as f:
+                f.seek(self._segment_list_offset)
+                data = f.read()
+            # 最后一行可能尚未写完，只处理以换行结尾的部分
+            complete = data[:data.rfind(b"\n") + 1]
+            self._segment_list_offset += len(complete)
+            for line in complete.decode("utf-8", errors="replace").splitlines():
+                parts = line.strip().rsplit(",", 2)
+                if len(parts) != 3:
+                    continue
+                name, start, end = parts
+                self._segment_closed(os.path.join(self.output_file, name.strip('"')), float(start), float(end))
+    
+    def _segment_closed(self, path, start, end):
+        """记录已关闭的分段并通知调用方"""
+        with self._segment_lock:
+            segment = {"index": len(self.segments), "path": path, "start": start, "end": end}
+            self.segments.append(segment)
+            self.logger.info(f"分段已关闭: {path} ({start:.1f}-{end:.1f}秒)")
+            if self.on_segment is not None:
+                try:
+                    self.on_segment(segment)
+                except Exception as e:
+                    self.logger.error(f"处理分段时出错: {path}, 错误: {e}")
+    
+    def _watch_process(self):
+        """
+        读取ffmpeg的错误输出，进程退出(如达到最大录制时长)时结束录制状态
+        """
+        process = self.process
+        try:
+            for line in iter(process.stderr.readline, b""):
+                line = line.decode("utf-8", errors="replace").strip()
+                if line:
+                    self._stderr_tail = (self._stderr_tail + [line])[-20:]
+                    self.logger.warning(f"ffmpeg: {line}")
+        except (ValueError, OSError):
+            # 释放资源时错误输出已关闭
+            pass
+        process.wait()
+        if self.is_recording and time.time() - self.start_time >= self.max_duration:
+            self.logger.info(f"达到最大录制时长({self.max_duration}秒)，停止录制")
+        self.is_recording = False
+    
+    def _start_opencv(self):
+        """
+        使用OpenCV解码并以mp4v重新编码录制
+        
+        Returns:
+            str: 录制文件的路径，失败时返回None
+        """
+        try:
+            if self.shared_capture:
+                # 从共享采集源取帧，有界缓冲保证写入短暂变慢时不丢帧
+                self.source = frame_sources.acquire(self.rtmp_url)
+                if self.source is None:
+                    raise ValueError(f"无法打开RTMP流: {self.rtmp_url}")
+                self.consumer = self.source.add_consumer("recorder", POLICY_BUFFER, max_size=self.buffer_frames)
+                fps, width, height = self.source.fps, self.source.width, self.source.height
+            else:
+                # 初始化视频捕获
+                self.cap = cv2.VideoCapture(self.rtmp_url, cv2.CAP_FFMPEG)
+                if not self.cap.isOpened():
+                    raise ValueError(f"无法打开RTMP流: {self.rtmp_url}")
+                
+                # 获取视频属性
+                fps = self.cap.get(cv2.CAP_PROP_FPS)
+                width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            
+            # 定义编码器和创建VideoWriter对象
+            self._writer_args = (cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+            if self.segment_seconds:
+                os.makedirs(self.output_file, exist_ok=True)
+                self.writer = cv2.VideoWriter(self._segment_path(0), *self._writer_args)
+            else:
+                self.writer = cv2.VideoWriter(self.output_file, *self._writer_args)
+            
+            # 开始录制
+            self.is_recording = True
+            self.start_time = time.time()
+            self._segment_start = self.start_time
+            self.active_backend = RECORD_OPENCV
+            self.logger.info(f"开始录制RTMP流到文件(重新编码{', 共享采集' if self.source else ''}): {self.output_file}")
+            
+            # 开始录制线程
+            self.recording_thread = threading.Thread(target=self._record_loop, daemon=True)
+            self.recording_thread.start()
+            
+            return self.output_file
+        except Exception as e:
+            self.logger.error(f"启动录制失败: {str(e)}")
+            self.release()
+            return None
+    
+    def _record_loop(self):
+        """
+        录制循环，在单独线程中运行
+        """
+        try:
+            while self.is_recording and (self.consumer is not None or self.cap.isOpened()):
+                # 检查是否超过最大录制时长
+                if time.time() - self.start_time > self.max_duration:
+                    self.logger.info(f"达到最大录制时长({self.max_duration}秒)，停止录制")
+                    self.stop_recording()
+                    break
+                
+                if self.consumer is not None:
+                    # 共享采集源负责重连，这里只等待下一帧
+                    item = self.consumer.get(timeout=0.5)
+                    if item is None:
+                        if self.consumer.closed:
+                            self.logger.warning("共享采集源已停止")
+                            break
+                        continue
+                    ret, frame = True, item[0]
+                else:
+                    ret, frame = self.cap.read()
+                if not ret or frame is None:
+                    self.logger.warning("无法读取帧，可能是连接问题")
+                    # 短暂暂停避免CPU占用过高
+                    time.sleep(0.01)
+                    continue
+                
+                # 写入帧到文件
+                self.writer.write(frame)
+                
+                # 分段录制时到达分段时长后换到下一个文件
+                if self.segment_seconds and time.time() - self._segment_start >= self.segment_seconds:
+                    self._rotate_writer()
+                
+        except Exception as e:
+            self.logger.error(f"录制过程中出错: {str(e)}")
+        finally:
+            self.release()
+    
+    def _rotate_writer(self):
+        """关闭当前分段并打开下一个分段文件"""
+        with self._segment_lock:
+            if self.writer is None:
+                return
+            self.writer.release()
+            now = time.time()
+            self._segment_closed(self._segment_path(len(self.segments)), self._segment_start - self.start_time,
+                                 now - self.start_time)
+            self._segment_start = now
+            self.writer = cv2.VideoWriter(self._segment_path(len(self.segments)), *self._writer_args)
+    
+    def stop_recording(self):
+        """
+        停止录制RTMP流，分段录制时只需结束最后一个分段
+        
+        Returns:
+            str: 录制文件的路径，分段录制时为分段目录
+        """
+        self.is_recording = False
+        self._stop_process()
+        current = threading.current_thread()
+        for name in ('recording_thread', 'segment_thread'):
+            thread = getattr(self, name, None)
+            if thread is not None and thread.is_alive() and thread is not current:
+                thread.join(timeout=2)
+        if self.segment_seconds and self.active_backend == RECORD_COPY:
+            # 读取进程退出时写入的最后一个分段
+            self._read_segment_list()
+        self.release()
+        self.logger.info(f"录制已停止，文件保存为: {self.output_file}")
+        return self.output_file
+    
+    def _stop_process(self, timeout=10):
+        """
+        让ffmpeg正常结束以写完MP4索引，超时后强制结束
+        """
+        process = self.process
+        if process is None or process.poll() is not None:
+            return
+        try:
+            # ffmpeg从标准输入读到q后停止读流并写完文件
+            process.stdin.write(b"q")
+            process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            self.logger.warning("ffmpeg未在超时内结束，强制终止")
+            process.terminate()
+            try:
+                process.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    
+    def release(self):
+        """
+        释放资源
+        """
+        if self.process is not None:
+            self._stop_process()
+            for stream in (self.process.stdin, self.process.stderr):
+                if stream is not None:
+                    try:
+                        stream.close()
+                    except OSError:
+                        pass
+            self.process = None
+        
+        with self._segment_lock:
+            if self.writer is not None:
+                self.writer.release()
+                self.writer = None
+                if self.segment_seconds and self.start_time is not None:
+                    now = time.time()
+                    self._segment_closed(self._segment_path(len(self.segments)),
+                                         self._segment_start - self.start_time, now - self.start_time)
+        
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        
+        # 录制线程结束和停止录制都会调用，只释放一次共享采集源的引用
+        with self._segment_lock:
+            source, consumer = self.source, self.consumer
+            self.source = self.consumer = None
+        if source is not None:
+            source.remove_consumer(consumer)
+            frame_sources.release(self.rtmp_url)
+
+class LiveAnalyzer:
+    """
+    录制过程中的实时分析：从共享采集源按帧间隔取采样帧，与观看者和录制器共用一次解码，
+    检测到物体的帧边分析边写入video_frames/detected_objects，录制结束后不必重新读取视频
+    """
+    def __init__(self, processor, rtmp_url, db_connector=None, frame_interval=30, sample_seconds=None,
+                 motion_gate=None, buffer_frames=16, flush_interval=5.0):
+        """
+        初始化实时分析
+        
+        Args:
+            processor: DetectionProcessor实例
+            rtmp_url: RTMP流地址
+            db_connector: 返回数据库连接的函数，为None时只统计不写库
+            frame_interval: 每隔多少个源帧分析一帧
+            sample_seconds: 按时间采样的间隔(秒)，设置后按采集源帧率换算并忽略frame_interval
+            motion_gate: MotionGate的参数字典，为None时每个采样帧都推理
+            buffer_frames: 采样帧队列的长度，推理跟不上时丢弃新的采样帧
+            flush_interval: 写入数据库的间隔(秒)
+        """
+        self.processor = processor
+        self.rtmp_url = rtmp_url
+        self.db_connector = db_connector
+        self.frame_interval = max(1, int(frame_interval))
+        self.sample_seconds = sample_seconds
+        self.motion_gate = motion_gate
+        self.buffer_frames = buffer_frames
+        self.flush_interval = flush_interval
+        self.task_id = None  # analysis_tasks的主键
+        self.source = None
+        self.consumer = None
+        self.thread = None
+        self.fps = 0.0
+        self.tracker = None
+        self.detect = None
+        self._pending = []  # (帧信息, 写入的Future)
+        self._detected = {}
+        self.start_time = None
+        
+        # 统计信息
+        self.frames_analyzed = 0
+        self.frames_saved = 0
+        self.frames_stored = 0
+    
+    def start(self):
+        """
+        获取共享采集源并启动分析线程
+        
+        Returns:
+            bool: 是否启动成功
+        """
+        self.source = frame_sources.acquire(self.rtmp_url)
+        if self.source is None:
+            logger.error(f"实时分析无法打开RTMP流: {self.rtmp_url}")
+            return False
+        self.fps = self.source.fps
+        if self.sample_seconds:
+            self.frame_interval = max(1, round(self.sample_seconds * self.fps))
+        self.tracker = ObjectTracker(max_age=track_max_age(self.fps, self.frame_interval))
+        self.detect = GatedDetector(lambda image: self.processor.model(image, conf=0.4, iou=0.5)[0],
+                                    MotionGate(**self.motion_gate) if self.motion_gate else None)
+        self.consumer = self.source.add_consumer("analysis", POLICY_BUFFER, max_size=self.buffer_frames,
+                                                 sample_interval=self.frame_interval)
+        self.start_time = datetime.datetime.now()
+        self.task_id = self._create_task_record()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info(f"实时分析已启动: {self.rtmp_url}, 帧间隔: {self.frame_interval}, 任务ID: {self.task_id}")
+        return True
+    
+    def _run(self):
+        """分析线程：逐个处理采样帧，按间隔把已写入图片的帧写入数据库"""
+        last_flush = time.time()
+        while True:
+            item = self.consumer.get(timeout=0.5)
+            if item is None and self.consumer.closed:
+                break
+            if item is not None:
+                frame, _, frame_index = item
+                try:
+                    frame_type_stats, frame_info, future = self.processor._analyze_frame(
+                        frame, frame_index, self.fps, self.detect, self.tracker)
+                    self.frames_analyzed += 1
+                    if frame_type_stats is not None:
+                        for type_name, data in frame_type_stats.items():
+                            merged = self._detected.setdefault(type_name, {"count": 0, "confidence_sum": 0.0})
+                            merged["count"] += data["count"]
+                            merged["confidence_sum"] += sum(data["confidence"])
+                    if frame_info is not None:
+                        self._pending.append((frame_info, future))
+                except Exception as e:
+                    logger.error(f"实时分析处理帧时出错: {e}")
+            if time.time() - last_flush >= self.flush_interval:
+                self._flush()
+                last_flush = time.time()
+        self._flush()
+    
+    def _flush(self):
+        """等待待写入帧的图片落盘，把成功落盘的帧和物体批量写入数据库"""
+        pending, self._pending = self._pending, []
+        written = []
+        for frame_info, future in pending:
+            try:
+                future.result()
+                written.append(frame_info)
+            except Exception as e:
+                logger.error(f"保存视频帧失败: {frame_info['path']}, 错误: {e}")
+        self.frames_saved += len(written)
+        if not written or self.task_id is None:
+            return
+        connection = self.db_connector()
+        if not connection:
+            logger.error("无法写入实时分析的视频帧，数据库连接失败")
+            return
+        try:
+            self.frames_stored += insert_frames_bulk(connection, self.task_id, written)
+            self._update_task_record(connection, JOB_RUNNING)
+        except Exception as e:
+            logger.error(f"写入实时分析的视频帧失败: {e}")
+            connection.rollback()
+        finally:
+            connection.close()
+    
+    def _create_task_record(self):
+        """插入running状态的analysis_tasks记录，返回任务ID"""
+        if self.db_connector is None:
+            return None
+        connection = self.db_connector()
+        if not connection:
+            logger.error("无法创建实时分析任务记录，数据库连接失败")
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO analysis_tasks (source_video, start_time, status) VALUES (%s, %s, %s)",
+                    (self.rtmp_url[-255:], self.start_time, JOB_RUNNING)
+                )
+                task_id = cursor.lastrowid
+            connection.commit()
+            return task_id
+        except Exception as e:
+            logger.error(f"创建实时分析任务记录失败: {e}")
+            connection.rollback()
+            return None
+        finally:
+            connection.close()
+    
+    def _update_task_record(self, connection, status, end_time=None):
+        """把状态、已解码帧数和已分析帧数写回analysis_tasks表"""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE analysis_tasks SET status = %s, total_frames = %s, frames_processed = %s, end_time = %s
+                WHERE id = %s
+                """,
+                (status, self.source.frames_decoded if self.source else 0, self.frames_analyzed, end_time,
+                 self.task_id)
+            )
+        connection.commit()
+    
+    def stop(self):
+        """
+        停止接收新帧，分析完已排队的采样帧并写入数据库后释放共享采集源
+        
+        Returns:
+            dict: 实时分析的统计
+        """
+        if self.consumer is not None:
+            self.consumer.close()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        summary = self.summary()
+        if self.task_id is not None:
+            connection = self.db_connector()
+            if connection:
+                try:
+                    self._update_task_record(connection, JOB_COMPLETED, datetime.datetime.now())
+                except Exception as e:
+                    logger.error(f"更新实时分析任务记录失败: {self.task_id}, 错误: {e}")
+                    connection.rollback()
+                finally:
+                    connection.close()
+        if self.source is not None:
+            self.source.remove_consumer(self.consumer)
+            frame_sources.release(self.rtmp_url)
+            self.source = None
+        logger.info(f"实时分析已停止: {self.rtmp_url}, 分析 {summary['frames_analyzed']} 帧, "
+                    f"保存 {summary['total_saved_frames']} 帧")
+        return summary
+    
+    def summary(self):
+        """返回已分析帧数、保存帧数、采样帧丢弃数和按类型的检测统计"""
+        tracks = self.tracker.tracks() if self.tracker else []
+        unique = summarize_tracks(tracks)
+        detected = {
+            type_name: {
+                "count": data["count"],
+                "unique_count": unique.get(type_name, {}).get("unique_count", 0),
+                "avg_confidence": round(data["confidence_sum"] / data["count"], 4) if data["count"] else 0.0
+            }
+            for type_name, data in list(self._detected.items())
+        }
+        return {
+            "task_id": self.task_id,
+            "frame_interval": self.frame_interval,
+            "frames_analyzed": self.frames_analyzed,
+            "frames_dropped": self.consumer.frames_dropped if self.consumer else 0,
+            "total_saved_frames": self.frames_saved,
+            "frames_stored": self.frames_stored,
+            "total_tracks": len(tracks),
+            "detected_objects": detected,
+            "motion_gate": self.detect.stats() if self.detect else None
+        }
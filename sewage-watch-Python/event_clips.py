@@ -0,0 +1,398 @@
+import datetime
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CLIP_INSERT_SQL = """
+INSERT INTO event_clips (stream_url, type, image_src, clip_src, start_time, end_time, frames, size_bytes)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+class ClipRing:
+    """
+    最近一段时间的已编码帧，按时长和总字节数两个上限淘汰最旧的帧，单路流占用的内存不超过max_bytes
+    """
+    def __init__(self, max_seconds=10.0, max_bytes=32 * 1024 * 1024):
+        """
+        Args:
+            max_seconds: 保留的时长(秒)
+            max_bytes: 保留的JPEG总字节数上限
+        """
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self._frames = deque()  # (时间戳, JPEG字节)
+        self.bytes = 0
+
+        # 统计信息
+        self.evicted = 0
+
+    def append(self, timestamp, jpeg):
+        """加入一帧并淘汰超出时长或字节上限的旧帧"""
+        self._frames.append((timestamp, jpeg))
+        self.bytes += len(jpeg)
+        while self._frames and (self.bytes > self.max_bytes or timestamp - self._frames[0][0] > self.max_seconds):
+            self.bytes -= len(self._frames.popleft()[1])
+            self.evicted += 1
+
+    def since(self, timestamp):
+        """返回不早于timestamp的帧，按时间排列"""
+        return [item for item in self._frames if item[0] >= timestamp]
+
+    def clear(self):
+        self._frames.clear()
+        self.bytes = 0
+
+    def __len__(self):
+        return len(self._frames)
+
+class EventClipRecorder:
+    """
+    单路流的检测事件片段：环形缓冲最近的已编码帧，检测事件触发时取pre_roll内的帧，
+    继续收集post_roll内的帧后交给clip_writer在后台写成视频；片段收集期间再次触发时延长结束时间
+    """
+    def __init__(self, stream_url, writer=None, pre_roll=10.0, post_roll=10.0, max_bytes=32 * 1024 * 1024,
+                 max_clip_seconds=60.0):
+        """
+        初始化事件片段录制
+
+        Args:
+            stream_url: 流地址，记录到数据库
+            writer: ClipWriter实例，默认为全局的clip_writer
+            pre_roll: 事件前保留的时长(秒)
+            post_roll: 事件后继续收集的时长(秒)
+            max_bytes: 环形缓冲和收集中的片段各自的字节数上限，单路流内存不超过其2倍
+            max_clip_seconds: 连续触发时片段的最长时长(秒)，到达后结束当前片段，之后的触发开始新片段
+        """
+        self.stream_url = stream_url
+        self.writer = writer if writer is not None else clip_writer
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.max_bytes = max_bytes
+        self.max_clip_seconds = max_clip_seconds
+        self.ring = ClipRing(pre_roll, max_bytes)
+        self._clip = None  # 收集中的片段
+        self._lock = threading.Lock()
+        self._first_frame_time = None
+        self._last_frame_time = None
+
+        # 统计信息
+        self.events = 0
+        self.clips_started = 0
+        self.clip_frames_dropped = 0
+
+    def add_frame(self, jpeg, timestamp=None):
+        """
+        处理线程每产出一帧调用一次，只保存编码后字节的引用
+
+        Args:
+            jpeg: 该帧的JPEG字节
+            timestamp: 采集时间戳(time.time())
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        finished = None
+        with self._lock:
+            if self._first_frame_time is None:
+                self._first_frame_time = timestamp
+            self._last_frame_time = timestamp
+            self.ring.append(timestamp, jpeg)
+            clip = self._clip
+            if clip is not None:
+                if clip["bytes"] + len(jpeg) <= self.max_bytes:
+                    clip["frames"].append((timestamp, jpeg))
+                    clip["bytes"] += len(jpeg)
+                else:
+                    self.clip_frames_dropped += 1
+                if timestamp >= clip["end"]:
+                    finished, self._clip = clip, None
+        if finished is not None:
+            self._submit(finished)
+
+    def trigger(self, types_str, image_src=None, timestamp=None):
+        """
+        检测事件触发，开始收集新片段，或延长收集中的片段
+
+        Args:
+            types_str: 事件的物体类型，用逗号分隔
+            image_src: 该事件保存的标注图片的相对路径(history.src)，用于在数据库中关联
+            timestamp: 事件时间，默认为当前时间
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            self.events += 1
+            clip = self._clip
+            if clip is not None and timestamp + self.post_roll - clip["start"] <= self.max_clip_seconds:
+                clip["end"] = timestamp + self.post_roll
+                clip["types"].update(filter(None, types_str.split(",")))
+                if image_src:
+                    clip["images"].append(image_src)
+                return
+            finished = clip
+            frames = self.ring.since(timestamp - self.pre_roll)
+            self._clip = {
+                "start": frames[0][0] if frames else timestamp,
+                "end": timestamp + self.post_roll,
+                "frames": frames,
+                "bytes": sum(len(jpeg) for _, jpeg in frames),
+                "types": set(filter(None, types_str.split(","))),
+                "images": [image_src] if image_src else []
+            }
+            self.clips_started += 1
+        if finished is not None:
+            self._submit(finished)
+
+    def close(self):
+        """流停止时提交收集中的片段(只包含已收到的帧)并释放缓冲"""
+        with self._lock:
+            clip, self._clip = self._clip, None
+            self.ring.clear()
+            stream_seconds = (self._last_frame_time - self._first_frame_time) if self._first_frame_time else 0.0
+            self._first_frame_time = self._last_frame_time = None
+        if clip is not None:
+            self._submit(clip)
+        self.writer.record_stream_seconds(stream_seconds)
+
+    def _submit(self, clip):
+        """把收集完的片段交给后台写入"""
+        if not clip["frames"]:
+            return
+        self.writer.submit(self.stream_url, clip["frames"], ",".join(sorted(clip["types"])), clip["images"])
+
+    def stats(self):
+        """返回缓冲占用、事件数、片段数，以及相对全程录制估算节省的字节数"""
+        with self._lock:
+            stream_seconds = (self._last_frame_time - self._first_frame_time) if self._first_frame_time else 0.0
+            return {
+                "pre_roll": self.pre_roll,
+                "post_roll": self.post_roll,
+                "buffer_frames": len(self.ring),
+                "buffer_bytes": self.ring.bytes,
+                "max_buffer_bytes": self.max_bytes,
+                "collecting": self._clip is not None,
+                "events": self.events,
+                "clips_started": self.clips_started,
+                "clip_frames_dropped": self.clip_frames_dropped,
+                "stream_seconds": round(stream_seconds, 1)
+            }
+
+class ClipWriter:
+    """
+    事件片段的后台写入器：在单独的线程中解码JPEG并写成MP4，先写临时文件再重命名，
+    写入成功后在event_clips表中记录片段，并通过image_src关联history中的标注图片
+    """
+    def __init__(self, output_dir="../history/clips", url_prefix="/history/clips/", db_connector=None,
+                 max_workers=1, max_pending=4):
+        """
+        初始化写入器
+
+        Args:
+            output_dir: 片段保存目录
+            url_prefix: 数据库中记录的片段路径前缀
+            db_connector: 返回数据库连接的函数，为None时只写文件
+            max_workers: 写入线程数
+            max_pending: 等待写入的最大片段数，超过时丢弃新片段，待写片段占用的内存不超过其与单个片段上限之积
+        """
+        self.output_dir = output_dir
+        self.url_prefix = url_prefix
+        self.db_connector = db_connector
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.submitted = 0
+        self.clips_written = 0
+        self.failed = 0
+        self.overflow = 0
+        self.frames_written = 0
+        self.bytes_written = 0
+        self.seconds_written = 0.0
+        self.total_write_time = 0.0
+        self.stream_seconds = 0.0  # 已结束的流的总运行时长
+
+    def configure(self, output_dir=None, url_prefix=None, db_connector=None, max_workers=None, max_pending=None):
+        """按配置更新参数，线程数和队列容量需在首次写入前设置"""
+        if output_dir is not None:
+            self.output_dir = output_dir
+        if url_prefix is not None:
+            self.url_prefix = url_prefix
+        if db_connector is not None:
+            self.db_connector = db_connector
+        if max_workers is not None or max_pending is not None:
+            if self._executor is not None:
+                logger.warning("片段写入线程池已创建，忽略新的线程数和队列设置")
+                return
+            if max_workers is not None:
+                self.max_workers = max(1, int(max_workers))
+            if max_pending is not None:
+                self.max_pending = max(1, int(max_pending))
+                self._slots = threading.BoundedSemaphore(self.max_pending)
+
+    @property
+    def executor(self):
+        """延迟创建的线程池"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="clip-writer")
+        return self._executor
+
+    def submit(self, stream_url, frames, types_str, image_srcs=()):
+        """
+        提交一个片段，不等待写入
+
+        Args:
+            stream_url: 流地址
+            frames: [(时间戳, JPEG字节)]，按时间排列
+            types_str: 片段中事件的物体类型
+            image_srcs: 片段中事件的标注图片相对路径
+
+        Returns:
+            Future: 写入完成后结果为片段的相对路径；队列满被丢弃时返回None
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.overflow += 1
+            logger.warning(f"片段写入队列已满，丢弃片段: {stream_url}")
+            return None
+        with self._lock:
+            self.submitted += 1
+        return self.executor.submit(self._write, stream_url, frames, types_str, list(image_srcs))
+
+    def _write(self, stream_url, frames, types_str, image_srcs):
+        """按时间戳以固定帧率写出片段，帧间隔不均匀时重复上一帧，使片段时长与实际一致"""
+        start_time = time.perf_counter()
+        temp_path = None
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            first, last = frames[0][0], frames[-1][0]
+            span = last - first
+            fps = min(30.0, max(1.0, round((len(frames) - 1) / span))) if span > 0 else 1.0
+            now = datetime.datetime.now()
+            filename = f"clip_{now.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}.mp4"
+            path = os.path.join(self.output_dir, filename)
+            temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp.mp4"
+
+            writer = None
+            size = None
+            image = None
+            written = 0
+            position = 0
+            decoded = -1
+            try:
+                for slot in range(int(span * fps) + 1):
+                    # 取该输出时刻之前的最新一帧
+                    slot_time = first + slot / fps
+                    while position + 1 < len(frames) and frames[position + 1][0] <= slot_time:
+                        position += 1
+                    if position != decoded:
+                        image = cv2.imdecode(np.frombuffer(frames[position][1], np.uint8), cv2.IMREAD_COLOR)
+                        decoded = position
+                    if image is None:
+                        continue
+                    if writer is None:
+                        size = (image.shape[1], image.shape[0])
+                        writer = cv2.VideoWriter(temp_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+                    elif (image.shape[1], image.shape[0]) != size:
+                        image = cv2.resize(image, size)
+                    writer.write(image)
+                    written += 1
+            finally:
+                if writer is not None:
+                    writer.release()
+            if written == 0:
+                raise ValueError("片段中没有可解码的帧")
+            os.replace(temp_path, path)
+            clip_bytes = os.path.getsize(path)
+            clip_src = f"{self.url_prefix}{filename}"
+            self._save_record(stream_url, types_str, image_srcs, clip_src, first, last, written, clip_bytes)
+
+            elapsed = time.perf_counter() - start_time
+            with self._lock:
+                self.clips_written += 1
+                self.frames_written += written
+                self.bytes_written += clip_bytes
+                self.seconds_written += span
+                self.total_write_time += elapsed
+            logger.info(f"已保存事件片段: {path} ({span:.1f}秒, {written}帧, 类型={types_str})")
+            return clip_src
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"保存事件片段失败: {stream_url}, 错误: {e}")
+            if temp_path is not None and os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        finally:
+            self._slots.release()
+
+    def _save_record(self, stream_url, types_str, image_srcs, clip_src, first, last, frames, size):
+        """在event_clips表中记录片段，片段包含多个事件时每张标注图片各记录一行"""
+        if self.db_connector is None:
+            return
+        connection = self.db_connector()
+        if not connection:
+            logger.error(f"无法记录事件片段，数据库连接失败: {clip_src}")
+            return
+        start = datetime.datetime.fromtimestamp(first)
+        end = datetime.datetime.fromtimestamp(last)
+        rows = [(stream_url[-255:], types_str[:255], image_src, clip_src, start, end, frames, size)
+                for image_src in (image_srcs or [None])]
+        try:
+            with connection.cursor() as cursor:
+                cursor.executemany(CLIP_INSERT_SQL, rows)
+            connection.commit()
+        except Exception as e:
+            logger.error(f"记录事件片段失败: {clip_src}, 错误: {e}")
+            connection.rollback()
+        finally:
+            connection.close()
+
+    def record_stream_seconds(self, seconds):
+        """流停止时记录其运行时长，用于估算节省的字节数"""
+        with self._lock:
+            self.stream_seconds += seconds
+
+    def shutdown(self):
+        """等待已提交的片段写完"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def stats(self, active_stream_seconds=0.0):
+        """
+        返回片段写入统计
+
+        Args:
+            active_stream_seconds: 运行中的流已运行的总时长(秒)，与已结束的流合计后估算全程录制需要的字节数
+        """
+        with self._lock:
+            stream_seconds = self.stream_seconds + active_stream_seconds
+            bytes_per_second = self.bytes_written / self.seconds_written if self.seconds_written > 0 else 0.0
+            continuous_bytes = int(bytes_per_second * stream_seconds)
+            return {
+                "stream_seconds": round(stream_seconds, 1),
+                "submitted": self.submitted,
+                "clips_written": self.clips_written,
+                "failed": self.failed,
+                "overflow": self.overflow,
+                "frames_written": self.frames_written,
+                "bytes_written": self.bytes_written,
+                "seconds_written": round(self.seconds_written, 1),
+                "avg_write_ms": round(self.total_write_time / self.clips_written * 1000, 1) if self.clips_written else 0.0,
+                # 以同样的编码全程录制所需的字节数，及只保存事件片段节省的字节数
+                "estimated_continuous_bytes": continuous_bytes,
+                "bytes_saved": max(0, continuous_bytes - self.bytes_written)
+            }
+
+# 全局片段写入器
+clip_writer = ClipWriter()
@@ -0,0 +1,133 @@
+import logging
+import threading
+import time
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class _Track:
+    """跟踪器的一条轨迹，以及它当前未保存事件中置信度最高的一帧"""
+    __slots__ = ("track_id", "last_seen", "event_start", "best_confidence", "best_snapshot", "cooldown_until")
+
+    def __init__(self, track_id, now):
+        self.track_id = track_id
+        self.last_seen = now
+        self.event_start = None
+        self.best_confidence = 0.0
+        self.best_snapshot = None
+        self.cooldown_until = 0.0
+
+class EventDeduplicator:
+    """
+    实时检测事件去重：按ObjectTracker分配的轨迹ID识别同一物体，新轨迹出现时开启事件，
+    每个事件只保存置信度最高的一帧，保存后冷却期内同一物体不再保存
+    """
+    def __init__(self, settle_time=2.0, cooldown=30.0, lost_timeout=1.0):
+        """
+        初始化去重器
+
+        Args:
+            settle_time: 事件开启后在该时间(秒)内挑选置信度最高的一帧，到时保存
+            cooldown: 保存后同一物体在该时间(秒)内不再保存，仍在画面中时冷却结束后开启新事件
+            lost_timeout: 轨迹连续该时间(秒)未出现时视为离开，未保存的事件立即保存
+        """
+        self.settle_time = settle_time
+        self.cooldown = cooldown
+        self.lost_timeout = lost_timeout
+        self._tracks = {}
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.frames = 0
+        self.candidate_frames = 0
+        self.events = 0
+        self.saved = 0
+
+    def update(self, track_ids, confidences, snapshot, now=None):
+        """
+        处理一帧中需要记录的检测结果
+
+        Args:
+            track_ids: 每个物体的轨迹ID(ObjectTracker.update的返回值)，小于0的未分配轨迹，不开启事件
+            confidences: 每个物体的置信度
+            snapshot: 无参函数，返回需要保存时使用的帧数据，每帧最多调用一次
+            now: 当前时间(秒)，默认为time.monotonic()
+
+        Returns:
+            list: 需要保存的帧数据，同一帧被多个事件选中时只出现一次
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.frames += 1
+            if len(track_ids) > 0:
+                self.candidate_frames += 1
+
+            captured = []
+
+            def capture():
+                if not captured:
+                    captured.append(snapshot())
+                return captured[0]
+
+            for track_id, confidence in zip(np.asarray(track_ids).tolist(), np.asarray(confidences).tolist()):
+                if track_id < 0:
+                    continue
+                track = self._tracks.get(track_id)
+                if track is None:
+                    track = self._tracks[track_id] = _Track(track_id, now)
+                track.last_seen = now
+                if track.event_start is None and now >= track.cooldown_until:
+                    track.event_start = now
+                    self.events += 1
+                if track.event_start is not None and confidence > track.best_confidence:
+                    track.best_confidence = float(confidence)
+                    track.best_snapshot = capture()
+
+            return self._collect(now)
+
+    def _collect(self, now, flush=False):
+        """取出到期或物体已离开的事件的最佳帧，并移除已离开的轨迹"""
+        to_save = []
+        remaining = {}
+        for track_id, track in self._tracks.items():
+            lost = now - track.last_seen > self.lost_timeout
+            if track.event_start is not None and (flush or lost or now - track.event_start >= self.settle_time):
+                if not any(track.best_snapshot is saved for saved in to_save):
+                    to_save.append(track.best_snapshot)
+                track.event_start = None
+                track.best_confidence = 0.0
+                track.best_snapshot = None
+                track.cooldown_until = now + self.cooldown
+            if not lost and not flush:
+                remaining[track_id] = track
+        self._tracks = remaining
+        self.saved += len(to_save)
+        return to_save
+
+    def flush(self, now=None):
+        """
+        流结束时保存所有未保存事件的最佳帧
+
+        Args:
+            now: 当前时间(秒)，默认为time.monotonic()
+
+        Returns:
+            list: 需要保存的帧数据
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return self._collect(now, flush=True)
+
+    def stats(self):
+        """返回去重前后的保存次数"""
+        with self._lock:
+            return {
+                "frames": self.frames,
+                "candidate_frames": self.candidate_frames,
+                "events": self.events,
+                "saved": self.saved,
+                "suppressed": max(0, self.candidate_frames - self.saved),
+                "active_tracks": len(self._tracks)
+            }
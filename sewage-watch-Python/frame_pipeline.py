@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FramePipeline:
+    """
+    基于线程池的帧处理流水线，将解码、推理、标注和编码等阻塞操作移出asyncio事件循环
+    """
+    def __init__(self, max_workers=4):
+        """
+        初始化流水线
+
+        Args:
+            max_workers: 线程池大小
+        """
+        self.max_workers = max_workers
+        self._executor = None
+
+    def configure(self, max_workers):
+        """
+        调整线程池大小，需在首次使用前调用
+
+        Args:
+            max_workers: 线程池大小
+        """
+        if self._executor is not None:
+            logger.warning("帧处理线程池已创建，忽略新的大小设置")
+            return
+        self.max_workers = max(1, int(max_workers))
+
+    @property
+    def executor(self):
+        """延迟创建的线程池"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="frame-pipeline")
+            logger.info(f"帧处理线程池已创建，线程数: {self.max_workers}")
+        return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        """
+        在线程池中执行阻塞函数，协程只等待执行完成的结果
+
+        Args:
+            func: 阻塞函数
+            *args: 位置参数
+            **kwargs: 关键字参数
+
+        Returns:
+            函数的返回值
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def shutdown(self):
+        """关闭线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# 进程内共享的帧处理流水线
+frame_pipeline = FramePipeline()
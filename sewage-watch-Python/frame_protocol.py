@@ -0,0 +1,117 @@
+import base64
+import struct
+import time
+import numpy as np
+
+# 二进制帧头: 魔数(2B) 版本(1B) 来源(1B) 帧序号(uint32) 采集时间戳(float64) 编码完成时间戳(float64) 帧率(float32) 检测数量(uint16)
+# 帧头之后紧跟原始JPEG字节，全部使用小端序
+FRAME_MAGIC = b"SW"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<2sBBIddfH")
+
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "binary"
+
+SOURCE_CODES = {
+    "本地": 0,
+    "RTMP": 1
+}
+
+def normalize_protocol(protocol):
+    """将查询参数规范化为支持的协议，未知值回退到JSON"""
+    if protocol and protocol.lower() == PROTOCOL_BINARY:
+        return PROTOCOL_BINARY
+    return PROTOCOL_JSON
+
+def pack_frame(jpeg_bytes, seq, capture_ts, fps, detections, source="本地", encoded_ts=None):
+    """
+    打包二进制帧
+
+    Args:
+        jpeg_bytes: JPEG编码后的图像字节
+        seq: 帧序号
+        capture_ts: 采集时间戳(秒)
+        fps: 当前帧率
+        detections: 检测到的物体数量
+        source: 视频来源
+        encoded_ts: 编码完成时间戳(秒)，默认为当前时间
+
+    Returns:
+        bytes: 帧头加JPEG字节
+    """
+    header = FRAME_HEADER.pack(
+        FRAME_MAGIC,
+        FRAME_VERSION,
+        SOURCE_CODES.get(source, 0),
+        seq & 0xFFFFFFFF,
+        capture_ts,
+        encoded_ts if encoded_ts is not None else time.time(),
+        fps,
+        min(detections, 0xFFFF)
+    )
+    return header + bytes(jpeg_bytes)
+
+def unpack_frame(data):
+    """
+    解析二进制帧
+
+    Args:
+        data: pack_frame生成的字节
+
+    Returns:
+        tuple: (帧头字典, JPEG字节)
+    """
+    magic, version, source, seq, capture_ts, encoded_ts, fps, detections = FRAME_HEADER.unpack_from(data)
+    if magic != FRAME_MAGIC:
+        raise ValueError("无效的帧数据：魔数不匹配")
+    header = {
+        "version": version,
+        "source": source,
+        "seq": seq,
+        "capture_ts": capture_ts,
+        "encoded_ts": encoded_ts,
+        "fps": fps,
+        "detections": detections
+    }
+    return header, data[FRAME_HEADER.size:]
+
+def build_payload(jpeg_bytes, protocol, seq, capture_ts, fps, detections, source="本地", image_b64=None,
+                  latency_ms=None):
+    """
+    按协议构造发送给客户端的数据
+
+    Args:
+        jpeg_bytes: JPEG编码后的图像字节
+        protocol: 协议，json或binary
+        seq: 帧序号
+        capture_ts: 采集时间戳(秒)
+        fps: 当前帧率
+        detections: 检测到的物体数量
+        source: 视频来源
+        image_b64: 已编码好的base64图像，多个观看者共用同一帧时避免重复编码
+        latency_ms: 采集到发送的端到端延迟(毫秒)，仅json协议携带，binary协议由帧头的两个时间戳计算
+
+    Returns:
+        binary协议返回bytes，json协议返回兼容旧格式的字典
+    """
+    if protocol == PROTOCOL_BINARY:
+        return pack_frame(jpeg_bytes, seq, capture_ts, fps, detections, source=source)
+
+    payload = {
+        "image": image_b64 if image_b64 is not None else base64.b64encode(jpeg_bytes).decode('utf-8'),
+        "fps": round(fps, 1),
+        "speed": round(np.random.uniform(10, 15), 1),
+        "weather": "晴朗"
+    }
+    if latency_ms is not None:
+        payload["latency_ms"] = latency_ms
+    if source != "本地":
+        payload["source"] = source
+    return payload
+
+async def send_payload(websocket, payload):
+    """根据数据类型选择二进制或JSON方式发送"""
+    if isinstance(payload, bytes):
+        await websocket.send_bytes(payload)
+    else:
+        await websocket.send_json(payload)
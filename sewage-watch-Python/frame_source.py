@@ -0,0 +1,347 @@
+import logging
+import threading
+import time
+from collections import deque
+import cv2
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 消费者的丢帧策略：只保留最新帧(满时丢弃最旧的帧)，或有界缓冲(满时丢弃新到的帧)
+POLICY_LATEST = "latest"
+POLICY_BUFFER = "buffer"
+POLICIES = (POLICY_LATEST, POLICY_BUFFER)
+
+class FrameConsumer:
+    """
+    采集源的一个消费者，持有自己的有界帧队列和丢帧策略，消费慢时只影响自己，不阻塞采集线程和其他消费者
+
+    所有消费者收到的是同一个帧数组，只能读取，需要修改时先复制
+    """
+    def __init__(self, name, policy=POLICY_LATEST, max_size=1, sample_interval=1):
+        """
+        Args:
+            name: 消费者名称，用于统计
+            policy: latest适合实时观看，buffer适合需要连续帧的录制和分析
+            max_size: 队列中最多保留的帧数
+            sample_interval: 每隔多少个源帧接收一帧，1表示接收所有帧
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"不支持的丢帧策略: {policy}")
+        self.name = name
+        self.policy = policy
+        self.max_size = max(1, int(max_size))
+        self.sample_interval = max(1, int(sample_interval))
+        self.closed = False
+        self._frames = deque()
+        self._condition = threading.Condition()
+
+        # 统计信息
+        self.frames_received = 0
+        self.frames_dropped = 0
+
+    def offer(self, frame, timestamp, index):
+        """
+        采集线程调用，按采样间隔和丢帧策略放入一帧，不阻塞
+
+        Args:
+            frame: BGR帧
+            timestamp: 采集时间戳(time.time())
+            index: 采集源的帧序号
+        """
+        if index % self.sample_interval:
+            return
+        with self._condition:
+            if self.closed:
+                return
+            if len(self._frames) >= self.max_size:
+                self.frames_dropped += 1
+                if self.policy == POLICY_BUFFER:
+                    return
+                self._frames.popleft()
+            self._frames.append((frame, timestamp, index))
+            self.frames_received += 1
+            self._condition.notify()
+
+    def get(self, timeout=None):
+        """
+        取出最早的一帧
+
+        Args:
+            timeout: 最长等待时间(秒)，None表示一直等待
+
+        Returns:
+            tuple: (帧, 采集时间戳, 帧序号)，超时或已关闭且队列为空时返回None
+        """
+        with self._condition:
+            if not self._frames and not self.closed:
+                self._condition.wait(timeout)
+            if self._frames:
+                return self._frames.popleft()
+            return None
+
+    def close(self):
+        """不再接收新帧，已排队的帧仍可取出"""
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+    def stats(self):
+        """返回接收、丢弃和排队的帧数"""
+        with self._condition:
+            return {
+                "name": self.name,
+                "policy": self.policy,
+                "sample_interval": self.sample_interval,
+                "frames_received": self.frames_received,
+                "frames_dropped": self.frames_dropped,
+                "queued": len(self._frames)
+            }
+
+class FrameSource:
+    """
+    单个视频地址的共享采集源：一个采集线程解码一次，把每一帧分发给所有消费者(观看、录制、分析)，
+    连接中断或超时未收到帧时自动重连
+    """
+    def __init__(self, url, reconnect_delay=5, timeout=10, realtime=False):
+        """
+        Args:
+            url: RTMP地址或视频文件路径
+            reconnect_delay: 连接丢失后重连前的等待时间(秒)
+            timeout: 超过该时间(秒)未收到有效帧时重新打开视频源
+            realtime: 按源帧率读取，用于以文件模拟直播流
+        """
+        self.url = url
+        self.reconnect_delay = reconnect_delay
+        self.timeout = timeout
+        self.realtime = realtime
+        self.cap = None
+        self.fps = 0.0
+        self.width = 0
+        self.height = 0
+        self.is_running = False
+        self.capture_thread = None
+        self._consumers = []
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+
+        # 统计信息
+        self.frames_decoded = 0
+        self.reconnects = 0
+        self.decode_time = 0.0
+
+    def open(self):
+        """
+        打开视频源并读取首帧验证连接
+
+        Returns:
+            bool: 是否打开成功
+        """
+        try:
+            logger.info(f"正在打开采集源: {self.url}")
+            self.cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG)
+            if not self.cap.isOpened():
+                raise ValueError(f"无法打开视频源: {self.url}")
+
+            # 设置额外的VideoCapture属性来处理H.264解码问题
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # 最小缓冲区大小
+            self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 30.0
+            self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+            self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+            # 尝试读取第一帧以验证连接，首帧同样分发给消费者
+            ret, frame = self.cap.read()
+            if ret and frame is not None:
+                self.height, self.width = frame.shape[:2]
+                logger.info(f"采集源打开成功，首帧尺寸: {frame.shape}")
+                self._dispatch(frame)
+            else:
+                logger.warning("首帧读取失败，但继续尝试...")  # 有些流需要几次尝试才能稳定
+            return True
+        except Exception as e:
+            logger.error(f"打开采集源失败: {e}")
+            if self.cap is not None:
+                self.cap.release()
+                self.cap = None
+            return False
+
+    def start(self):
+        """
+        打开视频源并启动采集线程，已启动时直接返回
+
+        Returns:
+            bool: 采集线程是否在运行
+        """
+        with self._start_lock:
+            if self.is_running:
+                return True
+            if not self.open():
+                return False
+            self.is_running = True
+            self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+            self.capture_thread.start()
+            return True
+
+    def add_consumer(self, name, policy=POLICY_LATEST, max_size=1, sample_interval=1):
+        """
+        添加一个消费者，从下一帧开始接收
+
+        Returns:
+            FrameConsumer: 新的消费者
+        """
+        consumer = FrameConsumer(name, policy, max_size, sample_interval)
+        with self._lock:
+            self._consumers = self._consumers + [consumer]
+        return consumer
+
+    def remove_consumer(self, consumer):
+        """移除并关闭消费者"""
+        consumer.close()
+        with self._lock:
+            self._consumers = [item for item in self._consumers if item is not consumer]
+
+    def _dispatch(self, frame):
+        """把一帧分发给当前所有消费者，消费者列表按写时复制，无需在分发时加锁"""
+        timestamp = time.time()
+        index = self.frames_decoded
+        self.frames_decoded += 1
+        for consumer in self._consumers:
+            consumer.offer(frame, timestamp, index)
+
+    def _capture_loop(self):
+        """在后台线程中解码并分发帧，处理连接中断"""
+        last_successful_frame_time = time.time()
+        next_due = time.monotonic()
+
+        while self.is_running:
+            if not self.cap or not self.cap.isOpened():
+                logger.error(f"采集源连接丢失，将在{self.reconnect_delay}秒后尝试重新连接: {self.url}")
+                time.sleep(self.reconnect_delay)
+                if not self.is_running or not self.open():
+                    continue  # 如果重连失败，则在下一次循环继续尝试
+                self.reconnects += 1
+                last_successful_frame_time = time.time()  # 重置计时器
+
+            start_time = time.perf_counter()
+            ret, frame = self.cap.read()
+            self.decode_time += time.perf_counter() - start_time
+
+            # 验证帧的有效性
+            if ret and frame is not None and frame.ndim == 3 and frame.shape[0] > 0 and frame.shape[1] > 0:
+                last_successful_frame_time = time.time()
+                self._dispatch(frame)
+                if self.realtime:
+                    next_due += 1.0 / self.fps
+                    time.sleep(max(0.0, next_due - time.monotonic()))
+            elif self.realtime and not ret:
+                # 文件模拟的直播流读到结尾时结束
+                break
+            elif time.time() - last_successful_frame_time > self.timeout:
+                logger.warning(f"超过{self.timeout}秒未收到有效帧，将重新初始化连接。")
+                # 只释放视频源，保留线程和消费者，循环将自动处理重新初始化
+                self.cap.release()
+                self.cap = None
+                last_successful_frame_time = time.time()  # 重置计时器以避免快速连续重连
+            else:
+                # 短暂等待，避免CPU占用过高
+                time.sleep(0.01)
+
+        self.is_running = False
+        # 通知消费者不会再有新帧
+        for consumer in self._consumers:
+            consumer.close()
+        logger.info(f"采集线程已停止: {self.url}")
+
+    def stop(self):
+        """停止采集线程并关闭所有消费者"""
+        self.is_running = False
+        thread = self.capture_thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=2)
+            if thread.is_alive():
+                logger.warning("采集线程在超时后仍未结束")
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
+        with self._lock:
+            consumers, self._consumers = self._consumers, []
+        for consumer in consumers:
+            consumer.close()
+
+    def stats(self):
+        """返回解码帧数、平均解码耗时和各消费者的丢帧统计"""
+        return {
+            "url": self.url,
+            "is_running": self.is_running,
+            "fps": round(self.fps, 2),
+            "resolution": [self.width, self.height],
+            "frames_decoded": self.frames_decoded,
+            "avg_decode_ms": round(self.decode_time / self.frames_decoded * 1000, 2) if self.frames_decoded else 0.0,
+            "reconnects": self.reconnects,
+            "consumers": [consumer.stats() for consumer in self._consumers]
+        }
+
+class FrameSourceRegistry:
+    """
+    按地址共享采集源，引用计数归零时停止采集，同一地址的观看、录制和分析只解码一次
+    """
+    def __init__(self, reconnect_delay=5, timeout=10):
+        self.reconnect_delay = reconnect_delay
+        self.timeout = timeout
+        self._sources = {}
+        self._refs = {}
+        self._lock = threading.Lock()
+
+    def configure(self, reconnect_delay=None, timeout=None):
+        """设置新建采集源的重连延迟和超时"""
+        if reconnect_delay is not None:
+            self.reconnect_delay = reconnect_delay
+        if timeout is not None:
+            self.timeout = timeout
+
+    def acquire(self, url):
+        """
+        获取地址对应的采集源，不存在时创建并启动，打开视频源可能需要数秒
+
+        Returns:
+            FrameSource: 正在运行的采集源，打开失败时返回None
+        """
+        with self._lock:
+            source = self._sources.get(url)
+            if source is None or (not source.is_running and not self._refs.get(url)):
+                source = FrameSource(url, self.reconnect_delay, self.timeout)
+                self._sources[url] = source
+            self._refs[url] = self._refs.get(url, 0) + 1
+        # 在锁外打开，不同地址的采集源可以同时打开
+        if source.start():
+            return source
+        self.release(url)
+        return None
+
+    def release(self, url):
+        """释放一次引用，最后一个使用者释放时停止采集"""
+        with self._lock:
+            count = self._refs.get(url, 0) - 1
+            if count > 0:
+                self._refs[url] = count
+                return
+            self._refs.pop(url, None)
+            source = self._sources.pop(url, None)
+        if source is not None:
+            source.stop()
+
+    def get(self, url):
+        """返回正在使用的采集源，不存在时返回None"""
+        with self._lock:
+            return self._sources.get(url)
+
+    def stats(self):
+        """返回所有采集源的统计和引用数"""
+        with self._lock:
+            sources = list(self._sources.items())
+            refs = dict(self._refs)
+        return [dict(source.stats(), refs=refs.get(url, 0)) for url, source in sources]
+
+# 全局采集源注册表
+frame_sources = FrameSourceRegistry()
@@ -0,0 +1,146 @@
+import logging
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FRAME_INSERT_SQL = """
+INSERT INTO video_frames (task_id, frame_index, time_seconds, image_path, detected_types, total_objects)
+VALUES (%s, %s, %s, %s, %s, %s)
+"""
+
+OBJECT_INSERT_SQL = """
+INSERT INTO detected_objects (frame_id, type, confidence, x1, y1, x2, y2, center_x, center_y, width, height, track_id)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+"""
+
+# 按自然键(task_id, frame_index)取回刚写入的帧ID，依赖video_frames上的唯一索引
+FRAME_ID_SQL = """
+SELECT id, frame_index FROM video_frames
+WHERE task_id = %s AND frame_index BETWEEN %s AND %s
+"""
+
+# 删除任务中一段帧索引范围内的帧，detected_objects随外键级联删除
+FRAME_DELETE_SQL = """
+DELETE FROM video_frames WHERE task_id = %s AND frame_index >= %s AND frame_index < %s
+"""
+
+def offset_frames(saved_frames, frame_offset=0, time_offset=0.0):
+    """
+    返回帧索引和时间加上偏移的副本，用于把分段的结果写入整个录制的任务中
+
+    Args:
+        saved_frames: process_video返回的saved_frames
+        frame_offset: 帧索引偏移
+        time_offset: 时间偏移(秒)
+
+    Returns:
+        list: 偏移后的帧，不修改原列表
+    """
+    if not frame_offset and not time_offset:
+        return saved_frames
+    return [dict(frame, frame_index=frame["frame_index"] + frame_offset, time=frame["time"] + time_offset)
+            for frame in saved_frames]
+
+def delete_frame_range(connection, task_id, start, end):
+    """
+    删除任务中帧索引在[start, end)内的帧和物体，重新分析分段时先清除该分段的旧结果
+
+    Returns:
+        int: 删除的帧数
+    """
+    with connection.cursor() as cursor:
+        deleted = cursor.execute(FRAME_DELETE_SQL, (task_id, start, end))
+    connection.commit()
+    return deleted or 0
+
+def frame_row(task_id, frame):
+    """构建video_frames的一行"""
+    return (
+        task_id,
+        frame["frame_index"],
+        frame["time"],
+        frame["relative_path"],
+        ",".join(frame["detected_types"].keys()),
+        frame["total_objects"]
+    )
+
+def object_rows(frame_id, frame):
+    """构建一帧中所有物体在detected_objects中的行"""
+    rows = []
+    for obj in frame["objects"]:
+        position = obj["position"]
+        rows.append((
+            frame_id,
+            obj["type"],
+            obj["confidence"],
+            position["x1"],
+            position["y1"],
+            position["x2"],
+            position["y2"],
+            position["center_x"],
+            position["center_y"],
+            position["width"],
+            position["height"],
+            obj.get("track_id")
+        ))
+    return rows
+
+def insert_frames_row_by_row(connection, task_id, saved_frames):
+    """
+    逐行写入帧和物体，每帧读取lastrowid作为物体的frame_id，最后统一提交
+
+    Args:
+        connection: 数据库连接
+        task_id: 分析任务ID
+        saved_frames: process_video返回的saved_frames
+
+    Returns:
+        int: 写入的帧数
+    """
+    count = 0
+    with connection.cursor() as cursor:
+        for frame in saved_frames:
+            cursor.execute(FRAME_INSERT_SQL, frame_row(task_id, frame))
+            frame_id = cursor.lastrowid
+            for row in object_rows(frame_id, frame):
+                cursor.execute(OBJECT_INSERT_SQL, row)
+            count += 1
+    connection.commit()
+    return count
+
+def insert_frames_bulk(connection, task_id, saved_frames, chunk_size=500):
+    """
+    分块批量写入帧和物体，每块提交一次
+
+    每块先用多行INSERT写入帧，再按(task_id, frame_index)一次查询取回帧ID，最后多行写入物体，
+    不依赖逐行的lastrowid，也不依赖自增ID连续
+
+    Args:
+        connection: 数据库连接
+        task_id: 分析任务ID
+        saved_frames: process_video返回的saved_frames，同一任务内frame_index唯一
+        chunk_size: 每块的帧数
+
+    Returns:
+        int: 写入的帧数
+    """
+    chunk_size = max(1, int(chunk_size))
+    count = 0
+    for offset in range(0, len(saved_frames), chunk_size):
+        chunk = saved_frames[offset:offset + chunk_size]
+        with connection.cursor() as cursor:
+            cursor.executemany(FRAME_INSERT_SQL, [frame_row(task_id, frame) for frame in chunk])
+
+            frame_indexes = [frame["frame_index"] for frame in chunk]
+            cursor.execute(FRAME_ID_SQL, (task_id, min(frame_indexes), max(frame_indexes)))
+            frame_ids = {row["frame_index"]: row["id"] for row in cursor.fetchall()}
+
+            rows = []
+            for frame in chunk:
+                rows.extend(object_rows(frame_ids[frame["frame_index"]], frame))
+            if rows:
+                cursor.executemany(OBJECT_INSERT_SQL, rows)
+        connection.commit()
+        count += len(chunk)
+    return count
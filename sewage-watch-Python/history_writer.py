@@ -0,0 +1,228 @@
+import datetime
+import logging
+import queue
+import threading
+import time
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+HISTORY_INSERT_SQL = """
+INSERT INTO history (taskId, type, src, createdTime)
+VALUES (%s, %s, %s, %s)
+"""
+
+_STOP = object()
+
+class HistoryWriter:
+    """
+    历史记录后台写入器，检测线程只把记录放入有界队列，由写入线程按数量或时间批量提交
+    """
+    def __init__(self, db_connector=None, max_queue_size=1000, batch_size=50, flush_interval=1.0, put_timeout=0.0):
+        """
+        初始化写入器
+
+        Args:
+            db_connector: 返回数据库连接的函数
+            max_queue_size: 队列容量，队列满时新记录计入溢出并丢弃
+            batch_size: 累积到该数量时立即提交
+            flush_interval: 距上次提交超过该时间(秒)时提交已累积的记录
+            put_timeout: 队列满时放入记录的最长等待时间(秒)，0表示不等待直接丢弃
+        """
+        self.db_connector = db_connector
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.overflow = 0
+        self.backpressure_waits = 0
+        self.batches = 0
+        self.total_flush_time = 0.0
+        self.max_queue_depth = 0
+
+    def configure(self, db_connector=None, max_queue_size=None, batch_size=None, flush_interval=None, put_timeout=None):
+        """按配置更新参数，队列容量需在启动前设置"""
+        if db_connector is not None:
+            self.db_connector = db_connector
+        if max_queue_size is not None:
+            if self._thread is not None:
+                logger.warning("历史记录写入线程已启动，忽略新的队列容量设置")
+            else:
+                self.max_queue_size = max(1, int(max_queue_size))
+                self._queue = queue.Queue(maxsize=self.max_queue_size)
+        if batch_size is not None:
+            self.batch_size = max(1, int(batch_size))
+        if flush_interval is not None:
+            self.flush_interval = max(0.01, float(flush_interval))
+        if put_timeout is not None:
+            self.put_timeout = max(0.0, float(put_timeout))
+
+    def start(self):
+        """启动写入线程"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+        logger.info(f"历史记录写入线程已启动，批大小: {self.batch_size}, 提交间隔: {self.flush_interval}秒")
+
+    def stop(self, timeout=10.0):
+        """
+        提交队列中剩余的记录并停止写入线程
+
+        Args:
+            timeout: 等待写入线程结束的最长时间(秒)
+        """
+        if self._thread is None:
+            return
+        if not self._thread.is_alive():
+            logger.error(f"历史记录写入线程已退出，丢弃剩余记录: {self._queue.qsize()}")
+            self._thread = None
+            return
+        # 停止标记必须入队，才能保证它之前的记录全部写入；队列一直满时不无限等待
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning(f"历史记录队列在{timeout}秒内一直是满的，无法放入停止标记")
+        self._thread.join(max(0.0, deadline - time.monotonic()))
+        if self._thread.is_alive():
+            logger.warning(f"历史记录写入线程未在{timeout}秒内结束，剩余记录: {self._queue.qsize()}")
+        else:
+            logger.info(f"历史记录写入线程已停止，共写入 {self.written} 条记录")
+        self._thread = None
+
+    def submit(self, type_name, image_path, task_id=None, created_time=None):
+        """
+        放入一条历史记录，不等待数据库写入
+
+        Args:
+            type_name: 检测到的类型，多个类型用逗号分隔
+            image_path: 图片相对路径
+            task_id: 关联的任务ID
+            created_time: 记录时间，默认为当前时间
+
+        Returns:
+            bool: 是否成功放入队列，队列满时返回False
+        """
+        row = (task_id, type_name, image_path, created_time or datetime.datetime.now())
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            if self.put_timeout <= 0:
+                return self._count_overflow()
+            # 队列已满，检测线程短暂等待写入线程腾出空间
+            with self._lock:
+                self.backpressure_waits += 1
+            try:
+                self._queue.put(row, timeout=self.put_timeout)
+            except queue.Full:
+                return self._count_overflow()
+        with self._lock:
+            self.submitted += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return True
+
+    def _count_overflow(self):
+        """记录一次溢出，每100次输出一条警告"""
+        with self._lock:
+            self.overflow += 1
+            overflow = self.overflow
+        if overflow % 100 == 1:
+            logger.warning(f"历史记录队列已满，已丢弃 {overflow} 条记录")
+        return False
+
+    def _run(self):
+        """写入线程：累积记录，达到批大小或超过提交间隔时批量写入"""
+        batch = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+                if item is _STOP:
+                    stopping = True
+                else:
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                try:
+                    self._flush(batch)
+                except Exception as e:
+                    # 任何一批出错都不能让写入线程退出，否则队列写满后检测线程的记录全部溢出
+                    logger.error(f"写入历史记录时出错，丢弃 {len(batch)} 条记录: {e}")
+                    with self._lock:
+                        self.failed += len(batch)
+                batch = []
+                deadline = None
+
+    def _flush(self, rows):
+        """用executemany在一个事务中写入一批记录"""
+        start_time = time.perf_counter()
+        connection = self.db_connector() if self.db_connector is not None else None
+        if not connection:
+            logger.error(f"无法保存历史记录，数据库连接失败，丢弃 {len(rows)} 条记录")
+            with self._lock:
+                self.failed += len(rows)
+            return
+        broken = False
+        try:
+            with connection.cursor() as cursor:
+                cursor.executemany(HISTORY_INSERT_SQL, rows)
+            connection.commit()
+            with self._lock:
+                self.written += len(rows)
+                self.batches += 1
+                self.total_flush_time += time.perf_counter() - start_time
+            logger.info(f"已批量保存 {len(rows)} 条历史记录")
+        except Exception as e:
+            logger.error(f"批量保存历史记录失败，丢弃 {len(rows)} 条记录: {e}")
+            with self._lock:
+                self.failed += len(rows)
+            try:
+                connection.rollback()
+            except Exception as rollback_error:
+                # 连接已断开时回滚也会失败，该连接不再放回连接池
+                logger.error(f"回滚历史记录写入失败: {rollback_error}")
+                broken = True
+        finally:
+            try:
+                if broken and hasattr(connection, "discard"):
+                    connection.discard()
+                else:
+                    connection.close()
+            except Exception as e:
+                logger.error(f"关闭数据库连接失败: {e}")
+
+    def stats(self):
+        """返回队列深度、写入量和溢出统计"""
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "max_queue_size": self.max_queue_size,
+                "max_queue_depth": self.max_queue_depth,
+                "submitted": self.submitted,
+                "written": self.written,
+                "failed": self.failed,
+                "overflow": self.overflow,
+                "backpressure_waits": self.backpressure_waits,
+                "batches": self.batches,
+                "avg_batch_size": round(self.written / self.batches, 2) if self.batches else 0.0,
+                "avg_flush_ms": round(self.total_flush_time / self.batches * 1000, 2) if self.batches else 0.0
+            }
+
+# 进程内共享的历史记录写入器
+history_writer = HistoryWriter()
@@ -0,0 +1,203 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import zipfile
+import cv2
+import numpy as np
+from upload_ingest import UploadTooLarge
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 压缩包中按扩展名识别的图片文件
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp", ".tif", ".tiff")
+
+def decode_image(data):
+    """从内存中的编码数据解码图片，失败时返回None"""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+def zip_image_names(archive, max_member_bytes=None, max_members=None, max_total_bytes=None):
+    """
+    列出压缩包中的图片文件，按成员头部记录的解压后大小检查限制，不解压任何数据
+
+    Args:
+        archive: 已打开的zipfile.ZipFile
+        max_member_bytes: 单张图片解压后的大小上限，None表示不限制
+        max_members: 图片数量上限，None表示不限制
+        max_total_bytes: 所有图片解压后的总大小上限，None表示不限制
+
+    Returns:
+        list: 图片成员名称列表，按压缩包中的顺序
+
+    Raises:
+        UploadTooLarge: 单张图片或总大小超过限制
+        ValueError: 图片数量超过限制
+    """
+    names = []
+    total_bytes = 0
+    for info in archive.infolist():
+        name = info.filename
+        if info.is_dir() or name.startswith("__MACOSX/") or os.path.basename(name).startswith("."):
+            continue
+        if not name.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        if max_member_bytes and info.file_size > max_member_bytes:
+            raise UploadTooLarge(max_member_bytes)
+        total_bytes += info.file_size
+        if max_total_bytes and total_bytes > max_total_bytes:
+            raise UploadTooLarge(max_total_bytes)
+        names.append(name)
+        if max_members and len(names) > max_members:
+            raise ValueError(f"压缩包中的图片超过数量限制: {max_members} 张")
+    return names
+
+def read_zip_member(archive, name, max_bytes=None):
+    """
+    读取压缩包中的一张图片，最多解压max_bytes + 1字节，不依赖成员头部记录的大小
+
+    Raises:
+        UploadTooLarge: 解压后超过max_bytes
+    """
+    with archive.open(name) as member:
+        if not max_bytes:
+            return member.read()
+        data = member.read(max_bytes + 1)
+    if len(data) > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    return data
+
+class ZipArchiveReader:
+    """
+    按线程打开压缩包读取图片：同一个ZipFile的所有成员共用一个文件句柄，多个线程同时读取不安全，
+    每个线程首次读取时打开自己的ZipFile
+    """
+    def __init__(self, path):
+        """
+        Args:
+            path: 压缩包路径
+        """
+        self.path = path
+        self._local = threading.local()
+        self._archives = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def archive(self):
+        """
+        返回当前线程使用的ZipFile，首次调用时打开
+
+        Raises:
+            zipfile.BadZipFile: 文件不是有效的zip压缩包
+            ValueError: 读取器已关闭
+        """
+        archive = getattr(self._local, "archive", None)
+        if archive is None:
+            with self._lock:
+                if self._closed:
+                    raise ValueError("压缩包已关闭")
+                archive = zipfile.ZipFile(self.path)
+                self._archives.append(archive)
+            self._local.archive = archive
+        return archive
+
+    def read(self, name, max_bytes=None):
+        """在当前线程的ZipFile中读取一张图片，限制同read_zip_member"""
+        return read_zip_member(self.archive(), name, max_bytes)
+
+    def close(self):
+        """关闭所有线程打开的ZipFile"""
+        with self._lock:
+            self._closed = True
+            archives, self._archives = self._archives, []
+        for archive in archives:
+            archive.close()
+
+async def run_image_batches(sources, processor, run, batch_size=16, save=None):
+    """
+    分批解码和推理图片，按批产出每张图片的结果，最后产出汇总信息
+
+    下一批图片的读取和解码与当前批的推理重叠进行，内存中最多同时保留两批解码后的图片
+
+    Args:
+        sources: [(文件名, 读取函数)]，读取函数为返回图片字节的协程函数
+        processor: DetectionProcessor实例
+        run: 在线程池中执行阻塞函数的协程函数，如frame_pipeline.run
+        batch_size: 每次模型调用的图片数
+        save: 保存检测结果的函数，参数为一批的结果列表，返回保存的记录数，在线程池中执行；
+            每批在产出结果之前保存，客户端中途断开时已处理的图片不会丢失记录
+
+    Yields:
+        dict: 每张图片的检测结果，最后一项为{"summary": 汇总信息}
+    """
+    batch_size = max(1, int(batch_size))
+    start_time = time.perf_counter()
+    decode_time = 0.0
+    inference_time = 0.0
+
+    async def load(index, name, loader):
+        """读取并解码一张图片，返回(序号, 文件名, 图片或None, 错误信息)"""
+        try:
+            data = await loader()
+            image = await run(decode_image, data)
+            if image is None:
+                return index, name, None, "无法解码图片数据"
+            return index, name, image, None
+        except Exception as e:
+            return index, name, None, str(e)
+
+    async def load_batch(offset):
+        nonlocal decode_time
+        batch_start = time.perf_counter()
+        batch = sources[offset:offset + batch_size]
+        loaded = await asyncio.gather(*[load(offset + i, name, loader) for i, (name, loader) in enumerate(batch)])
+        decode_time += time.perf_counter() - batch_start
+        return loaded
+
+    failed = 0
+    saved_records = 0
+    pending = asyncio.ensure_future(load_batch(0)) if sources else None
+    try:
+        for offset in range(0, len(sources), batch_size):
+            loaded = await pending
+            # 预取下一批，与本批推理并行
+            next_offset = offset + batch_size
+            pending = asyncio.ensure_future(load_batch(next_offset)) if next_offset < len(sources) else None
+
+            images = [image for _, _, image, _ in loaded if image is not None]
+            inference_start = time.perf_counter()
+            batch_results = await run(processor.process_image_batch, images) if images else []
+            inference_time += time.perf_counter() - inference_start
+
+            if save is not None and batch_results:
+                saved_records += await run(save, batch_results)
+
+            batch_results = iter(batch_results)
+            for index, name, image, error in loaded:
+                if image is None:
+                    result = {"success": False, "error": error}
+                else:
+                    result = next(batch_results)
+                if not result.get("success", False):
+                    failed += 1
+                yield {"index": index, "filename": name, **result}
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+    elapsed = time.perf_counter() - start_time
+    yield {
+        "summary": {
+            "total_images": len(sources),
+            "succeeded": len(sources) - failed,
+            "failed": failed,
+            "saved_records": saved_records,
+            "batch_size": batch_size,
+            "elapsed": round(elapsed, 3),
+            "decode_time": round(decode_time, 3),
+            "inference_time": round(inference_time, 3),
+            "images_per_second": round(len(sources) / elapsed, 2) if elapsed > 0 else 0
+        }
+    }
@@ -0,0 +1,200 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 支持的图片格式及对应的质量参数
+IMAGE_FORMATS = {
+    "jpg": cv2.IMWRITE_JPEG_QUALITY,
+    "webp": cv2.IMWRITE_WEBP_QUALITY,
+    "png": cv2.IMWRITE_PNG_COMPRESSION
+}
+
+class ImageWriter:
+    """
+    标注图片的后台写入器：调用方线程只做编码，文件写入在线程池中完成，
+    先写临时文件再重命名，写入成功后才执行回调(如写入数据库记录)
+    """
+    def __init__(self, max_workers=2, max_queue_size=64, image_format="jpg", quality=90):
+        """
+        初始化写入器
+
+        Args:
+            max_workers: 写文件的线程数
+            max_queue_size: 等待写入的最大图片数，超过时非阻塞提交直接丢弃
+            image_format: 图片格式，jpg/webp/png
+            quality: jpg/webp为0-100的质量，png为0-9的压缩级别
+        """
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.image_format = image_format
+        self.quality = quality
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(max_queue_size)
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.pending = 0
+        self.submitted = 0
+        self.written = 0
+        self.failed = 0
+        self.overflow = 0
+        self.bytes_written = 0
+        self.total_encode_time = 0.0
+        self.total_write_time = 0.0
+        self.max_write_time = 0.0
+
+    def configure(self, max_workers=None, max_queue_size=None, image_format=None, quality=None):
+        """按配置更新参数，线程数和队列容量需在首次写入前设置"""
+        if image_format is not None:
+            image_format = image_format.lower().lstrip(".")
+            if image_format == "jpeg":
+                image_format = "jpg"
+            if image_format not in IMAGE_FORMATS:
+                raise ValueError(f"不支持的图片格式: {image_format}")
+            self.image_format = image_format
+        if quality is not None:
+            self.quality = int(quality)
+        if max_workers is not None or max_queue_size is not None:
+            if self._executor is not None:
+                logger.warning("图片写入线程池已创建，忽略新的线程数和队列设置")
+                return
+            if max_workers is not None:
+                self.max_workers = max(1, int(max_workers))
+            if max_queue_size is not None:
+                self.max_queue_size = max(1, int(max_queue_size))
+                self._slots = threading.BoundedSemaphore(self.max_queue_size)
+
+    @property
+    def executor(self):
+        """延迟创建的线程池"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="image-writer")
+        return self._executor
+
+    @property
+    def extension(self):
+        """当前格式的文件扩展名"""
+        return f".{self.image_format}"
+
+    def encode(self, image):
+        """按配置的格式和质量编码图片"""
+        ok, buffer = cv2.imencode(self.extension, image, [int(IMAGE_FORMATS[self.image_format]), self.quality])
+        if not ok:
+            raise ValueError(f"图片编码失败: {self.image_format}")
+        return buffer.tobytes()
+
+    def submit(self, image, path, on_written=None, block=False, timeout=None):
+        """
+        编码图片并提交写入
+
+        Args:
+            image: BGR图片数组，或已编码的图片字节
+            path: 目标路径
+            on_written: 写入成功后在写入线程中调用的函数，参数为路径
+            block: 队列满时是否等待，False时直接丢弃并计入溢出
+            timeout: 阻塞等待的最长时间(秒)，None表示一直等待
+
+        Returns:
+            Future: 写入完成后结果为路径，写入失败时抛出异常；队列满被丢弃时返回None
+        """
+        if not self._slots.acquire(blocking=block, timeout=timeout if block else None):
+            with self._lock:
+                self.overflow += 1
+                overflow = self.overflow
+            if overflow % 100 == 1:
+                logger.warning(f"图片写入队列已满，已丢弃 {overflow} 张图片")
+            return None
+
+        try:
+            if isinstance(image, (bytes, bytearray, memoryview)):
+                data = bytes(image)
+            else:
+                # 在调用方线程中编码，调用方之后可以继续修改图片
+                encode_start = time.perf_counter()
+                data = self.encode(image)
+                with self._lock:
+                    self.total_encode_time += time.perf_counter() - encode_start
+            with self._lock:
+                self.pending += 1
+                self.submitted += 1
+            return self.executor.submit(self._write, data, path, on_written)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def write(self, image, path):
+        """同步写入一张图片，等待写入完成后返回路径"""
+        return self.submit(image, path, block=True).result()
+
+    def _write(self, data, path, on_written):
+        """写入临时文件后重命名，保证读取方不会看到写了一半的图片"""
+        start_time = time.perf_counter()
+        temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            write_time = time.perf_counter() - start_time
+            with self._lock:
+                self.written += 1
+                self.bytes_written += len(data)
+                self.total_write_time += write_time
+                self.max_write_time = max(self.max_write_time, write_time)
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            logger.error(f"写入图片失败: {path}, 错误: {e}")
+            if os.path.exists(temp_path):
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+
+        # 图片已完整落盘，再写入指向它的记录
+        if on_written is not None:
+            try:
+                on_written(path)
+            except Exception as e:
+                logger.error(f"图片写入后的回调出错: {path}, 错误: {e}")
+        return path
+
+    def shutdown(self, wait=True):
+        """等待已提交的图片写完并关闭线程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+            logger.info(f"图片写入线程池已关闭，共写入 {self.written} 张图片")
+
+    def stats(self):
+        """返回队列深度、写入延迟和溢出统计"""
+        with self._lock:
+            return {
+                "format": self.image_format,
+                "quality": self.quality,
+                "queue_depth": self.pending,
+                "max_queue_size": self.max_queue_size,
+                "submitted": self.submitted,
+                "written": self.written,
+                "failed": self.failed,
+                "overflow": self.overflow,
+                "bytes_written": self.bytes_written,
+                "avg_encode_ms": round(self.total_encode_time / self.submitted * 1000, 2) if self.submitted else 0.0,
+                "avg_write_ms": round(self.total_write_time / self.written * 1000, 2) if self.written else 0.0,
+                "max_write_ms": round(self.max_write_time * 1000, 2)
+            }
+
+# 进程内共享的图片写入器
+image_writer = ImageWriter()
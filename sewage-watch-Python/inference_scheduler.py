@@ -0,0 +1,292 @@
+import logging
+import threading
+import queue
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# infer未指定超时时间时等待结果的上限：SLO的倍数，且不少于MIN_RESULT_TIMEOUT秒(首批推理可能包含预热)
+RESULT_TIMEOUT_SLO_MULTIPLE = 20
+MIN_RESULT_TIMEOUT = 1.0
+
+class _InferenceRequest:
+    """单帧推理请求"""
+    __slots__ = ("frame", "future", "submit_time")
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.future = Future()
+        self.submit_time = time.perf_counter()
+
+class InferenceScheduler:
+    """
+    动态微批推理调度器，将多个流提交的帧合并为一次批量YOLO推理，并把结果分发回各自的请求
+    """
+    def __init__(self, model, max_batch_size=8, max_wait_ms=5, latency_slo_ms=100, max_queue_size=64):
+        """
+        初始化推理调度器
+
+        Args:
+            model: 共享模型句柄，接受图像列表并返回结果列表
+            max_batch_size: 单批最大帧数
+            max_wait_ms: 凑批时最长等待时间(毫秒)
+            latency_slo_ms: 从提交到返回结果的目标延迟(毫秒)，用于收紧凑批等待和统计超标次数
+            max_queue_size: 等待队列容量，满时丢弃最旧的请求
+        """
+        self.model = model
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms / 1000.0)
+        self.latency_slo = latency_slo_ms / 1000.0
+        self.result_timeout = max(MIN_RESULT_TIMEOUT, self.latency_slo * RESULT_TIMEOUT_SLO_MULTIPLE)
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._thread = None
+        self._running = False
+        self._stopped = False
+        # 保证stop之后不会再有请求进入队列而无人处理
+        self._submit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        # 统计信息
+        self.start_time = None
+        self.frames_submitted = 0
+        self.frames_completed = 0
+        self.frames_dropped = 0
+        self.frames_rejected = 0
+        self.timeouts = 0
+        self.batches = 0
+        self.slo_violations = 0
+        self.avg_batch_time = 0.0
+        self._latencies = deque(maxlen=1000)
+
+    def start(self):
+        """启动调度线程"""
+        if self._running or self._stopped:
+            return
+        self._running = True
+        self.start_time = time.time()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        logger.info(f"推理调度器已启动: 批大小={self.max_batch_size}, 等待={self.max_wait * 1000:.1f}ms, SLO={self.latency_slo * 1000:.0f}ms")
+
+    def stop(self):
+        """停止调度线程，未完成的请求以异常结束，之后提交的请求立即以异常结束"""
+        with self._submit_lock:
+            self._stopped = True
+            self._running = False
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2)
+        while True:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if request.future.set_running_or_notify_cancel():
+                request.future.set_exception(RuntimeError("推理调度器已停止"))
+
+    def submit(self, frame):
+        """
+        提交一帧等待批量推理
+
+        Args:
+            frame: BGR图像
+
+        Returns:
+            Future: 完成后结果为该帧的YOLO结果；调度器已停止时立即以异常结束
+        """
+        request = _InferenceRequest(frame)
+        with self._submit_lock:
+            if self._stopped:
+                request.future.set_exception(RuntimeError("推理调度器已停止"))
+                with self._stats_lock:
+                    self.frames_rejected += 1
+                return request.future
+            while True:
+                try:
+                    self._queue.put_nowait(request)
+                    break
+                except queue.Full:
+                    # 队列已满，丢弃最旧的请求以保证实时性
+                    try:
+                        stale = self._queue.get_nowait()
+                        if stale.future.set_running_or_notify_cancel():
+                            stale.future.set_exception(RuntimeError("推理队列已满，请求被丢弃"))
+                        with self._stats_lock:
+                            self.frames_dropped += 1
+                    except queue.Empty:
+                        pass
+        with self._stats_lock:
+            self.frames_submitted += 1
+        return request.future
+
+    def infer(self, frame, timeout=None):
+        """
+        同步推理一帧
+
+        Args:
+            frame: BGR图像
+            timeout: 等待结果的超时时间(秒)，为None时使用由SLO换算的result_timeout
+
+        Returns:
+            该帧的YOLO结果
+
+        Raises:
+            concurrent.futures.TimeoutError: 超时未返回结果，尚未开始推理的请求会被取消
+        """
+        future = self.submit(frame)
+        try:
+            return future.result(timeout=self.result_timeout if timeout is None else timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+
+    def _wait_window(self):
+        """凑批等待时间，保证等待加推理耗时不超过SLO"""
+        budget = self.latency_slo - self.avg_batch_time
+        return max(0.0, min(self.max_wait, budget))
+
+    def _collect_batch(self):
+        """收集一批请求，达到批大小或等待超时即返回，跳过已被调用方取消的请求"""
+        try:
+            first = self._queue.get(timeout=0.1)
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = first.submit_time + self._wait_window()
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    # 等待窗口已过，只取已在队列中的请求
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        # 标记为执行中，之后调用方不能再取消
+        return [request for request in batch if request.future.set_running_or_notify_cancel()]
+
+    def _run(self):
+        """调度循环，在单独线程中运行"""
+        while self._running:
+            batch = self._collect_batch()
+            if not batch:
+                continue
+
+            batch_start = time.perf_counter()
+            try:
+                results = self.model([request.frame for request in batch])
+            except Exception as e:
+                logger.error(f"批量推理失败: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            batch_time = time.perf_counter() - batch_start
+
+            now = time.perf_counter()
+            for request, result in zip(batch, results):
+                request.future.set_result(result)
+
+            with self._stats_lock:
+                self.batches += 1
+                self.frames_completed += len(batch)
+                self.avg_batch_time = batch_time if self.batches == 1 else 0.9 * self.avg_batch_time + 0.1 * batch_time
+                for request in batch:
+                    latency = now - request.submit_time
+                    self._latencies.append(latency)
+                    if latency > self.latency_slo:
+                        self.slo_violations += 1
+
+    def stats(self):
+        """返回吞吐量和延迟统计"""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            uptime = time.time() - self.start_time if self.start_time else 0
+
+            def percentile(p):
+                if not latencies:
+                    return 0.0
+                return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+            return {
+                "model_path": getattr(self.model, "model_path", None),
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": round(self.max_wait * 1000, 2),
+                "latency_slo_ms": round(self.latency_slo * 1000, 2),
+                "queue_depth": self._queue.qsize(),
+                "frames_submitted": self.frames_submitted,
+                "frames_completed": self.frames_completed,
+                "frames_dropped": self.frames_dropped,
+                "frames_rejected": self.frames_rejected,
+                "timeouts": self.timeouts,
+                "result_timeout_ms": round(self.result_timeout * 1000, 2),
+                "batches": self.batches,
+                "avg_batch_size": round(self.frames_completed / self.batches, 2) if self.batches else 0,
+                "avg_batch_time_ms": round(self.avg_batch_time * 1000, 2),
+                "throughput_fps": round(self.frames_completed / uptime, 2) if uptime > 0 else 0,
+                "latency_p50_ms": percentile(0.5),
+                "latency_p95_ms": percentile(0.95),
+                "slo_violations": self.slo_violations
+            }
+
+class InferenceService:
+    """
+    中央推理服务，为每个共享模型维护一个微批调度器
+    """
+    def __init__(self):
+        self._schedulers = {}
+        self._lock = threading.Lock()
+        self.settings = {
+            "max_batch_size": 8,
+            "max_wait_ms": 5,
+            "latency_slo_ms": 100
+        }
+
+    def configure(self, **settings):
+        """
+        更新之后新建调度器使用的参数
+
+        Args:
+            **settings: max_batch_size、max_wait_ms、latency_slo_ms
+        """
+        self.settings.update({k: v for k, v in settings.items() if v is not None})
+
+    def get(self, model):
+        """
+        获取模型对应的调度器，首次请求时创建并启动
+
+        Args:
+            model: 共享模型句柄
+
+        Returns:
+            InferenceScheduler: 该模型的调度器
+        """
+        with self._lock:
+            scheduler = self._schedulers.get(id(model))
+            if scheduler is None:
+                scheduler = InferenceScheduler(model, **self.settings)
+                scheduler.start()
+                self._schedulers[id(model)] = scheduler
+            return scheduler
+
+    def stop_all(self):
+        """停止所有调度器"""
+        with self._lock:
+            schedulers = list(self._schedulers.values())
+            self._schedulers.clear()
+        for scheduler in schedulers:
+            scheduler.stop()
+
+    def stats(self):
+        """返回所有调度器的统计信息"""
+        with self._lock:
+            schedulers = list(self._schedulers.values())
+        return [scheduler.stats() for scheduler in schedulers]
+
+# 进程内共享的推理服务
+inference_service = InferenceService()
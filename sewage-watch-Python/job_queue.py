@@ -0,0 +1,493 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 任务状态，与analysis_tasks.status字段一致
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+def summarize_result(result):
+    """
+    从process_video的结果中提取任务结束后保留在内存中的摘要，不保留逐帧结果、轨迹和逐个检测的置信度，
+    完整结果从结构化数据文件读取
+
+    Args:
+        result: process_video返回的结果
+
+    Returns:
+        dict: 视频信息、按类型的统计、帧数和轨迹数、运动门控统计和结构化数据文件路径
+    """
+    return {
+        "success": result.get("success", False),
+        "video_info": result.get("video_info", {}),
+        "detected_objects": {
+            type_name: {key: value for key, value in data.items() if key != "confidence"}
+            for type_name, data in result.get("detected_objects", {}).items()
+        },
+        "total_saved_frames": result.get("total_saved_frames", 0),
+        "total_tracks": result.get("total_tracks", 0),
+        "motion_gate": result.get("motion_gate"),
+        "structured_data_path": result.get("structured_data_path")
+    }
+
+class AnalysisJob:
+    """
+    一个视频分析任务，ID与analysis_tasks表的主键一致
+    """
+    def __init__(self, job_id, video_path, source_video, options, cleanup=False, on_finished=None, task_id=None,
+                 save_options=None):
+        """
+        Args:
+            job_id: 任务ID，数据库不可用或结果写入已有任务时为内存中生成的字符串
+            video_path: 待分析的视频路径
+            source_video: 记录到数据库的源视频文件名
+            options: 透传给process_video的分析参数
+            cleanup: 分析结束后是否删除视频文件
+            on_finished: 任务结束(完成、失败或取消)后调用的函数，参数为任务
+            task_id: 结果写入的已有analysis_tasks记录，None时为任务自己的记录
+            save_options: 透传给save_to_database的参数，如帧索引偏移
+        """
+        self.id = job_id
+        self.task_id = task_id
+        self.save_options = save_options or {}
+        self.video_path = video_path
+        self.source_video = source_video
+        self.options = options
+        self.cleanup = cleanup
+        self.on_finished = on_finished
+        self.status = JOB_PENDING
+        self.total_frames = 0
+        self.frames_processed = 0
+        self.result = None  # 完成后为summarize_result的摘要
+        self.error = None
+        self.created_at = datetime.datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def to_dict(self, include_result=True):
+        """返回任务状态，include_result为True时附带完成后的分析结果摘要"""
+        progress = self.frames_processed / self.total_frames * 100 if self.total_frames > 0 else 0
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "source_video": self.source_video,
+            "task_id": self.task_id if self.task_id is not None else self.id,
+            "total_frames": self.total_frames,
+            "frames_processed": self.frames_processed,
+            "progress": round(min(progress, 100), 2),
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "error": self.error
+        }
+        if include_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+class AnalysisJobQueue:
+    """
+    视频分析任务队列，请求只负责提交任务，由有界线程池在后台执行分析并写回进度
+    """
+    def __init__(self, max_concurrent=2, progress_interval=1.0, max_finished_jobs=200):
+        """
+        初始化任务队列
+
+        Args:
+            max_concurrent: 同时执行的分析任务数，超出的任务排队等待
+            progress_interval: 进度写入数据库的最小间隔(秒)
+            max_finished_jobs: 内存中保留的已结束任务数，更早的任务只能从数据库查询
+        """
+        self.max_concurrent = max_concurrent
+        self.progress_interval = progress_interval
+        self.max_finished_jobs = max_finished_jobs
+        self.db_connector = None
+        self.results_dir = None
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def configure(self, max_concurrent=None, db_connector=None, results_dir=None):
+        """
+        设置并发上限、数据库连接函数和结构化数据文件所在目录，并发上限需在首次提交前设置
+
+        Args:
+            max_concurrent: 同时执行的分析任务数
+            db_connector: 返回数据库连接的函数
+            results_dir: 结构化数据文件所在目录，用于读取已不在内存中的任务的完整结果
+        """
+        if db_connector is not None:
+            self.db_connector = db_connector
+        if results_dir is not None:
+            self.results_dir = results_dir
+        if max_concurrent is not None:
+            if self._executor is not None:
+                logger.warning("分析任务线程池已创建，忽略新的并发设置")
+            else:
+                self.max_concurrent = max(1, int(max_concurrent))
+
+    @property
+    def executor(self):
+        """延迟创建的线程池"""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="analysis-job")
+        return self._executor
+
+    def submit(self, processor, video_path, source_video=None, options=None, cleanup=False, on_finished=None,
+               task_id=None, save_options=None):
+        """
+        创建analysis_tasks记录并提交分析任务，立即返回；指定task_id时结果写入该记录，不新建记录
+
+        Args:
+            processor: DetectionProcessor实例
+            video_path: 待分析的视频路径
+            source_video: 记录到数据库的源视频文件名，默认取视频文件名
+            options: 透传给process_video的分析参数
+            cleanup: 分析结束后是否删除视频文件
+            on_finished: 任务结束后在工作线程中调用的函数，参数为任务
+            task_id: 结果写入的已有analysis_tasks记录(如分段录制的各分段)，该记录的状态由调用方维护
+            save_options: 透传给save_to_database的参数
+
+        Returns:
+            AnalysisJob: 新建的任务
+        """
+        source_video = source_video or os.path.basename(video_path)
+        job_id = self._create_task_record(source_video) if task_id is None else None
+        if job_id is None:
+            # 数据库不可用或写入已有记录时仍然执行分析，任务只在内存中跟踪
+            job_id = uuid.uuid4().hex
+        job = AnalysisJob(job_id, video_path, source_video, dict(options or {}), cleanup=cleanup,
+                          on_finished=on_finished, task_id=task_id, save_options=save_options)
+        with self._lock:
+            self._jobs[str(job_id)] = job
+            self._prune()
+        job.future = self.executor.submit(self._run, job, processor)
+        logger.info(f"已提交视频分析任务: {job_id}, 视频: {video_path}")
+        return job
+
+    def get(self, job_id):
+        """
+        查询任务状态，内存中没有时从analysis_tasks表读取
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            dict: 任务状态，不存在时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(str(job_id))
+        if job is not None:
+            return job.to_dict()
+        return self._load_task_record(job_id)
+
+    def get_result(self, job_id):
+        """
+        查询任务状态并附带完整的分析结果，逐帧结果和轨迹从结构化数据文件读取，不常驻内存
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            dict: 任务状态，已完成时result为摘要加saved_frames和tracks，任务不存在时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(str(job_id))
+        if job is not None:
+            data = job.to_dict()
+            summary = data.pop("result", None)
+            path = summary.get("structured_data_path") if summary else None
+        else:
+            data = self._load_task_record(job_id)
+            if data is None:
+                return None
+            summary = None
+            filename = data.get("structured_data_path")
+            path = os.path.join(self.results_dir, os.path.basename(filename)) if filename and self.results_dir else None
+        if data["status"] != JOB_COMPLETED:
+            return data
+
+        result = dict(summary or {})
+        if path is None:
+            # 没有检测到物体的任务不生成结构化数据文件
+            if summary is not None:
+                result.update(saved_frames=[], tracks=[])
+                data["result"] = result
+            return data
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                structured = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"读取分析结果失败: {job_id}, 文件: {path}, 错误: {e}")
+            data["result"] = summary
+            data["result_error"] = f"无法读取结构化数据文件: {os.path.basename(path)}"
+            return data
+        if summary is None:
+            metadata = structured.get("metadata", {})
+            result = {
+                "success": True,
+                "detected_objects": metadata.get("detection_summary", {}),
+                "total_saved_frames": metadata.get("total_frames_with_detections", 0),
+                "total_tracks": len(structured.get("tracks", [])),
+                "structured_data_path": path
+            }
+        result["saved_frames"] = structured.get("frames", [])
+        result["tracks"] = structured.get("tracks", [])
+        data["result"] = result
+        return data
+
+    def list_jobs(self):
+        """返回内存中所有任务的状态，不附带分析结果"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job.to_dict(include_result=False) for job in jobs]
+
+    def cancel(self, job_id):
+        """
+        取消任务，排队中的任务直接取消，执行中的任务在下一个采样帧停止
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            dict: 取消后的任务状态，任务不在队列中时返回None
+        """
+        with self._lock:
+            job = self._jobs.get(str(job_id))
+        if job is None:
+            return None
+        if job.status not in FINISHED_STATES:
+            job.cancel_event.set()
+            if job.future is not None and job.future.cancel():
+                self._finish(job, JOB_CANCELLED, error="分析已取消")
+                self._cleanup(job)
+            logger.info(f"已请求取消分析任务: {job_id}")
+        return job.to_dict(include_result=False)
+
+    def stats(self):
+        """返回各状态的任务数量"""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {state: 0 for state in (JOB_PENDING, JOB_RUNNING) + FINISHED_STATES}
+        for job in jobs:
+            counts[job.status] += 1
+        return {"max_concurrent": self.max_concurrent, "jobs": counts}
+
+    def shutdown(self):
+        """取消所有未完成的任务并等待执行中的任务停止"""
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job.status not in FINISHED_STATES]
+        for job in jobs:
+            self.cancel(job.id)
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _run(self, job, processor):
+        """在工作线程中执行分析并保存结果"""
+        try:
+            if job.cancel_event.is_set():
+                self._finish(job, JOB_CANCELLED, error="分析已取消")
+                return
+            job.status = JOB_RUNNING
+            job.started_at = datetime.datetime.now()
+            self._update_task_record(job)
+            logger.info(f"开始执行分析任务: {job.id}")
+
+            last_report = [time.monotonic()]
+
+            def on_progress(frames_processed, total_frames):
+                job.frames_processed = frames_processed
+                job.total_frames = total_frames
+                now = time.monotonic()
+                if now - last_report[0] >= self.progress_interval:
+                    last_report[0] = now
+                    self._update_task_record(job)
+
+            result = processor.process_video(job.video_path, progress_callback=on_progress,
+                                             cancel_event=job.cancel_event, **job.options)
+            if result.get("cancelled"):
+                self._finish(job, JOB_CANCELLED, error=result.get("error"))
+            elif not result.get("success", False):
+                logger.warning(f"视频分析失败: {job.id}, 错误: {result.get('error', '未知错误')}")
+                self._finish(job, JOB_FAILED, error=result.get("error", "未知错误"))
+            else:
+                video_info = result.get("video_info", {})
+                job.total_frames = video_info.get("frame_count", job.total_frames)
+                job.frames_processed = video_info.get("processed_frames", job.frames_processed)
+                if self.db_connector is not None:
+                    task_id = job.task_id if job.task_id is not None else (job.id if isinstance(job.id, int) else None)
+                    processor.save_to_database(self.db_connector, result, task_id, **job.save_options)
+                # 逐帧结果和轨迹已写入数据库和结构化数据文件，内存中只保留摘要
+                job.result = summarize_result(result)
+                self._finish(job, JOB_COMPLETED, structured_data_path=result.get("structured_data_path"))
+                logger.info(f"分析任务完成: {job.id}, 检测到 {result.get('total_saved_frames', 0)} 个包含物体的帧")
+        except Exception as e:
+            logger.error(f"执行分析任务时出错: {job.id}, 错误: {e}", exc_info=True)
+            self._finish(job, JOB_FAILED, error=str(e))
+        finally:
+            self._cleanup(job)
+
+    def _cleanup(self, job):
+        """删除任务提交时交给队列管理的临时视频"""
+        if job.cleanup and os.path.exists(job.video_path):
+            try:
+                os.unlink(job.video_path)
+                logger.info(f"已删除临时文件: {job.video_path}")
+            except Exception as e:
+                logger.error(f"删除临时文件失败: {job.video_path}, 错误: {e}")
+
+    def _finish(self, job, status, error=None, structured_data_path=None):
+        """记录任务结束状态"""
+        job.status = status
+        job.error = error
+        job.finished_at = datetime.datetime.now()
+        self._update_task_record(job, structured_data_path)
+        with self._lock:
+            self._prune()
+        if job.on_finished is not None:
+            try:
+                job.on_finished(job)
+            except Exception as e:
+                logger.error(f"分析任务结束回调出错: {job.id}, 错误: {e}")
+
+    def _prune(self):
+        """超出保留数量时移除最早结束的任务，需持有锁"""
+        finished = [key for key, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for key in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[key]
+
+    def create_task(self, source_video, status=JOB_RUNNING):
+        """
+        创建不由队列执行的analysis_tasks记录，用于多个分析任务共用一条记录(如分段录制)
+
+        Returns:
+            int: 任务ID，数据库不可用时返回None
+        """
+        return self._create_task_record(source_video, status)
+
+    def update_task(self, task_id, status, total_frames=0, frames_processed=0, end_time=None):
+        """更新create_task创建的记录的状态和进度"""
+        if self.db_connector is None or task_id is None:
+            return
+        connection = self.db_connector()
+        if not connection:
+            logger.error(f"无法更新分析任务记录，数据库连接失败: {task_id}")
+            return
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE analysis_tasks SET status = %s, total_frames = %s, frames_processed = %s, end_time = %s
+                    WHERE id = %s
+                    """,
+                    (status, total_frames, frames_processed, end_time, task_id)
+                )
+            connection.commit()
+        except Exception as e:
+            logger.error(f"更新分析任务记录失败: {task_id}, 错误: {e}")
+            connection.rollback()
+        finally:
+            connection.close()
+
+    def _create_task_record(self, source_video, status=JOB_PENDING):
+        """插入analysis_tasks记录，默认为pending状态，返回任务ID"""
+        if self.db_connector is None:
+            return None
+        connection = self.db_connector()
+        if not connection:
+            logger.error("无法创建分析任务记录，数据库连接失败")
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "INSERT INTO analysis_tasks (source_video, start_time, status) VALUES (%s, %s, %s)",
+                    (source_video, datetime.datetime.now(), status)
+                )
+                task_id = cursor.lastrowid
+            connection.commit()
+            return task_id
+        except Exception as e:
+            logger.error(f"创建分析任务记录失败: {e}")
+            connection.rollback()
+            return None
+        finally:
+            connection.close()
+
+    def _update_task_record(self, job, structured_data_path=None):
+        """把任务状态和进度写回analysis_tasks表"""
+        if self.db_connector is None or not isinstance(job.id, int):
+            return
+        connection = self.db_connector()
+        if not connection:
+            logger.error(f"无法更新分析任务记录，数据库连接失败: {job.id}")
+            return
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    UPDATE analysis_tasks
+                    SET status = %s, total_frames = %s, frames_processed = %s, end_time = %s,
+                        structured_data_path = COALESCE(%s, structured_data_path)
+                    WHERE id = %s
+                    """,
+                    (job.status, job.total_frames, job.frames_processed, job.finished_at,
+                     os.path.basename(structured_data_path) if structured_data_path else None, job.id)
+                )
+            connection.commit()
+        except Exception as e:
+            logger.error(f"更新分析任务记录失败: {job.id}, 错误: {e}")
+            connection.rollback()
+        finally:
+            connection.close()
+
+    def _load_task_record(self, job_id):
+        """从analysis_tasks表读取已不在内存中的任务"""
+        if self.db_connector is None or not str(job_id).isdigit():
+            return None
+        connection = self.db_connector()
+        if not connection:
+            return None
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT * FROM analysis_tasks WHERE id = %s", (int(job_id),))
+                row = cursor.fetchone()
+        except Exception as e:
+            logger.error(f"查询分析任务记录失败: {job_id}, 错误: {e}")
+            return None
+        finally:
+            connection.close()
+        if row is None:
+            return None
+        total_frames = row.get("total_frames") or 0
+        frames_processed = row.get("frames_processed") or 0
+        progress = frames_processed / total_frames * 100 if total_frames > 0 else 0
+        return {
+            "job_id": row["id"],
+            "status": row["status"],
+            "source_video": row["source_video"],
+            "total_frames": total_frames,
+            "frames_processed": frames_processed,
+            "progress": round(min(progress, 100), 2),
+            "started_at": row["start_time"].isoformat() if row.get("start_time") else None,
+            "finished_at": row["end_time"].isoformat() if row.get("end_time") else None,
+            "structured_data_path": row.get("structured_data_path")
+        }
+
+# 进程内共享的分析任务队列
+job_queue = AnalysisJobQueue()
@@ -1,16 +1,14 @@
 import cv2
-import base64
 import asyncio
 import numpy as np
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect, File, UploadFile, Form
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.websockets import WebSocketState
 from contextlib import asynccontextmanager
 import logging
 import threading
-import queue
 import time
 import os
 import xml.etree.ElementTree as ET
@@ -18,9 +16,36 @@ from pathlib import Path
 import pymysql
 import datetime
 import uuid
-
-from ultralytics import YOLO
-from detection import DetectionProcessor, RTMPRecorder
+import json
+import zipfile
+import functools
+from collections import OrderedDict
+from typing import List
+
+from detection import DetectionProcessor, LiveAnalyzer, RTMPRecorder
+from model_registry import model_registry
+from inference_scheduler import inference_service
+from shm_frame_bus import process_inference
+from frame_pipeline import frame_pipeline
+from frame_protocol import PROTOCOL_JSON, build_payload, send_payload, normalize_protocol
+from stream_hub import FrameBroadcaster, FramePacket, StreamHub
+from postprocess import FrameDetections
+from video_sampling import SAMPLE_AUTO
+from job_queue import JOB_COMPLETED, JOB_RUNNING, job_queue
+from upload_ingest import UploadTooLarge, upload_ingestor
+from image_batch import ZipArchiveReader, run_image_batches, zip_image_names
+from db_pool import ConnectionPool
+from history_writer import history_writer
+from image_writer import image_writer
+from event_dedup import EventDeduplicator
+from tracker import ObjectTracker
+from motion_gate import GatedDetector, MotionGate
+from pacing import FramePacer
+from adaptive_encoding import AdaptiveEncoder, encode_tier
+from frame_source import POLICY_LATEST, frame_sources
+from event_clips import EventClipRecorder, clip_writer
+from recording_segments import (SEGMENT_ANALYZED, SEGMENT_ANALYZING, SEGMENT_FAILED, SEGMENT_FRAME_STRIDE,
+                                SEGMENT_SKIPPED, SegmentIndex, segment_frame_offset, summarize_segment_result)
 
 # 保存原始环境变量值，以便在程序退出时恢复
 original_ffmpeg_options = os.environ.get('OPENCV_FFMPEG_CAPTURE_OPTIONS')
@@ -29,10 +54,128 @@ original_ffmpeg_options = os.environ.get('OPENCV_FFMPEG_CAPTURE_OPTIONS')
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# 模型权重路径：本地视频流与文件检测共用一个模型，RTMP流使用通用模型
+DETECTION_MODEL_PATH = "public/yolov8n_7_11.pt"
+RTMP_MODEL_PATH = "public/yolov8n.pt"
+
 # 创建临时目录来存储上传的文件
 TEMP_UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "temp_uploads")
 os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
 
+# 默认配置，配置文件缺失或读取失败时使用
+DEFAULT_CONFIG = {
+    "rtmp_url": "rtmp://example.com/live/default_stream",
+    "buffer_size": 30,
+    "fps": 60,
+    "reconnect_delay": 5,
+    "timeout": 10,
+    "db_host": "localhost",
+    "db_port": 3306,
+    "db_user": "root",
+    "db_password": "",
+    "db_name": "sewagewatch",
+    "db_pool_size": 10,
+    "db_pool_timeout": 5.0,
+    "db_pool_recycle": 3600,
+    "history_path": "../history",
+    "history_queue_size": 1000,
+    "history_batch_size": 50,
+    "history_flush_interval": 1.0,
+    "history_put_timeout": 0.0,
+    "image_writer_workers": 2,
+    "image_writer_queue_size": 64,
+    "image_format": "jpg",
+    "image_quality": 90,
+    "dedup_settle_time": 2.0,
+    "dedup_cooldown": 30.0,
+    "dedup_lost_timeout": 1.0,
+    "tracking_iou_threshold": 0.3,
+    "tracking_high_threshold": 0.5,
+    "tracking_max_age": 1.0,
+    "tracking_min_hits": 3,
+    "recording_backend": "auto",
+    "ffmpeg_path": "ffmpeg",
+    "recording_segment_seconds": 60,
+    "recording_segment_retention": 0,
+    "shared_capture_recorder": True,
+    "shared_capture_recorder_buffer": 90,
+    "live_analysis_buffer": 16,
+    "live_analysis_flush_interval": 5.0,
+    "event_clips_enabled": True,
+    "event_clips_pre_roll": 10.0,
+    "event_clips_post_roll": 10.0,
+    "event_clips_max_buffer_mb": 32,
+    "event_clips_max_clip_seconds": 60.0,
+    "event_clips_width": 960,
+    "event_clips_quality": 70,
+    "event_clips_max_pending": 4,
+    "adaptive_encoding_enabled": True,
+    "adaptive_max_width": 0,
+    "adaptive_degrade_ratio": 0.5,
+    "adaptive_upgrade_ratio": 0.2,
+    "adaptive_upgrade_after": 30,
+    "detect_types": ["bottle", "bird"],
+    "inference_max_batch_size": 8,
+    "inference_max_wait_ms": 5,
+    "inference_latency_slo_ms": 100,
+    "inference_backend": "thread",
+    "inference_process_workers": 2,
+    "inference_shm_slots": 16,
+    "inference_shm_max_width": 1920,
+    "inference_shm_max_height": 1080,
+    "pipeline_workers": 4,
+    "analysis_workers": 1,
+    "analysis_max_jobs": 2,
+    "image_batch_size": 16,
+    "upload_chunk_size_kb": 1024,
+    "upload_max_video_mb": 4096,
+    "upload_max_image_mb": 50,
+    "upload_hash_algorithm": "",
+    "upload_max_archive_images": 1000,
+    "upload_max_archive_mb": 1024,
+    "motion_gate": {
+        "enabled": True,
+        "method": "diff",
+        "pixel_threshold": 25,
+        "min_changed_ratio": 0.005,
+        "refresh_interval": 2.0,
+        "downscale_width": 160
+    },
+    "motion_gate_streams": {}
+}
+
+# 运动门控配置项及其类型，<stream url="...">下的同名节点覆盖对应流的设置
+MOTION_GATE_FIELDS = {
+    "enabled": lambda text: text.lower() in ("true", "1", "yes"),
+    "method": str,
+    "pixel_threshold": int,
+    "min_changed_ratio": float,
+    "refresh_interval": float,
+    "downscale_width": int
+}
+
+def read_optional(root, path, cast, default):
+    """读取可选配置项，节点不存在时返回默认值"""
+    elem = root.find(path)
+    if elem is None or elem.text is None:
+        return default
+    return cast(elem.text.strip())
+
+def read_motion_gate(root):
+    """读取运动门控的默认设置和按流地址的覆盖设置"""
+    defaults = dict(DEFAULT_CONFIG["motion_gate"])
+    streams = {}
+    node = root.find("motion_gate")
+    if node is not None:
+        for name, cast in MOTION_GATE_FIELDS.items():
+            defaults[name] = read_optional(node, name, cast, defaults[name])
+        for stream in node.findall("stream"):
+            url = stream.get("url")
+            if url:
+                streams[url] = {name: read_optional(stream, name, cast, defaults[name])
+                                for name, cast in MOTION_GATE_FIELDS.items()}
+    return defaults, streams
+
 # 读取XML配置文件
 def load_config():
     """从XML配置文件中加载配置"""
@@ -40,23 +183,11 @@ def load_config():
         config_path = Path(__file__).parent / "../config.xml"
         if not config_path.exists():
             logger.warning(f"配置文件不存在: {config_path}，将使用默认配置")
-            return {
-                "rtmp_url": "rtmp://example.com/live/default_stream",
-                "buffer_size": 30,
-                "fps": 60,
-                "reconnect_delay": 5,
-                "timeout": 10,
-                "db_host": "localhost",
-                "db_port": 3306,
-                "db_user": "root",
-                "db_password": "",
-                "db_name": "sewagewatch",
-                "history_path": "../history",
-                "detect_types": ["bottle", "bird"]
-            }
+            return dict(DEFAULT_CONFIG)
         
         tree = ET.parse(config_path)
         root = tree.getroot()
+        motion_gate, motion_gate_streams = read_motion_gate(root)
         
         # 读取RTMP URL
         rtmp_url = root.find("rtmp/url").text
@@ -96,25 +227,85 @@ def load_config():
             "db_user": db_user,
             "db_password": db_password,
             "db_name": db_name,
+            # 连接池配置（可选）
+            "db_pool_size": read_optional(root, "database/pool_size", int, DEFAULT_CONFIG["db_pool_size"]),
+            "db_pool_timeout": read_optional(root, "database/pool_timeout", float, DEFAULT_CONFIG["db_pool_timeout"]),
+            "db_pool_recycle": read_optional(root, "database/pool_recycle", int, DEFAULT_CONFIG["db_pool_recycle"]),
             "history_path": history_path,
-            "detect_types": detect_types
+            "detect_types": detect_types,
+            # 历史记录后台写入配置（可选）
+            "history_queue_size": read_optional(root, "history/queue_size", int, DEFAULT_CONFIG["history_queue_size"]),
+            "history_batch_size": read_optional(root, "history/batch_size", int, DEFAULT_CONFIG["history_batch_size"]),
+            "history_flush_interval": read_optional(root, "history/flush_interval", float, DEFAULT_CONFIG["history_flush_interval"]),
+            "history_put_timeout": read_optional(root, "history/put_timeout", float, DEFAULT_CONFIG["history_put_timeout"]),
+            # 标注图片后台写入配置（可选）
+            "image_writer_workers": read_optional(root, "image_writer/workers", int, DEFAULT_CONFIG["image_writer_workers"]),
+            "image_writer_queue_size": read_optional(root, "image_writer/queue_size", int, DEFAULT_CONFIG["image_writer_queue_size"]),
+            "image_format": read_optional(root, "image_writer/format", str, DEFAULT_CONFIG["image_format"]),
+            "image_quality": read_optional(root, "image_writer/quality", int, DEFAULT_CONFIG["image_quality"]),
+            # 实时检测事件去重配置（可选）
+            "dedup_settle_time": read_optional(root, "history/dedup/settle_time", float, DEFAULT_CONFIG["dedup_settle_time"]),
+            "dedup_cooldown": read_optional(root, "history/dedup/cooldown", float, DEFAULT_CONFIG["dedup_cooldown"]),
+            "dedup_lost_timeout": read_optional(root, "history/dedup/lost_timeout", float, DEFAULT_CONFIG["dedup_lost_timeout"]),
+            # 实时流多目标跟踪配置（可选）
+            "tracking_iou_threshold": read_optional(root, "tracking/iou_threshold", float, DEFAULT_CONFIG["tracking_iou_threshold"]),
+            "tracking_high_threshold": read_optional(root, "tracking/high_threshold", float, DEFAULT_CONFIG["tracking_high_threshold"]),
+            "tracking_max_age": read_optional(root, "tracking/max_age", float, DEFAULT_CONFIG["tracking_max_age"]),
+            "tracking_min_hits": read_optional(root, "tracking/min_hits", int, DEFAULT_CONFIG["tracking_min_hits"]),
+            # RTMP录制方式（可选）：auto/copy/opencv
+            "recording_backend": read_optional(root, "recording/backend", str, DEFAULT_CONFIG["recording_backend"]),
+            "ffmpeg_path": read_optional(root, "recording/ffmpeg_path", str, DEFAULT_CONFIG["ffmpeg_path"]),
+            "recording_segment_seconds": read_optional(root, "recording/segment_seconds", int, DEFAULT_CONFIG["recording_segment_seconds"]),
+            "recording_segment_retention": read_optional(root, "recording/segment_retention", int, DEFAULT_CONFIG["recording_segment_retention"]),
+            # 同一地址的观看、录制和实时分析共用一个采集源（可选）
+            "shared_capture_recorder": read_optional(root, "shared_capture/recorder", lambda text: text.lower() in ("true", "1", "yes"), DEFAULT_CONFIG["shared_capture_recorder"]),
+            "shared_capture_recorder_buffer": read_optional(root, "shared_capture/recorder_buffer", int, DEFAULT_CONFIG["shared_capture_recorder_buffer"]),
+            "live_analysis_buffer": read_optional(root, "shared_capture/analysis_buffer", int, DEFAULT_CONFIG["live_analysis_buffer"]),
+            "live_analysis_flush_interval": read_optional(root, "shared_capture/flush_interval", float, DEFAULT_CONFIG["live_analysis_flush_interval"]),
+            # 实时流检测事件的前后片段（可选）
+            "event_clips_enabled": read_optional(root, "event_clips/enabled", lambda text: text.lower() in ("true", "1", "yes"), DEFAULT_CONFIG["event_clips_enabled"]),
+            "event_clips_pre_roll": read_optional(root, "event_clips/pre_roll", float, DEFAULT_CONFIG["event_clips_pre_roll"]),
+            "event_clips_post_roll": read_optional(root, "event_clips/post_roll", float, DEFAULT_CONFIG["event_clips_post_roll"]),
+            "event_clips_max_buffer_mb": read_optional(root, "event_clips/max_buffer_mb", int, DEFAULT_CONFIG["event_clips_max_buffer_mb"]),
+            "event_clips_max_clip_seconds": read_optional(root, "event_clips/max_clip_seconds", float, DEFAULT_CONFIG["event_clips_max_clip_seconds"]),
+            "event_clips_width": read_optional(root, "event_clips/width", int, DEFAULT_CONFIG["event_clips_width"]),
+            "event_clips_quality": read_optional(root, "event_clips/quality", int, DEFAULT_CONFIG["event_clips_quality"]),
+            "event_clips_max_pending": read_optional(root, "event_clips/max_pending", int, DEFAULT_CONFIG["event_clips_max_pending"]),
+            # WebSocket观看者的自适应编码（可选）
+            "adaptive_encoding_enabled": read_optional(root, "adaptive_encoding/enabled", lambda text: text.lower() in ("true", "1", "yes"), DEFAULT_CONFIG["adaptive_encoding_enabled"]),
+            "adaptive_max_width": read_optional(root, "adaptive_encoding/max_width", int, DEFAULT_CONFIG["adaptive_max_width"]),
+            "adaptive_degrade_ratio": read_optional(root, "adaptive_encoding/degrade_ratio", float, DEFAULT_CONFIG["adaptive_degrade_ratio"]),
+            "adaptive_upgrade_ratio": read_optional(root, "adaptive_encoding/upgrade_ratio", float, DEFAULT_CONFIG["adaptive_upgrade_ratio"]),
+            "adaptive_upgrade_after": read_optional(root, "adaptive_encoding/upgrade_after", int, DEFAULT_CONFIG["adaptive_upgrade_after"]),
+            # 推理调度配置（可选）
+            "inference_max_batch_size": read_optional(root, "inference/max_batch_size", int, DEFAULT_CONFIG["inference_max_batch_size"]),
+            "inference_max_wait_ms": read_optional(root, "inference/max_wait_ms", float, DEFAULT_CONFIG["inference_max_wait_ms"]),
+            "inference_latency_slo_ms": read_optional(root, "inference/latency_slo_ms", float, DEFAULT_CONFIG["inference_latency_slo_ms"]),
+            "inference_backend": read_optional(root, "inference/backend", lambda text: text.strip().lower(), DEFAULT_CONFIG["inference_backend"]),
+            "inference_process_workers": read_optional(root, "inference/process_workers", int, DEFAULT_CONFIG["inference_process_workers"]),
+            "inference_shm_slots": read_optional(root, "inference/shm_slots", int, DEFAULT_CONFIG["inference_shm_slots"]),
+            "inference_shm_max_width": read_optional(root, "inference/shm_max_width", int, DEFAULT_CONFIG["inference_shm_max_width"]),
+            "inference_shm_max_height": read_optional(root, "inference/shm_max_height", int, DEFAULT_CONFIG["inference_shm_max_height"]),
+            # 帧处理线程池配置（可选）
+            "pipeline_workers": read_optional(root, "pipeline/workers", int, DEFAULT_CONFIG["pipeline_workers"]),
+            # 视频分段并行分析进程数（可选）
+            "analysis_workers": read_optional(root, "analysis/workers", int, DEFAULT_CONFIG["analysis_workers"]),
+            "analysis_max_jobs": read_optional(root, "analysis/max_jobs", int, DEFAULT_CONFIG["analysis_max_jobs"]),
+            "image_batch_size": read_optional(root, "analysis/image_batch_size", int, DEFAULT_CONFIG["image_batch_size"]),
+            # 上传读取配置（可选）
+            "upload_chunk_size_kb": read_optional(root, "upload/chunk_size_kb", int, DEFAULT_CONFIG["upload_chunk_size_kb"]),
+            "upload_max_video_mb": read_optional(root, "upload/max_video_mb", int, DEFAULT_CONFIG["upload_max_video_mb"]),
+            "upload_max_image_mb": read_optional(root, "upload/max_image_mb", int, DEFAULT_CONFIG["upload_max_image_mb"]),
+            "upload_hash_algorithm": read_optional(root, "upload/hash_algorithm", str, DEFAULT_CONFIG["upload_hash_algorithm"]),
+            "upload_max_archive_images": read_optional(root, "upload/max_archive_images", int, DEFAULT_CONFIG["upload_max_archive_images"]),
+            "upload_max_archive_mb": read_optional(root, "upload/max_archive_mb", int, DEFAULT_CONFIG["upload_max_archive_mb"]),
+            # 推理前的运动门控（可选），可按流地址覆盖
+            "motion_gate": motion_gate,
+            "motion_gate_streams": motion_gate_streams
         }
     except Exception as e:
         logger.error(f"读取配置文件时出错: {e}")
-        return {
-            "rtmp_url": "rtmp://example.com/live/default_stream",
-            "buffer_size": 30,
-            "fps": 60,
-            "reconnect_delay": 5,
-            "timeout": 10,
-            "db_host": "localhost",
-            "db_port": 3306,
-            "db_user": "root",
-            "db_password": "",
-            "db_name": "sewagewatch",
-            "history_path": "../history",
-            "detect_types": ["bottle", "bird"]
-        }
+        return dict(DEFAULT_CONFIG)
 
 # 加载配置
 config = load_config()
@@ -122,20 +313,32 @@ config = load_config()
 # 确保历史记录目录存在
 os.makedirs(config["history_path"], exist_ok=True)
 
+# 创建新的数据库连接，由连接池调用
+def create_db_connection():
+    """创建新的数据库连接"""
+    return pymysql.connect(
+        host=config["db_host"],
+        port=config["db_port"],
+        user=config["db_user"],
+        password=config["db_password"],
+        database=config["db_name"],
+        charset='utf8mb4',
+        cursorclass=pymysql.cursors.DictCursor
+    )
+
+# 所有持久化路径共用的数据库连接池
+db_pool = ConnectionPool(
+    create_db_connection,
+    max_size=config["db_pool_size"],
+    timeout=config["db_pool_timeout"],
+    recycle=config["db_pool_recycle"]
+)
+
 # 数据库连接函数
 def get_db_connection():
-    """创建并返回数据库连接"""
+    """从连接池借出数据库连接，调用close()时归还到连接池"""
     try:
-        connection = pymysql.connect(
-            host=config["db_host"],
-            port=config["db_port"],
-            user=config["db_user"],
-            password=config["db_password"],
-            database=config["db_name"],
-            charset='utf8mb4',
-            cursorclass=pymysql.cursors.DictCursor
-        )
-        return connection
+        return db_pool.acquire()
     except Exception as e:
         logger.error(f"数据库连接失败: {e}")
         return None
@@ -146,7 +349,8 @@ def init_database():
     try:
         connection = get_db_connection()
         if connection:
-            with connection.cursor() as cursor:
+            # 离开with时归还连接，出错时关闭连接
+            with connection, connection.cursor() as cursor:
                 # 创建历史记录表
                 cursor.execute("""
                 CREATE TABLE IF NOT EXISTS history (
@@ -182,10 +386,23 @@ def init_database():
                     image_path VARCHAR(255) NOT NULL COMMENT '帧图片路径',
                     detected_types VARCHAR(255) NOT NULL COMMENT '检测到的物体类型',
                     total_objects INT DEFAULT 0 COMMENT '物体总数',
+                    UNIQUE KEY uk_task_frame (task_id, frame_index),
                     FOREIGN KEY (task_id) REFERENCES analysis_tasks(id) ON DELETE CASCADE
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='视频帧表';
                 """)
                 
+                # 旧表补充(task_id, frame_index)唯一索引，批量写入按该自然键取回帧ID
+                cursor.execute("""
+                SELECT COUNT(*) AS count FROM information_schema.statistics
+                WHERE table_schema = DATABASE() AND table_name = 'video_frames' AND index_name = 'uk_task_frame'
+                """)
+                if cursor.fetchone()["count"] == 0:
+                    try:
+                        cursor.execute("ALTER TABLE video_frames ADD UNIQUE KEY uk_task_frame (task_id, frame_index)")
+                        logger.info("已为video_frames添加(task_id, frame_index)唯一索引")
+                    except Exception as e:
+                        logger.warning(f"无法为video_frames添加唯一索引，批量写入取回帧ID将变慢: {e}")
+                
                 # 创建检测物体表
                 cursor.execute("""
                 CREATE TABLE IF NOT EXISTS detected_objects (
@@ -201,10 +418,25 @@ def init_database():
                     center_y FLOAT NOT NULL COMMENT '中心点Y坐标',
                     width FLOAT NOT NULL COMMENT '宽度',
                     height FLOAT NOT NULL COMMENT '高度',
+                    track_id INT DEFAULT NULL COMMENT '任务内的轨迹ID，同一物体跨帧相同',
+                    KEY idx_frame_track (frame_id, track_id),
                     FOREIGN KEY (frame_id) REFERENCES video_frames(id) ON DELETE CASCADE
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='检测物体表';
                 """)
                 
+                # 旧表补充轨迹ID列
+                cursor.execute("""
+                SELECT COUNT(*) AS count FROM information_schema.columns
+                WHERE table_schema = DATABASE() AND table_name = 'detected_objects' AND column_name = 'track_id'
+                """)
+                if cursor.fetchone()["count"] == 0:
+                    try:
+                        cursor.execute("ALTER TABLE detected_objects ADD COLUMN track_id INT DEFAULT NULL "
+                                       "COMMENT '任务内的轨迹ID，同一物体跨帧相同', ADD KEY idx_frame_track (frame_id, track_id)")
+                        logger.info("已为detected_objects添加track_id列")
+                    except Exception as e:
+                        logger.warning(f"无法为detected_objects添加track_id列: {e}")
+                
                 # 创建结构化数据表
                 cursor.execute("""
                 CREATE TABLE IF NOT EXISTS structured_data (
@@ -216,9 +448,25 @@ def init_database():
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='结构化数据表';
                 """)
                 
+                # 创建事件片段表，image_src与history.src相同，用于关联事件的标注图片
+                cursor.execute("""
+                CREATE TABLE IF NOT EXISTS event_clips (
+                    id INT PRIMARY KEY AUTO_INCREMENT COMMENT '片段ID',
+                    stream_url VARCHAR(255) NOT NULL COMMENT '流地址',
+                    type VARCHAR(255) NOT NULL COMMENT '片段中事件的物体类型',
+                    image_src VARCHAR(255) DEFAULT NULL COMMENT '关联的历史记录图片路径(history.src)',
+                    clip_src VARCHAR(255) NOT NULL COMMENT '片段视频路径',
+                    start_time DATETIME NOT NULL COMMENT '片段开始时间',
+                    end_time DATETIME NOT NULL COMMENT '片段结束时间',
+                    frames INT DEFAULT 0 COMMENT '帧数',
+                    size_bytes INT DEFAULT 0 COMMENT '文件大小(字节)',
+                    createdTime DATETIME DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+                    KEY idx_image_src (image_src)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COMMENT='事件片段表';
+                """)
+                
                 connection.commit()
                 logger.info("数据库表初始化成功")
-            connection.close()
         else:
             logger.error("无法初始化数据库表，连接失败")
     except Exception as e:
@@ -226,32 +474,143 @@ def init_database():
 
 # 保存历史记录到数据库
 def save_history_record(type_name, image_path, task_id=None):
-    """保存历史记录到数据库"""
-    try:
-        connection = get_db_connection()
-        if connection:
-            with connection.cursor() as cursor:
-                # 插入历史记录
-                sql = """
-                INSERT INTO history (taskId, type, src, createdTime)
-                VALUES (%s, %s, %s, %s)
-                """
-                now = datetime.datetime.now()
-                cursor.execute(sql, (task_id, type_name, image_path, now))
-                connection.commit()
-                logger.info(f"历史记录已保存: {type_name}, {image_path}")
-            connection.close()
-            return True
-        else:
-            logger.error("无法保存历史记录，数据库连接失败")
-            return False
-    except Exception as e:
-        logger.error(f"保存历史记录失败: {e}")
-        return False
+    """把历史记录放入后台写入队列，由写入线程批量提交，不阻塞检测线程"""
+    return history_writer.submit(type_name, image_path, task_id)
+
+# 配置历史记录后台写入器
+history_writer.configure(
+    db_connector=get_db_connection,
+    max_queue_size=config["history_queue_size"],
+    batch_size=config["history_batch_size"],
+    flush_interval=config["history_flush_interval"],
+    put_timeout=config["history_put_timeout"]
+)
+
+def save_history_image(annotated_frame, types_str, relative_dir):
+    """
+    保存一张实时检测的标注图片，图片落盘后再记录到数据库
+
+    Args:
+        annotated_frame: 标注后的帧
+        types_str: 检测到的所有类型，用逗号分隔
+        relative_dir: 数据库中记录的图片目录前缀
+    
+    Returns:
+        str: 数据库中记录的图片相对路径，写入队列已满被丢弃时返回None
+    """
+    now = datetime.datetime.now()
+    date_str = now.strftime("%Y%m%d_%H%M%S")
+    
+    # 生成唯一文件名
+    unique_id = str(uuid.uuid4()).replace("-", "")
+    filename = f"{date_str}_{unique_id}{image_writer.extension}"
+    image_path = os.path.join(config["history_path"], filename)
+    relative_path = f"{relative_dir}{filename}"  # 使用相对路径存储
+    
+    # 在当前线程编码后交给后台写入，图片落盘后再记录到数据库
+    if image_writer.submit(annotated_frame, image_path,
+                           on_written=lambda _: save_history_record(types_str, relative_path)):
+        logger.info(f"已提交历史图片: 类型={types_str}, 图片={image_path}")
+        return relative_path
+    return None
+
+def create_event_deduplicator():
+    """按配置创建实时流的检测事件去重器，按同一流的跟踪器分配的轨迹ID识别同一物体"""
+    return EventDeduplicator(
+        settle_time=config["dedup_settle_time"],
+        cooldown=config["dedup_cooldown"],
+        lost_timeout=config["dedup_lost_timeout"]
+    )
+
+def create_object_tracker():
+    """按配置创建实时流的多目标跟踪器，只保留最近的已结束轨迹"""
+    return ObjectTracker(
+        iou_threshold=config["tracking_iou_threshold"],
+        high_threshold=config["tracking_high_threshold"],
+        max_age=config["tracking_max_age"],
+        min_hits=config["tracking_min_hits"],
+        max_finished_tracks=500
+    )
+
+def create_adaptive_encoder(max_width=None):
+    """按配置创建观看者的自适应编码档位，max_width为客户端请求的最大宽度，不超过配置的上限"""
+    limit = config["adaptive_max_width"]
+    if limit > 0:
+        max_width = min(max_width, limit) if max_width else limit
+    return AdaptiveEncoder(
+        max_width=max_width,
+        enabled=config["adaptive_encoding_enabled"],
+        degrade_ratio=config["adaptive_degrade_ratio"],
+        upgrade_ratio=config["adaptive_upgrade_ratio"],
+        upgrade_after=config["adaptive_upgrade_after"]
+    )
+
+def motion_gate_options(stream_key=None):
+    """返回指定流的运动门控参数，未配置该流时使用默认设置，未启用时返回None"""
+    options = dict(config["motion_gate_streams"].get(stream_key, config["motion_gate"]))
+    if not options.pop("enabled"):
+        return None
+    return options
+
+def create_gated_detector(infer, stream_key=None):
+    """按流的门控配置包装推理函数"""
+    options = motion_gate_options(stream_key)
+    return GatedDetector(infer, MotionGate(**options) if options else None)
+
+# 配置标注图片后台写入器
+image_writer.configure(
+    max_workers=config["image_writer_workers"],
+    max_queue_size=config["image_writer_queue_size"],
+    image_format=config["image_format"],
+    quality=config["image_quality"]
+)
+
+# 配置事件片段后台写入器，片段保存在历史记录目录下，通过/history/clips/访问
+clip_writer.configure(
+    output_dir=os.path.join(config["history_path"], "clips"),
+    url_prefix="/history/clips/",
+    db_connector=get_db_connection,
+    max_pending=config["event_clips_max_pending"]
+)
+
+def create_event_clip_recorder(stream_url):
+    """按配置创建实时流的事件片段录制，未启用时返回None"""
+    if not config["event_clips_enabled"]:
+        return None
+    return EventClipRecorder(
+        stream_url,
+        pre_roll=config["event_clips_pre_roll"],
+        post_roll=config["event_clips_post_roll"],
+        max_bytes=config["event_clips_max_buffer_mb"] * 1024 * 1024,
+        max_clip_seconds=config["event_clips_max_clip_seconds"]
+    )
+
+# 事件片段的编码档位，与同档位的观看者共用一次编码
+EVENT_CLIP_TIER = (config["event_clips_width"] or None, config["event_clips_quality"])
 
 # 全局录制器字典，用于存储活动的录制任务
 active_recorders = {}
 
+# 分段录制的索引，按录制任务ID；录制中或仍有分段待分析的索引常驻内存，其余按最近使用保留
+# MAX_CACHED_RECORDING_INDEXES个，需要时从录制目录中的segments.json重新读取
+MAX_CACHED_RECORDING_INDEXES = 32
+recording_indexes = OrderedDict()
+recording_indexes_lock = threading.Lock()
+
+# 录制任务ID -> 分段目录；新录制直接登记，服务重启后按需扫描临时目录，只读取未扫描过的目录
+recording_directories = {}
+recording_directories_scanned = set()
+recording_directories_lock = threading.Lock()
+
+# 创建分段录制共用任务记录时持有，避免开始录制和第一个分段同时创建两条记录
+recording_tasks_lock = threading.Lock()
+
+# 录制任务的实时分析，按录制任务ID
+live_analyzers = {}
+
+# 正在运行的本地视频流，按连接ID
+active_video_streams = {}
+
 def apply_h264_optimizations():
     """设置环境变量以优化FFmpeg的H.264解码"""
     ffmpeg_options = {
@@ -289,10 +648,34 @@ async def lifespan(app: FastAPI):
     apply_h264_optimizations()
     init_database()
     
+    # 启动历史记录后台写入线程
+    history_writer.start()
+    
+    # 预加载并预热所有流共享的模型，避免首个连接承担加载耗时
+    model_registry.preload([DETECTION_MODEL_PATH, RTMP_MODEL_PATH])
+    
     yield  # 这是应用运行的部分
     
     # 关闭事件
     clear_h264_optimizations()
+    await rtmp_hub.close_all()
+    # 结束录制中的ffmpeg子进程，避免服务退出后仍在后台录制
+    for recorder in list(active_recorders.values()):
+        await asyncio.get_running_loop().run_in_executor(None, recorder.stop_recording)
+    active_recorders.clear()
+    for analyzer in list(live_analyzers.values()):
+        await asyncio.get_running_loop().run_in_executor(None, analyzer.stop)
+    live_analyzers.clear()
+    # 取消排队和执行中的分析任务，等待工作线程退出后再清理临时文件
+    await asyncio.get_running_loop().run_in_executor(None, job_queue.shutdown)
+    frame_pipeline.shutdown()
+    inference_service.stop_all()
+    await asyncio.get_running_loop().run_in_executor(None, process_inference.stop_all)
+    # 流和分析任务都已停止，先写完剩余图片(其回调会放入历史记录)和事件片段，再提交剩余的历史记录并关闭连接池
+    await asyncio.get_running_loop().run_in_executor(None, image_writer.shutdown)
+    await asyncio.get_running_loop().run_in_executor(None, clip_writer.shutdown)
+    await asyncio.get_running_loop().run_in_executor(None, history_writer.stop)
+    db_pool.close_all()
     
     # 清理临时上传目录
     try:
@@ -334,6 +717,29 @@ async def log_requests(request, call_next):
         logger.error(f"请求处理异常: {method} {path} - 耗时: {process_time:.4f}秒 - 错误: {str(e)}")
         raise
 
+# 上传大小限制中间件：按Content-Length在解析请求体之前拒绝超限的上传
+# Starlette在调用接口之前会把整个multipart请求体写入临时文件，接口内的分块检查无法提前中止，
+# 因此配置了大小限制时，没有Content-Length的请求（如分块传输）直接拒绝，避免绕过限制
+@app.middleware("http")
+async def limit_upload_size(request, call_next):
+    max_bytes = upload_ingestor.max_upload_bytes
+    if not (max_bytes and request.method == "POST" and request.url.path.startswith("/detect/")):
+        return await call_next(request)
+    content_length = request.headers.get("content-length")
+    if not content_length or not content_length.isdigit():
+        logger.warning(f"上传请求缺少Content-Length: {request.url.path}")
+        return JSONResponse(
+            status_code=411,
+            content={"success": False, "error": "上传请求必须包含Content-Length"}
+        )
+    if int(content_length) > max_bytes:
+        logger.warning(f"上传请求过大: {request.url.path}, 大小: {content_length} 字节")
+        return JSONResponse(
+            status_code=413,
+            content={"success": False, "error": str(UploadTooLarge(max_bytes))}
+        )
+    return await call_next(request)
+
 # 配置静态文件服务，使前端能够访问静态资源
 # 使用Path确保路径格式跨平台兼容
 # 配置public目录（用于存放HTML页面和模型文件）
@@ -344,24 +750,235 @@ app.mount("/public", StaticFiles(directory=str(public_dir.resolve())), name="pub
 history_dir = Path(config["history_path"])
 app.mount("/history", StaticFiles(directory=str(history_dir.resolve())), name="history")
 
+# 配置实时流共用的微批推理服务
+inference_service.configure(
+    max_batch_size=config["inference_max_batch_size"],
+    max_wait_ms=config["inference_max_wait_ms"],
+    latency_slo_ms=config["inference_latency_slo_ms"]
+)
+
+# 配置实时流的进程外推理：帧经共享内存槽位交给推理进程，推理不占用服务进程的GIL
+process_inference.configure(
+    workers=config["inference_process_workers"],
+    slots=config["inference_shm_slots"],
+    max_width=config["inference_shm_max_width"],
+    max_height=config["inference_shm_max_height"],
+    max_batch_size=config["inference_max_batch_size"]
+)
+
+def get_stream_scheduler(model):
+    """按inference/backend返回实时流使用的推理调度器：thread为进程内微批调度，process为共享内存推理进程池"""
+    if config["inference_backend"] == "process":
+        return process_inference.get(model)
+    return inference_service.get(model)
+
+# 配置帧处理线程池，线程数应不少于并发流数量，才能让各流的帧进入同一批推理
+frame_pipeline.configure(config["pipeline_workers"])
+
+# 配置共享采集源的重连延迟和超时
+frame_sources.configure(reconnect_delay=config["reconnect_delay"], timeout=config["timeout"])
+
+# 配置视频分析任务队列，限制同时执行的分析任务数
+job_queue.configure(max_concurrent=config["analysis_max_jobs"], db_connector=get_db_connection,
+                    results_dir=config["history_path"])
+
+# 配置上传读取：分块大小、大小上限和可选的哈希算法
+upload_ingestor.configure(
+    chunk_size=config["upload_chunk_size_kb"] * 1024,
+    max_video_bytes=config["upload_max_video_mb"] * 1024 * 1024,
+    max_image_bytes=config["upload_max_image_mb"] * 1024 * 1024,
+    hash_algorithm=config["upload_hash_algorithm"]
+)
+
 # 创建检测处理器实例
 detection_processor = DetectionProcessor(
-    model_path="public/yolov8n_7_11.pt",
+    model_path=DETECTION_MODEL_PATH,
     history_path=config["history_path"],
     detect_types=config["detect_types"]
 )
 
+def analysis_options(frame_interval, sample_mode, sample_seconds, workers):
+    """录制视频分析任务的参数"""
+    return {
+        "save_frames": True,
+        "frame_interval": frame_interval,
+        "sample_mode": sample_mode,
+        "sample_seconds": sample_seconds,
+        "workers": workers or config["analysis_workers"]
+    }
+
+def recording_index(task_id, recorder=None):
+    """
+    返回录制任务的分段索引
+
+    Args:
+        task_id: 录制任务ID
+        recorder: 录制中的RTMPRecorder，索引不存在时在其分段目录中创建
+
+    Returns:
+        SegmentIndex: 分段索引，不存在时返回None
+    """
+    with recording_indexes_lock:
+        index = recording_indexes.get(task_id)
+        if index is None and recorder is not None:
+            index = SegmentIndex(recorder.output_file, task_id=task_id, rtmp_url=recorder.rtmp_url,
+                                 retention=config["recording_segment_retention"])
+            recording_directories[task_id] = recorder.output_file
+        if index is not None:
+            cache_recording_index(task_id, index)
+            return index
+    
+    # 不在内存中时在录制目录中查找，扫描不持有索引锁，不阻塞其他录制的查询
+    directory = find_recording_directory(task_id)
+    if directory is None:
+        return None
+    with recording_indexes_lock:
+        index = recording_indexes.get(task_id)
+        if index is None:
+            index = SegmentIndex.load(directory, retention=config["recording_segment_retention"])
+            if index is None:
+                return None
+        cache_recording_index(task_id, index)
+        return index
+
+def cache_recording_index(task_id, index):
+    """放入索引缓存并淘汰最久未使用的已结束索引，需持有recording_indexes_lock"""
+    recording_indexes[task_id] = index
+    recording_indexes.move_to_end(task_id)
+    excess = len(recording_indexes) - MAX_CACHED_RECORDING_INDEXES
+    if excess <= 0:
+        return
+    # 录制中或有分段待分析的索引仍被分析回调引用，不能淘汰，否则会出现两个实例写同一个索引文件
+    for key in [key for key, cached in recording_indexes.items()
+                if key not in active_recorders and not cached.has_pending()][:excess]:
+        del recording_indexes[key]
+
+def find_recording_directory(task_id):
+    """
+    查找录制任务的分段目录，只读取上次扫描后新出现的目录中的索引
+
+    Returns:
+        str: 分段目录，不存在时返回None
+    """
+    with recording_directories_lock:
+        directory = recording_directories.get(task_id)
+        if directory is not None or not os.path.isdir(TEMP_UPLOAD_DIR):
+            return directory
+        for name in os.listdir(TEMP_UPLOAD_DIR):
+            if name in recording_directories_scanned:
+                continue
+            path = os.path.join(TEMP_UPLOAD_DIR, name)
+            if not os.path.isdir(path):
+                continue
+            candidate = SegmentIndex.load(path)
+            if candidate is None:
+                # 录制刚开始、还没有写入索引的目录下次再读取
+                continue
+            recording_directories_scanned.add(name)
+            recording_directories[candidate.task_id] = path
+        return recording_directories.get(task_id)
+
+def ensure_recording_task(index):
+    """
+    返回分段录制各分段共用的analysis_tasks记录ID，不存在时创建
+
+    Returns:
+        int: 任务ID，数据库不可用时返回None，各分段的分析任务各自创建记录
+    """
+    with recording_tasks_lock:
+        if index.analysis_task_id is None:
+            analysis_task_id = job_queue.create_task(f"{os.path.basename(index.directory)}/", JOB_RUNNING)
+            if analysis_task_id is not None:
+                index.set_analysis_task_id(analysis_task_id)
+        return index.analysis_task_id
+
+def sync_recording_task(index):
+    """把已分析分段的合计帧数写回共用的任务记录，录制已结束且没有待分析的分段时标记为completed"""
+    if index.analysis_task_id is None:
+        return
+    totals = index.to_dict()["totals"]
+    done = index.finished and not index.has_pending()
+    job_queue.update_task(
+        index.analysis_task_id,
+        JOB_COMPLETED if done else JOB_RUNNING,
+        total_frames=totals["frame_count"],
+        frames_processed=totals["processed_frames"],
+        end_time=datetime.datetime.now() if done else None
+    )
+
+def submit_segment_analysis(index, segment_index, options):
+    """
+    提交一个分段的分析任务，结束后把统计写回分段索引，并按保留数量清理已分析的分段文件
+
+    检测结果写入录制共用的analysis_tasks记录，帧索引加上分段的偏移，帧时间为相对录制开始的时间；
+    重新分析时先删除该分段的旧结果
+
+    Returns:
+        AnalysisJob: 分析任务
+    """
+    path = index.segment_path(segment_index)
+    segment = index.get(segment_index)
+    analysis_task_id = ensure_recording_task(index)
+    save_options = None
+    if analysis_task_id is not None:
+        save_options = {
+            "frame_offset": segment_frame_offset(segment_index),
+            "time_offset": segment["start"],
+            "frame_span": SEGMENT_FRAME_STRIDE
+        }
+
+    def on_finished(job):
+        if job.status == JOB_COMPLETED:
+            index.update(segment_index, status=SEGMENT_ANALYZED, job_id=job.id, error=None,
+                         summary=summarize_segment_result(job.result))
+        else:
+            index.update(segment_index, status=SEGMENT_FAILED, job_id=job.id, error=job.error)
+        index.prune()
+        sync_recording_task(index)
+
+    # 先标记为分析中，避免任务很快结束时状态被覆盖
+    index.update(segment_index, status=SEGMENT_ANALYZING, error=None)
+    job = job_queue.submit(
+        detection_processor,
+        path,
+        source_video=f"{os.path.basename(index.directory)}/{os.path.basename(path)}",
+        options=options,
+        on_finished=on_finished,
+        task_id=analysis_task_id,
+        save_options=save_options
+    )
+    index.update(segment_index, job_id=job.id)
+    return job
+
 @app.post("/rtmp/start-recording")
-async def start_rtmp_recording(rtmp_url: str = Form(None), max_duration: int = Form(3600)):
+async def start_rtmp_recording(
+    rtmp_url: str = Form(None),
+    max_duration: int = Form(3600),
+    segment_seconds: int = Form(None),
+    analyze: bool = Form(True),
+    frame_interval: int = Form(30),
+    sample_mode: str = Form(SAMPLE_AUTO),
+    sample_seconds: float = Form(None),
+    workers: int = Form(None),
+    live_analysis: bool = Form(False)
+):
     """
-    开始录制RTMP流
+    开始录制RTMP流，分段录制时每个分段关闭后立即提交分析；live_analysis时改为录制过程中从共享采集源实时分析采样帧
     
     Args:
         rtmp_url: RTMP流地址，如果未提供则使用配置中的默认地址
         max_duration: 最大录制时长(秒)，默认3600秒(1小时)
+        segment_seconds: 分段时长(秒)，默认使用配置值，0表示录制为单个文件并在停止时分析
+        analyze: 分段录制时是否分析每个分段，默认True
+        frame_interval: 分段分析的帧间隔，默认每30帧处理一次
+        sample_mode: 分段分析的采样模式，read/grab/seek/auto，默认auto
+        sample_seconds: 分段分析按时间采样的间隔(秒)，设置后忽略frame_interval
+        workers: 分段分析的并行进程数，默认使用配置值
+        live_analysis: 是否在录制过程中实时分析(与观看者共用一次解码，边分析边写入数据库)，
+            启用后不再分析分段或录制文件
     
     Returns:
-        JSONResponse: 包含录制任务ID和文件路径的响应
+        JSONResponse: 包含录制任务ID和文件路径(分段录制时为分段目录)的响应
     """
     try:
         # 如果未提供RTMP URL，则使用配置中的默认URL
@@ -371,24 +988,70 @@ async def start_rtmp_recording(rtmp_url: str = Form(None), max_duration: int = F
         else:
             logger.info(f"接收到RTMP录制请求，URL: {rtmp_url}, 最大时长: {max_duration}秒")
         
+        if segment_seconds is None:
+            segment_seconds = config["recording_segment_seconds"]
+        task_id = str(uuid.uuid4())
+        # 实时分析时分段只录制不分析
+        options = analysis_options(frame_interval, sample_mode, sample_seconds, workers) \
+            if analyze and not live_analysis else None
+        
+        def on_segment(segment):
+            # 在录制线程中调用：写入分段索引并提交该分段的分析
+            index = recording_index(task_id, recorder)
+            entry = index.add(segment["path"], segment["start"], segment["end"])
+            if options is None:
+                index.update(entry["index"], status=SEGMENT_SKIPPED)
+                index.prune()
+            else:
+                submit_segment_analysis(index, entry["index"], options)
+        
         # 创建录制器
         recorder = RTMPRecorder(
             rtmp_url=rtmp_url,
             output_dir=TEMP_UPLOAD_DIR,
-            max_duration=max_duration
+            max_duration=max_duration,
+            backend=config["recording_backend"],
+            ffmpeg_path=config["ffmpeg_path"],
+            startup_timeout=config["timeout"],
+            segment_seconds=segment_seconds,
+            on_segment=on_segment,
+            shared_capture=config["shared_capture_recorder"],
+            buffer_frames=config["shared_capture_recorder_buffer"]
         )
         
-        # 开始录制
-        output_file = recorder.start_recording()
+        # 开始录制，等待ffmpeg连上流可能需要数秒，放到线程中执行
+        output_file = await frame_pipeline.run(recorder.start_recording)
         if not output_file:
             return JSONResponse(
                 status_code=500,
                 content={"success": False, "error": "启动录制失败"}
             )
         
-        # 生成任务ID
-        task_id = str(uuid.uuid4())
         active_recorders[task_id] = recorder
+        index = None
+        if recorder.segment_seconds:
+            index = recording_index(task_id, recorder)
+            if options is not None:
+                # 各分段的检测结果写入同一条任务记录
+                await frame_pipeline.run(ensure_recording_task, index)
+        
+        analyzer = None
+        if live_analysis:
+            analyzer = LiveAnalyzer(
+                detection_processor,
+                rtmp_url,
+                db_connector=get_db_connection,
+                frame_interval=frame_interval,
+                sample_seconds=sample_seconds,
+                motion_gate=motion_gate_options(rtmp_url),
+                buffer_frames=config["live_analysis_buffer"],
+                flush_interval=config["live_analysis_flush_interval"]
+            )
+            if await frame_pipeline.run(analyzer.start):
+                live_analyzers[task_id] = analyzer
+            else:
+                logger.warning(f"实时分析启动失败，仅录制: {task_id}")
+                analyzer = None
         
         logger.info(f"RTMP流录制已开始，任务ID: {task_id}, 文件: {output_file}")
         
@@ -397,6 +1060,11 @@ async def start_rtmp_recording(rtmp_url: str = Form(None), max_duration: int = F
             "task_id": task_id,
             "output_file": output_file,
             "rtmp_url": rtmp_url,
+            "backend": recorder.active_backend,
+            "segment_seconds": recorder.segment_seconds,
+            "shared_capture": recorder.source is not None,
+            "live_analysis": analyzer is not None,
+            "analysis_task_id": analyzer.task_id if analyzer else (index.analysis_task_id if index else None),
             "message": "RTMP流录制已开始"
         })
     except Exception as e:
@@ -407,17 +1075,30 @@ async def start_rtmp_recording(rtmp_url: str = Form(None), max_duration: int = F
         )
 
 @app.post("/rtmp/stop-recording")
-async def stop_rtmp_recording(task_id: str = Form(...), analyze: bool = Form(True), frame_interval: int = Form(30)):
+async def stop_rtmp_recording(
+    task_id: str = Form(...),
+    analyze: bool = Form(True),
+    frame_interval: int = Form(30),
+    sample_mode: str = Form(SAMPLE_AUTO),
+    sample_seconds: float = Form(None),
+    workers: int = Form(None)
+):
     """
     停止RTMP流录制并可选地进行分析
     
+    分段录制时只需结束最后一个分段，各分段已在录制过程中提交分析，返回分段索引，分析参数以开始录制时为准；
+    开始录制时启用了实时分析的，分析已随录制完成，返回实时分析的统计，不再重新读取录制文件
+    
     Args:
         task_id: 录制任务ID
         analyze: 是否对录制的视频进行分析，默认True
         frame_interval: 分析时的帧间隔，默认每30帧处理一次
+        sample_mode: 采样模式，read/grab/seek/auto，默认auto
+        sample_seconds: 按时间采样的间隔(秒)，设置后忽略frame_interval
+        workers: 并行分析进程数，默认使用配置值
     
     Returns:
-        JSONResponse: 包含录制结果和分析结果的响应
+        JSONResponse: 包含录制结果和分析任务ID的响应，分析进度通过/jobs/{job_id}查询
     """
     try:
         # 检查任务ID是否存在
@@ -431,7 +1112,7 @@ async def stop_rtmp_recording(task_id: str = Form(...), analyze: bool = Form(Tru
         
         # 获取录制器并停止录制
         recorder = active_recorders[task_id]
-        video_path = recorder.stop_recording()
+        video_path = await frame_pipeline.run(recorder.stop_recording)
         
         # 从活动列表中移除
         del active_recorders[task_id]
@@ -442,28 +1123,30 @@ async def stop_rtmp_recording(task_id: str = Form(...), analyze: bool = Form(Tru
             "message": "RTMP流录制已停止"
         }
         
-        # 如果需要分析视频
-        if analyze and video_path and os.path.exists(video_path):
-            logger.info(f"开始分析录制的视频: {video_path}, 帧间隔: {frame_interval}")
-            
-            # 使用检测处理器分析视频
-            analysis_result = detection_processor.process_video(
-                video_path=video_path,
-                save_frames=True,
-                frame_interval=frame_interval
+        analyzer = live_analyzers.pop(task_id, None)
+        if analyzer is not None:
+            # 分析完已排队的采样帧并写入数据库
+            result["live_analysis"] = await frame_pipeline.run(analyzer.stop)
+        
+        if recorder.segment_seconds:
+            # 最后一个分段已在停止时提交分析，返回分段索引，合计结果通过/rtmp/recordings/{task_id}查询
+            index = recording_index(task_id, recorder)
+            await frame_pipeline.run(index.finish)
+            await frame_pipeline.run(sync_recording_task, index)
+            result["recording"] = index.to_dict()
+            return JSONResponse(result)
+        
+        # 如果需要分析视频，提交到后台任务队列，立即返回任务ID
+        if analyze and analyzer is None and video_path and os.path.exists(video_path):
+            logger.info(f"提交录制视频分析任务: {video_path}, 帧间隔: {frame_interval}")
+            job = await frame_pipeline.run(
+                job_queue.submit,
+                detection_processor,
+                video_path,
+                options=analysis_options(frame_interval, sample_mode, sample_seconds, workers)
             )
-            
-            if analysis_result.get("success", False):
-                logger.info(f"视频分析完成，检测到 {analysis_result.get('total_saved_frames', 0)} 个包含物体的帧")
-                
-                # 保存到数据库，传递任务ID
-                detection_processor.save_to_database(get_db_connection, analysis_result, task_id)
-                
-                # 添加分析结果到响应
-                result["analysis_result"] = analysis_result
-            else:
-                logger.warning(f"视频分析失败: {analysis_result.get('error', '未知错误')}")
-                result["analysis_error"] = analysis_result.get('error', '未知错误')
+            result["job_id"] = job.id
+            result["analysis_job"] = job.to_dict()
         
         return JSONResponse(result)
     except Exception as e:
@@ -488,6 +1171,10 @@ async def get_active_tasks():
                 "task_id": task_id,
                 "rtmp_url": recorder.rtmp_url,
                 "output_file": recorder.output_file,
+                "backend": recorder.active_backend,
+                "segments": len(recorder.segments),
+                "shared_capture": recorder.source is not None,
+                "live_analysis": live_analyzers[task_id].summary() if task_id in live_analyzers else None,
                 "is_recording": recorder.is_recording,
                 "recording_time": time.time() - recorder.start_time if recorder.start_time else 0
             })
@@ -504,12 +1191,213 @@ async def get_active_tasks():
             content={"success": False, "error": str(e)}
         )
 
+@app.get("/rtmp/recordings/{task_id}")
+async def get_recording_segments(task_id: str):
+    """
+    获取分段录制的分段索引和已分析分段的合计结果
+    
+    Args:
+        task_id: 录制任务ID
+    
+    Returns:
+        JSONResponse: 各分段的文件、起止时间、分析状态和统计，以及合计统计
+    """
+    index = await frame_pipeline.run(recording_index, task_id)
+    if index is None:
+        return JSONResponse(
+            status_code=404,
+            content={"success": False, "error": f"分段录制不存在: {task_id}"}
+        )
+    return JSONResponse({
+        "success": True,
+        "is_recording": task_id in active_recorders,
+        "recording": index.to_dict()
+    })
+
+@app.post("/rtmp/recordings/{task_id}/segments/{segment_index}/analyze")
+async def reanalyze_recording_segment(
+    task_id: str,
+    segment_index: int,
+    frame_interval: int = Form(30),
+    sample_mode: str = Form(SAMPLE_AUTO),
+    sample_seconds: float = Form(None),
+    workers: int = Form(None)
+):
+    """
+    重新分析一个分段，结果覆盖该分段在索引中的统计
+    
+    Args:
+        task_id: 录制任务ID
+        segment_index: 分段序号
+        frame_interval: 帧间隔，默认每30帧处理一次
+        sample_mode: 采样模式，read/grab/seek/auto，默认auto
+        sample_seconds: 按时间采样的间隔(秒)，设置后忽略frame_interval
+        workers: 并行分析进程数，默认使用配置值
+    
+    Returns:
+        JSONResponse: 包含分析任务ID的响应，分析进度通过/jobs/{job_id}查询
+    """
+    index = await frame_pipeline.run(recording_index, task_id)
+    segment = index.get(segment_index) if index else None
+    if segment is None:
+        return JSONResponse(
+            status_code=404,
+            content={"success": False, "error": f"分段不存在: {task_id}/{segment_index}"}
+        )
+    if segment["deleted"] or not os.path.exists(index.segment_path(segment_index)):
+        return JSONResponse(
+            status_code=410,
+            content={"success": False, "error": f"分段文件已按保留策略删除: {segment['file']}"}
+        )
+    if segment["status"] == SEGMENT_ANALYZING:
+        return JSONResponse(
+            status_code=409,
+            content={"success": False, "error": "该分段正在分析中", "job_id": segment["job_id"]}
+        )
+    job = await frame_pipeline.run(submit_segment_analysis, index, segment_index,
+                                   analysis_options(frame_interval, sample_mode, sample_seconds, workers))
+    return JSONResponse({
+        "success": True,
+        "job_id": job.id,
+        "analysis_job": job.to_dict()
+    })
+
+@app.get("/models/stats")
+async def get_model_stats():
+    """
+    获取已加载模型的加载耗时和内存占用
+    
+    Returns:
+        JSONResponse: 包含模型统计信息的响应
+    """
+    models = model_registry.stats()
+    return JSONResponse({
+        "success": True,
+        "models": models,
+        "total_models": len(models)
+    })
+
+@app.get("/db/stats")
+async def get_db_stats():
+    """
+    获取数据库连接池的使用情况和等待统计，以及历史记录写入队列的统计
+    
+    Returns:
+        JSONResponse: 包含连接池统计信息的响应
+    """
+    return JSONResponse({
+        "success": True,
+        "pool": db_pool.stats(),
+        "history_writer": history_writer.stats()
+    })
+
+@app.get("/storage/stats")
+async def get_storage_stats():
+    """
+    获取标注图片写入队列的深度、写入延迟和溢出统计，以及事件片段的写入数量、字节数和相对全程录制节省的字节数
+    
+    Returns:
+        JSONResponse: 包含图片写入统计信息的响应
+    """
+    streams = [rtmp_hub.get(url) for url in rtmp_hub.stats()]
+    active_stream_seconds = sum(stream.clips.stats()["stream_seconds"] for stream in streams if stream and stream.clips)
+    return JSONResponse({
+        "success": True,
+        "image_writer": image_writer.stats(),
+        "clip_writer": clip_writer.stats(active_stream_seconds)
+    })
+
+@app.get("/inference/stats")
+async def get_inference_stats():
+    """
+    获取微批推理调度器的吞吐量和延迟统计
+    
+    Returns:
+        JSONResponse: 包含各调度器统计信息的响应
+    """
+    return JSONResponse({
+        "success": True,
+        "backend": config["inference_backend"],
+        "schedulers": inference_service.stats(),
+        "process_pools": process_inference.stats()
+    })
+
+@app.get("/jobs")
+async def list_jobs():
+    """
+    获取分析任务列表和各状态的任务数量
+    
+    Returns:
+        JSONResponse: 包含任务列表的响应
+    """
+    return JSONResponse({
+        "success": True,
+        "jobs": job_queue.list_jobs(),
+        "stats": job_queue.stats()
+    })
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    查询分析任务的状态和进度，完成后附带分析结果摘要
+    
+    Args:
+        job_id: 任务ID
+    
+    Returns:
+        JSONResponse: 包含任务状态的响应
+    """
+    job = await frame_pipeline.run(job_queue.get, job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"success": False, "error": f"分析任务不存在: {job_id}"}
+        )
+    return JSONResponse({"success": True, "job": job})
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """
+    查询已完成分析任务的完整结果，逐帧结果和轨迹从结构化数据文件读取
+    
+    Args:
+        job_id: 任务ID
+    
+    Returns:
+        JSONResponse: 包含任务状态和完整结果的响应
+    """
+    job = await frame_pipeline.run(job_queue.get_result, job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"success": False, "error": f"分析任务不存在: {job_id}"}
+        )
+    return JSONResponse({"success": True, "job": job})
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """
+    取消分析任务，排队中的任务直接取消，执行中的任务尽快停止
+    
+    Args:
+        job_id: 任务ID
+    
+    Returns:
+        JSONResponse: 包含取消后任务状态的响应
+    """
+    job = await frame_pipeline.run(job_queue.cancel, job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"success": False, "error": f"分析任务不存在或已过期: {job_id}"}
+        )
+    return JSONResponse({"success": True, "job": job})
+
 @app.post("/detect/image")
 async def detect_image(file: UploadFile = File(...)):
     """
-    处理上传的图片文件
+    处理上传的图片文件，直接在内存中解码，不写临时文件
     """
-    file_path = None
     try:
         logger.info(f"接收到图片上传请求: {file.filename}, 类型: {file.content_type}")
         
@@ -521,57 +1409,132 @@ async def detect_image(file: UploadFile = File(...)):
                 content={"success": False, "error": f"只支持图片文件，收到的是: {file.content_type}"}
             )
         
-        # 确保临时目录存在
-        os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
-        
-        # 生成唯一文件名，避免文件名冲突
-        unique_filename = f"{uuid.uuid4().hex}_{file.filename}"
-        file_path = os.path.join(TEMP_UPLOAD_DIR, unique_filename)
-        
-        # 保存上传的文件到临时目录
-        logger.info(f"正在保存上传的图片到: {file_path}")
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        logger.info(f"已保存上传的图片: {file_path}, 大小: {os.path.getsize(file_path)} 字节")
+        # 分块读取到内存缓冲区，超过大小限制时停止读取
+        data, file_hash = await upload_ingestor.read_to_memory(file)
+        logger.info(f"已读取上传的图片: {file.filename}, 大小: {len(data)} 字节")
         
         # 处理图片
-        logger.info(f"开始处理图片: {file_path}")
-        result = detection_processor.process_image(file_path)
-        logger.info(f"图片处理完成: {file_path}, 结果: {result.get('success', False)}")
+        logger.info(f"开始处理图片: {file.filename}")
+        result = await frame_pipeline.run(detection_processor.process_image_bytes, data)
+        logger.info(f"图片处理完成: {file.filename}, 结果: {result.get('success', False)}")
+        if file_hash:
+            result["file_hash"] = file_hash
         
         # 如果检测成功，保存到数据库
         if result.get("success", False):
             logger.info("检测成功，正在保存到数据库")
-            detection_processor.save_to_database(get_db_connection, result)
+            await frame_pipeline.run(detection_processor.save_to_database, get_db_connection, result)
             logger.info("已保存到数据库")
         else:
             logger.warning(f"检测未成功: {result.get('error', '未知错误')}")
         
         return result
+    except UploadTooLarge as e:
+        logger.warning(f"上传图片过大: {file.filename}, {e}")
+        return JSONResponse(
+            status_code=413,
+            content={"success": False, "error": str(e)}
+        )
     except Exception as e:
         logger.error(f"处理上传图片时出错: {e}", exc_info=True)
         return JSONResponse(
             status_code=500,
             content={"success": False, "error": f"处理图片时出错: {str(e)}"}
         )
-    finally:
-        # 确保临时文件被删除
-        if file_path and os.path.exists(file_path):
-            try:
-                os.unlink(file_path)
-                logger.info(f"已删除临时文件: {file_path}")
-            except Exception as e:
-                logger.error(f"删除临时文件失败: {file_path}, 错误: {e}")
+
+@app.post("/detect/images")
+async def detect_images(
+    files: List[UploadFile] = File(None),  # 多个图片文件
+    archive: UploadFile = File(None),  # 包含图片的zip压缩包
+    batch_size: int = Form(None)  # 每次模型调用的图片数，默认使用配置值
+):
+    """
+    批量检测图片，分批推理并以NDJSON逐行返回每张图片的结果，最后一行为汇总信息
+    """
+    archive_path = None
+    zip_reader = None
+    try:
+        sources = []
+        for upload in files or []:
+            if upload.content_type and not upload.content_type.startswith("image/"):
+                logger.warning(f"跳过非图片文件: {upload.filename}, 类型: {upload.content_type}")
+                continue
+            async def read_upload(upload=upload):
+                data, _ = await upload_ingestor.read_to_memory(upload)
+                return data
+            sources.append((upload.filename, read_upload))
+        
+        if archive is not None:
+            # 压缩包分块写入临时目录，图片按需从压缩包中读取
+            os.makedirs(TEMP_UPLOAD_DIR, exist_ok=True)
+            archive_path = os.path.join(TEMP_UPLOAD_DIR, f"{uuid.uuid4().hex}_{archive.filename}")
+            await upload_ingestor.save_to_disk(archive, archive_path)
+            # 图片在多个处理线程中读取，每个线程使用各自打开的ZipFile
+            zip_reader = ZipArchiveReader(archive_path)
+            # 按成员头部的解压后大小检查限制，读取时再按实际解压的字节数检查，防止压缩炸弹耗尽内存
+            for name in zip_image_names(
+                zip_reader.archive(),
+                max_member_bytes=upload_ingestor.max_image_bytes,
+                max_members=config["upload_max_archive_images"],
+                max_total_bytes=config["upload_max_archive_mb"] * 1024 * 1024
+            ):
+                sources.append((name, functools.partial(frame_pipeline.run, zip_reader.read, name,
+                                                        upload_ingestor.max_image_bytes)))
+        
+        if not sources:
+            raise ValueError("没有可处理的图片，请上传图片文件或包含图片的zip压缩包")
+        logger.info(f"接收到批量图片检测请求: {len(sources)} 张图片")
+    except (UploadTooLarge, zipfile.BadZipFile, ValueError) as e:
+        logger.warning(f"批量图片检测请求无效: {e}")
+        if zip_reader is not None:
+            zip_reader.close()
+        if archive_path and os.path.exists(archive_path):
+            os.unlink(archive_path)
+        status_code = 413 if isinstance(e, UploadTooLarge) else 400
+        return JSONResponse(status_code=status_code, content={"success": False, "error": str(e)})
+    except Exception as e:
+        logger.error(f"接收批量图片时出错: {e}", exc_info=True)
+        if zip_reader is not None:
+            zip_reader.close()
+        if archive_path and os.path.exists(archive_path):
+            os.unlink(archive_path)
+        return JSONResponse(
+            status_code=500,
+            content={"success": False, "error": f"接收图片时出错: {str(e)}"}
+        )
+    
+    async def generate():
+        try:
+            # 每批图片的历史记录在产出该批结果前一个事务中提交
+            async for item in run_image_batches(
+                sources,
+                detection_processor,
+                frame_pipeline.run,
+                batch_size=batch_size or config["image_batch_size"],
+                save=functools.partial(detection_processor.save_image_results, get_db_connection)
+            ):
+                if "summary" in item:
+                    logger.info(f"批量图片检测完成: {item['summary']}")
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        finally:
+            if zip_reader is not None:
+                zip_reader.close()
+            if archive_path and os.path.exists(archive_path):
+                os.unlink(archive_path)
+    
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 @app.post("/detect/video")
 async def detect_video(
     file: UploadFile = File(...),
-    frame_interval: int = Form(30)  # 默认每30帧处理一次
+    frame_interval: int = Form(30),  # 默认每30帧处理一次
+    sample_mode: str = Form(SAMPLE_AUTO),  # 采样模式：read/grab/seek/auto
+    sample_seconds: float = Form(None),  # 按时间采样，如2表示每2秒一帧
+    workers: int = Form(None),  # 并行分析进程数，默认使用配置值
+    motion_gate: bool = Form(False)  # 画面变化不大的采样帧复用上一采样帧的检测结果
 ):
     """
-    处理上传的视频文件
+    上传视频文件并提交分析任务，立即返回任务ID
     """
     file_path = None
     try:
@@ -592,28 +1555,45 @@ async def detect_video(
         unique_filename = f"{uuid.uuid4().hex}_{file.filename}"
         file_path = os.path.join(TEMP_UPLOAD_DIR, unique_filename)
         
-        # 保存上传的文件到临时目录
+        # 分块写入临时目录，超过大小限制时停止读取并删除已写入的部分
         logger.info(f"正在保存上传的视频到: {file_path}")
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        logger.info(f"已保存上传的视频: {file_path}, 大小: {os.path.getsize(file_path)} 字节")
+        upload_info = await upload_ingestor.save_to_disk(file, file_path)
         
-        # 处理视频
-        logger.info(f"开始处理视频: {file_path}, 帧间隔: {frame_interval}")
-        result = detection_processor.process_video(file_path, frame_interval=frame_interval)
-        logger.info(f"视频处理完成: {file_path}, 结果: {result.get('success', False)}")
+        logger.info(f"已保存上传的视频: {file_path}, 大小: {upload_info['size']} 字节")
         
-        # 如果检测成功，保存到数据库
-        if result.get("success", False):
-            logger.info("检测成功，正在保存到数据库")
-            detection_processor.save_to_database(get_db_connection, result)
-            logger.info("已保存到数据库")
-        else:
-            logger.warning(f"检测未成功: {result.get('error', '未知错误')}")
+        # 提交到后台任务队列，临时文件在分析结束后由任务队列删除
+        job = await frame_pipeline.run(
+            job_queue.submit,
+            detection_processor,
+            file_path,
+            source_video=file.filename,
+            options={
+                "frame_interval": frame_interval,
+                "sample_mode": sample_mode,
+                "sample_seconds": sample_seconds,
+                "workers": workers or config["analysis_workers"],
+                "motion_gate": motion_gate_options() if motion_gate else None
+            },
+            cleanup=True
+        )
+        file_path = None
+        logger.info(f"已提交视频分析任务: {job.id}")
         
-        return result
+        response = {
+            "success": True,
+            "job_id": job.id,
+            "status": job.status,
+            "message": "视频已提交分析，可通过/jobs/{job_id}查询进度"
+        }
+        if upload_info["hash"]:
+            response["file_hash"] = upload_info["hash"]
+        return response
+    except UploadTooLarge as e:
+        logger.warning(f"上传视频过大: {file.filename}, {e}")
+        return JSONResponse(
+            status_code=413,
+            content={"success": False, "error": str(e)}
+        )
     except Exception as e:
         logger.error(f"处理上传视频时出错: {e}", exc_info=True)
         return JSONResponse(
@@ -630,92 +1610,70 @@ async def detect_video(
                 logger.error(f"删除临时文件失败: {file_path}, 错误: {e}")
 
 class VideoStreamer:
-    def __init__(self, video_source, model_path="public/yolov8n_7_11.pt"):
+    def __init__(self, video_source, model_path=DETECTION_MODEL_PATH, protocol=PROTOCOL_JSON, target_fps=None,
+                 max_width=None):
         self.video_source = video_source
         self.cap = None
         self.should_stop = False
-        self.model = YOLO(model_path)
+        self.protocol = protocol  # 帧传输协议：json或binary
+        self.target_fps = target_fps or config["fps"]  # 该连接的目标帧率
+        self.encoder = create_adaptive_encoder(max_width)  # 按发送耗时调整分辨率和质量
+        self.pacer = None
+        self.position = 0  # 下一次读取的源帧索引
+        self.frame_seq = 0
+        self.last_detections = 0
+        self.model = model_registry.get(model_path)
+        self.scheduler = get_stream_scheduler(self.model)
+        self.detect = create_gated_detector(self.scheduler.infer, video_source)
+        self.deduplicator = create_event_deduplicator()
+        self.tracker = create_object_tracker()
 
     def process_frame(self, frame):
         """使用YOLOv8处理视频帧并绘制检测结果"""
-        # 模型推理
-        results = self.model(frame, conf=0.4, iou=0.5)  # 设置置信度和IOU阈值
+        # 画面变化足够大时提交到微批推理服务，与其他流的帧合并推理，否则复用上次的结果
+        try:
+            result, _ = self.detect(frame)
+        except Exception as e:
+            # 负载高时推理队列丢弃最旧的请求或等待超时，跳过本帧的检测，不断开观看者
+            logger.error(f"YOLO处理帧时出错: {e}")
+            return frame
 
-        # 获取检测结果
-        result = results[0]  # 单帧结果
+        # 使用加载时构建的类别表，一次性完成标签重映射和类型统计
+        result.names = self.model.names
+        detections = FrameDetections(result.boxes, self.model.class_map)
 
-        # 修改检测结果中的bird标签为bottle
-        for box in result.boxes:
-            cls = int(box.cls)
-            if result.names[cls] == 'bird':
-                result.names[cls] = 'bottle'
-        
-        # 检查是否需要记录所有类型（配置中包含*）
-        record_all_types = '*' in config["detect_types"]
-        
         # 收集所有检测到的物体类型
-        all_detected_types = {}
-        for box in result.boxes:
-            cls = int(box.cls)
-            type_name = result.names[cls]
-            if type_name not in all_detected_types:
-                all_detected_types[type_name] = 1
-            else:
-                all_detected_types[type_name] += 1
-        
-        # 确定需要记录的类型
-        detected_types_to_record = {}
-        if record_all_types and all_detected_types:
-            # 如果配置中有*且检测到物体，记录所有类型
-            detected_types_to_record = all_detected_types
-        else:
-            # 否则只记录配置中指定的类型
-            for box in result.boxes:
-                cls = int(box.cls)
-                type_name = result.names[cls]
-                if type_name in config["detect_types"]:
-                    if type_name not in detected_types_to_record:
-                        detected_types_to_record[type_name] = 1
-                    else:
-                        detected_types_to_record[type_name] += 1
+        all_detected_types = detections.counts()
+
+        # 跨帧跟踪，统计唯一物体数量和停留时间，轨迹ID同时用于事件去重
+        track_ids = self.tracker.update(detections.types, detections.conf, detections.xyxy)
+
+        # 需要记录的物体（配置中包含*时记录所有类型）
+        to_record = self.model.class_map.type_mask(config["detect_types"])[detections.cls]
         
         # 在原图上绘制边界框和标签
         annotated_frame = result.plot(
             conf=True,  # 显示置信度
             line_width=2,  # 边界框线条宽度
-            font_size=12  # 标签字体大小
+            font_size=12,  # 标签字体大小
+            img=frame  # 复用的结果也画在当前帧上
         )
         
-        # 如果检测到需要记录的类型，保存图片并记录到数据库
-        if detected_types_to_record:
-            # 保存图片
-            now = datetime.datetime.now()
-            date_str = now.strftime("%Y%m%d_%H%M%S")
-            
-            # 生成唯一文件名
-            unique_id = str(uuid.uuid4()).replace("-", "")
-            filename = f"{date_str}_{unique_id}.jpg"
-            image_path = os.path.join(config["history_path"], filename)
-            
-            # 保存图片
-            cv2.imwrite(image_path, annotated_frame)
-            
-            # 将所有检测到的类型合并为一个字符串，用逗号分隔
-            all_types_str = ",".join(all_detected_types.keys())
-            
-            # 记录到数据库
-            relative_path = f"/history/{filename}"  # 使用相对路径存储
-            save_history_record(all_types_str, relative_path)
-            
-            logger.info(f"已记录历史: 类型={all_types_str}, 图片={image_path}")
+        # 将所有检测到的类型合并为一个字符串，用逗号分隔
+        all_types_str = ",".join(all_detected_types.keys())
+        
+        # 按轨迹去重，同一物体的每个事件只保存置信度最高的一帧并记录到数据库
+        for snapshot, types_str in self.deduplicator.update(
+                track_ids[to_record], detections.conf[to_record], lambda: (annotated_frame.copy(), all_types_str)):
+            save_history_image(snapshot, types_str, "/history/")
 
         # 获取检测统计信息
-        detections = len(result.boxes)
+        self.last_detections = len(detections)
 
         # 添加统计信息到画面
         cv2.putText(
             annotated_frame,
-            f"Detections: {detections}",
+            f"Detections: {self.last_detections}",
             (10, 30),  # 位置
             cv2.FONT_HERSHEY_SIMPLEX,  # 字体
             1,  # 字体大小
@@ -726,12 +1684,62 @@ class VideoStreamer:
 
         return annotated_frame
 
+    def skip_behind(self):
+        """文件源处理跟不上视频帧率时，跳过按墙上时钟已经错过的帧"""
+        behind = self.pacer.frames_behind(self.position)
+        if behind <= 0:
+            return
+        if behind > self.pacer.source_fps:
+            # 落后超过1秒时直接定位，避免逐帧grab
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, self.position + behind)
+        else:
+            for _ in range(behind):
+                self.cap.grab()
+        self.position += behind
+        self.pacer.record_skipped(behind)
+
+    def next_encoded_frame(self):
+        """
+        读取下一帧并完成推理、标注和编码，在线程池中执行
+
+        Returns:
+            tuple: (发送数据, 采集时间戳, JPEG字节数)，视频播放结束时返回None
+        """
+        stage_start = time.perf_counter()
+        self.skip_behind()
+        ret, frame = self.cap.read()
+        if not ret:
+            # 视频播放结束，回到开头循环播放
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            self.position = 0
+            self.pacer.restart(0)
+            return None
+        self.position += 1
+        capture_ts = time.time()
+        self.pacer.record_stage("decode", time.perf_counter() - stage_start)
+
+        stage_start = time.perf_counter()
+        processed_frame = self.process_frame(frame)
+        self.pacer.record_stage("process", time.perf_counter() - stage_start)
+
+        stage_start = time.perf_counter()
+        jpeg = self.encode_frame(processed_frame)
+        self.pacer.record_stage("encode", time.perf_counter() - stage_start)
+
+        self.frame_seq += 1
+        payload = build_payload(jpeg, self.protocol, self.frame_seq, capture_ts, self.pacer.fps,
+                                self.last_detections, latency_ms=self.pacer.latency_ms(capture_ts))
+        return payload, capture_ts, len(jpeg)
+
     async def initialize(self):
         """初始化视频捕获"""
         try:
             self.cap = cv2.VideoCapture(self.video_source)
             if not self.cap.isOpened():
                 raise ValueError(f"无法打开视频源: {self.video_source}")
+            # 摄像头按直播源处理，只有文件源按视频帧率跳帧
+            source_fps = None if isinstance(self.video_source, int) else self.cap.get(cv2.CAP_PROP_FPS)
+            self.pacer = FramePacer(self.target_fps, source_fps)
             return True
         except Exception as e:
             logger.error(f"初始化视频捕获失败: {e}")
@@ -740,105 +1748,84 @@ class VideoStreamer:
     async def stream_video(self, websocket):
         """流式传输视频帧"""
         try:
-            # 锁定帧率为30fps
-            fps = 30.0
-            frame_delay = 0.033  # 固定30fps
-
             while not self.should_stop and websocket.client_state == WebSocketState.CONNECTED:
-                start_time = asyncio.get_event_loop().time()
-
-                ret, frame = self.cap.read()
-                if not ret:
-                    self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                # 解码、推理、标注和编码在线程池中完成，协程只等待处理好的帧
+                result = await frame_pipeline.run(self.next_encoded_frame)
+                if result is None:
                     continue
+                payload, capture_ts, size = result
 
-                # 处理帧 - 直接调用实例方法
-                processed_frame = self.process_frame(frame)
-
-                # 编码和发送
-                await self.send_frame(websocket, processed_frame, 30.0)
+                # 发送，按发送耗时调整下一帧的编码档位
+                send_start = time.perf_counter()
+                await self.send_frame(websocket, payload)
+                send_time = time.perf_counter() - send_start
+                self.pacer.record_stage("send", send_time)
+                self.pacer.frame_sent(capture_ts)
+                self.encoder.record_send(send_time, 1.0 / (self.pacer.target_fps or 30.0), size)
 
-                # 控制帧率
-                elapsed = asyncio.get_event_loop().time() - start_time
-                await asyncio.sleep(max(0, frame_delay - elapsed))
+                # 按目标帧率等待，处理耗时已计入，处理跟不上时不等待
+                await asyncio.sleep(self.pacer.wait_time())
 
         except Exception as e:
             logger.error(f"视频流错误: {e}")
         finally:
             self.release()
 
-    async def send_frame(self, websocket, frame, fps):
-        """发送帧到客户端"""
-        _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-        frame_b64 = base64.b64encode(buffer).decode('utf-8')
+    def encode_frame(self, frame):
+        """按当前编码档位缩放并编码为JPEG字节"""
+        return encode_tier(frame, *self.encoder.key(frame.shape[1]))
 
-        await websocket.send_json({
-            "image": frame_b64,
-            "fps": round(fps, 1),
-            "speed": round(np.random.uniform(10, 15), 1),
-            "weather": "晴朗"
-        })
+    async def send_frame(self, websocket, payload):
+        """发送已编码的帧到客户端，二进制协议使用send_bytes，JSON协议使用send_json"""
+        await send_payload(websocket, payload)
 
     def release(self):
         """释放资源"""
         if self.cap and self.cap.isOpened():
             self.cap.release()
         self.cap = None
+        # 保存尚未结束的检测事件
+        for snapshot, types_str in self.deduplicator.flush():
+            save_history_image(snapshot, types_str, "/history/")
 
 class RTMPStreamer:
-    def __init__(self, rtmp_url=None, model_path="public/yolov8n.pt"):
+    """
+    单路RTMP流的检测流水线，从共享采集源取最新帧，一个处理线程推理后广播给所有观看者；
+    采集源与同一地址的录制和实时分析共用，只解码一次
+    """
+    def __init__(self, rtmp_url=None, model_path=RTMP_MODEL_PATH):
         # 如果未提供RTMP URL，则使用配置文件中的URL
         self.rtmp_url = rtmp_url if rtmp_url else config["rtmp_url"]
-        self.cap = None
+        self.source = None  # 共享采集源
+        self.consumer = None
         self.should_stop = False
-        self.frame_queue = queue.Queue(maxsize=config["buffer_size"])  # 使用配置的队列大小
-        self.capture_thread = None
+        self.frame_seq = 0
+        self.last_detections = 0
+        self.broadcaster = FrameBroadcaster()  # 订阅该流的所有观看者
+        self.process_thread = None
         self.is_capturing = False
-        self.reconnect_delay = config["reconnect_delay"]  # 重连延迟时间
-        self.timeout = config["timeout"]  # 超时时间
+        self.deduplicator = create_event_deduplicator()  # 检测事件去重
+        self.tracker = create_object_tracker()  # 唯一物体统计
+        self.pacer = FramePacer(config["fps"])  # 流水线的输出帧率和各阶段耗时
+        self.clips = create_event_clip_recorder(self.rtmp_url)  # 检测事件的前后片段
         
-        # 初始化YOLO模型
+        # 从共享注册表获取YOLO模型
         try:
-            self.model = YOLO(model_path)
+            self.model = model_registry.get(model_path)
+            self.scheduler = get_stream_scheduler(self.model)
+            self.detect = create_gated_detector(self.scheduler.infer, self.rtmp_url)
             logger.info(f"YOLO模型初始化成功: {model_path}")
         except Exception as e:
             logger.error(f"YOLO模型初始化失败: {e}")
             self.model = None
+            self.scheduler = None
+            self.detect = None
 
-    def initialize(self):
-        """
-        初始化RTMP视频捕获。
-        使用在应用启动时设置的环境变量进行优化。
-        """
-        try:
-            logger.info(f"正在使用优化配置初始化RTMP流: {self.rtmp_url}")
-            self.cap = cv2.VideoCapture(self.rtmp_url, cv2.CAP_FFMPEG)
-            
-            if not self.cap.isOpened():
-                raise ValueError(f"无法打开RTMP视频源: {self.rtmp_url}")
-            
-            # 设置额外的VideoCapture属性来处理H.264解码问题
-            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # 最小缓冲区大小
-            self.cap.set(cv2.CAP_PROP_FPS, 30)        # 设置期望帧率为30fps
-            
-            # 尝试读取第一帧以验证连接
-            ret, test_frame = self.cap.read()
-            if ret and test_frame is not None:
-                logger.info(f"RTMP视频源初始化成功，首帧尺寸: {test_frame.shape}")
-                return True
-            else:
-                logger.warning("首帧读取失败，但继续尝试...")
-                return True  # 有些流需要几次尝试才能稳定
-                
-        except Exception as e:
-            logger.error(f"初始化RTMP捕获失败: {e}")
-            self.release()
-            return False
-            
     def process_frame(self, frame):
         """使用YOLOv8处理视频帧并绘制检测结果"""
         if self.model is None:
-            # 如果模型初始化失败，只添加基本的RTMP标识
+            # 如果模型初始化失败，只添加基本的RTMP标识，帧与其他消费者共享，画在副本上
+            frame = frame.copy()
             cv2.putText(
                 frame,
                 "RTMP LIVE (Optimized)",
@@ -852,86 +1839,49 @@ class RTMPStreamer:
             return frame
         
         try:
-            # 模型推理
-            results = self.model(frame, conf=0.4, iou=0.5)  # 设置置信度和IOU阈值
-
-            # 获取检测结果
-            result = results[0]  # 单帧结果
-
-            # 修改检测结果中的bird标签为bottle
-            for box in result.boxes:
-                cls = int(box.cls)
-                # result.names[cls] = 'bottle'
-                if result.names[cls] == 'bird':
-                    result.names[cls] = 'bottle'
-                
+            # 画面变化足够大时提交到微批推理服务，与其他流的帧合并推理，否则复用上次的结果
+            result, _ = self.detect(frame)
 
-            # 检查是否需要记录所有类型（配置中包含*）
-            record_all_types = '*' in config["detect_types"]
+            # 使用加载时构建的类别表，一次性完成标签重映射和类型统计
+            result.names = self.model.names
+            detections = FrameDetections(result.boxes, self.model.class_map)
             
             # 收集所有检测到的物体类型
-            all_detected_types = {}
-            for box in result.boxes:
-                cls = int(box.cls)
-                type_name = result.names[cls]
-                if type_name not in all_detected_types:
-                    all_detected_types[type_name] = 1
-                else:
-                    all_detected_types[type_name] += 1
+            all_detected_types = detections.counts()
             
-            # 确定需要记录的类型
-            detected_types_to_record = {}
-            if record_all_types and all_detected_types:
-                # 如果配置中有*且检测到物体，记录所有类型
-                detected_types_to_record = all_detected_types
-            else:
-                # 否则只记录配置中指定的类型
-                for box in result.boxes:
-                    cls = int(box.cls)
-                    type_name = result.names[cls]
-                    if type_name in config["detect_types"]:
-                        if type_name not in detected_types_to_record:
-                            detected_types_to_record[type_name] = 1
-                        else:
-                            detected_types_to_record[type_name] += 1
+            # 跨帧跟踪，统计唯一物体数量和停留时间，轨迹ID同时用于事件去重
+            track_ids = self.tracker.update(detections.types, detections.conf, detections.xyxy)
+            
+            # 需要记录的物体（配置中包含*时记录所有类型）
+            to_record = self.model.class_map.type_mask(config["detect_types"])[detections.cls]
             
             # 在原图上绘制边界框和标签
             annotated_frame = result.plot(
                 conf=True,  # 显示置信度
                 line_width=2,  # 边界框线条宽度
-                font_size=12  # 标签字体大小
+                font_size=12,  # 标签字体大小
+                img=frame  # 复用的结果也画在当前帧上
             )
             
-            # 如果检测到需要记录的类型，保存图片并记录到数据库
-            if detected_types_to_record:
-                # 保存图片
-                now = datetime.datetime.now()
-                date_str = now.strftime("%Y%m%d_%H%M%S")
-                
-                # 生成唯一文件名
-                unique_id = str(uuid.uuid4()).replace("-", "")
-                filename = f"{date_str}_{unique_id}.jpg"
-                image_path = os.path.join(config["history_path"], filename)
-                
-                # 保存图片
-                cv2.imwrite(image_path, annotated_frame)
-                
-                # 将所有检测到的类型合并为一个字符串，用逗号分隔
-                all_types_str = ",".join(all_detected_types.keys())
-                
-                # 记录到数据库
-                relative_path = f"..\\history\\{filename}"  # 使用相对路径存储
-                save_history_record(all_types_str, relative_path)
-                
-                logger.info(f"已记录历史: 类型={all_types_str}, 图片={image_path}")
+            # 将所有检测到的类型合并为一个字符串，用逗号分隔
+            all_types_str = ",".join(all_detected_types.keys())
+            
+            # 按轨迹去重，同一物体的每个事件只保存置信度最高的一帧并记录到数据库
+            for snapshot, types_str in self.deduplicator.update(
+                    track_ids[to_record], detections.conf[to_record],
+                    lambda: (annotated_frame.copy(), all_types_str)):
+                image_src = save_history_image(snapshot, types_str, "..\\history\\")
+                if self.clips is not None:
+                    # 从环形缓冲取事件前的帧，继续收集事件后的帧，写入在后台完成
+                    self.clips.trigger(types_str, image_src)
 
             # 获取检测统计信息
-            detections = len(result.boxes)
+            self.last_detections = len(detections)
 
             # 添加统计信息到画面
             cv2.putText(
                 annotated_frame,
-                f"Detections: {detections} | RTMP LIVE",
+                f"Detections: {self.last_detections} | RTMP LIVE",
                 (10, 30),  # 位置
                 cv2.FONT_HERSHEY_SIMPLEX,  # 字体
                 1,  # 字体大小
@@ -943,7 +1893,8 @@ class RTMPStreamer:
             return annotated_frame
         except Exception as e:
             logger.error(f"YOLO处理帧时出错: {e}")
-            # 出错时返回原始帧，并添加错误标识
+            # 出错时返回原始帧的副本，并添加错误标识
+            frame = frame.copy()
             cv2.putText(
                 frame,
                 "RTMP LIVE (Model Error)",
@@ -956,110 +1907,103 @@ class RTMPStreamer:
             )
             return frame
 
-    def capture_frames(self):
-        """在后台线程中捕获RTMP帧，并处理连接中断"""
-        if not self.initialize():
-            self.is_capturing = False
-            logger.error("无法启动RTMP捕获线程，初始化失败。")
-            return
-
-        last_successful_frame_time = time.time()
-        
+    def start_capture(self):
+        """获取共享采集源并启动处理线程，采集源的重连由frame_sources负责"""
+        self.source = frame_sources.acquire(self.rtmp_url)
+        if self.source is None:
+            return False
+        # 观看只需要最新帧，队列满时丢弃最旧的帧以减少延迟
+        self.consumer = self.source.add_consumer("viewers", POLICY_LATEST, max_size=config["buffer_size"])
+        self.is_capturing = True
+        self.process_thread = threading.Thread(target=self.process_frames, daemon=True)
+        self.process_thread.start()
+        logger.info("RTMP处理线程已启动")
+        return True
+
+    def process_frames(self):
+        """在后台线程中对最新帧推理、标注并编码一次，然后广播给所有观看者"""
         while self.is_capturing and not self.should_stop:
-            if not self.cap or not self.cap.isOpened():
-                logger.error(f"RTMP连接丢失，将在{self.reconnect_delay}秒后尝试重新连接...")
-                time.sleep(self.reconnect_delay)
-                if not self.initialize():
-                    continue  # 如果重连失败，则在下一次循环继续尝试
-                else:
-                    last_successful_frame_time = time.time() # 重置计时器
-
-            ret, frame = self.cap.read()
-
-            if ret and frame is not None and frame.size > 0:
-                # 验证帧的有效性
-                if len(frame.shape) == 3 and frame.shape[0] > 0 and frame.shape[1] > 0:
-                    last_successful_frame_time = time.time()
-                    if not self.frame_queue.full():
-                        self.frame_queue.put(frame)
-                    else:
-                        # 队列已满，丢弃旧帧以减少延迟
-                        try:
-                            self.frame_queue.get_nowait()
-                        except queue.Empty:
-                            pass
-                        self.frame_queue.put(frame)
-                else:
-                    logger.debug("收到无效帧，跳过...")
-            else:
-                # 处理解码错误或无帧情况
-                current_time = time.time()
-                if current_time - last_successful_frame_time > self.timeout:
-                    logger.warning(f"超过{self.timeout}秒未收到有效帧，将重新初始化连接。")
-                    self.release()
-                    # 循环将自动处理重新初始化
-                    last_successful_frame_time = current_time # 重置计时器以避免快速连续重连
-                else:
-                    # 短暂等待，避免CPU占用过高
-                    time.sleep(0.01)
-        
-        self.release()
-        logger.info("RTMP捕获线程已停止。")
+            item = self.consumer.get(timeout=0.1)
+            if item is None:
+                continue
+            
+            # 只处理最新帧，跳过积压的旧帧
+            while True:
+                newer = self.consumer.get(timeout=0)
+                if newer is None:
+                    break
+                item = newer
+            frame, capture_ts, _ = item
+            
+            try:
+                self.last_detections = 0
+                stage_start = time.perf_counter()
+                processed_frame = self.process_frame(frame)
+                self.pacer.record_stage("process", time.perf_counter() - stage_start)
+                self.frame_seq += 1
+                packet = FramePacket(self.frame_seq, capture_ts, processed_frame, self.last_detections,
+                                     fps=self.pacer.fps, source="RTMP")
+                # 按观看者的编码档位各编码一次后广播
+                stage_start = time.perf_counter()
+                self.broadcaster.publish(packet)
+                if self.clips is not None:
+                    # 环形缓冲只保存编码后的字节，与同档位的观看者共用一次编码
+                    width, quality = EVENT_CLIP_TIER
+                    key = (width if width is not None and width < packet.width else None, quality)
+                    self.clips.add_frame(packet.encoded(key), capture_ts)
+                self.pacer.record_stage("encode", time.perf_counter() - stage_start)
+                self.pacer.frame_sent(capture_ts)
+            except Exception as e:
+                logger.error(f"RTMP处理线程出错: {e}")
+            
+            # 按目标帧率等待，等待期间采集线程继续更新最新帧
+            time.sleep(self.pacer.wait_time())
         
-    def start_capture(self):
-        """启动RTMP捕获线程"""
-        if self.initialize():
-            self.is_capturing = True
-            self.capture_thread = threading.Thread(target=self.capture_frames, daemon=True)
-            self.capture_thread.start()
-            logger.info("RTMP捕获线程已启动")
-            return True
-        return False
+        logger.info("RTMP处理线程已停止。")
 
-    async def stream_video(self, websocket):
-        """流式传输RTMP视频帧"""
+    async def stream_video(self, websocket, subscriber):
+        """将共享流水线产出的帧发送给一个观看者"""
         try:
-            frame_delay = 0.033  # 锁定30fps
-            
             while not self.should_stop and websocket.client_state == WebSocketState.CONNECTED:
-                start_time = asyncio.get_event_loop().time()
-                
+                # 按观看者的目标帧率等待，等待期间队列中只保留最新帧
+                await asyncio.sleep(subscriber.pacer.wait_time())
                 try:
-                    # 从队列获取最新帧
-                    frame = self.frame_queue.get_nowait()
-                    
-                    # 处理帧
-                    processed_frame = self.process_frame(frame)
-                    
-                    # 编码和发送
-                    await self.send_frame(websocket, processed_frame, 30.0)
-                    
-                except queue.Empty:
-                    # 没有新帧，等待一下
-                    await asyncio.sleep(0.01)
+                    packet = await asyncio.wait_for(subscriber.queue.get(), timeout=1.0)
+                except asyncio.TimeoutError:
                     continue
                 
-                # 控制帧率
-                elapsed = asyncio.get_event_loop().time() - start_time
-                await asyncio.sleep(max(0, frame_delay - elapsed))
+                key = subscriber.tier_key(packet)
+                if packet.is_encoded(key):
+                    payload = subscriber.payload(packet, key)
+                else:
+                    # 档位在发布后刚切换，在线程池中编码
+                    payload = await frame_pipeline.run(subscriber.payload, packet, key)
+                
+                # 发送，按发送耗时和期间被覆盖的帧数调整编码档位
+                dropped = subscriber.frames_dropped
+                send_start = time.perf_counter()
+                await self.send_frame(websocket, payload)
+                subscriber.record_send(time.perf_counter() - send_start, packet, key,
+                                       subscriber.frames_dropped - dropped)
                 
+        except WebSocketDisconnect:
+            raise
         except Exception as e:
             logger.error(f"RTMP视频流错误: {e}")
-        finally:
-            self.release()
 
-    async def send_frame(self, websocket, frame, fps):
-        """发送帧到客户端"""
-        _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 80])
-        frame_b64 = base64.b64encode(buffer).decode('utf-8')
-
-        await websocket.send_json({
-            "image": frame_b64,
-            "fps": round(fps, 1),
-            "speed": round(np.random.uniform(10, 15), 1),
-            "weather": "晴朗",
-            "source": "RTMP"
-        })
+    async def send_frame(self, websocket, payload):
+        """发送已编码的帧到客户端，二进制协议使用send_bytes，JSON协议使用send_json"""
+        await send_payload(websocket, payload)
+
+    def pacing_stats(self):
+        """返回流水线和各观看者的实际帧率、延迟、丢帧统计和编码档位"""
+        subscribers = []
+        for subscriber in self.broadcaster.subscribers():
+            stats = subscriber.pacer.stats()
+            stats["frames_dropped"] = subscriber.frames_dropped
+            stats["encoding"] = subscriber.encoder.stats()
+            subscribers.append(stats)
+        return {"pipeline": self.pacer.stats(), "subscribers": subscribers}
 
     def release(self):
         """安全地释放所有资源"""
@@ -1067,38 +2011,45 @@ class RTMPStreamer:
         self.should_stop = True
         self.is_capturing = False
         
-        if self.capture_thread and self.capture_thread.is_alive():
-            logger.info("等待捕获线程结束...")
-            self.capture_thread.join(timeout=2)
-            if self.capture_thread.is_alive():
-                logger.warning("捕获线程在超时后仍未结束")
+        current = threading.current_thread()
+        if self.process_thread and self.process_thread.is_alive() and self.process_thread is not current:
+            logger.info("等待处理线程结束...")
+            self.process_thread.join(timeout=2)
+            if self.process_thread.is_alive():
+                logger.warning("处理线程在超时后仍未结束")
         
-        if self.cap:
-            if self.cap.isOpened():
-                logger.info("释放VideoCapture对象...")
-                self.cap.release()
-            self.cap = None
+        # 释放共享采集源的引用，没有其他录制或分析使用时采集线程随之停止
+        if self.source is not None:
+            logger.info("释放共享采集源...")
+            self.source.remove_consumer(self.consumer)
+            frame_sources.release(self.rtmp_url)
+            self.source = None
         
-        # 清空队列
-        logger.info("清空帧队列...")
-        while not self.frame_queue.empty():
-            try:
-                self.frame_queue.get_nowait()
-            except queue.Empty:
-                break
+        # 处理线程已结束，保存尚未结束的检测事件，其片段只包含事件前的帧
+        for snapshot, types_str in self.deduplicator.flush():
+            image_src = save_history_image(snapshot, types_str, "..\\history\\")
+            if self.clips is not None:
+                self.clips.trigger(types_str, image_src)
+        if self.clips is not None:
+            self.clips.close()
         logger.info("RTMPStreamer资源释放完成")
 
 @app.websocket("/ws/video")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, protocol: str = PROTOCOL_JSON, fps: float = None,
+                             max_width: int = None):
     logger.info("进行连接尝试")
     logger.info(f"websocket {websocket}")
     await websocket.accept()
-    streamer = VideoStreamer("public/sample.mp4")  # 或使用0表示摄像头
+    # fps为该连接的目标帧率，未提供时使用配置的帧率；max_width为客户端可接受的最大宽度
+    streamer = VideoStreamer("public/sample.mp4", protocol=normalize_protocol(protocol), target_fps=fps,
+                             max_width=max_width)  # 或使用0表示摄像头
 
     if not await streamer.initialize():
         await websocket.close(code=1008, reason="无法初始化视频源")
         return
 
+    stream_id = str(uuid.uuid4()).replace("-", "")[:8]
+    active_video_streams[stream_id] = streamer
     try:
         await streamer.stream_video(websocket)
     except WebSocketDisconnect:
@@ -1106,37 +2057,100 @@ async def websocket_endpoint(websocket: WebSocket):
     except Exception as e:
         logger.error(f"WebSocket错误: {e}")
     finally:
+        active_video_streams.pop(stream_id, None)
         streamer.should_stop = True
         streamer.release()
         await websocket.close()
 
+@app.get("/video/streams")
+async def get_video_streams():
+    """
+    获取正在运行的本地视频流及其检测事件去重统计、按类型的唯一物体统计、运动门控的跳帧统计和实际帧率
+    
+    Returns:
+        JSONResponse: 包含各连接统计的响应
+    """
+    stream_list = []
+    for stream_id, streamer in list(active_video_streams.items()):
+        stream_list.append({
+            "stream_id": stream_id,
+            "video_source": streamer.video_source,
+            "events": streamer.deduplicator.stats(),
+            "tracks": streamer.tracker.stats(),
+            "motion_gate": streamer.detect.stats() if streamer.detect else None,
+            "pacing": streamer.pacer.stats() if streamer.pacer else None,
+            "encoding": streamer.encoder.stats()
+        })
+    return JSONResponse({
+        "success": True,
+        "streams": stream_list,
+        "total_streams": len(stream_list)
+    })
+
+# 按RTMP地址共享采集检测流水线，多个观看者只占用一份解码和推理开销
+rtmp_hub = StreamHub(RTMPStreamer)
+
+@app.get("/rtmp/streams")
+async def get_rtmp_streams():
+    """
+    获取正在运行的共享RTMP流水线及其观看者数量、检测事件去重统计、按类型的唯一物体统计、运动门控的跳帧统计，
+    以及流水线和各观看者的实际帧率、端到端延迟和各阶段耗时，共享采集源的解码和各消费者的丢帧统计
+    
+    Returns:
+        JSONResponse: 包含各流观看者数量的响应
+    """
+    streams = rtmp_hub.stats()
+    stream_list = []
+    for url, count in streams.items():
+        stream = rtmp_hub.get(url)
+        stream_list.append({
+            "rtmp_url": url,
+            "subscribers": count,
+            "events": stream.deduplicator.stats() if stream else None,
+            "tracks": stream.tracker.stats() if stream else None,
+            "motion_gate": stream.detect.stats() if stream and stream.detect else None,
+            "pacing": stream.pacing_stats() if stream else None,
+            "clips": stream.clips.stats() if stream and stream.clips else None
+        })
+    return JSONResponse({
+        "success": True,
+        "streams": stream_list,
+        "total_streams": len(streams),
+        # 共享采集源的解码统计和各消费者(观看、录制、实时分析)的丢帧统计
+        "sources": frame_sources.stats()
+    })
+
 @app.websocket("/ws/rtmp")
-async def rtmp_websocket_endpoint(websocket: WebSocket, rtmp_url: str = None):
-    """RTMP视频流WebSocket端点，优化了关闭逻辑"""
+async def rtmp_websocket_endpoint(websocket: WebSocket, rtmp_url: str = None, protocol: str = PROTOCOL_JSON,
+                                  fps: float = None, max_width: int = None):
+    """
+    RTMP视频流WebSocket端点，同一RTMP地址的观看者共享一条采集检测流水线，
+    fps为该观看者的目标帧率，max_width为可接受的最大宽度，同一编码档位的观看者共用一次编码
+    """
     if not rtmp_url:
-        logger.info(f"未提供RTMP URL参数，将使用配置文件中的默认URL: {config['rtmp_url']}")
+        rtmp_url = config["rtmp_url"]
+        logger.info(f"未提供RTMP URL参数，将使用配置文件中的默认URL: {rtmp_url}")
     else:
         logger.info(f"RTMP连接尝试，URL: {rtmp_url}")
     
     await websocket.accept()
     
     rtmp_streamer = None
+    subscriber = None
     
     try:
-        if rtmp_url:
-            rtmp_streamer = RTMPStreamer(rtmp_url)
-        else:
-            rtmp_streamer = RTMPStreamer()
+        rtmp_streamer, subscriber = await rtmp_hub.subscribe(rtmp_url, normalize_protocol(protocol), fps,
+                                                              create_adaptive_encoder(max_width))
         
-        if not rtmp_streamer.start_capture():
+        if rtmp_streamer is None:
             logger.error("启动RTMP捕获失败")
             # 初始化失败时，确保websocket被关闭
             if websocket.client_state == WebSocketState.CONNECTED:
                 await websocket.close(code=1008, reason="无法连接RTMP流")
             return
         
-        logger.info("RTMP捕获启动成功，开始推流...")
-        await rtmp_streamer.stream_video(websocket)
+        logger.info("已订阅RTMP流水线，开始推流...")
+        await rtmp_streamer.stream_video(websocket, subscriber)
         
     except WebSocketDisconnect:
         logger.info("RTMP客户端断开连接")
@@ -1144,8 +2158,8 @@ async def rtmp_websocket_endpoint(websocket: WebSocket, rtmp_url: str = None):
         logger.error(f"RTMP WebSocket主循环出现异常: {e}", exc_info=True)
     finally:
         logger.info("进入RTMP WebSocket的finally块")
-        if rtmp_streamer:
-            rtmp_streamer.release()
+        if subscriber:
+            await rtmp_hub.unsubscribe(rtmp_url, subscriber)
         
         # 使用WebSocketState检查连接状态，这是最可靠的方式
         if websocket.client_state == WebSocketState.CONNECTED:
@@ -0,0 +1,160 @@
+import os
+import logging
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+from ultralytics import YOLO
+
+from postprocess import ClassMap
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class ModelHandle:
+    """
+    共享的YOLO模型句柄，同一模型的推理调用通过锁串行执行，保证多线程安全
+    """
+    def __init__(self, model_path, conf=0.4, iou=0.5, imgsz=640):
+        """
+        加载YOLO模型
+
+        Args:
+            model_path: YOLO模型权重路径
+            conf: 默认置信度阈值
+            iou: 默认IOU阈值
+            imgsz: 预热时使用的输入尺寸
+        """
+        self.model_path = model_path
+        self.conf = conf
+        self.iou = iou
+        self.imgsz = imgsz
+        self.warmup_time = 0.0
+        self._lock = threading.Lock()
+
+        start_time = time.perf_counter()
+        self.model = YOLO(model_path)
+        self.load_time = time.perf_counter() - start_time
+        # 类别重映射表只在加载时构建一次，推理结果直接引用
+        self.class_map = ClassMap(self.model.names)
+        self.names = self.class_map.names
+        self.memory_bytes = self._estimate_memory()
+
+    def __call__(self, source, **kwargs):
+        """
+        执行推理，未指定的conf/iou使用句柄的默认值
+
+        Args:
+            source: 单帧图像或图像列表
+            **kwargs: 透传给YOLO的推理参数
+
+        Returns:
+            list: YOLO推理结果列表
+        """
+        kwargs.setdefault("conf", self.conf)
+        kwargs.setdefault("iou", self.iou)
+        with self._lock:
+            return self.model(source, **kwargs)
+
+    def warmup(self):
+        """使用空白图像执行一次推理，提前完成权重初始化和算子编译"""
+        start_time = time.perf_counter()
+        dummy = np.zeros((self.imgsz, self.imgsz, 3), dtype=np.uint8)
+        self(dummy, verbose=False)
+        self.warmup_time = time.perf_counter() - start_time
+        logger.info(f"YOLO模型预热完成: {self.model_path}, 耗时: {self.warmup_time:.3f}秒")
+
+    def _estimate_memory(self):
+        """根据模型参数和缓冲区估算模型占用的内存(字节)"""
+        try:
+            module = self.model.model
+            tensors = list(module.parameters()) + list(module.buffers())
+            return sum(t.numel() * t.element_size() for t in tensors)
+        except Exception as e:
+            logger.warning(f"无法估算模型内存占用: {self.model_path}, 错误: {e}")
+            return 0
+
+    def stats(self):
+        """返回模型的加载耗时和内存占用统计"""
+        return {
+            "model_path": self.model_path,
+            "conf": self.conf,
+            "iou": self.iou,
+            "load_time": round(self.load_time, 3),
+            "warmup_time": round(self.warmup_time, 3),
+            "memory_mb": round(self.memory_bytes / (1024 * 1024), 2)
+        }
+
+class ModelRegistry:
+    """
+    进程级模型注册表，按权重路径和推理参数缓存模型，每个模型只加载一次
+    """
+    def __init__(self):
+        self._models = {}  # 缓存键 -> Future，加载完成后结果为ModelHandle
+        self._lock = threading.Lock()
+
+    def get(self, model_path, conf=0.4, iou=0.5, warmup=True):
+        """
+        获取共享模型句柄，首次请求时加载并预热
+
+        注册表锁只用于登记占位的Future，加载和预热在锁外进行，
+        加载一个模型时不会阻塞其他已加载模型的获取；同一模型的并发请求等待同一个Future
+
+        Args:
+            model_path: YOLO模型权重路径
+            conf: 置信度阈值
+            iou: IOU阈值
+            warmup: 首次加载后是否执行预热推理
+
+        Returns:
+            ModelHandle: 共享的模型句柄
+        """
+        key = (os.path.abspath(model_path), float(conf), float(iou))
+        with self._lock:
+            future = self._models.get(key)
+            owner = future is None
+            if owner:
+                future = self._models[key] = Future()
+        if not owner:
+            return future.result()
+
+        try:
+            handle = ModelHandle(model_path, conf=conf, iou=iou)
+            logger.info(f"YOLO模型加载成功: {model_path}, 耗时: {handle.load_time:.3f}秒")
+            if warmup:
+                handle.warmup()
+        except BaseException as e:
+            # 加载失败时移除占位，之后的请求可以重新尝试加载
+            with self._lock:
+                if self._models.get(key) is future:
+                    del self._models[key]
+            future.set_exception(e)
+            raise
+        future.set_result(handle)
+        return handle
+
+    def preload(self, model_paths, conf=0.4, iou=0.5):
+        """
+        启动时预加载并预热模型，加载失败只记录日志
+
+        Args:
+            model_paths: 模型权重路径列表
+            conf: 置信度阈值
+            iou: IOU阈值
+        """
+        for model_path in model_paths:
+            try:
+                self.get(model_path, conf=conf, iou=iou)
+            except Exception as e:
+                logger.error(f"预加载YOLO模型失败: {model_path}, 错误: {e}")
+
+    def stats(self):
+        """返回所有已加载模型的统计信息"""
+        with self._lock:
+            futures = list(self._models.values())
+        # 正在加载的模型不计入统计
+        return [future.result().stats() for future in futures if future.done()]
+
+# 进程内共享的模型注册表
+model_registry = ModelRegistry()
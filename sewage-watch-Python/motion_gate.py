@@ -0,0 +1,238 @@
+import logging
+import threading
+import time
+import cv2
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 画面变化的检测方式：与上次推理帧做差分，或使用MOG2背景建模
+MOTION_DIFF = "diff"
+MOTION_MOG2 = "mog2"
+MOTION_METHODS = (MOTION_DIFF, MOTION_MOG2)
+
+class GateDecision:
+    """门控对一帧的判断，推理成功后交给MotionGate.commit更新参考帧"""
+    __slots__ = ("infer", "gray", "timestamp", "forced")
+
+    def __init__(self, infer, gray, timestamp, forced):
+        self.infer = infer
+        self.gray = gray
+        self.timestamp = timestamp
+        self.forced = forced
+
+class MotionGate:
+    """
+    推理前的运动门控：把帧缩小为灰度小图，画面变化足够大或距上次推理超过刷新间隔时才推理，
+    否则调用方复用上次的检测结果
+
+    判断(decide)和提交(commit)分开：只有推理成功后才把该帧作为参考帧并重置刷新计时，
+    推理失败时下一帧仍与上次成功推理的帧比较
+    """
+    def __init__(self, method=MOTION_DIFF, pixel_threshold=25, min_changed_ratio=0.005, refresh_interval=2.0,
+                 downscale_width=160):
+        """
+        初始化门控
+
+        Args:
+            method: diff与上次推理的帧做差分，mog2使用背景建模
+            pixel_threshold: diff模式下灰度差超过该值的像素视为变化
+            min_changed_ratio: 变化像素占比不低于该值时推理
+            refresh_interval: 距上次推理超过该时间(秒)时强制推理，0表示每帧都推理
+            downscale_width: 比较前把帧缩小到的宽度(像素)
+        """
+        if method not in MOTION_METHODS:
+            raise ValueError(f"不支持的运动检测方式: {method}")
+        self.method = method
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_ratio = min_changed_ratio
+        self.refresh_interval = refresh_interval
+        self.downscale_width = max(16, int(downscale_width))
+        self._reference = None
+        self._last_inference_time = None
+        self._subtractor = None
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.frames = 0
+        self.inferred = 0
+        self.skipped = 0
+        self.failed = 0
+        self.forced = 0
+        self.gate_time = 0.0
+        self.inference_time = 0.0
+        self.last_changed_ratio = 0.0
+
+    def _small_gray(self, frame):
+        """缩小并转为模糊后的灰度图，过滤噪点和压缩伪影"""
+        height, width = frame.shape[:2]
+        # 先隔行隔列抽取到目标宽度的约2倍，再做区域插值，大分辨率帧上比直接缩放快数倍
+        step = max(1, width // (self.downscale_width * 2))
+        frame = frame[::step, ::step]
+        small = cv2.resize(frame, (self.downscale_width, max(1, int(height * self.downscale_width / width))),
+                           interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _changed_ratio(self, gray):
+        """当前帧相对参考帧或背景模型的变化像素占比"""
+        if self.method == MOTION_MOG2:
+            if self._subtractor is None:
+                self._subtractor = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=16,
+                                                                      detectShadows=False)
+            mask = self._subtractor.apply(gray)
+            return float(np.count_nonzero(mask)) / mask.size
+        if self._reference is None or self._reference.shape != gray.shape:
+            return 1.0
+        diff = cv2.absdiff(gray, self._reference)
+        return float(np.count_nonzero(diff > self.pixel_threshold)) / diff.size
+
+    def decide(self, frame, timestamp=None):
+        """
+        判断当前帧是否需要推理，不更新参考帧
+
+        diff模式只与上次成功推理的帧比较，缓慢的累计变化也会触发推理
+
+        Args:
+            frame: BGR帧
+            timestamp: 帧时间(秒)，默认为time.monotonic()，视频分析传入帧时间
+
+        Returns:
+            GateDecision: infer为True表示需要推理，推理成功后调用commit，失败时调用discard
+        """
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        start_time = time.perf_counter()
+        gray = self._small_gray(frame)
+        with self._lock:
+            changed_ratio = self._changed_ratio(gray)
+            self.last_changed_ratio = changed_ratio
+            self.frames += 1
+            due = (self._last_inference_time is None or
+                   timestamp - self._last_inference_time >= self.refresh_interval)
+            infer = due or changed_ratio >= self.min_changed_ratio
+            if not infer:
+                self.skipped += 1
+            self.gate_time += time.perf_counter() - start_time
+        return GateDecision(infer, gray, timestamp, due and changed_ratio < self.min_changed_ratio)
+
+    def commit(self, decision, inference_seconds=0.0):
+        """
+        推理成功后把该帧作为参考帧并重置刷新计时
+
+        Args:
+            decision: decide返回的判断
+            inference_seconds: 推理耗时，用于估算跳帧节省的时间
+        """
+        with self._lock:
+            self._reference = decision.gray
+            self._last_inference_time = decision.timestamp
+            self.inferred += 1
+            if decision.forced:
+                self.forced += 1
+            self.inference_time += inference_seconds
+
+    def discard(self, decision):
+        """推理失败，保留原参考帧，下一帧仍按上次成功推理的帧判断"""
+        with self._lock:
+            self.failed += 1
+
+    def should_infer(self, frame, timestamp=None):
+        """
+        判断当前帧是否需要推理，需要时立即视为已推理并更新参考帧，用于不会失败的调用方
+
+        Returns:
+            bool: True表示需要推理，False表示复用上次的检测结果
+        """
+        decision = self.decide(frame, timestamp)
+        if decision.infer:
+            self.commit(decision)
+        return decision.infer
+
+    def stats(self):
+        """返回跳帧率和估算节省的推理时间"""
+        with self._lock:
+            avg_inference = self.inference_time / self.inferred if self.inferred else 0.0
+            return {
+                "method": self.method,
+                "frames": self.frames,
+                "inferred": self.inferred,
+                "skipped": self.skipped,
+                "failed": self.failed,
+                "forced": self.forced,
+                "skip_rate": round(self.skipped / self.frames, 4) if self.frames else 0.0,
+                "last_changed_ratio": round(self.last_changed_ratio, 4),
+                "avg_gate_ms": round(self.gate_time / self.frames * 1000, 3) if self.frames else 0.0,
+                "avg_inference_ms": round(avg_inference * 1000, 2),
+                # 跳过的帧按平均推理耗时估算，扣除所有帧的门控开销
+                "estimated_saved_seconds": round(self.skipped * avg_inference - self.gate_time, 3)
+            }
+
+class GatedDetector:
+    """
+    带运动门控的检测函数：门控判断需要推理时调用推理函数并缓存结果，否则返回上次的结果
+    """
+    def __init__(self, infer, gate=None):
+        """
+        Args:
+            infer: 推理函数，参数为帧，返回单帧检测结果
+            gate: MotionGate实例，为None时每帧都推理
+        """
+        self.infer = infer
+        self.gate = gate
+        self.last_result = None
+
+    def __call__(self, frame, timestamp=None):
+        """
+        返回当前帧的检测结果，复用的结果中框的位置来自上次推理的帧
+
+        Args:
+            frame: BGR帧
+            timestamp: 帧时间(秒)，默认为time.monotonic()
+
+        Returns:
+            tuple: (检测结果, 是否复用了上次的结果)
+        """
+        if self.gate is None:
+            return self.infer(frame), False
+        decision = self.gate.decide(frame, timestamp)
+        if not decision.infer and self.last_result is not None:
+            return self.last_result, True
+        start_time = time.perf_counter()
+        try:
+            result = self.infer(frame)
+        except Exception:
+            # 推理失败(如调度队列满被丢弃、推理超时)时不更新参考帧，变化后的画面下一帧仍会触发推理
+            self.gate.discard(decision)
+            raise
+        self.gate.commit(decision, time.perf_counter() - start_time)
+        self.last_result = result
+        return result, False
+
+    def stats(self):
+        """返回门控统计，未启用门控时返回None"""
+        return self.gate.stats() if self.gate is not None else None
+
+def merge_gate_stats(stats_list):
+    """合并多个门控(如分段分析的各段)的统计"""
+    stats_list = [stats for stats in stats_list if stats]
+    if not stats_list:
+        return None
+    frames = sum(stats["frames"] for stats in stats_list)
+    inferred = sum(stats["inferred"] for stats in stats_list)
+    skipped = sum(stats["skipped"] for stats in stats_list)
+    inference_ms = sum(stats["avg_inference_ms"] * stats["inferred"] for stats in stats_list)
+    gate_ms = sum(stats["avg_gate_ms"] * stats["frames"] for stats in stats_list)
+    return {
+        "method": stats_list[0]["method"],
+        "frames": frames,
+        "inferred": inferred,
+        "skipped": skipped,
+        "failed": sum(stats.get("failed", 0) for stats in stats_list),
+        "forced": sum(stats["forced"] for stats in stats_list),
+        "skip_rate": round(skipped / frames, 4) if frames else 0.0,
+        "avg_gate_ms": round(gate_ms / frames, 3) if frames else 0.0,
+        "avg_inference_ms": round(inference_ms / inferred, 2) if inferred else 0.0,
+        "estimated_saved_seconds": round(sum(stats["estimated_saved_seconds"] for stats in stats_list), 3)
+    }
@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from collections import deque
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FramePacer:
+    """
+    按实际耗时调节推流节奏：按目标帧率安排下一帧的发送时间，文件源按墙上时钟计算应播放到的帧并跳过落后的帧，
+    同时统计实际帧率、端到端延迟和各阶段耗时
+    """
+    def __init__(self, target_fps=30.0, source_fps=None, window=2.0, smoothing=0.1):
+        """
+        初始化节奏控制器
+
+        Args:
+            target_fps: 目标输出帧率，0或None表示不限制
+            source_fps: 文件源的帧率，None表示直播源(直播源由采集端只保留最新帧)
+            window: 计算实际帧率的时间窗口(秒)
+            smoothing: 延迟和阶段耗时的指数平滑系数
+        """
+        self.target_fps = target_fps if target_fps and target_fps > 0 else None
+        self.source_fps = source_fps if source_fps and source_fps > 0 else None
+        self.window = window
+        self.smoothing = smoothing
+        self._next_due = None
+        self._sent_times = deque()
+        self._clock_start = None
+        self._clock_position = 0
+        self._lock = threading.Lock()
+
+        # 统计信息
+        self.frames_sent = 0
+        self.source_frames_skipped = 0
+        self.latency = None
+        self.stage_times = {}
+
+    def restart(self, position=0, now=None):
+        """文件源从指定帧重新开始播放(如循环回到开头)时重置播放时钟，now默认为time.monotonic()"""
+        with self._lock:
+            self._clock_start = time.monotonic() if now is None else now
+            self._clock_position = position
+
+    def frames_behind(self, position, now=None):
+        """
+        文件源按墙上时钟应播放到的帧与当前位置之差
+
+        Args:
+            position: 下一次读取的帧索引
+            now: 当前时间(秒)，默认为time.monotonic()
+
+        Returns:
+            int: 需要跳过的帧数，直播源或未落后时为0
+        """
+        if self.source_fps is None:
+            return 0
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._clock_start is None:
+                self._clock_start = now
+                self._clock_position = position
+                return 0
+            expected = self._clock_position + (now - self._clock_start) * self.source_fps
+            behind = int(expected) - position
+            if behind < 0:
+                return 0
+            return behind
+
+    def record_skipped(self, count):
+        """记录跳过的源帧数"""
+        with self._lock:
+            self.source_frames_skipped += count
+
+    def record_stage(self, stage, seconds):
+        """记录一个阶段的耗时，按指数平滑保存"""
+        with self._lock:
+            previous = self.stage_times.get(stage)
+            self.stage_times[stage] = seconds if previous is None else previous + self.smoothing * (seconds - previous)
+
+    def wait_time(self):
+        """距下一帧发送时间还需等待的秒数"""
+        if self.target_fps is None:
+            return 0.0
+        with self._lock:
+            if self._next_due is None:
+                return 0.0
+            return max(0.0, self._next_due - time.monotonic())
+
+    def frame_sent(self, capture_ts=None):
+        """
+        记录一帧已发送，安排下一帧的发送时间
+
+        Args:
+            capture_ts: 该帧的采集时间戳(time.time())，用于计算端到端延迟
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.frames_sent += 1
+            self._sent_times.append(now)
+            while self._sent_times and now - self._sent_times[0] > self.window:
+                self._sent_times.popleft()
+            if self.target_fps is not None:
+                interval = 1.0 / self.target_fps
+                # 落后超过一帧时不追赶，从当前时间重新排期，避免连续突发发送
+                if self._next_due is None or now - self._next_due > interval:
+                    self._next_due = now + interval
+                else:
+                    self._next_due += interval
+            if capture_ts is not None:
+                latency = max(0.0, time.time() - capture_ts)
+                self.latency = latency if self.latency is None else self.latency + self.smoothing * (latency - self.latency)
+
+    @property
+    def fps(self):
+        """时间窗口内的实际发送帧率"""
+        with self._lock:
+            if len(self._sent_times) < 2:
+                return 0.0
+            span = self._sent_times[-1] - self._sent_times[0]
+            return (len(self._sent_times) - 1) / span if span > 0 else 0.0
+
+    def latency_ms(self, capture_ts=None):
+        """给定采集时间戳时返回该帧到现在的延迟，否则返回平滑后的延迟(毫秒)"""
+        if capture_ts is not None:
+            return round(max(0.0, time.time() - capture_ts) * 1000, 1)
+        return round(self.latency * 1000, 1) if self.latency is not None else 0.0
+
+    def stats(self):
+        """返回目标帧率、实际帧率、延迟和各阶段耗时"""
+        fps = self.fps
+        with self._lock:
+            return {
+                "target_fps": self.target_fps,
+                "achieved_fps": round(fps, 2),
+                "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else 0.0,
+                "frames_sent": self.frames_sent,
+                "source_frames_skipped": self.source_frames_skipped,
+                "stage_ms": {stage: round(seconds * 1000, 2) for stage, seconds in self.stage_times.items()}
+            }
@@ -0,0 +1,147 @@
+import numpy as np
+
+# 类别名称重映射表：模型把漂浮瓶误识别为bird，统一显示为bottle
+DEFAULT_CLASS_REMAP = {
+    "bird": "bottle"
+}
+
+def _to_numpy(values):
+    """将torch张量或数组转换为numpy数组"""
+    if hasattr(values, "cpu"):
+        values = values.cpu()
+    if hasattr(values, "numpy"):
+        return values.numpy()
+    return np.asarray(values)
+
+class ClassMap:
+    """
+    模型加载时构建一次的类别表，包含重映射后的名称和按检测类型生成的布尔掩码
+    """
+    def __init__(self, names, remap=None):
+        """
+        构建类别表
+
+        Args:
+            names: 模型的类别名称字典 {类别ID: 名称}
+            remap: 名称重映射表，默认把bird显示为bottle
+        """
+        remap = DEFAULT_CLASS_REMAP if remap is None else remap
+        self.names = {cls: remap.get(name, name) for cls, name in names.items()}
+        size = max(self.names) + 1 if self.names else 0
+        self.name_array = np.array([self.names.get(cls, str(cls)) for cls in range(size)], dtype=object)
+        self._masks = {}
+
+    def type_mask(self, detect_types):
+        """
+        按需要记录的类型生成类别掩码，包含'*'时所有类别都为True
+
+        Args:
+            detect_types: 需要检测的物体类型列表
+
+        Returns:
+            numpy.ndarray: 以类别ID为下标的布尔数组
+        """
+        key = tuple(detect_types)
+        mask = self._masks.get(key)
+        if mask is None:
+            if '*' in detect_types:
+                mask = np.ones(len(self.name_array), dtype=bool)
+            else:
+                mask = np.isin(self.name_array, list(detect_types))
+            self._masks[key] = mask
+        return mask
+
+class FrameDetections:
+    """
+    单帧检测结果的向量化视图，一次性从boxes读取类别、置信度和坐标
+    """
+    def __init__(self, boxes, class_map):
+        """
+        Args:
+            boxes: YOLO结果的boxes对象
+            class_map: 模型对应的ClassMap
+        """
+        self.class_map = class_map
+        if boxes is None or len(boxes) == 0:
+            self.cls = np.zeros(0, dtype=np.int64)
+            self.conf = np.zeros(0, dtype=np.float32)
+            self.xyxy = np.zeros((0, 4), dtype=np.float32)
+        else:
+            self.cls = _to_numpy(boxes.cls).astype(np.int64)
+            self.conf = _to_numpy(boxes.conf)
+            self.xyxy = _to_numpy(boxes.xyxy).reshape(-1, 4)
+        self.types = class_map.name_array[self.cls]
+
+    def __len__(self):
+        return len(self.cls)
+
+    def _grouped(self, mask=None):
+        """按类型分组，保持类型首次出现的顺序，返回(类型, 索引数组)列表"""
+        indices = np.arange(len(self.cls))
+        if mask is not None:
+            indices = indices[mask[self.cls]]
+        if len(indices) == 0:
+            return []
+        # 先按整数类别ID分组，再合并重映射后同名的类别
+        cls = self.cls[indices]
+        order = np.argsort(cls, kind="stable")
+        boundaries = np.flatnonzero(np.diff(cls[order])) + 1
+        groups = {}
+        for group in np.split(indices[order], boundaries):
+            type_name = self.types[group[0]]
+            groups[type_name] = np.concatenate([groups[type_name], group]) if type_name in groups else group
+        grouped = [(type_name, np.sort(idx)) for type_name, idx in groups.items()]
+        grouped.sort(key=lambda item: item[1][0])
+        return grouped
+
+    def counts(self, mask=None):
+        """
+        统计各类型数量
+
+        Args:
+            mask: ClassMap.type_mask生成的类别掩码，为None时统计所有类型
+
+        Returns:
+            dict: {类型: 数量}
+        """
+        return {type_name: len(idx) for type_name, idx in self._grouped(mask)}
+
+    def type_stats(self, mask=None):
+        """
+        统计各类型数量和置信度列表
+
+        Args:
+            mask: 类别掩码，为None时统计所有类型
+
+        Returns:
+            dict: {类型: {"count": 数量, "confidence": [置信度]}}
+        """
+        confidences = self.conf.tolist()
+        return {
+            type_name: {"count": len(idx), "confidence": [confidences[i] for i in idx]}
+            for type_name, idx in self._grouped(mask)
+        }
+
+    def objects(self):
+        """
+        计算每个物体的中心点和宽高，返回与数据库字段对应的物体列表
+
+        Returns:
+            list: 每个物体的类型、置信度和位置信息
+        """
+        if len(self.cls) == 0:
+            return []
+        # 使用float64计算，与逐个box转换为Python浮点数后计算的结果一致
+        xyxy = self.xyxy.astype(np.float64)
+        centers = (xyxy[:, :2] + xyxy[:, 2:]) / 2
+        sizes = xyxy[:, 2:] - xyxy[:, :2]
+        geometry = np.concatenate([xyxy, centers, sizes], axis=1).tolist()
+        keys = ("x1", "y1", "x2", "y2", "center_x", "center_y", "width", "height")
+        return [
+            {
+                "type": type_name,
+                "confidence": confidence,
+                "position": dict(zip(keys, values))
+            }
+            for type_name, confidence, values in zip(self.types.tolist(), self.conf.tolist(), geometry)
+        ]
@@ -0,0 +1,238 @@
+import datetime
+import json
+import logging
+import os
+import threading
+import uuid
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 分段状态
+SEGMENT_RECORDED = "recorded"
+SEGMENT_ANALYZING = "analyzing"
+SEGMENT_ANALYZED = "analyzed"
+SEGMENT_FAILED = "failed"
+SEGMENT_SKIPPED = "skipped"
+
+INDEX_FILENAME = "segments.json"
+
+# 各分段的检测结果写入录制的同一条analysis_tasks记录，分段n的帧索引从n * SEGMENT_FRAME_STRIDE开始，
+# 单个分段最多SEGMENT_FRAME_STRIDE帧(30fps下约9小时)
+SEGMENT_FRAME_STRIDE = 1000000
+
+def segment_frame_offset(segment_index):
+    """分段在录制任务中的帧索引偏移"""
+    return segment_index * SEGMENT_FRAME_STRIDE
+
+def summarize_segment_result(result):
+    """从process_video的结果中提取分段索引需要保存的统计，不保存逐帧结果"""
+    video_info = result.get("video_info", {})
+    return {
+        "frame_count": video_info.get("frame_count", 0),
+        "processed_frames": video_info.get("processed_frames", 0),
+        "total_saved_frames": result.get("total_saved_frames", 0),
+        "total_tracks": result.get("total_tracks", 0),
+        "detected_objects": {
+            type_name: {
+                "count": data.get("count", 0),
+                "unique_count": data.get("unique_count", 0),
+                "avg_confidence": round(data.get("avg_confidence", 0.0), 4)
+            }
+            for type_name, data in result.get("detected_objects", {}).items()
+        },
+        "structured_data_path": result.get("structured_data_path")
+    }
+
+def merge_segment_summaries(summaries):
+    """
+    合并各分段的统计
+
+    轨迹不跨分段连接，unique_count为各分段之和，跨越分段边界的物体会被计为多个
+
+    Args:
+        summaries: summarize_segment_result的返回值列表
+
+    Returns:
+        dict: 合计的帧数、保存帧数和按类型的检测统计
+    """
+    detected = {}
+    for summary in summaries:
+        for type_name, data in summary["detected_objects"].items():
+            merged = detected.setdefault(type_name, {"count": 0, "unique_count": 0, "confidence_sum": 0.0})
+            merged["count"] += data["count"]
+            merged["unique_count"] += data["unique_count"]
+            merged["confidence_sum"] += data["avg_confidence"] * data["count"]
+    for data in detected.values():
+        confidence_sum = data.pop("confidence_sum")
+        data["avg_confidence"] = round(confidence_sum / data["count"], 4) if data["count"] else 0.0
+    return {
+        "segments_analyzed": len(summaries),
+        "frame_count": sum(summary.get("frame_count", 0) for summary in summaries),
+        "processed_frames": sum(summary["processed_frames"] for summary in summaries),
+        "total_saved_frames": sum(summary["total_saved_frames"] for summary in summaries),
+        "total_tracks": sum(summary["total_tracks"] for summary in summaries),
+        "detected_objects": detected
+    }
+
+class SegmentIndex:
+    """
+    分段录制的索引，保存在录制目录下的segments.json中：每个分段的文件、起止时间、分析状态、
+    分析任务ID和统计，服务重启后仍可按分段重新分析
+    """
+    def __init__(self, directory, task_id=None, rtmp_url=None, retention=0):
+        """
+        初始化索引，目录中已有索引时读取
+
+        Args:
+            directory: 录制目录
+            task_id: 录制任务ID
+            rtmp_url: 录制的RTMP地址
+            retention: 保留的分段文件数，超过时删除最早的已分析分段的文件，0表示全部保留
+        """
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_FILENAME)
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._data = {
+            "task_id": task_id,
+            "rtmp_url": rtmp_url,
+            "created_at": datetime.datetime.now().isoformat(),
+            "finished_at": None,
+            "analysis_task_id": None,  # 各分段检测结果共用的analysis_tasks记录
+            "segments": []
+        }
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                self._data.update(json.load(f))
+
+    @classmethod
+    def load(cls, directory, retention=0):
+        """读取已有的索引，不存在时返回None"""
+        if not os.path.exists(os.path.join(directory, INDEX_FILENAME)):
+            return None
+        return cls(directory, retention=retention)
+
+    @property
+    def task_id(self):
+        return self._data["task_id"]
+
+    @property
+    def analysis_task_id(self):
+        return self._data["analysis_task_id"]
+
+    @property
+    def finished(self):
+        return self._data["finished_at"] is not None
+
+    def set_analysis_task_id(self, analysis_task_id):
+        """记录各分段检测结果共用的analysis_tasks记录"""
+        with self._lock:
+            self._data["analysis_task_id"] = analysis_task_id
+            self._save()
+
+    def has_pending(self):
+        """是否还有未分析完的分段"""
+        with self._lock:
+            return any(segment["status"] in (SEGMENT_RECORDED, SEGMENT_ANALYZING) for segment in self._data["segments"])
+
+    def add(self, path, start, end):
+        """
+        记录一个已关闭的分段
+
+        Args:
+            path: 分段文件路径
+            start: 相对录制开始的起始时间(秒)
+            end: 相对录制开始的结束时间(秒)
+
+        Returns:
+            dict: 新分段的索引项
+        """
+        with self._lock:
+            segment = {
+                "index": len(self._data["segments"]),
+                "file": os.path.basename(path),
+                "start": round(start, 3),
+                "end": round(end, 3),
+                "duration": round(end - start, 3),
+                "size": os.path.getsize(path) if os.path.exists(path) else 0,
+                "closed_at": datetime.datetime.now().isoformat(),
+                "deleted": False,
+                "status": SEGMENT_RECORDED,
+                "job_id": None,
+                "error": None,
+                "summary": None
+            }
+            self._data["segments"].append(segment)
+            self._save()
+            return dict(segment)
+
+    def update(self, index, **fields):
+        """更新分段的状态、任务ID或统计"""
+        with self._lock:
+            self._data["segments"][index].update(fields)
+            self._save()
+
+    def get(self, index):
+        """返回分段索引项，不存在时返回None"""
+        with self._lock:
+            segments = self._data["segments"]
+            return dict(segments[index]) if 0 <= index < len(segments) else None
+
+    def segment_path(self, index):
+        """分段文件的完整路径"""
+        segment = self.get(index)
+        return os.path.join(self.directory, segment["file"]) if segment else None
+
+    def finish(self):
+        """录制结束时记录结束时间"""
+        with self._lock:
+            self._data["finished_at"] = datetime.datetime.now().isoformat()
+            self._save()
+
+    def prune(self):
+        """
+        超过保留数量时删除最早的已分析(或无需分析)分段的文件，索引项和统计保留
+
+        Returns:
+            list: 删除的文件名
+        """
+        if not self.retention or self.retention <= 0:
+            return []
+        deleted = []
+        with self._lock:
+            on_disk = [segment for segment in self._data["segments"] if not segment["deleted"]]
+            for segment in on_disk[:max(0, len(on_disk) - self.retention)]:
+                if segment["status"] in (SEGMENT_RECORDED, SEGMENT_ANALYZING):
+                    continue
+                path = os.path.join(self.directory, segment["file"])
+                try:
+                    if os.path.exists(path):
+                        os.unlink(path)
+                    segment["deleted"] = True
+                    deleted.append(segment["file"])
+                except OSError as e:
+                    logger.error(f"删除过期分段失败: {path}, 错误: {e}")
+            if deleted:
+                self._save()
+        if deleted:
+            logger.info(f"已按保留数量删除分段: {', '.join(deleted)}")
+        return deleted
+
+    def to_dict(self):
+        """返回索引和已分析分段的合计统计"""
+        with self._lock:
+            data = json.loads(json.dumps(self._data))
+        summaries = [segment["summary"] for segment in data["segments"] if segment["summary"]]
+        data["totals"] = merge_segment_summaries(summaries)
+        data["pending_segments"] = sum(1 for segment in data["segments"]
+                                       if segment["status"] in (SEGMENT_RECORDED, SEGMENT_ANALYZING))
+        return data
+
+    def _save(self):
+        """先写临时文件再重命名，需持有锁"""
+        temp_path = f"{self.path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self._data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,695 @@
+import functools
+import logging
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait as wait_connections
+import cv2
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 槽位头部的字段：序号(写入中为-1)、帧高、帧宽
+HEADER_FIELDS = 3
+SEQ, HEIGHT, WIDTH = range(HEADER_FIELDS)
+
+# 槽位状态，只由主进程维护：空闲、已写入等待分派、已分派给推理进程
+SLOT_FREE = 0
+SLOT_READY = 1
+SLOT_DISPATCHED = 2
+
+# 推理进程状态：启动中(加载模型)、运行中、等待重启、多次失败后停用
+WORKER_STARTING = "starting"
+WORKER_RUNNING = "running"
+WORKER_RESTARTING = "restarting"
+WORKER_FAILED = "failed"
+
+class SharedFrameBus:
+    """
+    基于multiprocessing.shared_memory的帧缓冲区：预分配固定数量、固定最大尺寸的槽位，
+    每个槽位带序号头部，推理进程按(槽位, 序号)直接读取槽位内存，不经过序列化
+    """
+    def __init__(self, slots=16, max_width=1920, max_height=1080, name=None, create=True):
+        """
+        创建或连接共享内存
+
+        Args:
+            slots: 槽位数
+            max_width: 槽位可容纳的最大帧宽
+            max_height: 槽位可容纳的最大帧高
+            name: 共享内存名称，连接已有的缓冲区时必须提供
+            create: True时创建新的共享内存，False时连接name指定的共享内存
+        """
+        self.slots = slots
+        self.max_width = max_width
+        self.max_height = max_height
+        self.frame_bytes = max_width * max_height * 3
+        header_bytes = slots * HEADER_FIELDS * 8
+        self.shm = shared_memory.SharedMemory(name=name, create=create,
+                                              size=header_bytes + slots * self.frame_bytes)
+        self.header = np.ndarray((slots, HEADER_FIELDS), dtype=np.int64, buffer=self.shm.buf)
+        self.frames = np.ndarray((slots, max_height, max_width, 3), dtype=np.uint8, buffer=self.shm.buf,
+                                 offset=header_bytes)
+        if create:
+            self.header[:, SEQ] = -1
+
+    @property
+    def spec(self):
+        """在推理进程中连接同一缓冲区所需的参数"""
+        return {"slots": self.slots, "max_width": self.max_width, "max_height": self.max_height,
+                "name": self.shm.name}
+
+    @classmethod
+    def attach(cls, spec):
+        """连接主进程创建的缓冲区"""
+        return cls(create=False, **spec)
+
+    def write(self, slot, frame, seq):
+        """
+        把一帧写入槽位，超过槽位尺寸的帧按比例缩小后直接写入槽位内存
+
+        写入前把序号置为-1，写完后再写入新序号，读取方据此判断槽位内容是否属于自己的请求
+
+        Args:
+            slot: 槽位索引
+            frame: BGR帧
+            seq: 本次请求的序号
+
+        Returns:
+            float: 槽位中的帧相对原始帧的缩放比例
+        """
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.max_width / width, self.max_height / height)
+        self.header[slot, SEQ] = -1
+        if scale < 1.0:
+            height, width = max(1, int(height * scale)), max(1, int(width * scale))
+            cv2.resize(frame, (width, height), dst=self.frames[slot, :height, :width], interpolation=cv2.INTER_AREA)
+        else:
+            self.frames[slot, :height, :width] = frame
+        self.header[slot, HEIGHT] = height
+        self.header[slot, WIDTH] = width
+        self.header[slot, SEQ] = seq
+        return scale
+
+    def view(self, slot, seq):
+        """
+        返回槽位中帧的视图(不复制)
+
+        Returns:
+            ndarray: 帧视图，槽位序号与seq不一致(已被复用)时返回None
+        """
+        if self.header[slot, SEQ] != seq:
+            return None
+        return self.frames[slot, :self.header[slot, HEIGHT], :self.header[slot, WIDTH]]
+
+    def is_current(self, slot, seq):
+        """槽位是否仍属于该序号的请求"""
+        return self.header[slot, SEQ] == seq
+
+    def close(self, unlink=False):
+        """断开共享内存，创建方在最后调用unlink释放"""
+        # 先释放引用共享内存的数组，否则close会因缓冲区仍被导出而失败
+        self.header = None
+        self.frames = None
+        self.shm.close()
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+def _yolo_infer_factory(model_path, conf, iou):
+    """在推理进程中加载YOLO模型，返回批量推理函数，结果为每帧的N×6数组(x1, y1, x2, y2, 置信度, 类别)"""
+    from model_registry import ModelHandle
+
+    handle = ModelHandle(model_path, conf=conf, iou=iou)
+    handle.warmup()
+
+    def infer(frames):
+        return [result.boxes.data.cpu().numpy() for result in handle(frames, verbose=False)]
+    return infer
+
+def _inference_worker(worker_id, bus_spec, infer_factory, connection, max_batch_size):
+    """
+    推理进程主循环：从管道接收(槽位, 序号)，直接在共享内存上批量推理，推理前后各核对一次序号，
+    槽位已被复用时丢弃结果；通过同一管道返回(序号, 检测结果, 错误, 推理耗时)
+    """
+    bus = SharedFrameBus.attach(bus_spec)
+    frames = []
+    try:
+        try:
+            infer = infer_factory()
+        except Exception as e:
+            # 加载模型失败(路径错误、显存不足等)时把原因告知主进程后退出
+            connection.send(("failed", worker_id, f"{type(e).__name__}: {e}"))
+            return
+        connection.send(("ready", worker_id))
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            batch = [message]
+            # 管道中已有的请求合并为一批
+            while len(batch) < max_batch_size and connection.poll():
+                message = connection.recv()
+                if message is None:
+                    return
+                batch.append(message)
+
+            frames, requests = [], []
+            for slot, seq in batch:
+                frame = bus.view(slot, seq)
+                if frame is None:
+                    connection.send((seq, None, "槽位已被复用", 0.0))
+                else:
+                    frames.append(frame)
+                    requests.append((slot, seq))
+            if not frames:
+                continue
+            start_time = time.perf_counter()
+            try:
+                results = infer(frames)
+                error = None
+            except Exception as e:
+                results, error = [None] * len(frames), str(e)
+            elapsed = time.perf_counter() - start_time
+            for (slot, seq), result in zip(requests, results):
+                if error is None and not bus.is_current(slot, seq):
+                    result, error = None, "推理期间槽位被覆盖"
+                connection.send((seq, result, error, elapsed / len(frames)))
+    except (EOFError, BrokenPipeError, KeyboardInterrupt):
+        pass
+    finally:
+        del frames
+        bus.close()
+
+class _BusRequest:
+    """一次推理请求，占用一个槽位"""
+    __slots__ = ("seq", "slot", "scale", "future", "submit_time", "worker", "retries")
+
+    def __init__(self, seq, slot, scale):
+        self.seq = seq
+        self.slot = slot
+        self.scale = scale
+        self.future = Future()
+        self.submit_time = time.perf_counter()
+        self.worker = None
+        self.retries = 0
+
+class _Worker:
+    """主进程中对一个推理进程的记录"""
+    __slots__ = ("index", "process", "connection", "state", "in_flight", "restarts", "failures", "next_spawn",
+                 "last_error")
+
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.connection = None
+        self.state = WORKER_RESTARTING
+        self.in_flight = {}  # 序号 -> _BusRequest
+        self.restarts = 0
+        self.failures = 0  # 连续异常退出次数，返回一次成功结果后清零
+        self.next_spawn = 0.0
+        self.last_error = None
+
+class InferenceWorkerPool:
+    """
+    多进程推理池：调用方线程把帧写入共享内存槽位，按(槽位, 序号)分派给推理进程，
+    推理不受主进程GIL限制，可随进程数扩展到多个核；进程异常退出时回收其槽位、重新分派请求，
+    按指数退避重启进程，连续失败超过上限后停用该进程，所有进程都停用时推理池进入失败状态
+    """
+    def __init__(self, infer_factory, workers=2, slots=16, max_width=1920, max_height=1080, max_batch_size=4,
+                 request_timeout=5.0, max_retries=1, restart_delay=1.0, max_restart_delay=30.0, max_restarts=5,
+                 names=None):
+        """
+        初始化推理池
+
+        Args:
+            infer_factory: 可序列化的无参函数，在推理进程中调用，返回批量推理函数(帧列表 -> N×6数组列表)
+            workers: 推理进程数
+            slots: 共享内存槽位数，应不少于workers * max_batch_size
+            max_width: 槽位的最大帧宽，更大的帧缩小后写入，检测框按比例还原
+            max_height: 槽位的最大帧高
+            max_batch_size: 推理进程单批最多合并的帧数，也是每个进程同时分派的请求上限
+            request_timeout: 请求超过该时间(秒)未返回时以超时结束并回收槽位
+            max_retries: 推理进程异常退出时请求重新分派的次数，避免导致崩溃的帧反复使进程退出
+            restart_delay: 推理进程第一次异常退出后的重启等待时间(秒)，之后每次连续失败翻倍
+            max_restart_delay: 重启等待时间上限(秒)
+            max_restarts: 连续异常退出超过该次数后停用该进程，不再重启
+            names: 类别名称，提供时infer返回ultralytics的Results对象
+        """
+        self.infer_factory = infer_factory
+        self.num_workers = max(1, int(workers))
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        self.max_restarts = max_restarts
+        self.names = names
+        self.bus = SharedFrameBus(slots, max_width, max_height)
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = [_Worker(index) for index in range(self.num_workers)]
+        self._slot_states = [SLOT_FREE] * slots
+        self._ready = deque()  # 已写入槽位、等待分派的请求
+        self._requests = {}  # 序号 -> _BusRequest
+        self._next_seq = 0
+        self._lock = threading.Lock()
+        self._running = False
+        self._thread = None
+        self._supervisor = None
+        self._reap = deque()  # 已退出、等待回收的进程，由监督线程join
+        self._wakeup = threading.Event()
+        self.failed = None  # 所有进程都停用时的原因，之后的请求直接失败
+
+        # 统计信息
+        self.frames_submitted = 0
+        self.frames_completed = 0
+        self.frames_dropped = 0
+        self.frames_failed = 0
+        self.stale_results = 0
+        self.timeouts = 0
+        self.worker_restarts = 0
+        self.requeued = 0
+        self.total_infer_time = 0.0
+        self._latencies = deque(maxlen=1000)
+
+    def start(self):
+        """启动推理进程和结果接收线程"""
+        if self._running:
+            return
+        self._running = True
+        for worker in self._workers:
+            self._spawn(worker)
+        self._thread = threading.Thread(target=self._run, name="shm-inference", daemon=True)
+        self._thread.start()
+        self._supervisor = threading.Thread(target=self._supervise, name="shm-inference-supervisor", daemon=True)
+        self._supervisor.start()
+        logger.info(f"多进程推理池已启动: 进程数={self.num_workers}, 槽位={self.bus.slots}, "
+                    f"槽位尺寸={self.bus.max_width}x{self.bus.max_height}")
+
+    def _spawn(self, worker):
+        """启动(或重启)一个推理进程，进程加载完模型后发送ready才开始分派"""
+        parent, child = self._context.Pipe()
+        process = self._context.Process(
+            target=_inference_worker,
+            args=(worker.index, self.bus.spec, self.infer_factory, child, self.max_batch_size),
+            name=f"shm-inference-{worker.index}",
+            daemon=True
+        )
+        process.start()
+        child.close()
+        with self._lock:
+            worker.process = process
+            worker.connection = parent
+            worker.state = WORKER_STARTING
+
+    def _supervise(self):
+        """监督线程：回收已退出的进程，到达退避时间后重启，避免阻塞接收线程的结果分发"""
+        while self._running:
+            self._wakeup.wait(0.2)
+            self._wakeup.clear()
+            self._reap_exited()
+            now = time.monotonic()
+            for worker in self._workers:
+                if self._running and worker.state == WORKER_RESTARTING and now >= worker.next_spawn:
+                    try:
+                        self._spawn(worker)
+                    except Exception as e:
+                        logger.error(f"重启推理进程失败: {worker.index}, 错误: {e}")
+                        worker.next_spawn = now + self.max_restart_delay
+
+    def _reap_exited(self):
+        """join已退出的进程，仍在运行(管道断开但未退出)时终止"""
+        while self._reap:
+            index, process = self._reap.popleft()
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            logger.info(f"已回收推理进程: {index} (pid {process.pid}, 退出码 {process.exitcode})")
+
+    def stop(self):
+        """停止推理进程，未完成的请求以异常结束，最后释放共享内存"""
+        if not self._running:
+            return
+        self._running = False
+        self._wakeup.set()
+        for thread in (self._thread, self._supervisor):
+            if thread is not None:
+                thread.join(timeout=2)
+        self._reap_exited()
+        active = [worker for worker in self._workers if worker.state in (WORKER_STARTING, WORKER_RUNNING)]
+        for worker in active:
+            try:
+                worker.connection.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in active:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+                worker.process.join()
+            worker.connection.close()
+        with self._lock:
+            requests = list(self._requests.values())
+            self._requests.clear()
+            self._ready.clear()
+        for request in requests:
+            request.future.set_exception(RuntimeError("推理池已停止"))
+        self.bus.close(unlink=True)
+
+    def submit(self, frame):
+        """
+        把一帧写入共享内存并提交推理，不等待结果
+
+        槽位用尽时复用最早的未分派请求的槽位(该请求以异常结束)，所有槽位都已分派时丢弃当前帧
+
+        Args:
+            frame: BGR图像
+
+        Returns:
+            Future: 完成后结果为原始帧坐标下的N×6数组
+        """
+        with self._lock:
+            if not self._running:
+                raise RuntimeError("推理池未启动")
+            if self.failed is not None:
+                # 所有推理进程都已停用，不再占用槽位
+                self.frames_failed += 1
+                future = Future()
+                future.set_exception(RuntimeError(f"推理池不可用: {self.failed}"))
+                return future
+            slot = self._claim_slot()
+            if slot is None:
+                self.frames_dropped += 1
+                future = Future()
+                future.set_exception(RuntimeError("共享内存槽位已满，帧被丢弃"))
+                return future
+            seq = self._next_seq
+            self._next_seq += 1
+        # 在锁外写入帧数据，该槽位此时只属于本请求
+        scale = self.bus.write(slot, frame, seq)
+        request = _BusRequest(seq, slot, scale)
+        with self._lock:
+            self._requests[seq] = request
+            self._slot_states[slot] = SLOT_READY
+            self._ready.append(request)
+            self.frames_submitted += 1
+            self._dispatch()
+        return request.future
+
+    def infer(self, frame, timeout=None):
+        """
+        同步推理一帧
+
+        Returns:
+            提供了names时为ultralytics的Results对象，否则为N×6数组
+        """
+        data = self.submit(frame).result(timeout=timeout)
+        if self.names is None:
+            return data
+        import torch
+        from ultralytics.engine.results import Results
+        return Results(orig_img=frame, path="", names=self.names, boxes=torch.from_numpy(data))
+
+    def _claim_slot(self):
+        """取一个空闲槽位，没有时回收最早的未分派请求的槽位，需持有锁"""
+        for slot, state in enumerate(self._slot_states):
+            if state == SLOT_FREE:
+                self._slot_states[slot] = SLOT_READY
+                return slot
+        if self._ready:
+            # 保留较新的帧，与单进程调度器队列满时丢弃最旧请求的行为一致
+            stale = self._ready.popleft()
+            self._requests.pop(stale.seq, None)
+            stale.future.set_exception(RuntimeError("推理队列已满，请求被丢弃"))
+            self.frames_dropped += 1
+            return stale.slot
+        return None
+
+    def _dispatch(self):
+        """把等待中的请求分派给已就绪且未满的推理进程，优先分派给进行中请求最少的进程，需持有锁"""
+        while self._ready:
+            candidates = [worker for worker in self._workers
+                          if worker.state == WORKER_RUNNING and len(worker.in_flight) < self.max_batch_size]
+            if not candidates:
+                return
+            worker = min(candidates, key=lambda item: len(item.in_flight))
+            request = self._ready.popleft()
+            try:
+                worker.connection.send((request.slot, request.seq))
+            except (OSError, ValueError):
+                # 进程已退出，不再向其分派，等待接收线程检测到管道断开后回收
+                self._ready.appendleft(request)
+                worker.state = WORKER_STARTING
+                return
+            request.worker = worker.index
+            worker.in_flight[request.seq] = request
+            self._slot_states[request.slot] = SLOT_DISPATCHED
+
+    def _run(self):
+        """接收线程：读取各推理进程的结果，检查进程存活和请求超时"""
+        while self._running:
+            with self._lock:
+                connections = {worker.connection: worker for worker in self._workers
+                               if worker.state in (WORKER_STARTING, WORKER_RUNNING)}
+            if connections:
+                ready = wait_connections(list(connections), timeout=0.5)
+            else:
+                ready = []
+                time.sleep(0.5)
+            for connection in ready:
+                worker = connections[connection]
+                if worker.connection is not connection:
+                    continue
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    self._recover(worker)
+                    continue
+                self._handle(worker, message)
+            for worker in connections.values():
+                if worker.state in (WORKER_STARTING, WORKER_RUNNING) and not worker.process.is_alive():
+                    self._recover(worker)
+            self._expire()
+
+    def _handle(self, worker, message):
+        """处理推理进程的消息，释放槽位并完成请求"""
+        if message[0] == "ready":
+            with self._lock:
+                worker.state = WORKER_RUNNING
+                self._dispatch()
+            logger.info(f"推理进程已就绪: {worker.index} (pid {worker.process.pid})")
+            return
+        if message[0] == "failed":
+            # 进程随后退出，由管道断开触发回收
+            worker.last_error = message[2]
+            logger.error(f"推理进程启动失败: {worker.index} (pid {worker.process.pid}), 错误: {message[2]}")
+            return
+        seq, data, error, infer_time = message
+        with self._lock:
+            request = worker.in_flight.pop(seq, None)
+            if request is not None:
+                self._slot_states[request.slot] = SLOT_FREE
+            if request is None or self._requests.pop(seq, None) is None:
+                # 请求已超时，推理进程不再读取该槽位，可以复用
+                self.stale_results += 1
+                self._dispatch()
+                return
+            if error is None:
+                worker.failures = 0
+                self.frames_completed += 1
+                self.total_infer_time += infer_time
+                self._latencies.append(time.perf_counter() - request.submit_time)
+            else:
+                self.frames_failed += 1
+            self._dispatch()
+        if error is not None:
+            request.future.set_exception(RuntimeError(error))
+            return
+        if request.scale < 1.0 and len(data):
+            data[:, :4] /= request.scale
+        request.future.set_result(data)
+
+    def _recover(self, worker):
+        """
+        推理进程退出后回收其已分派的槽位，未超过重试次数的请求重新排队，安排监督线程按退避时间重启进程；
+        不在此处join进程，避免阻塞其他进程的结果分发
+        """
+        if not self._running:
+            return
+        failed = []
+        with self._lock:
+            if worker.state not in (WORKER_STARTING, WORKER_RUNNING):
+                return
+            process, connection = worker.process, worker.connection
+            in_flight = len(worker.in_flight)
+            worker.failures += 1
+            if worker.failures > self.max_restarts:
+                worker.state = WORKER_FAILED
+                delay = None
+            else:
+                worker.state = WORKER_RESTARTING
+                delay = min(self.max_restart_delay, self.restart_delay * 2 ** (worker.failures - 1))
+                worker.next_spawn = time.monotonic() + delay
+                worker.restarts += 1
+                self.worker_restarts += 1
+            for request in sorted(worker.in_flight.values(), key=lambda item: item.seq, reverse=True):
+                request.worker = None
+                if request.seq not in self._requests:
+                    # 已超时结束的请求只回收槽位
+                    self._slot_states[request.slot] = SLOT_FREE
+                elif request.retries < self.max_retries:
+                    request.retries += 1
+                    self._slot_states[request.slot] = SLOT_READY
+                    self._ready.appendleft(request)
+                    self.requeued += 1
+                else:
+                    self._requests.pop(request.seq, None)
+                    self._slot_states[request.slot] = SLOT_FREE
+                    self.frames_failed += 1
+                    failed.append(request)
+            worker.in_flight.clear()
+            if all(item.state == WORKER_FAILED for item in self._workers):
+                # 没有可用的进程，排队的请求不会再被处理
+                self.failed = worker.last_error or "推理进程多次异常退出"
+                for request in self._ready:
+                    self._requests.pop(request.seq, None)
+                    self._slot_states[request.slot] = SLOT_FREE
+                    self.frames_failed += 1
+                    failed.append(request)
+                self._ready.clear()
+            self._dispatch()
+        connection.close()
+        self._reap.append((worker.index, process))
+        self._wakeup.set()
+        if delay is None:
+            logger.error(f"推理进程连续异常退出 {worker.failures} 次，已停用: {worker.index}"
+                         f"{'，推理池不可用' if self.failed else ''}")
+        else:
+            logger.error(f"推理进程异常退出: {worker.index} (pid {process.pid})，回收 {in_flight} 个槽位，"
+                         f"{delay:.1f}秒后重启")
+        for request in failed:
+            request.future.set_exception(RuntimeError(self.failed or "推理进程异常退出"))
+
+    def _expire(self):
+        """超时的请求以异常结束；已分派的槽位可能仍在被读取，等进程返回结果或退出后再释放"""
+        if not self.request_timeout:
+            return
+        now = time.perf_counter()
+        expired = []
+        with self._lock:
+            for seq, request in list(self._requests.items()):
+                if now - request.submit_time <= self.request_timeout:
+                    continue
+                del self._requests[seq]
+                if self._slot_states[request.slot] == SLOT_READY:
+                    self._ready.remove(request)
+                    self._slot_states[request.slot] = SLOT_FREE
+                expired.append(request)
+            self.timeouts += len(expired)
+        for request in expired:
+            request.future.set_exception(TimeoutError("推理请求超时"))
+
+    def stats(self):
+        """返回吞吐量、延迟、槽位占用和进程重启统计"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+
+            def percentile(p):
+                if not latencies:
+                    return 0.0
+                return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2)
+
+            return {
+                "workers": [{"index": worker.index, "pid": worker.process.pid if worker.process else None,
+                             "state": worker.state, "in_flight": len(worker.in_flight), "restarts": worker.restarts,
+                             "failures": worker.failures, "last_error": worker.last_error}
+                            for worker in self._workers],
+                "failed": self.failed,
+                "slots": self.bus.slots,
+                "slot_size": [self.bus.max_width, self.bus.max_height],
+                "slots_free": self._slot_states.count(SLOT_FREE),
+                "queue_depth": len(self._ready),
+                "frames_submitted": self.frames_submitted,
+                "frames_completed": self.frames_completed,
+                "frames_dropped": self.frames_dropped,
+                "frames_failed": self.frames_failed,
+                "stale_results": self.stale_results,
+                "timeouts": self.timeouts,
+                "requeued": self.requeued,
+                "worker_restarts": self.worker_restarts,
+                "avg_infer_ms": round(self.total_infer_time / self.frames_completed * 1000, 2) if self.frames_completed else 0.0,
+                "latency_p50_ms": percentile(0.5),
+                "latency_p95_ms": percentile(0.95)
+            }
+
+class ProcessInferenceService:
+    """
+    按模型维护多进程推理池，接口与InferenceService一致，供实时流在进程外推理
+    """
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+        self.settings = {
+            "workers": 2,
+            "slots": 16,
+            "max_width": 1920,
+            "max_height": 1080,
+            "max_batch_size": 4
+        }
+
+    def configure(self, **settings):
+        """
+        更新之后新建推理池使用的参数
+
+        Args:
+            **settings: workers、slots、max_width、max_height、max_batch_size
+        """
+        self.settings.update({k: v for k, v in settings.items() if v is not None})
+
+    def get(self, model):
+        """
+        获取模型对应的推理池，首次请求时创建并启动，推理进程按模型句柄的路径和阈值各自加载模型；
+        已进入失败状态的推理池停止后重新创建，例如模型文件修复后新的流可以重新加载
+
+        Args:
+            model: 主进程中的模型句柄(ModelHandle)，提供类别名称和推理参数
+
+        Returns:
+            InferenceWorkerPool: 该模型的推理池
+        """
+        with self._lock:
+            pool = self._pools.get(id(model))
+            if pool is not None and pool.failed is not None:
+                pool.stop()
+                pool = None
+            if pool is None:
+                factory = functools.partial(_yolo_infer_factory, model.model_path, model.conf, model.iou)
+                pool = InferenceWorkerPool(factory, names=model.names, **self.settings)
+                pool.start()
+                self._pools[id(model)] = pool
+            return pool
+
+    def stop_all(self):
+        """停止所有推理池并释放共享内存"""
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+        for pool in pools:
+            pool.stop()
+
+    def stats(self):
+        """返回所有推理池的统计信息"""
+        with self._lock:
+            pools = list(self._pools.values())
+        return [pool.stats() for pool in pools]
+
+# 进程外推理服务
+process_inference = ProcessInferenceService()
@@ -0,0 +1,280 @@
+import asyncio
+import base64
+import logging
+import threading
+from contextlib import asynccontextmanager
+
+from adaptive_encoding import FULL_TIER, AdaptiveEncoder, encode_tier
+from frame_protocol import PROTOCOL_JSON, build_payload
+from pacing import FramePacer
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class FramePacket:
+    """
+    处理完成的一帧，每个编码档位只编码一次，供该档位的所有订阅者共用
+    """
+    __slots__ = ("seq", "capture_ts", "image", "detections", "fps", "source", "_jpeg", "_b64", "_lock")
+
+    def __init__(self, seq, capture_ts, image, detections, fps=30.0, source="RTMP"):
+        self.seq = seq
+        self.capture_ts = capture_ts
+        self.image = image
+        self.detections = detections
+        self.fps = fps
+        self.source = source
+        self._jpeg = {}
+        self._b64 = {}
+        self._lock = threading.Lock()
+
+    @property
+    def width(self):
+        """原始帧宽度"""
+        return self.image.shape[1]
+
+    def is_encoded(self, key):
+        """指定档位是否已编码"""
+        with self._lock:
+            return key in self._jpeg
+
+    def encoded(self, key=FULL_TIER):
+        """
+        指定档位的JPEG，首次访问时编码并缓存
+
+        Args:
+            key: (宽度, 质量)，AdaptiveEncoder.key的返回值
+
+        Returns:
+            bytes: JPEG字节
+        """
+        with self._lock:
+            jpeg = self._jpeg.get(key)
+        if jpeg is None:
+            # 在锁外编码，不阻塞其他档位，极少数并发时重复编码的结果以先完成的为准
+            jpeg = encode_tier(self.image, *key)
+            with self._lock:
+                jpeg = self._jpeg.setdefault(key, jpeg)
+        return jpeg
+
+    def b64(self, key=FULL_TIER):
+        """JSON协议使用的base64图像，首次访问时编码并缓存"""
+        jpeg = self.encoded(key)
+        with self._lock:
+            image_b64 = self._b64.get(key)
+            if image_b64 is None:
+                image_b64 = self._b64[key] = base64.b64encode(jpeg).decode('utf-8')
+            return image_b64
+
+    @property
+    def jpeg(self):
+        """原始分辨率、默认质量的JPEG"""
+        return self.encoded(FULL_TIER)
+
+class FrameSubscriber:
+    """
+    单个WebSocket观看者，只保留最新一帧，发送慢时丢弃旧帧，可按自己的目标帧率限速，
+    并按发送耗时自适应调整编码档位
+    """
+    def __init__(self, loop, protocol=PROTOCOL_JSON, target_fps=None, encoder=None):
+        self.loop = loop
+        self.protocol = protocol
+        self.queue = asyncio.Queue(maxsize=1)
+        self.pacer = FramePacer(target_fps)
+        self.encoder = encoder if encoder is not None else AdaptiveEncoder()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+    def offer(self, packet):
+        """在事件循环线程中放入最新帧"""
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.frames_dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(packet)
+
+    def tier_key(self, packet):
+        """该订阅者当前档位在这一帧上的编码参数"""
+        return self.encoder.key(packet.width)
+
+    def prepare(self, packet):
+        """按订阅者当前的档位预先编码，在发布线程中调用"""
+        key = self.tier_key(packet)
+        if self.protocol == PROTOCOL_JSON:
+            packet.b64(key)
+        else:
+            packet.encoded(key)
+
+    def payload(self, packet, key=None):
+        """按订阅者的协议和编码档位构造发送数据"""
+        key = key if key is not None else self.tier_key(packet)
+        image_b64 = packet.b64(key) if self.protocol == PROTOCOL_JSON else None
+        # 帧率和延迟按该观看者实际收到的帧计算
+        fps = self.pacer.fps or packet.fps
+        return build_payload(packet.encoded(key), self.protocol, packet.seq, packet.capture_ts,
+                             fps, packet.detections, source=packet.source, image_b64=image_b64,
+                             latency_ms=self.pacer.latency_ms(packet.capture_ts))
+
+    def record_send(self, seconds, packet, key, dropped):
+        """
+        记录一次发送，调整编码档位
+
+        Args:
+            seconds: 发送耗时(秒)
+            packet: 已发送的帧
+            key: 使用的编码档位
+            dropped: 发送期间被新帧覆盖而丢弃的帧数
+        """
+        self.frames_sent += 1
+        self.pacer.frame_sent(packet.capture_ts)
+        target_fps = self.pacer.target_fps
+        interval = 1.0 / (target_fps or packet.fps or 30.0)
+        # 限速低于流水线帧率时丢帧是预期的，只按发送耗时判断
+        backlog = dropped if target_fps is None else 0
+        self.encoder.record_send(seconds, interval, len(packet.encoded(key)), backlog)
+
+class FrameBroadcaster:
+    """
+    将处理线程产出的帧广播给所有订阅者
+    """
+    def __init__(self):
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def add(self, subscriber):
+        """添加订阅者，返回当前订阅者数量"""
+        with self._lock:
+            self._subscribers.add(subscriber)
+            return len(self._subscribers)
+
+    def remove(self, subscriber):
+        """移除订阅者，返回剩余订阅者数量"""
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            return len(self._subscribers)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def subscribers(self):
+        """返回当前订阅者列表的副本"""
+        with self._lock:
+            return list(self._subscribers)
+
+    def publish(self, packet):
+        """从任意线程发布一帧，先在发布线程中按各订阅者的档位编码(同档位只编码一次)，再投递到各订阅者所在的事件循环"""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.prepare(packet)
+            except Exception as e:
+                logger.error(f"帧编码失败: {e}")
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.offer, packet)
+            except RuntimeError:
+                # 事件循环已关闭，订阅者稍后会被移除
+                pass
+
+class StreamHub:
+    """
+    按流地址共享采集检测流水线，订阅者引用计数：首个订阅者启动流水线，最后一个离开时关闭
+
+    启动和关闭只持有该流地址的锁，一路流连接超时或关闭缓慢不影响其他流的订阅
+    """
+    def __init__(self, factory):
+        """
+        初始化流中心
+
+        Args:
+            factory: 根据流地址创建流水线的函数，流水线需提供start_capture()、release()和broadcaster属性
+        """
+        self.factory = factory
+        self._streams = {}
+        self._key_locks = {}  # 流地址 -> [asyncio.Lock, 使用中的协程数]
+
+    @asynccontextmanager
+    async def _locked(self, key):
+        """持有单个流地址的锁，没有协程使用时删除该锁；字典只在事件循环线程中修改，无需全局锁"""
+        entry = self._key_locks.get(key)
+        if entry is None:
+            entry = self._key_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._key_locks.get(key) is entry:
+                del self._key_locks[key]
+
+    async def subscribe(self, key, protocol=PROTOCOL_JSON, target_fps=None, encoder=None):
+        """
+        订阅指定流，流水线不存在时创建并启动
+
+        Args:
+            key: 流地址
+            protocol: 订阅者使用的帧协议
+            target_fps: 订阅者的目标帧率，None表示跟随流水线的输出帧率
+            encoder: 订阅者的AdaptiveEncoder，None时使用默认设置
+
+        Returns:
+            tuple: (流水线, 订阅者)，启动失败时返回(None, None)
+        """
+        loop = asyncio.get_running_loop()
+        async with self._locked(key):
+            stream = self._streams.get(key)
+            if stream is None:
+                stream = self.factory(key)
+                # 打开流可能耗时数秒，放到线程中执行
+                started = await loop.run_in_executor(None, stream.start_capture)
+                if not started:
+                    await loop.run_in_executor(None, stream.release)
+                    return None, None
+                self._streams[key] = stream
+                logger.info(f"已为流创建共享流水线: {key}")
+            subscriber = FrameSubscriber(loop, protocol, target_fps, encoder)
+            count = stream.broadcaster.add(subscriber)
+            logger.info(f"新订阅者加入: {key}, 当前订阅者: {count}")
+            return stream, subscriber
+
+    async def unsubscribe(self, key, subscriber):
+        """
+        取消订阅，最后一个订阅者离开时关闭流水线
+
+        Args:
+            key: 流地址
+            subscriber: subscribe返回的订阅者
+        """
+        loop = asyncio.get_running_loop()
+        async with self._locked(key):
+            stream = self._streams.get(key)
+            if stream is None:
+                return
+            remaining = stream.broadcaster.remove(subscriber)
+            logger.info(f"订阅者离开: {key}, 剩余订阅者: {remaining}")
+            if remaining == 0:
+                del self._streams[key]
+                await loop.run_in_executor(None, stream.release)
+                logger.info(f"最后一个订阅者已离开，已关闭流水线: {key}")
+
+    async def close_all(self):
+        """关闭所有流水线"""
+        loop = asyncio.get_running_loop()
+        streams = list(self._streams.values())
+        self._streams.clear()
+        for stream in streams:
+            await loop.run_in_executor(None, stream.release)
+
+    def get(self, key):
+        """返回正在运行的流水线，不存在时返回None"""
+        return self._streams.get(key)
+
+    def stats(self):
+        """返回各流的订阅者数量"""
+        return {key: len(stream.broadcaster) for key, stream in list(self._streams.items())}
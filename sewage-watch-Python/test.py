@@ -1,8 +1,22 @@
+import argparse
+import base64
+import gc
+import json
 import logging
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+import urllib.request
 import xml.etree.ElementTree as ET
 from pathlib import Path
-import mysql.connector
-from mysql.connector import Error
+from urllib.parse import urlsplit
+import numpy as np
+
+from db_pool import ConnectionPool
+from frame_store import insert_frames_bulk, insert_frames_row_by_row
 
 # 配置日志
 logging.basicConfig(
@@ -47,6 +61,9 @@ def load_config():
 
 def test_db_connection(config):
     """测试数据库连接"""
+    import mysql.connector
+    from mysql.connector import Error
+
     if not config or 'database' not in config:
         logger.error("无效的数据库配置")
         return False
@@ -80,7 +97,622 @@ def test_db_connection(config):
         logger.error(f"数据库连接错误: {e}")
         return False
 
+def run_writers(get_connection, rows, threads, placeholder):
+    """多个线程各自取连接写入一行并归还，模拟检测路径的逐帧写入，返回耗时(秒)"""
+    sql = f"INSERT INTO pool_benchmark (type, src) VALUES ({placeholder}, {placeholder})"
+    per_thread = rows // threads
+
+    def writer(worker):
+        for i in range(per_thread):
+            connection = get_connection()
+            try:
+                cursor = connection.cursor()
+                cursor.execute(sql, ("bottle", f"/history/{worker}_{i}.jpg"))
+                cursor.close()
+                connection.commit()
+            finally:
+                connection.close()
+
+    workers = [threading.Thread(target=writer, args=(worker,)) for worker in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+def benchmark_pool(config=None, use_sqlite=False, rows=2000, threads=8, pool_sizes=(4, 8)):
+    """对比每次写入新建连接和使用连接池的写入速度，可使用本地MySQL或SQLite替代"""
+    temp_dir = None
+    if use_sqlite:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "pool_benchmark.db")
+        factory = lambda: sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        placeholder = "?"
+        create_sql = "CREATE TABLE pool_benchmark (id INTEGER PRIMARY KEY AUTOINCREMENT, type TEXT, src TEXT)"
+        logger.info(f"使用SQLite替代数据库: {db_path}")
+    else:
+        import pymysql
+        database = config['database']
+        factory = lambda: pymysql.connect(
+            host=database['host'],
+            port=database['port'],
+            user=database['user'],
+            password=database['password'] or "",
+            database=database['name'],
+            charset='utf8mb4'
+        )
+        placeholder = "%s"
+        create_sql = """
+        CREATE TABLE IF NOT EXISTS pool_benchmark (
+            id INT PRIMARY KEY AUTO_INCREMENT, type VARCHAR(20), src VARCHAR(255)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+        """
+        logger.info(f"使用MySQL: {database['host']}:{database['port']}/{database['name']}")
+
+    connection = factory()
+    cursor = connection.cursor()
+    cursor.execute(create_sql)
+    cursor.close()
+    connection.commit()
+    connection.close()
+
+    try:
+        elapsed = run_writers(factory, rows, threads, placeholder)
+        logger.info(f"每次新建连接: {rows / elapsed:.0f} 行/秒 ({threads}个线程)")
+
+        for pool_size in pool_sizes:
+            pool = ConnectionPool(factory, max_size=pool_size, timeout=30)
+            elapsed = run_writers(pool.acquire, rows, threads, placeholder)
+            stats = pool.stats()
+            pool.close_all()
+            logger.info(f"连接池(大小{pool_size}): {rows / elapsed:.0f} 行/秒, 新建连接 {stats['created']}, "
+                        f"等待 {stats['waits']} 次, 平均等待 {stats['avg_wait_ms']} ms, 最长等待 {stats['max_wait_ms']} ms")
+    finally:
+        connection = factory()
+        cursor = connection.cursor()
+        cursor.execute("DROP TABLE pool_benchmark")
+        cursor.close()
+        connection.commit()
+        connection.close()
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+class SQLiteStandIn:
+    """
+    把sqlite3连接包装成与pymysql DictCursor相同的用法：%s占位符、字典行、游标支持with
+    
+    SQLite在进程内执行没有网络往返，round_trip_ms为每条语句和每次提交模拟的往返延迟
+    """
+    def __init__(self, db_path, round_trip_ms=0.0):
+        self._connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        self.round_trip = round_trip_ms / 1000
+
+    def cursor(self):
+        return _SQLiteCursor(self._connection.cursor(), self.round_trip)
+
+    def commit(self):
+        time.sleep(self.round_trip)
+        self._connection.commit()
+
+    def rollback(self):
+        self._connection.rollback()
+
+    def close(self):
+        self._connection.close()
+
+class _SQLiteCursor:
+    def __init__(self, cursor, round_trip):
+        self._cursor = cursor
+        self._round_trip = round_trip
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._cursor.close()
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def execute(self, sql, params=()):
+        time.sleep(self._round_trip)
+        self._cursor.execute(sql.replace("%s", "?"), params)
+
+    def executemany(self, sql, rows):
+        # pymysql把多行INSERT合并为一条语句发送，这里同样只计一次往返
+        time.sleep(self._round_trip)
+        self._cursor.executemany(sql.replace("%s", "?"), rows)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+def make_saved_frames(frames, objects_per_frame):
+    """生成与process_video结果结构相同的帧数据"""
+    saved_frames = []
+    for frame_index in range(frames):
+        objects = []
+        for i in range(objects_per_frame):
+            x1, y1 = float(i * 10), float(i * 5)
+            objects.append({
+                "type": "bottle",
+                "confidence": 0.8,
+                "track_id": i + 1,
+                "position": {"x1": x1, "y1": y1, "x2": x1 + 40, "y2": y1 + 30, "center_x": x1 + 20,
+                             "center_y": y1 + 15, "width": 40.0, "height": 30.0}
+            })
+        saved_frames.append({
+            "frame_index": frame_index * 30,
+            "time": frame_index,
+            "relative_path": f"/history/frame{frame_index}.jpg",
+            "detected_types": {"bottle": objects_per_frame},
+            "objects": objects,
+            "total_objects": objects_per_frame
+        })
+    return saved_frames
+
+def benchmark_frame_store(config=None, use_sqlite=False, frames=5000, objects_per_frame=10, chunk_size=500,
+                          round_trip_ms=0.2):
+    """对比逐行写入和分块批量写入video_frames/detected_objects的速度(行/秒)"""
+    temp_dir = None
+    if use_sqlite:
+        temp_dir = tempfile.TemporaryDirectory()
+        db_path = os.path.join(temp_dir.name, "frame_store_benchmark.db")
+        factory = lambda: SQLiteStandIn(db_path, round_trip_ms)
+        connection = SQLiteStandIn(db_path)
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE TABLE analysis_tasks (id INTEGER PRIMARY KEY AUTOINCREMENT, source_video TEXT)")
+            cursor.execute("""
+            CREATE TABLE video_frames (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, task_id INT, frame_index INT, time_seconds REAL,
+                image_path TEXT, detected_types TEXT, total_objects INT, UNIQUE (task_id, frame_index)
+            )""")
+            cursor.execute("""
+            CREATE TABLE detected_objects (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, frame_id INT, type TEXT, confidence REAL, x1 REAL, y1 REAL,
+                x2 REAL, y2 REAL, center_x REAL, center_y REAL, width REAL, height REAL, track_id INT
+            )""")
+        connection.commit()
+        connection.close()
+        logger.info(f"使用SQLite替代数据库: {db_path}, 模拟往返延迟 {round_trip_ms} ms")
+    else:
+        import pymysql
+        database = config['database']
+        factory = lambda: pymysql.connect(
+            host=database['host'],
+            port=database['port'],
+            user=database['user'],
+            password=database['password'] or "",
+            database=database['name'],
+            charset='utf8mb4',
+            cursorclass=pymysql.cursors.DictCursor
+        )
+        logger.info(f"使用MySQL: {database['host']}:{database['port']}/{database['name']}（需已由main.py建表）")
+
+    saved_frames = make_saved_frames(frames, objects_per_frame)
+    total_rows = frames * (objects_per_frame + 1)
+    try:
+        for name, insert in (("逐行写入", insert_frames_row_by_row),
+                             (f"批量写入(每块{chunk_size}帧)",
+                              lambda connection, task_id, rows: insert_frames_bulk(connection, task_id, rows, chunk_size))):
+            connection = factory()
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("INSERT INTO analysis_tasks (source_video, start_time) VALUES (%s, NOW())"
+                                   if not use_sqlite else "INSERT INTO analysis_tasks (source_video) VALUES (%s)",
+                                   ("benchmark.mp4",))
+                    task_id = cursor.lastrowid
+                connection.commit()
+
+                start = time.perf_counter()
+                insert(connection, task_id, saved_frames)
+                elapsed = time.perf_counter() - start
+                logger.info(f"{name}: {frames}帧 + {frames * objects_per_frame}个物体, 耗时 {elapsed:.2f}秒, "
+                            f"{total_rows / elapsed:.0f} 行/秒")
+
+                # 删除测试数据，MySQL通过外键级联删除帧和物体
+                with connection.cursor() as cursor:
+                    if use_sqlite:
+                        cursor.execute("DELETE FROM detected_objects")
+                        cursor.execute("DELETE FROM video_frames")
+                    cursor.execute("DELETE FROM analysis_tasks WHERE id = %s", (task_id,))
+                connection.commit()
+            finally:
+                connection.close()
+    finally:
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+def test_pool_reclaim():
+    """借出的连接未归还就被回收时释放名额；with块中出错时关闭连接而不放回"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_path = os.path.join(temp_dir, "pool_test.db")
+        pool = ConnectionPool(lambda: sqlite3.connect(db_path, check_same_thread=False), max_size=1, timeout=1)
+
+        # 模拟调用方忘记close()：唯一的名额被占用，之后仍能在超时内借到连接
+        connection = pool.acquire()
+        connection.execute("CREATE TABLE t (id INTEGER)")
+        del connection
+        gc.collect()
+        with pool.acquire() as connection:
+            connection.execute("INSERT INTO t VALUES (1)")
+            connection.commit()
+        stats = pool.stats()
+        assert stats["reclaimed"] == 1, stats
+        assert stats["idle"] == 1 and stats["in_use"] == 0, stats
+
+        # with块中出错的连接不放回空闲连接
+        try:
+            with pool.acquire() as connection:
+                raise RuntimeError("模拟写入失败")
+        except RuntimeError:
+            pass
+        stats = pool.stats()
+        assert stats["size"] == 0 and stats["idle"] == 0, stats
+        pool.close_all()
+
+def _full_frame_infer_factory():
+    """推理进程中使用的推理函数：每帧返回一个覆盖整帧的检测框"""
+    def infer(frames):
+        return [np.array([[0, 0, frame.shape[1], frame.shape[0], 0.9, 0]], dtype=np.float32) for frame in frames]
+    return infer
+
+def _failing_infer_factory():
+    """推理进程中使用的推理函数：加载模型时失败，模拟模型路径错误"""
+    raise FileNotFoundError("model.pt")
+
+def test_shared_frame_bus():
+    """槽位读写、超尺寸缩放和序号校验，推理进程返回原始帧坐标，加载模型失败后推理池停用"""
+    from shm_frame_bus import SharedFrameBus, InferenceWorkerPool
+
+    bus = SharedFrameBus(slots=2, max_width=64, max_height=48)
+    try:
+        frame = np.random.default_rng(0).integers(0, 255, (40, 60, 3), dtype=np.uint8)
+        assert bus.write(0, frame, seq=1) == 1.0
+        assert np.array_equal(bus.view(0, 1), frame)
+        # 同一槽位被新请求复用后，旧序号读不到数据
+        assert bus.write(0, np.zeros((96, 128, 3), dtype=np.uint8), seq=2) == 0.5
+        assert bus.view(0, 1) is None
+        assert bus.view(0, 2).shape == (48, 64, 3)
+    finally:
+        bus.close(unlink=True)
+
+    frame = np.zeros((96, 128, 3), dtype=np.uint8)
+    pool = InferenceWorkerPool(_full_frame_infer_factory, workers=1, slots=4, max_width=64, max_height=48)
+    pool.start()
+    try:
+        boxes = pool.infer(frame, timeout=60)
+        # 推理进程看到的是缩小一半的帧，结果换算回原始帧坐标
+        assert boxes.shape == (1, 6) and boxes[0, 2] == 128 and boxes[0, 3] == 96, boxes
+        assert pool.stats()["slots_free"] == 4
+    finally:
+        pool.stop()
+
+    pool = InferenceWorkerPool(_failing_infer_factory, workers=1, slots=2, max_width=64, max_height=48,
+                               restart_delay=0.05, max_restarts=1)
+    pool.start()
+    try:
+        deadline = time.monotonic() + 60
+        while pool.failed is None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert pool.failed is not None, "加载模型持续失败时推理池应停用"
+        future = pool.submit(frame)
+        assert future.done() and isinstance(future.exception(), RuntimeError)
+    finally:
+        pool.stop()
+
+def test_tracker():
+    """匀速运动的物体保持同一轨迹ID，类型不同的检测不匹配，超过max_age未匹配的轨迹结束"""
+    from tracker import ObjectTracker
+
+    tracker = ObjectTracker(max_age=0.5)
+    ids = set()
+    for frame in range(30):
+        t = frame / 10
+        boxes = [[10 + 20 * t, 10, 50 + 20 * t, 40], [200, 100 + 15 * t, 240, 140 + 15 * t]]
+        track_ids = tracker.update(["bottle", "bag"], [0.9, 0.8], boxes, timestamp=t)
+        ids.add(tuple(track_ids.tolist()))
+    assert ids == {(1, 2)}, ids
+
+    # 与bottle轨迹位置重合的bag检测开启新轨迹
+    track_ids = tracker.update(["bag"], [0.9], [[10 + 20 * 3.0, 10, 50 + 20 * 3.0, 40]], timestamp=3.0)
+    assert track_ids.tolist() == [3], track_ids
+
+    # 超过max_age后前两条轨迹结束
+    tracker.update([], [], np.zeros((0, 4)), timestamp=4.0)
+    assert tracker.stats()["active_tracks"] == 0
+    summary = tracker.summary()
+    assert summary["bottle"]["unique_count"] == 1 and summary["bag"]["unique_count"] == 2, summary
+    assert summary["bottle"]["max_dwell_time"] == 2.9, summary
+
+def test_event_dedup():
+    """事件在settle_time到期时保存置信度最高的一帧，冷却期内不再开启事件，物体离开或流结束时保存未到期的事件"""
+    from event_dedup import EventDeduplicator
+
+    dedup = EventDeduplicator(settle_time=2.0, cooldown=5.0, lost_timeout=1.0)
+    assert dedup.update([1], [0.5], lambda: "a", now=0.0) == []
+    assert dedup.update([1], [0.9], lambda: "b", now=1.0) == []
+    # 到期时保存事件期间置信度最高的一帧
+    assert dedup.update([1], [0.6], lambda: "c", now=2.0) == ["b"]
+
+    # 冷却期内物体一直在画面中，不开启新事件
+    for step in range(1, 10):
+        assert dedup.update([1], [0.99], lambda: "cooldown", now=2.0 + step * 0.5) == []
+    assert dedup.stats()["events"] == 1
+    # 冷却结束后开启新事件
+    assert dedup.update([1], [0.7], lambda: "d", now=7.0) == []
+    assert dedup.stats()["events"] == 2
+
+    # 同一帧被两个事件选中时只保存一次，未分配轨迹的检测不开启事件
+    assert dedup.update([2, 3, -1], [0.8, 0.6, 0.9], lambda: "e", now=7.5) == []
+    # 轨迹1在settle_time到期时保存，轨迹2、3超过lost_timeout未出现，事件提前保存
+    assert dedup.update([1], [0.5], lambda: "f", now=9.0) == ["d", "e"]
+    assert dedup.stats()["active_tracks"] == 1
+
+    # 流结束时保存未到期的事件并清空轨迹
+    assert dedup.update([4], [0.9], lambda: "g", now=10.0) == []
+    assert dedup.flush(now=10.5) == ["g"]
+    stats = dedup.stats()
+    assert stats["active_tracks"] == 0 and stats["saved"] == 4 and stats["events"] == 5, stats
+    assert stats["suppressed"] == stats["candidate_frames"] - 4, stats
+
+def test_motion_gate():
+    """推理成功才更新参考帧，推理失败的帧下一帧仍触发推理，画面不变时超过刷新间隔强制推理"""
+    from motion_gate import MotionGate, GatedDetector
+
+    still = np.zeros((120, 160, 3), dtype=np.uint8)
+    moved = still.copy()
+    moved[30:90, 40:120] = 255
+
+    gate = MotionGate(refresh_interval=10.0, downscale_width=32)
+    decision = gate.decide(still, timestamp=0.0)
+    assert decision.infer and not decision.forced
+    gate.commit(decision)
+    assert not gate.decide(still, timestamp=1.0).infer
+
+    # 推理失败时保留原参考帧，同样的画面下一帧仍需推理
+    decision = gate.decide(moved, timestamp=2.0)
+    assert decision.infer
+    gate.discard(decision)
+    decision = gate.decide(moved, timestamp=3.0)
+    assert decision.infer
+    gate.commit(decision)
+    assert not gate.decide(moved, timestamp=4.0).infer
+
+    # 刷新计时从上次成功推理的时间开始
+    assert not gate.decide(moved, timestamp=12.9).infer
+    decision = gate.decide(moved, timestamp=13.0)
+    assert decision.infer and decision.forced
+    gate.commit(decision)
+    stats = gate.stats()
+    assert (stats["frames"], stats["inferred"], stats["skipped"], stats["failed"], stats["forced"]) == (7, 3, 3, 1, 1), stats
+
+    # GatedDetector在推理失败时调用discard，复用的是上次成功推理的结果
+    calls = []
+
+    def infer(frame):
+        calls.append(frame)
+        if len(calls) == 2:
+            raise TimeoutError("模拟推理超时")
+        return len(calls)
+
+    detector = GatedDetector(infer, MotionGate(refresh_interval=10.0, downscale_width=32))
+    assert detector(still, timestamp=0.0) == (1, False)
+    try:
+        detector(moved, timestamp=1.0)
+        raise AssertionError("推理失败时应抛出异常")
+    except TimeoutError:
+        pass
+    assert detector(moved, timestamp=2.0) == (3, False)
+    assert detector(moved, timestamp=3.0) == (3, True)
+    assert detector.stats()["failed"] == 1
+
+def test_pacer_frames_behind():
+    """文件源按墙上时钟计算落后的帧数，首次调用和重新开始播放时重置时钟，直播源不跳帧"""
+    from pacing import FramePacer
+
+    pacer = FramePacer(target_fps=None, source_fps=10.0)
+    assert pacer.frames_behind(0, now=100.0) == 0
+    assert pacer.frames_behind(1, now=100.15) == 0
+    # 0.35秒应播放到第3.5帧，下一次读取第1帧时跳过2帧
+    assert pacer.frames_behind(1, now=100.35) == 2
+    # 当前位置超前时不跳帧
+    assert pacer.frames_behind(10, now=100.35) == 0
+    assert pacer.frames_behind(10, now=102.0) == 10
+
+    # 循环回到开头后从新位置重新计时
+    pacer.restart(0, now=200.0)
+    assert pacer.frames_behind(0, now=200.05) == 0
+    assert pacer.frames_behind(5, now=201.0) == 5
+
+    live = FramePacer(target_fps=10.0)
+    assert live.frames_behind(0, now=0.0) == 0 and live.frames_behind(0, now=100.0) == 0
+
+def test_adaptive_encoder():
+    """拥塞时降档但切换后hold_frames帧内不再降档，连续upgrade_after帧空闲才升档，中间状态打断空闲计数"""
+    from adaptive_encoding import AdaptiveEncoder
+
+    interval = 0.1
+    encoder = AdaptiveEncoder(degrade_ratio=0.5, upgrade_ratio=0.2, upgrade_after=3, hold_frames=2, smoothing=1.0)
+    levels = []
+    for _ in range(4):
+        encoder.record_send(0.08, interval)
+        levels.append(encoder.level)
+    assert levels == [0, 1, 1, 2], levels
+
+    # 发送耗时在两个阈值之间时保持档位
+    for _ in range(10):
+        encoder.record_send(0.03, interval)
+    assert encoder.level == 2
+
+    levels = []
+    for seconds in (0.01, 0.01, 0.03, 0.01, 0.01, 0.01, 0.01, 0.01, 0.01):
+        encoder.record_send(seconds, interval)
+        levels.append(encoder.level)
+    assert levels == [2, 2, 2, 2, 2, 1, 1, 1, 0], levels
+
+    # 发送期间有帧被覆盖时即使发送很快也视为拥塞
+    encoder.record_send(0.01, interval, backlog=1)
+    encoder.record_send(0.01, interval, backlog=1)
+    stats = encoder.stats()
+    assert (stats["level"], stats["downgrades"], stats["upgrades"]) == (1, 3, 2), stats
+
+    # 最低档不再降档，观看者的max_width限制编码宽度
+    encoder = AdaptiveEncoder(hold_frames=0, smoothing=1.0, max_width=800)
+    assert encoder.key(1920) == (800, 80) and encoder.key(640) == (None, 80)
+    for _ in range(len(encoder.tiers) + 3):
+        encoder.record_send(1.0, interval)
+    assert encoder.level == len(encoder.tiers) - 1 and encoder.key(1920) == (320, 40)
+
+    encoder = AdaptiveEncoder(enabled=False, hold_frames=0, smoothing=1.0)
+    encoder.record_send(1.0, interval)
+    assert encoder.level == 0 and encoder.stats()["downgrades"] == 0
+
+def test_zip_archive_reader():
+    """多个线程同时读取压缩包中的图片时各自使用自己的ZipFile，内容与写入的一致，关闭后不能再读取"""
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor
+    from image_batch import ZipArchiveReader
+
+    rng = np.random.default_rng(0)
+    members = {f"{i}.jpg": rng.integers(0, 255, 64 * 1024, dtype=np.uint8).tobytes() for i in range(32)}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "images.zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+            for name, data in members.items():
+                archive.writestr(name, data)
+
+        reader = ZipArchiveReader(path)
+        try:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                for _ in range(4):
+                    names = list(members)
+                    assert list(executor.map(reader.read, names)) == [members[name] for name in names]
+            assert len(reader._archives) <= 4, len(reader._archives)
+            # 同一线程复用自己的ZipFile，其他线程打开新的ZipFile
+            other = []
+            thread = threading.Thread(target=lambda: other.append(reader.archive()))
+            thread.start()
+            thread.join()
+            assert reader.archive() is reader.archive() and other[0] is not reader.archive()
+        finally:
+            reader.close()
+        try:
+            reader.read("0.jpg")
+            raise AssertionError("关闭后读取应失败")
+        except ValueError:
+            pass
+
+def run_unit_tests():
+    """运行不依赖数据库和服务的行为测试，返回是否全部通过"""
+    passed = True
+    for test in (test_pool_reclaim, test_shared_frame_bus, test_tracker, test_event_dedup,
+                 test_motion_gate, test_pacer_frames_behind, test_adaptive_encoder,
+                 test_zip_archive_reader):
+        try:
+            test()
+            logger.info(f"{test.__name__}: 通过")
+        except Exception as e:
+            passed = False
+            logger.error(f"{test.__name__}: 失败 {e!r}")
+    return passed
+
+def open_websocket(url):
+    """用标准库完成WebSocket握手并在后台线程中读取并丢弃服务端推送的帧，返回套接字"""
+    parts = urlsplit(url)
+    sock = socket.create_connection((parts.hostname, parts.port or 80), timeout=10)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall((f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUpgrade: websocket\r\n"
+                  f"Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n").encode())
+    response = sock.recv(4096)
+    if not response.startswith(b"HTTP/1.1 101"):
+        sock.close()
+        raise ConnectionError(f"WebSocket握手失败: {response[:80]!r}")
+    sock.settimeout(None)
+
+    def drain():
+        try:
+            while sock.recv(65536):
+                pass
+        except OSError:
+            pass
+
+    threading.Thread(target=drain, daemon=True).start()
+    return sock
+
+def measure_latency(url, requests):
+    """顺序请求url，返回各次耗时(毫秒)"""
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        with urllib.request.urlopen(url, timeout=30) as response:
+            json.loads(response.read())
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def test_active_tasks_latency(base_url="http://localhost:8081", streams=4, requests=50, warmup=3.0,
+                              tolerance_ms=50.0):
+    """
+    对运行中的服务先测量空闲时/rtmp/active-tasks的延迟，再打开streams路/ws/video检测流后重新测量，
+    推理在线程池中执行时事件循环不被阻塞，有流时的P95应不超过空闲时P95加tolerance_ms
+
+    Returns:
+        bool: 是否通过
+    """
+    url = base_url.rstrip("/") + "/rtmp/active-tasks"
+    ws_url = base_url.rstrip("/").replace("http", "ws", 1) + "/ws/video"
+    idle = np.array(measure_latency(url, requests))
+    sockets = [open_websocket(ws_url) for _ in range(streams)]
+    try:
+        time.sleep(warmup)
+        loaded = np.array(measure_latency(url, requests))
+    finally:
+        for sock in sockets:
+            sock.close()
+
+    idle_p95, loaded_p95 = np.percentile(idle, 95), np.percentile(loaded, 95)
+    logger.info(f"/rtmp/active-tasks 空闲: p50 {np.median(idle):.1f} ms, p95 {idle_p95:.1f} ms; "
+                f"{streams}路检测流: p50 {np.median(loaded):.1f} ms, p95 {loaded_p95:.1f} ms")
+    if loaded_p95 > idle_p95 + tolerance_ms:
+        logger.error(f"有检测流时P95延迟增加 {loaded_p95 - idle_p95:.1f} ms，超过 {tolerance_ms} ms")
+        return False
+    return True
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="数据库连接测试和连接池性能测试")
+    parser.add_argument("--benchmark", action="store_true", help="运行连接池性能测试")
+    parser.add_argument("--bulk", action="store_true", help="运行视频帧和物体批量写入性能测试")
+    parser.add_argument("--sqlite", action="store_true", help="性能测试使用SQLite替代MySQL")
+    parser.add_argument("--rows", type=int, default=2000, help="性能测试写入的行数")
+    parser.add_argument("--threads", type=int, default=8, help="性能测试的写入线程数")
+    parser.add_argument("--round-trip-ms", type=float, default=0.2, help="SQLite替代时每条语句模拟的往返延迟(毫秒)")
+    parser.add_argument("--unit", action="store_true", help="运行连接池、共享内存帧缓冲区、跟踪器、事件去重、运动门控、推流节奏、自适应编码和压缩包读取的行为测试")
+    parser.add_argument("--latency", action="store_true", help="测试运行中的服务在有检测流时/rtmp/active-tasks的延迟")
+    parser.add_argument("--url", default="http://localhost:8081", help="延迟测试的服务地址")
+    parser.add_argument("--streams", type=int, default=4, help="延迟测试打开的检测流数量")
+    args = parser.parse_args()
+    
+    if args.unit or args.latency:
+        passed = True
+        if args.unit:
+            passed = run_unit_tests() and passed
+        if args.latency:
+            passed = test_active_tasks_latency(args.url, streams=args.streams) and passed
+        exit(0 if passed else 1)
+    
+    if args.sqlite and (args.benchmark or args.bulk):
+        if args.benchmark:
+            benchmark_pool(use_sqlite=True, rows=args.rows, threads=args.threads)
+        if args.bulk:
+            benchmark_frame_store(use_sqlite=True, round_trip_ms=args.round_trip_ms)
+        exit(0)
+    
     logger.info("开始数据库连接测试")
     
     # 加载配置
@@ -92,5 +724,9 @@ if __name__ == "__main__":
     # 测试连接
     if test_db_connection(config):
         logger.info("数据库连接测试成功")
+        if args.benchmark:
+            benchmark_pool(config, rows=args.rows, threads=args.threads)
+        if args.bulk:
+            benchmark_frame_store(config)
     else:
         logger.error("数据库连接测试失败")
\ No newline at end of file
@@ -0,0 +1,365 @@
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def iou_matrix(boxes_a, boxes_b):
+    """计算两组框两两之间的IoU，框格式为[x1, y1, x2, y2]"""
+    boxes_a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    boxes_b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    inter = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(boxes_a[:, 2:] - boxes_a[:, :2], axis=1)
+    area_b = np.prod(boxes_b[:, 2:] - boxes_b[:, :2], axis=1)
+    union = area_a[:, None] + area_b[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+def greedy_match(scores, threshold):
+    """
+    按分数从高到低贪心匹配行和列
+
+    Args:
+        scores: 分数矩阵，越大越好
+        threshold: 低于该分数的配对不匹配
+
+    Returns:
+        list: [(行, 列)]
+    """
+    if scores.size == 0:
+        return []
+    rows, cols = np.nonzero(scores >= threshold)
+    order = np.argsort(-scores[rows, cols], kind="stable")
+    used_rows, used_cols = set(), set()
+    matches = []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if row in used_rows or col in used_cols:
+            continue
+        used_rows.add(row)
+        used_cols.add(col)
+        matches.append((row, col))
+    return matches
+
+def _xyxy_to_cxcywh(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return np.concatenate([(boxes[:, :2] + boxes[:, 2:]) / 2, boxes[:, 2:] - boxes[:, :2]], axis=1)
+
+def _cxcywh_to_xyxy(state):
+    half = np.abs(state[:, 2:4]) / 2
+    return np.concatenate([state[:, :2] - half, state[:, :2] + half], axis=1)
+
+class _TrackInfo:
+    """一条轨迹的元数据，状态向量和协方差保存在跟踪器的数组中"""
+    __slots__ = ("track_id", "type_name", "hits", "first_time", "last_time", "best_confidence",
+                 "first_box", "last_box", "trajectory")
+
+    def __init__(self, track_id, type_name, box, confidence, timestamp):
+        self.track_id = track_id
+        self.type_name = type_name
+        self.hits = 1
+        self.first_time = timestamp
+        self.last_time = timestamp
+        self.best_confidence = confidence
+        self.first_box = box
+        self.last_box = box
+        self.trajectory = []
+
+    def to_dict(self):
+        return {
+            "track_id": self.track_id,
+            "type": self.type_name,
+            "hits": self.hits,
+            "first_seen": round(self.first_time, 3),
+            "last_seen": round(self.last_time, 3),
+            "dwell_time": round(self.last_time - self.first_time, 3),
+            "best_confidence": round(self.best_confidence, 4),
+            "first_box": [round(v, 1) for v in self.first_box],
+            "last_box": [round(v, 1) for v in self.last_box],
+            "trajectory": self.trajectory
+        }
+
+class ObjectTracker:
+    """
+    仅依赖NumPy的多目标跟踪器（SORT/ByteTrack方式）：所有轨迹的匀速卡尔曼滤波按数组一次计算，
+    先用高置信度检测与轨迹按IoU匹配，再用低置信度检测匹配剩余轨迹，类型不同的检测不会匹配到同一轨迹
+    """
+    def __init__(self, iou_threshold=0.3, high_threshold=0.5, max_center_distance=1.0, max_age=1.0, min_hits=1,
+                 max_trajectory_points=200, max_finished_tracks=None):
+        """
+        初始化跟踪器
+
+        Args:
+            iou_threshold: 预测框与检测框的IoU不低于该值时匹配
+            high_threshold: 置信度不低于该值的检测参与第一轮匹配并可开启新轨迹，低于的只用于延续已有轨迹
+            max_center_distance: IoU不足时，中心点距离不超过框对角线的该倍数也可匹配，0表示不使用
+            max_age: 轨迹连续该时间(秒)未匹配时结束
+            min_hits: 至少匹配该次数的轨迹才计入唯一物体统计
+            max_trajectory_points: 每条轨迹保留的轨迹点上限，超过后隔点抽稀
+            max_finished_tracks: 保留的已结束轨迹数，None表示全部保留(视频分析)，实时流应设置上限
+        """
+        self.iou_threshold = iou_threshold
+        self.high_threshold = high_threshold
+        self.max_center_distance = max_center_distance
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.max_trajectory_points = max(2, int(max_trajectory_points))
+        self._mean = np.zeros((0, 8))
+        self._covariance = np.zeros((0, 8, 8))
+        self._infos = []
+        self._last_time = None
+        self._next_id = 1
+        self.finished = deque(maxlen=max_finished_tracks)
+        self._lock = threading.Lock()
+
+        # 按类型累计已结束轨迹的数量和停留时间
+        self._type_totals = {}
+
+        # 统计信息
+        self.updates = 0
+        self.total_update_time = 0.0
+
+    def _noise(self, heights, position_scale, velocity_scale):
+        """按框高度缩放的对角噪声矩阵"""
+        std = np.concatenate([
+            np.repeat((position_scale * heights)[:, None], 4, axis=1),
+            np.repeat((velocity_scale * heights)[:, None], 4, axis=1)
+        ], axis=1)
+        return np.einsum("ni,ij->nij", std ** 2, np.eye(8))
+
+    def _predict(self, dt):
+        """按时间间隔(秒)推进所有轨迹"""
+        if len(self._infos) == 0 or dt <= 0:
+            return
+        transition = np.eye(8)
+        transition[:4, 4:] = np.eye(4) * dt
+        heights = np.maximum(self._mean[:, 3], 1.0)
+        self._mean = self._mean @ transition.T
+        self._covariance = transition @ self._covariance @ transition.T + self._noise(heights, 0.05, 0.2) * dt
+
+    def _correct(self, indices, measurements):
+        """用匹配到的检测框批量修正轨迹状态"""
+        if len(indices) == 0:
+            return
+        mean = self._mean[indices]
+        covariance = self._covariance[indices]
+        heights = np.maximum(measurements[:, 3], 1.0)
+        innovation_cov = covariance[:, :4, :4] + (0.05 * heights)[:, None, None] ** 2 * np.eye(4)
+        # K = P H^T S^-1，S对称，解 S K^T = H P
+        gain = np.linalg.solve(innovation_cov, covariance[:, :4, :]).transpose(0, 2, 1)
+        residual = measurements - mean[:, :4]
+        self._mean[indices] = mean + np.einsum("nij,nj->ni", gain, residual)
+        self._covariance[indices] = covariance - gain @ covariance[:, :4, :]
+
+    def _associate(self, track_indices, track_boxes, track_types, det_indices, boxes, types):
+        """在给定的轨迹和检测之间先按IoU、再按中心点距离匹配，返回[(轨迹下标, 检测下标)]"""
+        if len(track_indices) == 0 or len(det_indices) == 0:
+            return []
+        same_type = track_types[track_indices][:, None] == types[det_indices][None, :]
+        scores = iou_matrix(track_boxes[track_indices], boxes[det_indices]) * same_type
+        pairs = [(track_indices[r], det_indices[c]) for r, c in greedy_match(scores, self.iou_threshold)]
+        if self.max_center_distance <= 0:
+            return pairs
+
+        matched_tracks = {t for t, _ in pairs}
+        matched_dets = {d for _, d in pairs}
+        rest_tracks = np.array([t for t in track_indices if t not in matched_tracks], dtype=np.int64)
+        rest_dets = np.array([d for d in det_indices if d not in matched_dets], dtype=np.int64)
+        if len(rest_tracks) == 0 or len(rest_dets) == 0:
+            return pairs
+        track_centers = (track_boxes[rest_tracks, :2] + track_boxes[rest_tracks, 2:]) / 2
+        det_centers = (boxes[rest_dets, :2] + boxes[rest_dets, 2:]) / 2
+        distances = np.linalg.norm(track_centers[:, None, :] - det_centers[None, :, :], axis=2)
+        track_diagonals = np.linalg.norm(track_boxes[rest_tracks, 2:] - track_boxes[rest_tracks, :2], axis=1)
+        det_diagonals = np.linalg.norm(boxes[rest_dets, 2:] - boxes[rest_dets, :2], axis=1)
+        scale = np.maximum(np.maximum(track_diagonals[:, None], det_diagonals[None, :]), 1e-9)
+        # 距离越小分数越高，超过阈值的分数为负，不会匹配
+        scores = (1.0 - distances / (scale * self.max_center_distance))
+        scores = np.where(track_types[rest_tracks][:, None] == types[rest_dets][None, :], scores, -1.0)
+        pairs.extend((rest_tracks[r], rest_dets[c]) for r, c in greedy_match(scores, 0.0))
+        return pairs
+
+    def update(self, types, confidences, boxes, timestamp=None):
+        """
+        用一帧的检测结果更新轨迹
+
+        Args:
+            types: 每个检测的类型
+            confidences: 每个检测的置信度
+            boxes: 每个检测的[x1, y1, x2, y2]
+            timestamp: 帧时间(秒)，默认为time.monotonic()
+
+        Returns:
+            numpy.ndarray: 与检测一一对应的轨迹ID，未分配轨迹的低置信度检测为-1
+        """
+        timestamp = time.monotonic() if timestamp is None else float(timestamp)
+        start_time = time.perf_counter()
+        types = np.asarray(types, dtype=object).reshape(-1)
+        confidences = np.asarray(confidences, dtype=np.float64).reshape(-1)
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        track_ids = np.full(len(types), -1, dtype=np.int64)
+
+        with self._lock:
+            dt = 0.0 if self._last_time is None else timestamp - self._last_time
+            self._last_time = timestamp
+            self._predict(dt)
+
+            track_boxes = _cxcywh_to_xyxy(self._mean)
+            track_types = np.array([info.type_name for info in self._infos], dtype=object)
+            all_tracks = np.arange(len(self._infos))
+            high = np.flatnonzero(confidences >= self.high_threshold)
+            low = np.flatnonzero(confidences < self.high_threshold)
+
+            # 第一轮：高置信度检测匹配所有轨迹；第二轮：低置信度检测匹配剩余轨迹
+            pairs = self._associate(all_tracks, track_boxes, track_types, high, boxes, types)
+            matched_tracks = {t for t, _ in pairs}
+            remaining = np.array([t for t in all_tracks if t not in matched_tracks], dtype=np.int64)
+            pairs += self._associate(remaining, track_boxes, track_types, low, boxes, types)
+
+            if pairs:
+                track_index = np.array([t for t, _ in pairs], dtype=np.int64)
+                det_index = np.array([d for _, d in pairs], dtype=np.int64)
+                self._correct(track_index, _xyxy_to_cxcywh(boxes[det_index]))
+                for t, d in pairs:
+                    info = self._infos[t]
+                    info.hits += 1
+                    info.last_time = timestamp
+                    info.last_box = boxes[d].tolist()
+                    info.best_confidence = max(info.best_confidence, float(confidences[d]))
+                    self._add_point(info, timestamp, boxes[d])
+                    track_ids[d] = info.track_id
+
+            # 未匹配的高置信度检测开启新轨迹
+            matched_dets = {d for _, d in pairs}
+            new_dets = [d for d in high.tolist() if d not in matched_dets]
+            if new_dets:
+                measurements = _xyxy_to_cxcywh(boxes[new_dets])
+                mean = np.concatenate([measurements, np.zeros((len(new_dets), 4))], axis=1)
+                heights = np.maximum(measurements[:, 3], 1.0)
+                covariance = self._noise(heights, 0.1, 1.0)
+                self._mean = np.concatenate([self._mean, mean])
+                self._covariance = np.concatenate([self._covariance, covariance])
+                for d in new_dets:
+                    info = _TrackInfo(self._next_id, types[d], boxes[d].tolist(), float(confidences[d]), timestamp)
+                    self._next_id += 1
+                    self._add_point(info, timestamp, boxes[d])
+                    self._infos.append(info)
+                    track_ids[d] = info.track_id
+
+            self._expire(timestamp)
+            self.updates += 1
+            self.total_update_time += time.perf_counter() - start_time
+        return track_ids
+
+    def _add_point(self, info, timestamp, box):
+        """追加轨迹点，超过上限时隔点抽稀，保留完整的时间跨度"""
+        info.trajectory.append([round(timestamp, 3), round(float(box[0] + box[2]) / 2, 1),
+                                round(float(box[1] + box[3]) / 2, 1)])
+        if len(info.trajectory) > self.max_trajectory_points:
+            last = info.trajectory[-1]
+            info.trajectory = info.trajectory[:-1:2] + [last]
+
+    def _expire(self, now):
+        """结束超过max_age未匹配的轨迹"""
+        if not self._infos:
+            return
+        alive = np.array([now - info.last_time <= self.max_age for info in self._infos])
+        if alive.all():
+            return
+        for info, keep in zip(self._infos, alive):
+            if not keep:
+                self._finish(info)
+        self._mean = self._mean[alive]
+        self._covariance = self._covariance[alive]
+        self._infos = [info for info, keep in zip(self._infos, alive) if keep]
+
+    def _finish(self, info):
+        """记录一条结束的轨迹"""
+        if info.hits < self.min_hits:
+            return
+        totals = self._type_totals.setdefault(info.type_name, {"unique_count": 0, "total_dwell": 0.0,
+                                                               "max_dwell": 0.0})
+        dwell = info.last_time - info.first_time
+        totals["unique_count"] += 1
+        totals["total_dwell"] += dwell
+        totals["max_dwell"] = max(totals["max_dwell"], dwell)
+        self.finished.append(info)
+
+    def close(self):
+        """结束所有进行中的轨迹"""
+        with self._lock:
+            for info in self._infos:
+                self._finish(info)
+            self._mean = np.zeros((0, 8))
+            self._covariance = np.zeros((0, 8, 8))
+            self._infos = []
+
+    def tracks(self):
+        """返回已结束和进行中的有效轨迹，按轨迹ID排序"""
+        with self._lock:
+            infos = list(self.finished) + [info for info in self._infos if info.hits >= self.min_hits]
+        return [info.to_dict() for info in sorted(infos, key=lambda info: info.track_id)]
+
+    def summary(self):
+        """按类型返回唯一物体数量、停留时间和进行中的轨迹数"""
+        with self._lock:
+            totals = {name: dict(values) for name, values in self._type_totals.items()}
+            for info in self._infos:
+                if info.hits < self.min_hits:
+                    continue
+                values = totals.setdefault(info.type_name, {"unique_count": 0, "total_dwell": 0.0,
+                                                            "max_dwell": 0.0})
+                dwell = info.last_time - info.first_time
+                values["unique_count"] += 1
+                values["total_dwell"] += dwell
+                values["max_dwell"] = max(values["max_dwell"], dwell)
+                values["active"] = values.get("active", 0) + 1
+        return {
+            name: {
+                "unique_count": values["unique_count"],
+                "active": values.get("active", 0),
+                "avg_dwell_time": round(values["total_dwell"] / values["unique_count"], 3),
+                "max_dwell_time": round(values["max_dwell"], 3)
+            }
+            for name, values in totals.items()
+        }
+
+    def stats(self):
+        """返回按类型的唯一物体统计和跟踪耗时"""
+        summary = self.summary()
+        with self._lock:
+            return {
+                "types": summary,
+                "active_tracks": len(self._infos),
+                "updates": self.updates,
+                "avg_update_ms": round(self.total_update_time / self.updates * 1000, 3) if self.updates else 0.0
+            }
+
+def summarize_tracks(tracks):
+    """
+    按类型统计轨迹的唯一物体数量和停留时间
+
+    Args:
+        tracks: 轨迹字典列表
+
+    Returns:
+        dict: {类型: {"unique_count", "avg_dwell_time", "max_dwell_time"}}
+    """
+    summary = {}
+    for track in tracks:
+        values = summary.setdefault(track["type"], {"unique_count": 0, "total_dwell": 0.0, "max_dwell": 0.0})
+        values["unique_count"] += 1
+        values["total_dwell"] += track["dwell_time"]
+        values["max_dwell"] = max(values["max_dwell"], track["dwell_time"])
+    return {
+        name: {
+            "unique_count": values["unique_count"],
+            "avg_dwell_time": round(values["total_dwell"] / values["unique_count"], 3),
+            "max_dwell_time": round(values["max_dwell"], 3)
+        }
+        for name, values in summary.items()
+    }
@@ -0,0 +1,130 @@
+import asyncio
+import hashlib
+import logging
+import os
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+class UploadTooLarge(Exception):
+    """上传文件超过大小限制"""
+    def __init__(self, max_bytes):
+        super().__init__(f"文件超过大小限制: {max_bytes // (1024 * 1024)} MB")
+        self.max_bytes = max_bytes
+
+class UploadIngestor:
+    """
+    分块读取上传文件，视频边读边写入磁盘，图片读入内存缓冲区，内存中不持有完整的文件副本
+    注意：FastAPI的UploadFile是Starlette解析multipart后写入的临时文件，这里的大小检查只能限制第二次复制，
+    请求体本身的大小由main.py中按Content-Length拒绝的中间件限制
+    """
+    def __init__(self, chunk_size=DEFAULT_CHUNK_SIZE, max_video_bytes=None, max_image_bytes=None, hash_algorithm=None):
+        """
+        初始化上传读取器
+
+        Args:
+            chunk_size: 每次读取的字节数
+            max_video_bytes: 视频大小上限，None表示不限制
+            max_image_bytes: 图片大小上限，None表示不限制
+            hash_algorithm: 边读边计算的哈希算法，如sha256，None表示不计算
+        """
+        self.chunk_size = max(1, int(chunk_size))
+        self.max_video_bytes = max_video_bytes
+        self.max_image_bytes = max_image_bytes
+        self.hash_algorithm = hash_algorithm or None
+        if self.hash_algorithm:
+            # 配置了不支持的算法时尽早报错
+            hashlib.new(self.hash_algorithm)
+
+    def configure(self, chunk_size=None, max_video_bytes=None, max_image_bytes=None, hash_algorithm=None):
+        """按配置文件更新参数，未传入的参数保持不变"""
+        if chunk_size is not None:
+            self.chunk_size = max(1, int(chunk_size))
+        if max_video_bytes is not None:
+            self.max_video_bytes = max_video_bytes
+        if max_image_bytes is not None:
+            self.max_image_bytes = max_image_bytes
+        if hash_algorithm is not None:
+            if hash_algorithm:
+                hashlib.new(hash_algorithm)
+            self.hash_algorithm = hash_algorithm or None
+
+    @property
+    def max_upload_bytes(self):
+        """所有上传类型中最大的限制，用于在解析请求体之前按Content-Length拒绝"""
+        limits = [limit for limit in (self.max_video_bytes, self.max_image_bytes) if limit]
+        return max(limits) if len(limits) == 2 else None
+
+    def _check_declared_size(self, upload, max_bytes):
+        """上传对象已知大小时直接检查，不读取任何数据"""
+        size = getattr(upload, "size", None)
+        if max_bytes and size is not None and size > max_bytes:
+            raise UploadTooLarge(max_bytes)
+
+    async def save_to_disk(self, upload, dest_path, max_bytes=None):
+        """
+        分块复制上传文件到磁盘，超过大小限制时停止复制并删除已写入的部分
+
+        Args:
+            upload: FastAPI的UploadFile
+            dest_path: 目标路径
+            max_bytes: 大小上限，默认使用视频上限
+
+        Returns:
+            dict: {"path": 路径, "size": 字节数, "hash": 哈希值或None}
+        """
+        max_bytes = max_bytes if max_bytes is not None else self.max_video_bytes
+        self._check_declared_size(upload, max_bytes)
+        digest = hashlib.new(self.hash_algorithm) if self.hash_algorithm else None
+        loop = asyncio.get_running_loop()
+        size = 0
+        try:
+            with open(dest_path, "wb") as buffer:
+                while True:
+                    chunk = await upload.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes and size > max_bytes:
+                        raise UploadTooLarge(max_bytes)
+                    if digest is not None:
+                        digest.update(chunk)
+                    # 磁盘写入放到线程中，避免大文件阻塞事件循环
+                    await loop.run_in_executor(None, buffer.write, chunk)
+        except BaseException:
+            if os.path.exists(dest_path):
+                os.unlink(dest_path)
+            raise
+        return {"path": dest_path, "size": size, "hash": digest.hexdigest() if digest is not None else None}
+
+    async def read_to_memory(self, upload, max_bytes=None):
+        """
+        分块读取上传文件到内存，供cv2.imdecode直接解码
+
+        Args:
+            upload: FastAPI的UploadFile
+            max_bytes: 大小上限，默认使用图片上限
+
+        Returns:
+            tuple: (bytearray数据, 哈希值或None)
+        """
+        max_bytes = max_bytes if max_bytes is not None else self.max_image_bytes
+        self._check_declared_size(upload, max_bytes)
+        digest = hashlib.new(self.hash_algorithm) if self.hash_algorithm else None
+        data = bytearray()
+        while True:
+            chunk = await upload.read(self.chunk_size)
+            if not chunk:
+                break
+            if max_bytes and len(data) + len(chunk) > max_bytes:
+                raise UploadTooLarge(max_bytes)
+            if digest is not None:
+                digest.update(chunk)
+            data += chunk
+        return data, digest.hexdigest() if digest is not None else None
+
+# 进程内共享的上传读取器
+upload_ingestor = UploadIngestor()
@@ -0,0 +1,144 @@
+import logging
+import cv2
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# 采样模式
+SAMPLE_READ = "read"  # 逐帧read()，完整解码每一帧（原有行为）
+SAMPLE_GRAB = "grab"  # 跳过的帧只grab()不retrieve()，省去色彩转换和拷贝
+SAMPLE_SEEK = "seek"  # 直接定位到目标帧/时间点，适合大间隔
+SAMPLE_AUTO = "auto"  # 间隔超过阈值时使用seek，否则使用grab
+SAMPLE_MODES = (SAMPLE_READ, SAMPLE_GRAB, SAMPLE_SEEK, SAMPLE_AUTO)
+
+class FrameSampler:
+    """
+    视频帧采样器，按帧间隔或时间间隔产出需要分析的帧
+    """
+    def __init__(self, cap, frame_interval=30, sample_seconds=None, mode=SAMPLE_AUTO, seek_threshold=300,
+                 start_frame=0, end_frame=None):
+        """
+        初始化采样器
+
+        Args:
+            cap: 已打开的cv2.VideoCapture
+            frame_interval: 每隔多少帧采样一帧
+            sample_seconds: 按时间采样的间隔(秒)，设置后忽略frame_interval，基于帧时间戳而不是容器帧率
+            mode: 采样模式，read/grab/seek/auto
+            seek_threshold: auto模式下帧间隔达到该值时改用seek
+            start_frame: 起始帧索引(包含)
+            end_frame: 结束帧索引(不包含)，None表示到视频结尾
+        """
+        if mode not in SAMPLE_MODES:
+            raise ValueError(f"不支持的采样模式: {mode}")
+        self.cap = cap
+        self.frame_interval = max(1, int(frame_interval))
+        self.sample_seconds = sample_seconds if sample_seconds and sample_seconds > 0 else None
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.fps = cap.get(cv2.CAP_PROP_FPS)
+        if mode == SAMPLE_AUTO:
+            interval_frames = self.sample_seconds * self.fps if self.sample_seconds and self.fps > 0 else self.frame_interval
+            mode = SAMPLE_SEEK if interval_frames >= seek_threshold else SAMPLE_GRAB
+        self.mode = mode
+        self.frames_scanned = 0  # 已经过(读取、抓取或跳过)的帧数
+        self.frames_sampled = 0
+
+    def __iter__(self):
+        """产出(帧索引, 帧)"""
+        if self.mode == SAMPLE_SEEK:
+            yield from self._iter_seek()
+        else:
+            yield from self._iter_sequential()
+
+    def _is_target(self, frame_index, next_time_ms):
+        """判断当前帧是否为采样目标"""
+        if self.sample_seconds:
+            return self.cap.get(cv2.CAP_PROP_POS_MSEC) >= next_time_ms
+        return frame_index % self.frame_interval == 0
+
+    def _iter_sequential(self):
+        """顺序遍历，read模式解码每一帧，grab模式只解码目标帧"""
+        frame_index = self.start_frame
+        if frame_index > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+        next_time_ms = self._first_target_time_ms()
+
+        while self.end_frame is None or frame_index < self.end_frame:
+            if self.mode == SAMPLE_READ:
+                ret, frame = self.cap.read()
+                if not ret:
+                    break
+                is_target = self._is_target(frame_index, next_time_ms)
+            else:
+                if not self.cap.grab():
+                    break
+                is_target = self._is_target(frame_index, next_time_ms)
+                frame = None
+                if is_target:
+                    ret, frame = self.cap.retrieve()
+                    if not ret:
+                        break
+
+            if is_target:
+                if self.sample_seconds:
+                    next_time_ms = self._next_target_time_ms(self.cap.get(cv2.CAP_PROP_POS_MSEC))
+                self.frames_sampled += 1
+                yield frame_index, frame
+
+            frame_index += 1
+            self.frames_scanned = frame_index - self.start_frame
+
+    def _iter_seek(self):
+        """直接定位到每个目标帧或目标时间点再解码"""
+        frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        end_frame = self.end_frame if self.end_frame is not None else frame_count
+        target_time_ms = self._first_target_time_ms()
+        target_frame = self._first_target_frame()
+
+        while True:
+            if self.sample_seconds:
+                self.cap.set(cv2.CAP_PROP_POS_MSEC, target_time_ms)
+            else:
+                if end_frame and target_frame >= end_frame:
+                    break
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, target_frame)
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            # read之后POS_FRAMES指向下一帧
+            frame_index = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) - 1
+            if self.sample_seconds and end_frame and frame_index >= end_frame:
+                break
+            self.frames_sampled += 1
+            self.frames_scanned = frame_index + 1 - self.start_frame
+            yield frame_index, frame
+
+            if self.sample_seconds:
+                target_time_ms = self._next_target_time_ms(target_time_ms)
+            else:
+                target_frame += self.frame_interval
+
+        if end_frame:
+            self.frames_scanned = max(self.frames_scanned, end_frame - self.start_frame)
+
+    def _first_target_frame(self):
+        """起始位置之后的第一个按帧间隔对齐的目标帧"""
+        remainder = self.start_frame % self.frame_interval
+        return self.start_frame if remainder == 0 else self.start_frame + self.frame_interval - remainder
+
+    def _first_target_time_ms(self):
+        """起始位置之后的第一个按时间间隔对齐的目标时间点(毫秒)"""
+        if not self.sample_seconds:
+            return 0.0
+        interval_ms = self.sample_seconds * 1000
+        start_ms = self.start_frame / self.fps * 1000 if self.fps > 0 else 0.0
+        steps = int(start_ms // interval_ms)
+        target = steps * interval_ms
+        return target if target >= start_ms else target + interval_ms
+
+    def _next_target_time_ms(self, current_ms):
+        """当前时间点之后的下一个目标时间点(毫秒)"""
+        interval_ms = self.sample_seconds * 1000
+        return (int(current_ms // interval_ms) + 1) * interval_ms